@@ -1,7 +1,10 @@
-from fastapi import APIRouter, Body, HTTPException, Depends
+from fastapi import APIRouter, Body, HTTPException, Depends, Request
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 import os
 import logging
 import json
+import time
 from typing import Optional
 from dotenv import load_dotenv
 from sqlalchemy.orm import Session
@@ -10,6 +13,18 @@ from controller import models, schemas, crud
 from pydantic import BaseModel, Field
 from model.materia import Materia as MateriaLogica
 from model.buzon_sugerencias import BuzonSugerencia
+from controller.cliente_groq import GROQ_TIMEOUT_MAX, cliente_groq
+from controller.cache_respuestas import cache_respuestas, CacheRespuestas, huella
+from controller.normalizacion import normalizar_prompt
+from controller.coalescer import coalescedor
+from controller.admision import ADMISION_ESPERA_MAX, control_admision, SolicitudDescartada
+from controller.cache_contexto import cache_contexto
+from model.arbol_opciones import registro_opciones
+from controller.presupuesto_prompt import estimar_tokens, presupuesto_tokens, detectar_temas, ramas_relevantes
+from model.pln import registro_pln
+from controller.enrutador_modelos import EnrutadorModelos, no_enviada, tipo_error
+from controller.metricas import (errores_total, ia_cache_total, ia_contexto_segundos, ia_groq_segundos,
+                                 ia_modelo_elegido_total, ia_prompt_tokens, ia_respaldo_total, ia_tokens_total)
 
 # Cargar variables de entorno desde .env
 load_dotenv()
@@ -26,6 +41,12 @@ class AIGenerateRequest(BaseModel):
     temperature: float = Field(0.7, description="Temperatura (0.0-2.0)")
     identificacion: Optional[str] = Field(None, description="Identificación del estudiante para contexto personalizado")
     usar_contexto: bool = Field(True, description="Si usar el contexto del sistema (JSON + BD)")
+    timeout: Optional[float] = Field(None, gt=0, le=GROQ_TIMEOUT_MAX,
+                                     description="Tiempo máximo en segundos para la llamada al modelo (opcional)")
+    usar_cache: bool = Field(True, description="Si reutilizar respuestas en caché para prompts iguales o casi iguales")
+    usar_pln: bool = Field(True, description="Si responder con la opción del menú cuando la pregunta coincide con seguridad")
+    espera_max: Optional[float] = Field(None, ge=0, le=ADMISION_ESPERA_MAX,
+                                        description="Segundos máximos esperando cupo en la cuota de Groq (opcional)")
 
 # Configuración de Groq con API Key (ahora desde variable de entorno)
 GROQ_API_KEY = os.getenv("GROQ_API_KEY", "")
@@ -38,243 +59,411 @@ AVAILABLE_MODELS = [
     "llama-3.1-8b-instant",       # Ultra rápido
 ]
 
+MODELOS_INFO = [
+    {
+        "name": "llama-3.3-70b-versatile",
+        "description": "LLaMA 3.3 70B - Más nuevo y potente, excelente para español",
+        "context_window": 32768
+    },
+    {
+        "name": "llama-3.1-70b-versatile", 
+        "description": "LLaMA 3.1 70B - Muy bueno, equilibrio perfecto",
+        "context_window": 131072
+    },
+    {
+        "name": "mixtral-8x7b-32768",
+        "description": "Mixtral 8x7B - Excelente para español y multilingüe",
+        "context_window": 32768
+    },
+    {
+        "name": "llama-3.1-8b-instant",
+        "description": "LLaMA 3.1 8B - Ultra rápido para respuestas simples",
+        "context_window": 131072
+    }
+]
+
+CONTEXT_WINDOWS = {modelo["name"]: modelo["context_window"] for modelo in MODELOS_INFO}
+
+# Latencia, errores y circuit breaker por modelo
+enrutador = EnrutadorModelos(AVAILABLE_MODELS)
+
 
 def _get_groq_client():
-    """Obtiene el cliente de Groq configurado con API key."""
-    if not GROQ_API_KEY:
-        raise HTTPException(
-            status_code=500,
-            detail="GROQ_API_KEY no configurada. Obtén una en https://console.groq.com/ y configúrala como variable de entorno."
-        )
-    
+    """Obtiene el cliente asíncrono de Groq compartido (se crea al iniciar la app)."""
     try:
-        from groq import Groq
-        return Groq(api_key=GROQ_API_KEY)
-    except ImportError:
-        raise HTTPException(
-            status_code=500,
-            detail="Paquete 'groq' no instalado. Ejecuta: pip install groq"
-        )
+        return cliente_groq.obtener()
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error configurando Groq: {e}")
 
 
 def _cargar_contexto_json():
-    """Carga el archivo opciones.json para usar como contexto."""
+    """Retorna las opciones del chatbot ya compiladas (se recargan si cambia el archivo)."""
     try:
-        ruta_opciones = os.path.join(os.path.dirname(__file__), "opciones.json")
-        with open(ruta_opciones, "r", encoding="utf-8") as f:
-            return json.load(f)
+        return registro_opciones.arbol("general").datos
     except Exception as e:
         logger.warning(f"No se pudo cargar opciones.json: {e}")
         return None
 
 
-def _obtener_contexto_bd(db: Session, identificacion: str = None):
-    """Obtiene información completa y real de la base de datos para el contexto de la IA."""
-    contexto = []
-    
-    try:
-        # ============ INFORMACIÓN DEL USUARIO ============
-        if identificacion:
-            # Buscar primero como estudiante (el id es la identificación)
-            estudiante = db.query(models.Estudiante).filter(
-                models.Estudiante.id == identificacion
-            ).first()
-            
-            if estudiante:
-                contexto.append("=" * 50)
-                contexto.append("INFORMACIÓN DEL ESTUDIANTE")
-                contexto.append("=" * 50)
-                contexto.append(f"Nombre completo: {estudiante.nombre} {estudiante.apellidos}")
-                contexto.append(f"Identificación: {estudiante.id}")
-                contexto.append(f"Tipo de documento: {estudiante.tipo_id}")
-                
-                # Materias matriculadas con todos los detalles
-                materias = db.query(models.EstudianteMateria, models.Materia).join(
-                    models.Materia, models.EstudianteMateria.id_materia == models.Materia.id_materia
-                ).filter(
-                    models.EstudianteMateria.id_estudiante == estudiante.id
-                ).all()
-                
-                if materias:
-                    contexto.append(f"\nMATERIAS MATRICULADAS ({len(materias)} materias):")
-                    total_creditos = 0
-                    for est_mat, mat in materias:
-                        contexto.append(f"  • {mat.nombre_materia} - {mat.creditos} créditos")
-                        total_creditos += mat.creditos
-                    contexto.append(f"\nTotal de créditos matriculados: {total_creditos}")
-                    
-                    # MATERIAS PRIORIZADAS POR CRÉDITOS
-                    try:
-                        materias_priorizadas = MateriaLogica.ordenar_matrias(estudiante.id)
-                        if materias_priorizadas:
-                            contexto.append("\n📊 MATERIAS PRIORIZADAS POR CRÉDITOS:")
-                            contexto.append("(Ordenadas de mayor a menor prioridad según créditos)")
-                            posicion = 1
-                            for materia_obj, prioridad in materias_priorizadas.items():
-                                contexto.append(f"  {posicion}. {materia_obj.nombre_materia} - {materia_obj.creditos} créditos (Prioridad: {prioridad})")
-                                posicion += 1
-                    except Exception as e:
-                        logger.warning(f"Error al obtener materias priorizadas: {e}")
-                        
-                contexto.append("")
-            
-            # Si no es estudiante, buscar como usuario general
-            if not estudiante:
-                usuario = db.query(models.Usuario).filter(
-                    models.Usuario.id == identificacion
-                ).first()
-                
-                if usuario:
-                    contexto.append("=" * 50)
-                    contexto.append(f"INFORMACIÓN DEL {usuario.rol.upper()}")
-                    contexto.append("=" * 50)
-                    contexto.append(f"Nombre completo: {usuario.nombre} {usuario.apellidos}")
-                    contexto.append(f"Identificación: {usuario.id}")
-                    contexto.append(f"Rol: {usuario.rol}")
-                    contexto.append(f"Tipo de documento: {usuario.tipo_id}")
-                    contexto.append("")
-        
-        # ============ TODAS LAS MATERIAS DISPONIBLES ============
-        todas_materias = db.query(models.Materia).limit(20).all()
-        if todas_materias:
-            contexto.append("=" * 50)
-            contexto.append(f"MATERIAS DISPONIBLES EN LA UNIVERSIDAD ({len(todas_materias)} primeras):")
-            contexto.append("=" * 50)
-            for mat in todas_materias:
+def _cargar_contexto_usuario(db: Session, identificacion: str) -> dict:
+    """Secciones del contexto propias del usuario (datos personales y matrícula)."""
+    secciones = {}
+
+    # Buscar primero como estudiante (el id es la identificación)
+    estudiante = db.query(models.Estudiante).filter(
+        models.Estudiante.id == identificacion
+    ).first()
+
+    if estudiante:
+        contexto = []
+        contexto.append("=" * 50)
+        contexto.append("INFORMACIÓN DEL ESTUDIANTE")
+        contexto.append("=" * 50)
+        contexto.append(f"Nombre completo: {estudiante.nombre} {estudiante.apellidos}")
+        contexto.append(f"Identificación: {estudiante.id}")
+        contexto.append(f"Tipo de documento: {estudiante.tipo_id}")
+        secciones["usuario"] = "\n".join(contexto)
+
+        # Materias matriculadas, ya ordenadas por créditos (una sola consulta)
+        materias_priorizadas = MateriaLogica.ordenar_matrias(estudiante.id, db)
+
+        if materias_priorizadas:
+            contexto = []
+            contexto.append(f"\nMATERIAS MATRICULADAS ({len(materias_priorizadas)} materias):")
+            total_creditos = 0
+            for mat in materias_priorizadas:
                 contexto.append(f"  • {mat.nombre_materia} - {mat.creditos} créditos")
+                total_creditos += mat.creditos
+            contexto.append(f"\nTotal de créditos matriculados: {total_creditos}")
+
+            # MATERIAS PRIORIZADAS POR CRÉDITOS
+            contexto.append("\n📊 MATERIAS PRIORIZADAS POR CRÉDITOS:")
+            contexto.append("(Ordenadas de mayor a menor prioridad según créditos)")
+            posicion = 1
+            for materia_obj, prioridad in materias_priorizadas.items():
+                contexto.append(f"  {posicion}. {materia_obj.nombre_materia} - {materia_obj.creditos} créditos (Prioridad: {prioridad})")
+                posicion += 1
             contexto.append("")
-        
-        # ============ USUARIOS DEL SISTEMA ============
-        usuarios = db.query(models.Usuario).limit(10).all()
-        if usuarios:
-            contexto.append("=" * 50)
-            contexto.append("USUARIOS DEL SISTEMA:")
-            contexto.append("=" * 50)
-            for user in usuarios:
-                contexto.append(f"� {user.nombre} {user.apellidos}")
-                contexto.append(f"   Rol: {user.rol}")
-                contexto.append(f"   Tipo ID: {user.tipo_id}")
-                contexto.append("")
-                
+            secciones["matricula"] = "\n".join(contexto)
+        return secciones
+
+    # Si no es estudiante, buscar como usuario general
+    usuario = db.query(models.Usuario).filter(
+        models.Usuario.id == identificacion
+    ).first()
+
+    if usuario:
+        contexto = []
+        contexto.append("=" * 50)
+        contexto.append(f"INFORMACIÓN DEL {usuario.rol.upper()}")
+        contexto.append("=" * 50)
+        contexto.append(f"Nombre completo: {usuario.nombre} {usuario.apellidos}")
+        contexto.append(f"Identificación: {usuario.id}")
+        contexto.append(f"Rol: {usuario.rol}")
+        contexto.append(f"Tipo de documento: {usuario.tipo_id}")
+        contexto.append("")
+        secciones["usuario"] = "\n".join(contexto)
+    return secciones
+
+
+def _cargar_contexto_global(db: Session) -> dict:
+    """Secciones del contexto compartidas por todos los usuarios."""
+    secciones = {}
+
+    # ============ TODAS LAS MATERIAS DISPONIBLES ============
+    todas_materias = db.query(models.Materia).limit(20).all()
+    if todas_materias:
+        contexto = []
+        contexto.append("=" * 50)
+        contexto.append(f"MATERIAS DISPONIBLES EN LA UNIVERSIDAD ({len(todas_materias)} primeras):")
+        contexto.append("=" * 50)
+        for mat in todas_materias:
+            contexto.append(f"  • {mat.nombre_materia} - {mat.creditos} créditos")
+        contexto.append("")
+        secciones["materias_disponibles"] = "\n".join(contexto)
+
+    # ============ USUARIOS DEL SISTEMA ============
+    usuarios = db.query(models.Usuario).limit(10).all()
+    if usuarios:
+        contexto = []
+        contexto.append("=" * 50)
+        contexto.append("USUARIOS DEL SISTEMA:")
+        contexto.append("=" * 50)
+        for user in usuarios:
+            contexto.append(f"� {user.nombre} {user.apellidos}")
+            contexto.append(f"   Rol: {user.rol}")
+            contexto.append(f"   Tipo ID: {user.tipo_id}")
+            contexto.append("")
+        secciones["usuarios_sistema"] = "\n".join(contexto)
+    return secciones
+
+
+def _secciones_contexto_bd(db: Session, identificacion: str = None) -> dict:
+    """Secciones del contexto de BD, servidas desde la caché de instantáneas."""
+    secciones = {}
+
+    # ============ INFORMACIÓN DEL USUARIO ============
+    if identificacion:
+        try:
+            secciones.update(cache_contexto.usuario(
+                identificacion, lambda: _cargar_contexto_usuario(db, identificacion)
+            ))
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"Error obteniendo contexto del usuario: {e}")
+
+    try:
+        secciones.update(cache_contexto.global_(lambda: _cargar_contexto_global(db)))
     except Exception as e:
+        db.rollback()
         logger.warning(f"Error obteniendo contexto de BD: {e}")
-    
-    return "\n".join(contexto) if contexto else None
 
+    return secciones
 
-def _construir_prompt_con_contexto(prompt_usuario: str, contexto_json: dict = None, contexto_bd: str = None):
-    """Construye un prompt enriquecido con el contexto del sistema."""
-    
-    partes = [
+
+def _obtener_contexto_bd(db: Session, identificacion: str = None):
+    """Obtiene información completa y real de la base de datos para el contexto de la IA."""
+    secciones = _secciones_contexto_bd(db, identificacion)
+    return "\n".join(secciones.values()) if secciones else None
+
+
+# Preámbulo del prompt dividido en bloques para incluir solo las reglas que aplican
+_PREAMBULO_BASE = [
+    "="*70,
+    "ASISTENTE VIRTUAL INTELIGENTE - UNIVERSIDAD DE MEDELLÍN",
+    "="*70,
+    "",
+    "Eres un asistente virtual avanzado de la Universidad de Medellín (UdeM).",
+    "",
+    "TU MISIÓN:",
+    "- Ayudar a estudiantes y profesores con información precisa y personalizada",
+    "- Responder preguntas sobre materias, calificaciones, profesores, eventos",
+    "- Mostrar materias priorizadas por créditos cuando lo soliciten",
+    "- Guiar en trámites administrativos y procesos académicos",
+    "- Ser amigable, profesional y usar un tono conversacional",
+    "",
+    "CAPACIDADES:",
+    "✓ Acceso COMPLETO a la base de datos de la universidad",
+    "✓ Información en TIEMPO REAL de estudiantes, profesores, materias, noticias",
+    "✓ Puedes llamar al usuario por su NOMBRE si está identificado",
+    "✓ Puedes hacer cálculos (promedios, créditos, etc.)",
+    "✓ Puedes ayudar a los usuarios a enviar SUGERENCIAS al buzón",
+    "",
+    "REGLAS IMPORTANTES:",
+    "1. Si el usuario está identificado, dirígete a él por su NOMBRE",
+    "2. Si preguntan por materias/notas, usa la información REAL de la BD",
+    "3. Si preguntan por profesores, usa los datos REALES",
+]
+
+_PREAMBULO_CIERRE = [
+    "6. Si no tienes la info exacta, sugiere contactar a la universidad",
+    "7. SIEMPRE responde en español de forma clara y concisa",
+    "8. Si hay múltiples opciones, preséntalas en formato de lista numerada",
+    "9. Incluye emojis relevantes para hacer la conversación más amigable 😊",
+    "",
+]
+
+_REGLA_PRIORIZADAS = [
+    "4. 📊 MATERIAS PRIORIZADAS: Cuando te pregunten por materias priorizadas o por orden de créditos:",
+    "   - USA EXCLUSIVAMENTE la sección '📊 MATERIAS PRIORIZADAS POR CRÉDITOS'",
+    "   - Muestra el listado COMPLETO tal como aparece en el contexto",
+    "   - Explica que están ordenadas de MAYOR a MENOR número de créditos",
+    "   - Menciona la prioridad (Alta/Media/Baja) de cada materia",
+    "",
+]
+
+_REGLA_BUZON = [
+    "5. 📝 BUZÓN DE SUGERENCIAS: Si el usuario quiere enviar una queja, reclamo, sugerencia o felicitación:",
+    "   - Explica que puede enviarlo al buzón de sugerencias",
+    "   - Los tipos válidos son: Queja, Reclamo, Sugerencia, Felicitación",
+    "   - Pide el ASUNTO (tema breve)",
+    "   - Pide la DESCRIPCIÓN (detallada)",
+    "   - Indica que su mensaje será registrado y revisado por la universidad",
+    "   - NO intentes guardar la sugerencia tú mismo, solo guía al usuario",
+    "   - Cuando el USUARIO te diga el tipo de sugerencias y lo que quiere di gracias",
+    "",
+]
+
+_REGLA_ENLACES = [
+    "⚠️ REGLA CRÍTICA SOBRE ENLACES:",
+    "- Cuando una respuesta incluya una URL, DEBES mostrar el enlace COMPLETO",
+    "- NO digas 'haz clic aquí' sin el enlace",
+    "- Formato correcto: 'Accede aquí: https://ejemplo.com/url-completa'",
+    "- Las URLs pueden ser largas, NO LAS ACORTES",
+    "- Siempre verifica en las OPCIONES Y SERVICIOS si hay enlaces disponibles",
+    "",
+]
+
+_INSTRUCCIONES_ENLACES = [
+    "",
+    "🔗 INSTRUCCIONES SOBRE ENLACES:",
+    "- Cuando respondas con URLs, SIEMPRE muestra el enlace completo",
+    "- Usa el formato: 'Puedes acceder aquí: [URL completa]'",
+    "- NO acortes ni omitas las URLs",
+    "- Si el resultado contiene un enlace, INCLÚYELO en tu respuesta",
+    "",
+]
+
+# Secciones de BD que se incluyen según el tema de la pregunta ("usuario" siempre)
+_SECCIONES_BD_POR_TEMA = {
+    "matricula": "materias",
+    "materias_disponibles": "materias",
+    "usuarios_sistema": "usuarios",
+}
+
+
+def _formatear_rama(key: str, opcion: dict) -> list:
+    """Texto de una opción de primer nivel con sus sub-opciones y resultados (URLs)."""
+    partes = [f"\n{key}. {opcion.get('texto', '')}"]
+
+    # Si tiene sub-opciones
+    if "opciones" in opcion:
+        for sub_key, sub_opcion in opcion["opciones"].items():
+            partes.append(f"   {key}.{sub_key}. {sub_opcion.get('texto', '')}")
+
+            # IMPORTANTE: Incluir el resultado con URLs
+            if "resultado" in sub_opcion:
+                resultado = sub_opcion["resultado"]
+                partes.append(f"      → Resultado: {resultado}")
+
+    # Si tiene resultado directo (sin sub-opciones)
+    elif "resultado" in opcion:
+        partes.append(f"   → Resultado: {opcion['resultado']}")
+    return partes
+
+
+def _tokens_opciones_completas(contexto_json: dict) -> int:
+    """Tokens que ocuparían todas las opciones (se calcula una vez por árbol)."""
+    clave = ("opciones", id(contexto_json))
+    entrada = _TOKENS_COMPLETOS.get(clave)
+    if entrada is None or entrada[0] is not contexto_json:
+        partes = []
+        for key, opcion in contexto_json.get("opciones", {}).items():
+            partes.extend(_formatear_rama(key, opcion))
+        entrada = (contexto_json, estimar_tokens("\n".join(partes + _INSTRUCCIONES_ENLACES)))
+        _TOKENS_COMPLETOS.clear()
+        _TOKENS_COMPLETOS[clave] = entrada
+    return entrada[1]
+
+
+_TOKENS_COMPLETOS = {}
+_TOKENS_PREAMBULO_COMPLETO = estimar_tokens("\n".join(
+    _PREAMBULO_BASE + _REGLA_PRIORIZADAS + _REGLA_BUZON + _PREAMBULO_CIERRE + _REGLA_ENLACES
+))
+
+
+def _construir_prompt_con_contexto(prompt_usuario: str, contexto_json: dict = None, contexto_bd=None,
+                                   context_window: int = None, max_tokens: int = 512):
+    """Construye un prompt enriquecido solo con el contexto relevante para la pregunta.
+
+    ``contexto_bd`` son las secciones de ``_secciones_contexto_bd`` (o un texto).
+    Las secciones se agregan por prioridad mientras quepan en el presupuesto de
+    tokens del modelo. Retorna (prompt, info) con el tamaño estimado y el ahorro.
+    """
+    if isinstance(contexto_bd, str):
+        contexto_bd = {"bd": contexto_bd}
+    contexto_bd = contexto_bd or {}
+    temas = detectar_temas(prompt_usuario)
+    presupuesto = presupuesto_tokens(context_window or min(m["context_window"] for m in MODELOS_INFO), max_tokens)
+
+    pregunta = [
         "="*70,
-        "ASISTENTE VIRTUAL INTELIGENTE - UNIVERSIDAD DE MEDELLÍN",
+        "💬 PREGUNTA DEL USUARIO:",
         "="*70,
+        prompt_usuario,
         "",
-        "Eres un asistente virtual avanzado de la Universidad de Medellín (UdeM).",
-        "",
-        "TU MISIÓN:",
-        "- Ayudar a estudiantes y profesores con información precisa y personalizada",
-        "- Responder preguntas sobre materias, calificaciones, profesores, eventos",
-        "- Mostrar materias priorizadas por créditos cuando lo soliciten",
-        "- Guiar en trámites administrativos y procesos académicos",
-        "- Ser amigable, profesional y usar un tono conversacional",
-        "",
-        "CAPACIDADES:",
-        "✓ Acceso COMPLETO a la base de datos de la universidad",
-        "✓ Información en TIEMPO REAL de estudiantes, profesores, materias, noticias",
-        "✓ Puedes llamar al usuario por su NOMBRE si está identificado",
-        "✓ Puedes hacer cálculos (promedios, créditos, etc.)",
-        "✓ Puedes ayudar a los usuarios a enviar SUGERENCIAS al buzón",
-        "",
-        "REGLAS IMPORTANTES:",
-        "1. Si el usuario está identificado, dirígete a él por su NOMBRE",
-        "2. Si preguntan por materias/notas, usa la información REAL de la BD",
-        "3. Si preguntan por profesores, usa los datos REALES",
-        "4. 📊 MATERIAS PRIORIZADAS: Cuando te pregunten por materias priorizadas o por orden de créditos:",
-        "   - USA EXCLUSIVAMENTE la sección '📊 MATERIAS PRIORIZADAS POR CRÉDITOS'",
-        "   - Muestra el listado COMPLETO tal como aparece en el contexto",
-        "   - Explica que están ordenadas de MAYOR a MENOR número de créditos",
-        "   - Menciona la prioridad (Alta/Media/Baja) de cada materia",
-        "5. 📝 BUZÓN DE SUGERENCIAS: Si el usuario quiere enviar una queja, reclamo, sugerencia o felicitación:",
-        "   - Explica que puede enviarlo al buzón de sugerencias",
-        "   - Los tipos válidos son: Queja, Reclamo, Sugerencia, Felicitación",
-        "   - Pide el ASUNTO (tema breve)",
-        "   - Pide la DESCRIPCIÓN (detallada)",
-        "   - Indica que su mensaje será registrado y revisado por la universidad",
-        "   - NO intentes guardar la sugerencia tú mismo, solo guía al usuario",
-        "   - Cuando el USUARIO te diga el tipo de sugerencias y lo que quiere di gracias",
-        "6. Si no tienes la info exacta, sugiere contactar a la universidad",
-        "7. SIEMPRE responde en español de forma clara y concisa",
-        "8. Si hay múltiples opciones, preséntalas en formato de lista numerada",
-        "9. Incluye emojis relevantes para hacer la conversación más amigable 😊",
-        "",
-        "⚠️ REGLA CRÍTICA SOBRE ENLACES:",
-        "- Cuando una respuesta incluya una URL, DEBES mostrar el enlace COMPLETO",
-        "- NO digas 'haz clic aquí' sin el enlace",
-        "- Formato correcto: 'Accede aquí: https://ejemplo.com/url-completa'",
-        "- Las URLs pueden ser largas, NO LAS ACORTES",
-        "- Siempre verifica en las OPCIONES Y SERVICIOS si hay enlaces disponibles",
-        "",
+        "="*70,
+        "📝 TU RESPUESTA (clara, precisa y amigable):",
+        "="*70,
     ]
-    
+    usados = estimar_tokens("\n".join(_PREAMBULO_BASE + _PREAMBULO_CIERRE)) + estimar_tokens("\n".join(pregunta))
+    incluidas, omitidas = [], []
+
+    def agregar(nombre, lineas):
+        nonlocal usados
+        tokens = estimar_tokens("\n".join(lineas))
+        if usados + tokens > presupuesto:
+            omitidas.append(nombre)
+            return False
+        usados += tokens
+        incluidas.append(nombre)
+        return True
+
+    # Candidatos en orden de prioridad
+    reglas, enlaces, bd, opciones = [], [], [], []
+    if "usuario" in contexto_bd and agregar("usuario", [contexto_bd["usuario"]]):
+        bd.append(contexto_bd["usuario"])
+    if "materias" in temas and "matricula" in contexto_bd and agregar("regla_priorizadas", _REGLA_PRIORIZADAS):
+        reglas.extend(_REGLA_PRIORIZADAS)
+    if "sugerencia" in temas and agregar("regla_buzon", _REGLA_BUZON):
+        reglas.extend(_REGLA_BUZON)
+    for nombre, texto in contexto_bd.items():
+        tema = _SECCIONES_BD_POR_TEMA.get(nombre)
+        if nombre == "usuario" or (tema and tema not in temas):
+            continue
+        if agregar(nombre, [texto]):
+            bd.append(texto)
+
+    if contexto_json and "opciones" in contexto_json:
+        ramas = ramas_relevantes(contexto_json, prompt_usuario)
+        for key in ramas:
+            lineas = _formatear_rama(key, contexto_json["opciones"][key])
+            if agregar(f"opcion_{key}", lineas):
+                opciones.extend(lineas)
+        if not ramas:
+            # Sin coincidencias: solo el menú principal, sin resultados
+            lineas = [f"{key}. {opcion.get('texto', '')}" for key, opcion in contexto_json["opciones"].items()]
+            if agregar("menu", lineas):
+                opciones.extend(lineas)
+        if any("http" in linea for linea in opciones) and agregar("regla_enlaces", _REGLA_ENLACES + _INSTRUCCIONES_ENLACES):
+            enlaces.extend(_REGLA_ENLACES)
+            opciones.extend(_INSTRUCCIONES_ENLACES)
+
+    partes = _PREAMBULO_BASE + reglas + _PREAMBULO_CIERRE + enlaces
+
     # Agregar contexto de BD si existe
-    if contexto_bd:
+    if bd:
         partes.append("="*70)
         partes.append("📊 INFORMACIÓN DE LA BASE DE DATOS (TIEMPO REAL):")
         partes.append("="*70)
-        partes.append(contexto_bd)
+        partes.extend(bd)
         partes.append("")
-    
+
     # Agregar contexto del JSON si existe
-    if contexto_json:
+    if opciones:
         partes.append("="*70)
         partes.append("📋 OPCIONES, SERVICIOS Y ENLACES DISPONIBLES:")
         partes.append("="*70)
-        
-        # Extraer información completa del JSON incluyendo resultados y URLs
-        if "opciones" in contexto_json:
-            for key, opcion in contexto_json["opciones"].items():
-                partes.append(f"\n{key}. {opcion.get('texto', '')}")
-                
-                # Si tiene sub-opciones
-                if "opciones" in opcion:
-                    for sub_key, sub_opcion in opcion["opciones"].items():
-                        partes.append(f"   {key}.{sub_key}. {sub_opcion.get('texto', '')}")
-                        
-                        # IMPORTANTE: Incluir el resultado con URLs
-                        if "resultado" in sub_opcion:
-                            resultado = sub_opcion["resultado"]
-                            partes.append(f"      → Resultado: {resultado}")
-                
-                # Si tiene resultado directo (sin sub-opciones)
-                elif "resultado" in opcion:
-                    partes.append(f"   → Resultado: {opcion['resultado']}")
-        
+        partes.extend(opciones)
         partes.append("")
-        partes.append("🔗 INSTRUCCIONES SOBRE ENLACES:")
-        partes.append("- Cuando respondas con URLs, SIEMPRE muestra el enlace completo")
-        partes.append("- Usa el formato: 'Puedes acceder aquí: [URL completa]'")
-        partes.append("- NO acortes ni omitas las URLs")
-        partes.append("- Si el resultado contiene un enlace, INCLÚYELO en tu respuesta")
-        partes.append("")
-    
-    # Agregar pregunta del usuario
-    partes.append("="*70)
-    partes.append("💬 PREGUNTA DEL USUARIO:")
-    partes.append("="*70)
-    partes.append(prompt_usuario)
-    partes.append("")
-    partes.append("="*70)
-    partes.append("📝 TU RESPUESTA (clara, precisa y amigable):")
-    partes.append("="*70)
-    
-    return "\n".join(partes)
+
+    contexto_inyectado = "\n".join(partes)
+    prompt = contexto_inyectado + "\n" + "\n".join(pregunta)
+
+    # Tamaño que habría tenido el prompt con todo el contexto
+    tokens_completos = _TOKENS_PREAMBULO_COMPLETO + estimar_tokens("\n".join(pregunta))
+    tokens_completos += sum(estimar_tokens(texto) for texto in contexto_bd.values())
+    if contexto_json and "opciones" in contexto_json:
+        tokens_completos += _tokens_opciones_completas(contexto_json)
+    tokens_estimados = estimar_tokens(prompt)
+
+    info = {
+        "tokens_estimados": tokens_estimados,
+        "tokens_sin_filtrar": tokens_completos,
+        "tokens_ahorrados": max(0, tokens_completos - tokens_estimados),
+        "presupuesto_tokens": presupuesto,
+        "temas": sorted(temas),
+        "secciones": incluidas,
+        "omitidas": omitidas,
+        "huella": huella(contexto_inyectado),
+    }
+    return prompt, info
 
 
 @router.get("/verificar_identificacion/{identificacion}")
-async def verificar_identificacion(identificacion: str, db: Session = Depends(get_db)):
+def verificar_identificacion(identificacion: str, db: Session = Depends(get_db)):
     """Verifica la identificación y retorna el nombre del usuario."""
     try:
         # Buscar como estudiante
@@ -314,18 +503,231 @@ async def verificar_identificacion(identificacion: str, db: Session = Depends(ge
         raise HTTPException(status_code=500, detail=f"Error al verificar identificación: {str(e)}")
 
 
+async def _preparar_prompt(request: AIGenerateRequest, db: Session):
+    """Construye el prompt final (con contexto si está habilitado).
+
+    Retorna (prompt_final, info_contexto); ``info_contexto["huella"]`` identifica
+    el contexto inyectado para la caché de respuestas.
+    """
+    prompt_final = request.prompt
+    info_contexto = {"huella": "", "tokens_estimados": estimar_tokens(prompt_final)}
+    if request.usar_contexto:
+        with ia_contexto_segundos.medir():
+            contexto_json = _cargar_contexto_json()
+            # Las consultas a la BD son síncronas: se ejecutan fuera del event loop
+            contexto_bd = await run_in_threadpool(_secciones_contexto_bd, db, request.identificacion) if request.identificacion else None
+            prompt_final, info_contexto = _construir_prompt_con_contexto(
+                request.prompt, contexto_json, contexto_bd,
+                context_window=CONTEXT_WINDOWS.get(request.model), max_tokens=request.max_tokens
+            )
+        logger.info(
+            f"Prompt con contexto construido (~{info_contexto['tokens_estimados']} tokens, "
+            f"{info_contexto['tokens_ahorrados']} ahorrados)"
+        )
+    ia_prompt_tokens.observar(info_contexto["tokens_estimados"])
+    return prompt_final, info_contexto
+
+
+def _metadata_contexto(info_contexto: dict) -> dict:
+    """Tamaño del prompt para la respuesta (sin la huella interna)."""
+    return {clave: valor for clave, valor in info_contexto.items() if clave != "huella"}
+
+
+def _particion_cache(request: AIGenerateRequest, info_contexto: dict) -> tuple:
+    return CacheRespuestas.particion(request.model, request.temperature, info_contexto["huella"], request.identificacion)
+
+
+def _buscar_en_cache(request: AIGenerateRequest, particion: tuple):
+    """Consulta la caché de respuestas y cuenta aciertos y fallos."""
+    resultado, tipo_hit = cache_respuestas.obtener(request.prompt, particion)
+    ia_cache_total.inc(tipo_hit if resultado is not None else "fallo")
+    return resultado, tipo_hit
+
+
+def _registrar_uso(model_name: str, uso):
+    """Suma los tokens que reportó Groq a las métricas."""
+    if uso is None:
+        return
+    ia_tokens_total.inc(model_name, "prompt", cantidad=uso.prompt_tokens or 0)
+    ia_tokens_total.inc(model_name, "completion", cantidad=uso.completion_tokens or 0)
+
+
+async def _crear_completion(client, request: AIGenerateRequest, prompt_final: str, stream: bool = False,
+                            tokens_reservados: int = 0):
+    """Llama a Groq con los modelos que propone el enrutador, en orden.
+
+    ``admitir`` reservó la cuota de un intento (``tokens_reservados``); cada
+    modelo de respaldo cobra otra petición. Los intentos que no llegaron a Groq
+    se devuelven, y si ninguno llegó también los tokens.
+
+    Retorna (modelo, respuesta, enrutamiento); ``enrutamiento`` explica la elección.
+    """
+    clase = EnrutadorModelos.clasificar(estimar_tokens(request.prompt), bool(request.identificacion))
+    models_to_try, motivo = enrutador.candidatos(clase, request.model)
+
+    fallidos = []
+    last_error = None
+    # Intentos cobrados (el primero lo reservó admitir), devueltos y si alguno llegó a Groq
+    cobrados = devueltos = 0
+    llego = False
+    try:
+        if not models_to_try:
+            raise HTTPException(
+                status_code=503,
+                detail="Todos los modelos están temporalmente fuera de servicio. Intenta de nuevo en unos segundos."
+            )
+        for model_name in models_to_try:
+            if not enrutador.intentar(model_name):
+                continue
+            if cobrados:
+                control_admision.cobrar_intento()
+            cobrados += 1
+            inicio = time.perf_counter()
+            try:
+                logger.info(f"Intentando generar con modelo: {model_name} ({motivo})")
+
+                # Llamar a Groq API (compatible con OpenAI)
+                response = await client.chat.completions.create(
+                    model=model_name,
+                    messages=[
+                        {"role": "user", "content": prompt_final}
+                    ],
+                    max_tokens=request.max_tokens,
+                    temperature=request.temperature,
+                    timeout=request.timeout or cliente_groq.timeout,
+                    stream=stream,
+                )
+                llego = True
+                latencia = time.perf_counter() - inicio
+                enrutador.registrar(model_name, latencia)
+                ia_groq_segundos.observar(latencia, model_name, "ok")
+                if fallidos:
+                    motivo = f"{motivo}; respaldo tras fallo en {', '.join(fallidos)}"
+                enrutador.registrar_eleccion(model_name, motivo)
+                ia_modelo_elegido_total.inc(model_name, clase)
+                return model_name, response, {"clase": clase, "motivo": motivo, "fallidos": fallidos}
+
+            except Exception as e:
+                latencia = time.perf_counter() - inicio
+                enrutador.registrar(model_name, latencia, e)
+                ia_groq_segundos.observar(latencia, model_name, tipo_error(e))
+                errores_total.inc("groq")
+                error_msg = str(e)
+                logger.warning(f"Fallo con modelo {model_name}: {error_msg}")
+                last_error = error_msg
+                if no_enviada(e):
+                    devueltos += 1
+                else:
+                    llego = True
+
+                # Modelo inexistente, rate limit, timeout o error del servidor: probar el siguiente
+                if tipo_error(e) != "definitivo":
+                    fallidos.append(model_name)
+                    continue
+                else:
+                    # Otros errores (auth, petición inválida) no reintentar
+                    raise HTTPException(status_code=500, detail=f"Error al generar con {model_name}: {error_msg}")
+            except BaseException:
+                # Cancelada en vuelo: Groq pudo recibirla
+                llego = True
+                raise
+
+        # Si llegamos aquí, ningún modelo funcionó
+        raise HTTPException(
+            status_code=502,
+            detail=f"No se pudo generar contenido con ningún modelo disponible. Último error: {last_error}"
+        )
+    finally:
+        # Sin ningún intento tampoco se usó la petición que reservó admitir
+        peticiones = devueltos if cobrados else 1
+        tokens = 0 if llego else tokens_reservados
+        if peticiones or tokens:
+            control_admision.devolver(tokens, peticiones)
+
+
+def _respuesta_menu(request: AIGenerateRequest):
+    """Responde con el resultado de una opción del menú si la pregunta coincide con seguridad.
+
+    Solo aplica a hojas con resultado fijo; lo demás sigue al LLM.
+    """
+    if not request.usar_pln:
+        return None
+    arbol = registro_opciones.arbol("general")
+    coincidencia = registro_pln.para(arbol).mejor(request.prompt)
+    if coincidencia is None or not coincidencia.segura:
+        return None
+    nodo = arbol.nodo(coincidencia.id_nodo)
+    if nodo.tipo != "resultado" or nodo.usa_link_hoja:
+        return None
+    ia_respaldo_total.inc("menu")
+    return {
+        "text": nodo.resultado,
+        "model": None,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "total_tokens": 0,
+        "finish_reason": "stop",
+        "contexto_usado": False,
+        "fuente": "menu",
+        "nodo_id": nodo.id,
+    }
+
+
+def _respuesta_descartada(request: AIGenerateRequest, motivo: str, reintentar_en: float = 0.0):
+    """Respuesta cuando no se llama al modelo por carga: remite a la opción del menú más cercana."""
+    arbol = registro_opciones.arbol("general")
+    coincidencia = registro_pln.para(arbol).mejor(request.prompt)
+    nodo = arbol.nodo(coincidencia.id_nodo) if coincidencia else None
+
+    texto = "⏳ En este momento hay muchas consultas al asistente y no puedo responderte con IA."
+    opcion_sugerida = None
+    if nodo is not None:
+        # Ruta legible en el menú, p. ej. "Problemas con el correo > Restablecer contraseña"
+        partes = nodo.id.split(".")
+        ruta = " > ".join(arbol.nodo(".".join(partes[:i + 1])).datos["texto"] for i in range(len(partes)))
+        texto += f"\n\nEsto puede ayudarte, en el menú: {ruta}"
+        if nodo.resultado and not nodo.usa_link_hoja:
+            texto += f"\n{nodo.resultado}"
+        opcion_sugerida = {"nodo_id": nodo.id, "ruta": ruta}
+    else:
+        texto += "\n\nMientras tanto, puedes usar el menú de opciones."
+    if reintentar_en:
+        texto += f"\n\nIntenta de nuevo en unos {max(1, round(reintentar_en))} segundos."
+    ia_respaldo_total.inc(motivo)
+
+    return {
+        "text": texto,
+        "model": None,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "total_tokens": 0,
+        "finish_reason": "descartada",
+        "contexto_usado": False,
+        "fuente": "menu_respaldo",
+        "descartada": {"motivo": motivo, "reintentar_en": reintentar_en},
+        "opcion_sugerida": opcion_sugerida,
+    }
+
+
+async def _admitir(request: AIGenerateRequest, info_contexto: dict) -> int:
+    """Espera cupo en las cuotas de Groq. Retorna los tokens reservados."""
+    tokens = info_contexto["tokens_estimados"] + request.max_tokens
+    await control_admision.admitir(tokens, request.espera_max)
+    return tokens
+
+
 @router.post("/generate")
 async def generate_ai(
     request: AIGenerateRequest,
     db: Session = Depends(get_db)
 ):
     """Genera texto usando Groq (LLaMA/Mixtral) con contexto del sistema.
-    
+
     La IA puede usar:
     - Opciones del chatbot (opciones.json)
     - Información del estudiante de la BD (si se proporciona identificación)
     - Noticias, grupos estudiantiles, etc.
-    
+
     Ejemplo de uso:
     ```json
     {
@@ -338,68 +740,177 @@ async def generate_ai(
     if not request.prompt or not request.prompt.strip():
         raise HTTPException(status_code=400, detail="El prompt no puede estar vacío")
 
-    client = _get_groq_client()
-    
+    # Preguntas que ya resuelve el menú no llegan al modelo
+    resultado = _respuesta_menu(request)
+    if resultado is not None:
+        return {**resultado, "cache": None}
+
     # Construir prompt con contexto si está habilitado
-    prompt_final = request.prompt
-    if request.usar_contexto:
-        contexto_json = _cargar_contexto_json()
-        contexto_bd = _obtener_contexto_bd(db, request.identificacion) if request.identificacion else None
-        prompt_final = _construir_prompt_con_contexto(request.prompt, contexto_json, contexto_bd)
-        logger.info(f"Prompt con contexto construido (longitud: {len(prompt_final)} caracteres)")
-    
-    # Determinar qué modelo usar
-    models_to_try = [request.model] if request.model else AVAILABLE_MODELS
-    
-    last_error = None
-    for model_name in models_to_try:
+    prompt_final, info_contexto = await _preparar_prompt(request, db)
+
+    # Reutilizar la respuesta si ya se generó para este prompt y contexto
+    particion = _particion_cache(request, info_contexto)
+    if request.usar_cache:
+        resultado, tipo_hit = _buscar_en_cache(request, particion)
+        if resultado is not None:
+            return {**resultado, "cache": tipo_hit, "contexto": _metadata_contexto(info_contexto)}
+
+    async def generar():
+        # El cliente solo se pide si la respuesta no salió de la caché ni de una llamada en vuelo
+        client = _get_groq_client()
+        tokens_reservados = await _admitir(request, info_contexto)
+        model_name, response, enrutamiento = await _crear_completion(client, request, prompt_final,
+                                                                     tokens_reservados=tokens_reservados)
+        control_admision.ajustar(tokens_reservados, response.usage.total_tokens)
+        _registrar_uso(model_name, response.usage)
+
+        # Extraer respuesta
+        text = response.choices[0].message.content
+
+        resultado = {
+            "text": text,
+            "model": model_name,
+            "prompt_tokens": response.usage.prompt_tokens,
+            "completion_tokens": response.usage.completion_tokens,
+            "total_tokens": response.usage.total_tokens,
+            "finish_reason": response.choices[0].finish_reason,
+            "contexto_usado": request.usar_contexto
+        }
+        if request.usar_cache and resultado["finish_reason"] == "stop":
+            cache_respuestas.guardar(request.prompt, particion, resultado)
+        return resultado, enrutamiento
+
+    try:
+        if request.identificacion:
+            resultado, enrutamiento = await generar()
+        else:
+            # Preguntas iguales en vuelo (sin datos personales) comparten una sola llamada a Groq
+            clave = (particion, normalizar_prompt(request.prompt), request.max_tokens)
+            resultado, enrutamiento = await coalescedor.ejecutar(clave, generar)
+    except SolicitudDescartada as e:
+        return {**_respuesta_descartada(request, e.motivo, e.reintentar_en), "cache": None}
+    except HTTPException as e:
+        if e.status_code != 503:
+            raise
+        return {**_respuesta_descartada(request, "modelos_no_disponibles"), "cache": None}
+    return {**resultado, "cache": None, "contexto": _metadata_contexto(info_contexto), "enrutamiento": enrutamiento}
+
+
+def _evento_sse(datos: dict, evento: str = None) -> str:
+    """Formatea un evento server-sent events."""
+    linea_evento = f"event: {evento}\n" if evento else ""
+    return f"{linea_evento}data: {json.dumps(datos, ensure_ascii=False)}\n\n"
+
+
+def _uso_de_chunk(chunk):
+    """Groq envía el uso de tokens en el último chunk (``x_groq.usage``)."""
+    uso = getattr(chunk, "usage", None)
+    if uso is None:
+        uso = getattr(getattr(chunk, "x_groq", None), "usage", None)
+    return uso
+
+
+async def _eventos_resultado(resultado: dict, **extra):
+    """Envía como SSE una respuesta ya calculada (caché o menú)."""
+    yield _evento_sse({"text": resultado["text"]})
+    fin = {clave: valor for clave, valor in resultado.items() if clave != "text"}
+    yield _evento_sse({**fin, **extra}, "fin")
+
+
+@router.post("/generate/stream")
+async def generate_ai_stream(
+    request: AIGenerateRequest,
+    http_request: Request,
+    db: Session = Depends(get_db)
+):
+    """Igual que /generate pero envía los tokens a medida que se generan (SSE).
+
+    Cada evento ``data`` trae ``{"text": "..."}`` con un fragmento de la respuesta.
+    El evento final ``fin`` trae el modelo, ``finish_reason`` y el uso de tokens.
+    Si el cliente se desconecta se cancela la llamada a Groq.
+    """
+    if not request.prompt or not request.prompt.strip():
+        raise HTTPException(status_code=400, detail="El prompt no puede estar vacío")
+
+    resultado = _respuesta_menu(request)
+    if resultado is not None:
+        return StreamingResponse(_eventos_resultado(resultado, cache=None), media_type="text/event-stream")
+
+    prompt_final, info_contexto = await _preparar_prompt(request, db)
+
+    particion = _particion_cache(request, info_contexto)
+    if request.usar_cache:
+        resultado, tipo_hit = _buscar_en_cache(request, particion)
+        if resultado is not None:
+            eventos_cache = _eventos_resultado(resultado, cache=tipo_hit, contexto=_metadata_contexto(info_contexto))
+            return StreamingResponse(eventos_cache, media_type="text/event-stream")
+
+    client = _get_groq_client()
+    try:
+        tokens_reservados = await _admitir(request, info_contexto)
+        model_name, stream, enrutamiento = await _crear_completion(client, request, prompt_final, stream=True,
+                                                                   tokens_reservados=tokens_reservados)
+    except SolicitudDescartada as e:
+        resultado = _respuesta_descartada(request, e.motivo, e.reintentar_en)
+        return StreamingResponse(_eventos_resultado(resultado, cache=None), media_type="text/event-stream")
+    except HTTPException as e:
+        if e.status_code != 503:
+            raise
+        resultado = _respuesta_descartada(request, "modelos_no_disponibles")
+        return StreamingResponse(_eventos_resultado(resultado, cache=None), media_type="text/event-stream")
+    inicio = time.perf_counter()
+
+    async def eventos():
+        finish_reason = None
+        uso = None
+        partes = []
         try:
-            logger.info(f"Intentando generar con modelo: {model_name}")
-            
-            # Llamar a Groq API (compatible con OpenAI)
-            response = client.chat.completions.create(
-                model=model_name,
-                messages=[
-                    {"role": "user", "content": prompt_final}
-                ],
-                max_tokens=request.max_tokens,
-                temperature=request.temperature,
-            )
-            
-            # Extraer respuesta
-            text = response.choices[0].message.content
-            
-            return {
-                "text": text,
+            async for chunk in stream:
+                if await http_request.is_disconnected():
+                    logger.info(f"Cliente desconectado, se cancela la generación con {model_name}")
+                    return
+                if chunk.choices:
+                    choice = chunk.choices[0]
+                    if choice.delta.content:
+                        partes.append(choice.delta.content)
+                        yield _evento_sse({"text": choice.delta.content})
+                    finish_reason = choice.finish_reason or finish_reason
+                uso = _uso_de_chunk(chunk) or uso
+
+            fin = {
                 "model": model_name,
-                "prompt_tokens": response.usage.prompt_tokens,
-                "completion_tokens": response.usage.completion_tokens,
-                "total_tokens": response.usage.total_tokens,
-                "finish_reason": response.choices[0].finish_reason,
+                "finish_reason": finish_reason,
+                "prompt_tokens": uso.prompt_tokens if uso else None,
+                "completion_tokens": uso.completion_tokens if uso else None,
+                "total_tokens": uso.total_tokens if uso else None,
                 "contexto_usado": request.usar_contexto
             }
-                
+            control_admision.ajustar(tokens_reservados, uso.total_tokens if uso else None)
+            _registrar_uso(model_name, uso)
+            if request.usar_cache and finish_reason == "stop":
+                cache_respuestas.guardar(request.prompt, particion, {"text": "".join(partes), **fin})
+            yield _evento_sse({
+                **fin, "cache": None, "contexto": _metadata_contexto(info_contexto), "enrutamiento": enrutamiento
+            }, "fin")
         except Exception as e:
-            error_msg = str(e)
-            logger.warning(f"Fallo con modelo {model_name}: {error_msg}")
-            last_error = error_msg
-            
-            # Si es un error de modelo no encontrado, probar el siguiente
-            if "model" in error_msg.lower() and "not found" in error_msg.lower():
-                continue
-            else:
-                # Otros errores (rate limit, auth, etc.) no reintentar
-                raise HTTPException(status_code=500, detail=f"Error al generar con {model_name}: {error_msg}")
-    
-    # Si llegamos aquí, ningún modelo funcionó
-    raise HTTPException(
-        status_code=502,
-        detail=f"No se pudo generar contenido con ningún modelo disponible. Último error: {last_error}"
+            # La petición ya llegó a Groq: la reserva queda cobrada
+            enrutador.registrar(model_name, time.perf_counter() - inicio, e)
+            errores_total.inc("groq_stream")
+            logger.warning(f"Error durante el streaming con {model_name}: {e}")
+            yield _evento_sse({"error": str(e), "model": model_name}, "error")
+        finally:
+            # Cierra la conexión con Groq (también al cancelarse por desconexión)
+            await stream.close()
+
+    return StreamingResponse(
+        eventos(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
 
 
 @router.post("/sugerencia")
-async def crear_sugerencia(
+def crear_sugerencia(
     sugerencia: schemas.BuzonSugerenciasBase,
     db: Session = Depends(get_db)
 ):
@@ -476,32 +987,33 @@ async def crear_sugerencia(
         raise HTTPException(status_code=500, detail=f"Error al procesar la sugerencia: {str(e)}")
 
 
+@router.get("/cache")
+async def estadisticas_cache():
+    """Aciertos, fallos y tamaño de las cachés de respuestas y de contexto, y llamadas deduplicadas."""
+    return {
+        **cache_respuestas.estadisticas(),
+        "contexto": cache_contexto.estadisticas(),
+        "coalescencia": coalescedor.estadisticas(),
+    }
+
+
+@router.get("/admision")
+async def estadisticas_admision():
+    """Cola de espera, cupo disponible en las cuotas de Groq y peticiones descartadas."""
+    return control_admision.estadisticas()
+
+
+@router.get("/modelos/estado")
+async def estado_modelos():
+    """Latencia, tasa de error y circuito de cada modelo, y motivos de elección."""
+    return enrutador.estadisticas()
+
+
 @router.get("/models")
 async def list_models():
     """Lista los modelos disponibles de Groq."""
     return {
-        "models": [
-            {
-                "name": "llama-3.3-70b-versatile",
-                "description": "LLaMA 3.3 70B - Más nuevo y potente, excelente para español",
-                "context_window": 32768
-            },
-            {
-                "name": "llama-3.1-70b-versatile", 
-                "description": "LLaMA 3.1 70B - Muy bueno, equilibrio perfecto",
-                "context_window": 131072
-            },
-            {
-                "name": "mixtral-8x7b-32768",
-                "description": "Mixtral 8x7B - Excelente para español y multilingüe",
-                "context_window": 32768
-            },
-            {
-                "name": "llama-3.1-8b-instant",
-                "description": "LLaMA 3.1 8B - Ultra rápido para respuestas simples",
-                "context_window": 131072
-            }
-        ],
-        "count": 4,
+        "models": MODELOS_INFO,
+        "count": len(MODELOS_INFO),
         "provider": "Groq"
     }
\ No newline at end of file
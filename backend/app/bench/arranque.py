@@ -0,0 +1,189 @@
+"""Benchmark del arranque en frío: tiempo de importación y hasta la primera petición.
+
+Por cada modo de arranque levanta uvicorn en un proceso nuevo (con un Groq
+falso y un SQLite temporal con datos de prueba) y mide, desde que se lanza el
+proceso:
+
+* ``puerto_s``: primera respuesta HTTP de cualquier tipo (el puerto acepta).
+* ``primera_s``: primera respuesta 200 de ``/procesar_mensaje``.
+* ``listo_s``: ``/ready`` responde 200 (terminó el calentamiento).
+* La latencia de la primera y la segunda petición al chat y a ``/ai/generate``:
+  la diferencia es lo que la primera petición paga por lo que no se calentó.
+
+Modos: ``bloqueante`` (calienta antes de abrir el puerto), ``fondo``
+(``ARRANQUE_EN_FONDO=1``) y ``minimo`` (una conexión y sin conectar con Groq).
+
+Uso (desde backend/app):
+    python -m bench.arranque
+    python -m bench.arranque --modo fondo --repeticiones 5 --importaciones 0
+    python -m bench.arranque --detalle 20        # módulos que más tardan en importarse
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from bench.carga import (RUTA_APP, _detener, _puerto_libre, entorno_app, iniciar_groq_falso, preparar_bd)
+from bench.groq_falso import agregar_argumentos
+
+MODOS = {
+    "bloqueante": {},
+    "fondo": {"ARRANQUE_EN_FONDO": "1"},
+    "minimo": {"ARRANQUE_CONEXIONES": "1", "ARRANQUE_CONECTAR_GROQ": "0"},
+}
+
+MENSAJE = {"mensaje": "CC", "usar_sesion": True}
+PREGUNTA_IA = {"prompt": "¿Cómo solicito un certificado de notas? (arranque {n})", "max_tokens": 64,
+               "usar_cache": False, "usar_pln": False}
+
+CODIGO_IMPORTACION = (
+    "import time; inicio = time.perf_counter(); import main; "
+    "print(time.perf_counter() - inicio)"
+)
+
+
+def medir_importacion(entorno: dict, repeticiones: int) -> dict:
+    """Segundos de ``import main`` en procesos nuevos (sin lifespan)."""
+    tiempos = []
+    for _ in range(repeticiones):
+        salida = subprocess.run([sys.executable, "-c", CODIGO_IMPORTACION], cwd=RUTA_APP, check=True,
+                                capture_output=True, text=True, env={**os.environ, **entorno})
+        tiempos.append(float(salida.stdout.strip().splitlines()[-1]))
+    return {"mediana_s": round(statistics.median(tiempos), 3), "min_s": round(min(tiempos), 3),
+            "max_s": round(max(tiempos), 3)}
+
+
+def detalle_importacion(entorno: dict, cantidad: int) -> list:
+    """Módulos de primer nivel con mayor tiempo acumulado según ``-X importtime``."""
+    salida = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=RUTA_APP, check=True,
+                            capture_output=True, text=True, env={**os.environ, **entorno})
+    modulos = []
+    for linea in salida.stderr.splitlines():
+        if not linea.startswith("import time:") or "cumulative" in linea:
+            continue
+        _, acumulado, nombre = linea.split("|")
+        # La sangría del nombre indica la profundidad en el árbol de importaciones
+        if len(nombre) - len(nombre.lstrip()) <= 5:
+            modulos.append((int(acumulado) / 1000, nombre.strip()))
+    return sorted(modulos, reverse=True)[:cantidad]
+
+
+def _latencia(cliente: httpx.Client, metodo: str, ruta: str, cuerpo: dict = None) -> float:
+    inicio = time.perf_counter()
+    respuesta = cliente.request(metodo, ruta, json=cuerpo)
+    respuesta.raise_for_status()
+    return round((time.perf_counter() - inicio) * 1000, 1)
+
+
+def medir_arranque(entorno: dict, limite: float = 60.0, intervalo: float = 0.005) -> dict:
+    """Lanza uvicorn y mide los hitos del arranque. Retorna segundos y milisegundos."""
+    puerto = _puerto_libre()
+    url = f"http://127.0.0.1:{puerto}"
+    inicio = time.perf_counter()
+    proceso = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(puerto),
+         "--log-level", "warning", "--no-access-log"],
+        cwd=RUTA_APP, env={**os.environ, **entorno},
+    )
+    fila = {}
+    try:
+        with httpx.Client(base_url=url, timeout=limite) as cliente:
+            # Primera petición al chat apenas el puerto acepte conexiones
+            while "primera_s" not in fila:
+                if proceso.poll() is not None:
+                    raise RuntimeError(f"uvicorn terminó al iniciar (código {proceso.returncode})")
+                if time.perf_counter() - inicio > limite:
+                    raise RuntimeError(f"La app no respondió en {limite} s")
+                try:
+                    envio = time.perf_counter()
+                    respuesta = cliente.post("/procesar_mensaje", json=MENSAJE)
+                except httpx.TransportError:
+                    time.sleep(intervalo)
+                    continue
+                fila.setdefault("puerto_s", round(envio - inicio, 3))
+                if respuesta.status_code == 200:
+                    fila["primera_s"] = round(time.perf_counter() - inicio, 3)
+                    fila["chat_primera_ms"] = round((time.perf_counter() - envio) * 1000, 1)
+                else:
+                    time.sleep(intervalo)
+            while cliente.get("/ready").status_code != 200:
+                if proceso.poll() is not None or time.perf_counter() - inicio > limite:
+                    raise RuntimeError("El calentamiento no terminó (revisa /ready)")
+                time.sleep(intervalo)
+            fila["listo_s"] = round(time.perf_counter() - inicio, 3)
+            fila["chat_segunda_ms"] = _latencia(cliente, "POST", "/procesar_mensaje", MENSAJE)
+            for numero, clave in ((1, "ia_primera_ms"), (2, "ia_segunda_ms")):
+                pregunta = {**PREGUNTA_IA, "prompt": PREGUNTA_IA["prompt"].format(n=numero)}
+                fila[clave] = _latencia(cliente, "POST", "/ai/generate", pregunta)
+            fila["etapas_ms"] = {nombre: etapa["ms"] for nombre, etapa in cliente.get("/ready").json()["etapas"].items()}
+    finally:
+        _detener(proceso)
+    return fila
+
+
+def resumir(filas: list) -> dict:
+    """Mediana de cada medida entre repeticiones."""
+    resumen = {}
+    for clave in filas[0]:
+        if clave == "etapas_ms":
+            resumen[clave] = {etapa: round(statistics.median(f[clave][etapa] for f in filas), 1)
+                              for etapa in filas[0][clave]}
+        else:
+            resumen[clave] = round(statistics.median(f[clave] for f in filas), 3)
+    return resumen
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tiempo de arranque en frío del chatbot")
+    parser.add_argument("--modo", action="append", choices=sorted(MODOS), help="Modo a medir (repetible; por defecto todos)")
+    parser.add_argument("--repeticiones", type=int, default=3, help="Arranques por modo")
+    parser.add_argument("--importaciones", type=int, default=5, help="Procesos para medir 'import main' (0 = omitir)")
+    parser.add_argument("--detalle", type=int, default=0, help="Muestra los N módulos más lentos de importar")
+    parser.add_argument("--groq-url", help="Usa un servidor compatible ya levantado en lugar de bench/groq_falso.py")
+    parser.add_argument("--database-url", help="BD de la app (por defecto un SQLite temporal con datos de prueba)")
+    parser.add_argument("--semilla", type=int)
+    parser.add_argument("--json", help="Guarda los resultados en este archivo")
+    agregar_argumentos(parser)
+    parser.set_defaults(latencia=50.0, distribucion="fija")
+    args = parser.parse_args()
+    args.cuotas_reales = False
+
+    resultados = {}
+    procesos = []
+    with tempfile.TemporaryDirectory(prefix="arranque_") as directorio:
+        try:
+            groq_url = args.groq_url
+            if not groq_url:
+                proceso, groq_url = iniciar_groq_falso(args)
+                procesos.append(proceso)
+            entorno = entorno_app(args, groq_url, directorio)
+            # Las sesiones quedan en memoria: no se mide la creación de otro SQLite
+            entorno["SESIONES_ALMACEN"] = "memoria"
+            if not args.database_url:
+                preparar_bd(entorno["DATABASE_URL"])
+
+            if args.importaciones:
+                resultados["importacion"] = medir_importacion(entorno, args.importaciones)
+                print(f"import main: {resultados['importacion']}", flush=True)
+            if args.detalle:
+                print("Módulos más lentos (ms acumulados):")
+                for ms, nombre in detalle_importacion(entorno, args.detalle):
+                    print(f"  {ms:8.1f}  {nombre}")
+
+            for modo in args.modo or list(MODOS):
+                filas = [medir_arranque({**entorno, **MODOS[modo]}) for _ in range(args.repeticiones)]
+                resultados[modo] = resumir(filas)
+                print(f"{modo:11} {json.dumps(resultados[modo], ensure_ascii=False)}", flush=True)
+        finally:
+            for proceso in procesos:
+                _detener(proceso)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, ensure_ascii=False, indent=2)
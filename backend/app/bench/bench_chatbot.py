@@ -0,0 +1,356 @@
+"""Microbenchmark de ``ChatBot.respuesta`` por estado, con repetición del historial.
+
+Recorre todas las ramas de la máquina de estados (pidiendo_tipo, pidiendo_numero,
+en_opciones, en_encuesta, en_sugerencia, ordenar_materias, reiniciar) con los
+archivos de opciones reales y una BD SQLite en memoria, y mide por turno la
+latencia, la memoria asignada (tracemalloc) y las consultas SQL.
+
+Uso (desde backend/app):
+    python -m bench.bench_chatbot
+    python -m bench.bench_chatbot --guardar-base bench/base_chatbot.json
+    python -m bench.bench_chatbot --comparar bench/base_chatbot.json
+    python -m bench.bench_chatbot --exportar conversaciones.jsonl --url postgresql://...
+    python -m bench.bench_chatbot --repetir conversaciones.jsonl --comparar bench/base_chatbot.json
+"""
+import argparse
+import copy
+import json
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from pathlib import Path
+from types import SimpleNamespace
+
+# La BD del benchmark se define antes de importar la app
+os.environ["DATABASE_URL"] = os.getenv("BENCH_DATABASE_URL", "sqlite://")
+# Encuestas e historial se escriben en el momento para contarlos en el turno
+os.environ["OUTBOX_HABILITADO"] = "0"
+
+ruta = Path(__file__).resolve().parent.parent
+sys.path.append(str(ruta))
+
+from sqlalchemy import create_engine, event, text
+
+from controller import models
+from controller.databaseconfig import engine, session_local
+from model.arbol_opciones import registro_opciones
+from model.chat_bot import ChatBot
+
+ESTUDIANTE = "1001"
+PROFESOR = "2002"
+# Conversaciones del historial separadas por más de este tiempo sin mensajes
+PAUSA_CONVERSACION = timedelta(minutes=30)
+
+# Cada escenario parte de un estado y envía los mensajes en orden
+ESCENARIOS = [
+    {"nombre": "identificacion", "mensajes": ["CC", ESTUDIANTE]},
+    {"nombre": "resultado_menu", "inicio": "en_opciones", "mensajes": ["1", "1", "no"]},
+    {"nombre": "texto_libre", "inicio": "en_opciones", "mensajes": ["olvidé la contraseña del correo", "si"]},
+    {"nombre": "opcion_invalida", "inicio": "en_opciones", "mensajes": ["99", "quiero hablar de algo sin relación"]},
+    {"nombre": "encuesta", "inicio": "en_opciones", "mensajes": ["6", "1", "1", "4"]},
+    {"nombre": "encuesta_invalida", "inicio": "en_opciones", "mensajes": ["6", "1", "9"]},
+    {"nombre": "sugerencia", "inicio": "en_opciones",
+     "mensajes": ["7", "3", "2", "La plataforma se cae en semana de parciales"]},
+    {"nombre": "priorizar_desde_menu", "inicio": "en_opciones", "mensajes": ["11"]},
+    {"nombre": "ordenar_materias", "inicio": "ordenar_materias", "mensajes": [""]},
+    {"nombre": "hoja_calificaciones", "arbol": "profesor", "inicio": "en_opciones",
+     "documento": PROFESOR, "mensajes": ["8", "no"]},
+    {"nombre": "conversacion_completa",
+     "mensajes": ["CC", ESTUDIANTE, "3", "3", "si", "4", "1", "si", "2", "1", "no"]},
+]
+
+
+def preparar_bd():
+    """Crea el esquema y datos mínimos (usuario, materias, matrícula y profesor)."""
+    models.Base.metadata.create_all(bind=engine)
+    with engine.begin() as conexion:
+        conexion.execute(text("DELETE FROM profesores"))
+        for tabla in ("estudiante_materias", "materias", "estudiante", "usuarios"):
+            conexion.execute(text(f"DELETE FROM {tabla}"))
+        conexion.execute(text(
+            "INSERT INTO usuarios (id, nombre, apellidos, rol, tipo_id) VALUES "
+            f"({ESTUDIANTE}, 'Ana', 'Restrepo', 'estudiante', 'CC'), ({PROFESOR}, 'Luis', 'Mejía', 'profesor', 'CC')"
+        ))
+        conexion.execute(text(f"INSERT INTO estudiante (id, nombre, apellidos, tipo_id) VALUES ({ESTUDIANTE}, 'Ana', 'Restrepo', 'CC')"))
+        materias = [(1, "Cálculo", 4), (2, "Física", 3), (3, "Programación", 4), (4, "Ética", 1), (5, "Inglés", 2)]
+        for id_materia, nombre, creditos in materias:
+            conexion.execute(text("INSERT INTO materias (id_materia, nombre_materia, creditos) VALUES (:i, :n, :c)"),
+                             {"i": id_materia, "n": nombre, "c": creditos})
+            conexion.execute(text("INSERT INTO estudiante_materias (id_estudiante, id_materia) VALUES (:e, :i)"),
+                             {"e": ESTUDIANTE, "i": id_materia})
+        conexion.execute(text("INSERT INTO profesores (id, link_hoja) VALUES (:id, :link)"),
+                         {"id": PROFESOR, "link": "https://docs.google.com/spreadsheets/d/calificaciones"})
+
+
+class ContadorConsultas:
+    """Cuenta las sentencias SQL que ejecuta el motor."""
+
+    def __init__(self, motor):
+        self.total = 0
+        event.listen(motor, "before_cursor_execute", self._contar)
+
+    def _contar(self, *args):
+        self.total += 1
+
+
+class Conversacion:
+    """Mantiene estado, identificación y nodo actual como lo hace el cliente (modo compatible)."""
+
+    def __init__(self, arbol, estado: str = "pidiendo_tipo", identificacion: dict = None):
+        self.arbol = arbol
+        self.estado = estado
+        self.identificacion = identificacion or {}
+        self.nodo_actual = arbol.datos if estado == "en_opciones" else None
+
+    def turno(self, mensaje: str, db):
+        peticion = SimpleNamespace(mensaje=mensaje, estado=self.estado, identificacion=self.identificacion,
+                                   nodo_actual=self.nodo_actual)
+        respuesta = ChatBot(peticion, self.arbol.datos, self.arbol, db=db).respuesta()
+        if isinstance(respuesta, dict):
+            self.estado = respuesta["nuevo_estado"]
+            self.identificacion = respuesta.get("identificacion") or self.identificacion
+            self.nodo_actual = respuesta.get("nodo_actual")
+        return respuesta
+
+
+def _nueva_conversacion(escenario: dict) -> Conversacion:
+    arbol = registro_opciones.arbol(escenario.get("arbol", "general"))
+    estado = escenario.get("inicio", "pidiendo_tipo")
+    identificacion = {} if estado == "pidiendo_tipo" else {"tipo": "CC", "numero": escenario.get("documento", ESTUDIANTE)}
+    return Conversacion(arbol, estado, copy.deepcopy(identificacion))
+
+
+def _salida(respuesta) -> dict:
+    """Lo observable de un turno, para comparar el comportamiento entre versiones."""
+    if not isinstance(respuesta, dict):
+        return {"nuevo_estado": None, "mensajes": [str(respuesta)]}
+    return {"nuevo_estado": respuesta["nuevo_estado"], "mensajes": respuesta["mensajes"]}
+
+
+def _ejecutar(escenario: dict, consultas: ContadorConsultas = None, memoria: bool = False) -> list:
+    """Una pasada del escenario. Retorna por turno (estado, salida, segundos, consultas, bytes pico)."""
+    conversacion = _nueva_conversacion(escenario)
+    turnos = []
+    for mensaje in escenario["mensajes"]:
+        estado = conversacion.estado
+        db = session_local()
+        try:
+            antes = consultas.total if consultas else 0
+            if memoria:
+                tracemalloc.reset_peak()
+                base = tracemalloc.get_traced_memory()[0]
+            inicio = time.perf_counter()
+            respuesta = conversacion.turno(mensaje, db)
+            segundos = time.perf_counter() - inicio
+            pico = tracemalloc.get_traced_memory()[1] - base if memoria else 0
+            turnos.append((estado, _salida(respuesta), segundos, (consultas.total - antes) if consultas else 0, pico))
+        finally:
+            db.close()
+    return turnos
+
+
+def _percentil(valores: list, p: float) -> float:
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(p * len(valores)))] if valores else 0.0
+
+
+def medir(escenarios: list, iteraciones: int) -> dict:
+    """Mide cada escenario: comportamiento, consultas, memoria y latencia por turno."""
+    consultas = ContadorConsultas(engine)
+    resultados = {}
+    for escenario in escenarios:
+        # Primera pasada: salida de referencia y consultas (también calienta cachés)
+        referencia = _ejecutar(escenario, consultas)
+        tracemalloc.start()
+        try:
+            memoria = _ejecutar(escenario, memoria=True)
+        finally:
+            tracemalloc.stop()
+        latencias = [[] for _ in referencia]
+        for _ in range(iteraciones):
+            for i, turno in enumerate(_ejecutar(escenario)):
+                latencias[i].append(turno[2])
+        resultados[escenario["nombre"]] = [
+            {
+                "mensaje": mensaje,
+                "estado": estado,
+                "salida": salida,
+                "p50_us": round(_percentil(latencias[i], 0.5) * 1e6, 1),
+                "p95_us": round(_percentil(latencias[i], 0.95) * 1e6, 1),
+                "consultas": n_consultas,
+                "kb_pico": round(memoria[i][4] / 1024, 1),
+            }
+            for i, (mensaje, (estado, salida, _, n_consultas, _)) in enumerate(zip(escenario["mensajes"], referencia))
+        ]
+    return resultados
+
+
+def resumen_por_estado(resultados: dict) -> dict:
+    por_estado = {}
+    for turnos in resultados.values():
+        for turno in turnos:
+            por_estado.setdefault(turno["estado"], []).append(turno)
+    return {
+        estado: {
+            "turnos": len(turnos),
+            "p50_us": round(_percentil([t["p50_us"] for t in turnos], 0.5), 1),
+            "p95_us": round(max(t["p95_us"] for t in turnos), 1),
+            "consultas_max": max(t["consultas"] for t in turnos),
+            "kb_pico_max": max(t["kb_pico"] for t in turnos),
+        }
+        for estado, turnos in sorted(por_estado.items())
+    }
+
+
+def imprimir(resultados: dict):
+    print(f"{'escenario':<24}{'turno':>6}  {'estado':<18}{'p50 µs':>10}{'p95 µs':>10}{'consultas':>11}{'KB pico':>9}")
+    for nombre, turnos in resultados.items():
+        for i, turno in enumerate(turnos):
+            print(f"{nombre:<24}{i + 1:>6}  {turno['estado']:<18}{turno['p50_us']:>10}{turno['p95_us']:>10}"
+                  f"{turno['consultas']:>11}{turno['kb_pico']:>9}")
+    print("\nPor estado:")
+    for estado, datos in resumen_por_estado(resultados).items():
+        print(f"  {estado:<18} {datos}")
+
+
+def comparar(resultados: dict, base: dict, tolerancia: float) -> list:
+    """Diferencias de comportamiento y regresiones de latencia/consultas frente a la base."""
+    problemas = []
+    for nombre, turnos in resultados.items():
+        turnos_base = base.get(nombre)
+        if turnos_base is None:
+            continue
+        if len(turnos_base) != len(turnos):
+            problemas.append(f"{nombre}: {len(turnos)} turnos (base {len(turnos_base)})")
+            continue
+        for i, (turno, previo) in enumerate(zip(turnos, turnos_base), 1):
+            if turno["salida"] != previo["salida"] or turno["estado"] != previo["estado"]:
+                problemas.append(f"{nombre} turno {i}: comportamiento distinto\n"
+                                 f"    base:  {previo['salida']}\n    ahora: {turno['salida']}")
+            if turno["consultas"] > previo["consultas"]:
+                problemas.append(f"{nombre} turno {i}: {turno['consultas']} consultas (base {previo['consultas']})")
+            # Se ignoran turnos muy rápidos donde el ruido domina
+            if turno["p50_us"] > max(previo["p50_us"], 20) * (1 + tolerancia):
+                problemas.append(f"{nombre} turno {i}: p50 {turno['p50_us']} µs (base {previo['p50_us']} µs)")
+    return problemas
+
+
+# --- Historial -------------------------------------------------------------
+
+def exportar_historial(url: str, salida: str, limite: int = None) -> int:
+    """Exporta chat_history como conversaciones (una por línea) para repetirlas.
+
+    El turno ``pidiendo_tipo`` se guarda sin documento, así que cada conversación
+    empieza en su turno ``pidiendo_numero`` y el tipo se toma de esa fila.
+    """
+    consulta = ("SELECT tipo_documento, numero_documento, mensaje, estado, created_at FROM chat_history "
+                "WHERE numero_documento IS NOT NULL ORDER BY numero_documento, created_at, id")
+    if limite:
+        consulta += f" LIMIT {int(limite)}"
+    motor = create_engine(url)
+    conversaciones = []
+    actual, clave, ultima = None, None, None
+    with motor.connect() as conexion:
+        for tipo, numero, mensaje, estado, creado in conexion.execute(text(consulta)):
+            if isinstance(creado, str):
+                # SQLite devuelve las fechas como texto
+                creado = datetime.fromisoformat(creado)
+            nueva = (
+                actual is None or (tipo, numero) != clave or estado == "pidiendo_numero"
+                or (creado and ultima and creado - ultima > PAUSA_CONVERSACION)
+            )
+            if nueva:
+                if estado != "pidiendo_numero":
+                    # Fragmento sin inicio (p. ej. modo sesión): no se puede repetir
+                    actual = None
+                    clave, ultima = (tipo, numero), creado
+                    continue
+                actual = {"tipo": tipo, "turnos": [{"mensaje": tipo, "estado": "pidiendo_tipo"}]}
+                conversaciones.append(actual)
+            if actual is not None:
+                actual["turnos"].append({"mensaje": mensaje, "estado": estado})
+            clave, ultima = (tipo, numero), creado
+    motor.dispose()
+    with open(salida, "w", encoding="utf-8") as f:
+        for conversacion in conversaciones:
+            f.write(json.dumps(conversacion, ensure_ascii=False) + "\n")
+    return len(conversaciones)
+
+
+def escenarios_de_historial(ruta_archivo: str) -> tuple:
+    """Convierte el archivo exportado en escenarios. Retorna (escenarios, estados registrados)."""
+    escenarios, estados = [], {}
+    with open(ruta_archivo, encoding="utf-8") as f:
+        for i, linea in enumerate(f, 1):
+            if not linea.strip():
+                continue
+            conversacion = json.loads(linea)
+            nombre = f"historial_{i}"
+            escenarios.append({"nombre": nombre, "mensajes": [t["mensaje"] for t in conversacion["turnos"]]})
+            estados[nombre] = [t["estado"] for t in conversacion["turnos"]]
+    return escenarios, estados
+
+
+def divergencias_historial(resultados: dict, estados: dict) -> int:
+    """Turnos donde el estado repetido no coincide con el que quedó en el historial."""
+    return sum(
+        1
+        for nombre, turnos in resultados.items()
+        for turno, estado in zip(turnos, estados.get(nombre, []))
+        if turno["estado"] != estado
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de la máquina de estados del chatbot")
+    parser.add_argument("--iteraciones", type=int, default=200)
+    parser.add_argument("--escenario", action="append", help="Solo los escenarios con este nombre")
+    parser.add_argument("--repetir", help="Archivo JSONL exportado con --exportar")
+    parser.add_argument("--guardar-base", help="Guarda los resultados como base de comparación")
+    parser.add_argument("--comparar", help="Compara con una base guardada (sale con 1 si hay diferencias)")
+    parser.add_argument("--tolerancia", type=float, default=0.25, help="Aumento de p50 permitido (0.25 = 25%%)")
+    parser.add_argument("--exportar", help="Exporta chat_history de --url a este archivo y termina")
+    parser.add_argument("--url", help="BD de origen para --exportar")
+    parser.add_argument("--limite", type=int)
+    parser.add_argument("--json", action="store_true", help="Imprime los resultados en JSON")
+    parser.add_argument("--preparar", action="store_true",
+                        help="Solo crea el esquema y los datos de prueba en BENCH_DATABASE_URL (lo usa bench/carga.py)")
+    args = parser.parse_args()
+
+    if args.exportar:
+        if not args.url:
+            parser.error("--exportar requiere --url")
+        print(f"{exportar_historial(args.url, args.exportar, args.limite)} conversaciones exportadas")
+        sys.exit(0)
+
+    preparar_bd()
+    if args.preparar:
+        sys.exit(0)
+    estados_historial = {}
+    if args.repetir:
+        escenarios, estados_historial = escenarios_de_historial(args.repetir)
+    else:
+        escenarios = [e for e in ESCENARIOS if not args.escenario or e["nombre"] in args.escenario]
+    resultados = medir(escenarios, args.iteraciones)
+
+    if args.json:
+        print(json.dumps({"escenarios": resultados, "por_estado": resumen_por_estado(resultados)},
+                         ensure_ascii=False, indent=2))
+    else:
+        imprimir(resultados)
+    if estados_historial:
+        print(f"\nTurnos con estado distinto al del historial: {divergencias_historial(resultados, estados_historial)}")
+
+    if args.guardar_base:
+        with open(args.guardar_base, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, ensure_ascii=False, indent=2)
+        print(f"\nBase guardada en {args.guardar_base}")
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            problemas = comparar(resultados, json.load(f), args.tolerancia)
+        print(f"\nComparación con {args.comparar}: {'sin diferencias' if not problemas else ''}")
+        for problema in problemas:
+            print(f"  - {problema}")
+        sys.exit(1 if problemas else 0)
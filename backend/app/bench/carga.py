@@ -0,0 +1,369 @@
+"""Prueba de carga de punta a punta con un Groq falso e inyección de fallos.
+
+Genera tráfico mixto (conversaciones de ``/procesar_mensaje`` en modo sesión y
+preguntas a ``/ai/generate``) a una tasa objetivo, en lazo abierto: las
+peticiones salen a su hora aunque las anteriores no hayan terminado, y la
+latencia se mide desde la hora programada (sin omisión coordinada).
+
+Por cada número de workers de uvicorn y cada tasa reporta throughput,
+percentiles de latencia y tasa de error, y la tasa máxima que cumple el SLO:
+la curva de escalamiento por núcleo.
+
+Uso (desde backend/app):
+    python -m bench.carga --workers 1,2,4 --rps 20,50,100 --duracion 20
+    python -m bench.carga --en-proceso --rps 30 --mezcla-ia 0.5 --tasa-429 0.05
+    python -m bench.carga --url http://localhost:8000 --rps 10      # app ya levantada
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import deque
+from pathlib import Path
+
+import httpx
+
+from bench.groq_falso import agregar_argumentos
+
+RUTA_APP = Path(__file__).resolve().parent.parent
+
+# Guiones de conversación (modo sesión); cada paso es un mensaje del estudiante
+CONVERSACIONES = [
+    ["CC", "1001", "1", "1", "no"],
+    ["CC", "1001", "3", "3", "si", "5", "2", "no"],
+    ["TI", "77", "olvidé la contraseña del correo", "no"],
+    ["CC", "1001", "6", "1", "2", "5", "no"],
+    ["CC", "1001", "11", "no"],
+]
+
+PREGUNTAS_IA = [
+    "¿Cuáles son los requisitos para solicitar un certificado de notas?",
+    "¿Qué hago si no puedo entrar a la plataforma virtual desde mi casa?",
+    "¿Cómo organizo mejor mi tiempo de estudio durante los parciales?",
+    "¿Qué diferencias hay entre cancelar una materia y retirarla?",
+    "Explícame cómo se calcula el promedio ponderado del semestre",
+]
+
+
+def _percentil(valores: list, p: float) -> float:
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(p * len(valores)))] if valores else 0.0
+
+
+class Resultados:
+    """Latencias y resultados por endpoint."""
+
+    def __init__(self):
+        self.latencias = {}
+        self.estados = {}
+        self.fuentes = {}
+
+    def registrar(self, endpoint: str, segundos: float, estado: str, fuente: str = None):
+        self.latencias.setdefault(endpoint, []).append(segundos)
+        conteo = self.estados.setdefault(endpoint, {})
+        conteo[estado] = conteo.get(estado, 0) + 1
+        if fuente:
+            self.fuentes[fuente] = self.fuentes.get(fuente, 0) + 1
+
+    def resumen(self, duracion: float) -> dict:
+        resumen = {}
+        for endpoint, latencias in sorted(self.latencias.items()):
+            estados = self.estados[endpoint]
+            ok = estados.get("200", 0)
+            resumen[endpoint] = {
+                "peticiones": len(latencias),
+                "ok": ok,
+                "tasa_error": round(1 - ok / len(latencias), 4),
+                "throughput_rps": round(ok / duracion, 2),
+                "p50_ms": round(_percentil(latencias, 0.5) * 1000, 1),
+                "p90_ms": round(_percentil(latencias, 0.9) * 1000, 1),
+                "p99_ms": round(_percentil(latencias, 0.99) * 1000, 1),
+                "max_ms": round(max(latencias) * 1000, 1),
+                "estados": estados,
+            }
+        todas = [l for latencias in self.latencias.values() for l in latencias]
+        total_ok = sum(e.get("200", 0) for e in self.estados.values())
+        resumen["total"] = {
+            "peticiones": len(todas),
+            "ok": total_ok,
+            "tasa_error": round(1 - total_ok / len(todas), 4) if todas else 0.0,
+            "throughput_rps": round(total_ok / duracion, 2),
+            "p50_ms": round(_percentil(todas, 0.5) * 1000, 1),
+            "p99_ms": round(_percentil(todas, 0.99) * 1000, 1),
+            # Ley de Little: peticiones en curso en promedio
+            "concurrencia_media": round(sum(todas) / duracion, 1),
+            "fuentes_ia": dict(self.fuentes),
+        }
+        return resumen
+
+
+class GeneradorCarga:
+    """Envía tráfico mixto a ``rps`` peticiones por segundo durante ``duracion`` segundos."""
+
+    def __init__(self, cliente: httpx.AsyncClient, rps: float, mezcla_ia: float = 0.3, unicas: float = 0.5,
+                 poisson: bool = True, semilla: int = None):
+        self.cliente = cliente
+        self.rps = rps
+        self.mezcla_ia = mezcla_ia
+        self.unicas = unicas
+        self.poisson = poisson
+        self._azar = random.Random(semilla)
+        # Conversaciones esperando su siguiente turno (la respuesta anterior ya llegó)
+        self._listas = deque()
+        self._numero = 0
+
+    async def _turno_chat(self, programada: float, resultados: Resultados):
+        if self._listas:
+            conversacion = self._listas.popleft()
+        else:
+            conversacion = {"pasos": self._azar.choice(CONVERSACIONES), "i": 0, "session_id": None}
+        cuerpo = {"mensaje": conversacion["pasos"][conversacion["i"]], "usar_sesion": True}
+        if conversacion["session_id"]:
+            cuerpo["session_id"] = conversacion["session_id"]
+        try:
+            respuesta = await self.cliente.post("/procesar_mensaje", json=cuerpo)
+            estado = str(respuesta.status_code)
+            if respuesta.status_code == 200:
+                conversacion["session_id"] = respuesta.json().get("session_id")
+                conversacion["i"] += 1
+                if conversacion["i"] < len(conversacion["pasos"]):
+                    self._listas.append(conversacion)
+        except httpx.HTTPError as e:
+            estado = type(e).__name__
+        resultados.registrar("/procesar_mensaje", time.perf_counter() - programada, estado)
+
+    async def _pregunta_ia(self, programada: float, resultados: Resultados):
+        cuerpo = {"prompt": self._azar.choice(PREGUNTAS_IA), "max_tokens": 256}
+        if self._azar.random() < self.unicas:
+            # Pregunta nueva: sin caché (la aproximada la confundiría con las repetidas) y sin agrupar
+            self._numero += 1
+            cuerpo.update(prompt=f"{cuerpo['prompt']} (consulta {self._numero})", usar_cache=False)
+        fuente = None
+        try:
+            respuesta = await self.cliente.post("/ai/generate", json=cuerpo)
+            estado = str(respuesta.status_code)
+            if respuesta.status_code == 200:
+                datos = respuesta.json()
+                fuente = "cache" if datos.get("cache") else (datos.get("fuente") or "groq")
+        except httpx.HTTPError as e:
+            estado = type(e).__name__
+        resultados.registrar("/ai/generate", time.perf_counter() - programada, estado, fuente)
+
+    async def ejecutar(self, duracion: float, drenar: float = 60.0) -> tuple:
+        """Retorna (resultados, segundos transcurridos)."""
+        resultados = Resultados()
+        tareas = set()
+        inicio = time.perf_counter()
+        siguiente = inicio
+        while siguiente - inicio < duracion:
+            espera = siguiente - time.perf_counter()
+            if espera > 0:
+                await asyncio.sleep(espera)
+            tipo = self._pregunta_ia if self._azar.random() < self.mezcla_ia else self._turno_chat
+            tarea = asyncio.ensure_future(tipo(siguiente, resultados))
+            tareas.add(tarea)
+            tarea.add_done_callback(tareas.discard)
+            siguiente += self._azar.expovariate(self.rps) if self.poisson else 1 / self.rps
+        if tareas:
+            await asyncio.wait(tareas, timeout=drenar)
+            for tarea in list(tareas):
+                tarea.cancel()
+        return resultados, time.perf_counter() - inicio
+
+
+async def correr(base_url: str, rps: float, args, transporte=None) -> dict:
+    limites = httpx.Limits(max_connections=None, max_keepalive_connections=200)
+    async with httpx.AsyncClient(base_url=base_url, transport=transporte, limits=limites,
+                                 timeout=args.timeout) as cliente:
+        if args.calentamiento:
+            await GeneradorCarga(cliente, rps, args.mezcla_ia, args.unicas, not args.uniforme).ejecutar(args.calentamiento)
+        generador = GeneradorCarga(cliente, rps, args.mezcla_ia, args.unicas, not args.uniforme, args.semilla)
+        resultados, duracion = await generador.ejecutar(args.duracion)
+    return resultados.resumen(duracion)
+
+
+# --- Procesos ----------------------------------------------------------------
+
+def _puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _esperar(url: str, proceso: subprocess.Popen, limite: float = 60.0):
+    fin = time.monotonic() + limite
+    while time.monotonic() < fin:
+        if proceso.poll() is not None:
+            raise RuntimeError(f"El proceso terminó al iniciar (código {proceso.returncode})")
+        try:
+            if httpx.get(url, timeout=1).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} no respondió en {limite} s")
+
+
+def _detener(proceso: subprocess.Popen):
+    if proceso.poll() is None:
+        proceso.terminate()
+        try:
+            proceso.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            proceso.kill()
+
+
+def iniciar_groq_falso(args) -> tuple:
+    """Levanta bench/groq_falso.py. Retorna (proceso, url)."""
+    puerto = _puerto_libre()
+    comando = [sys.executable, "-m", "bench.groq_falso", "--puerto", str(puerto),
+               "--latencia", str(args.latencia), "--distribucion", args.distribucion,
+               "--dispersion", str(args.dispersion), "--tokens-por-segundo", str(args.tokens_por_segundo),
+               "--tokens-respuesta", str(args.tokens_respuesta), "--tasa-429", str(args.tasa_429),
+               "--tasa-500", str(args.tasa_500), "--tasa-timeout", str(args.tasa_timeout),
+               "--espera-timeout", str(args.espera_timeout), "--reintentar-en", str(args.reintentar_en)]
+    for modelo in args.modelo_caido or []:
+        comando += ["--modelo-caido", modelo]
+    if args.semilla is not None:
+        comando += ["--semilla", str(args.semilla)]
+    proceso = subprocess.Popen(comando, cwd=RUTA_APP)
+    url = f"http://127.0.0.1:{puerto}"
+    _esperar(url + "/falso/config", proceso)
+    return proceso, url
+
+
+def entorno_app(args, groq_url: str, directorio: str) -> dict:
+    """Variables de entorno de la app bajo prueba."""
+    entorno = {
+        "GROQ_BASE_URL": groq_url,
+        "GROQ_API_KEY": os.getenv("GROQ_API_KEY") or "falso",
+        "OUTBOX_SPOOL": os.path.join(directorio, "outbox.jsonl"),
+        # Sesiones compartidas entre workers
+        "SESIONES_ALMACEN": "sqlite",
+        "SESIONES_RUTA": os.path.join(directorio, "sesiones.db"),
+    }
+    if not args.cuotas_reales:
+        # Se mide la app, no las cuotas de Groq (la admisión descartaría casi todo)
+        entorno.update(GROQ_RPM="1000000", GROQ_TPM="1000000000")
+    entorno["DATABASE_URL"] = args.database_url or f"sqlite:///{os.path.join(directorio, 'carga.db')}"
+    return entorno
+
+
+def preparar_bd(url: str):
+    """Esquema y datos de prueba (los mismos de bench/bench_chatbot.py)."""
+    subprocess.run([sys.executable, "-m", "bench.bench_chatbot", "--preparar"], cwd=RUTA_APP, check=True,
+                   env={**os.environ, "BENCH_DATABASE_URL": url})
+
+
+def iniciar_app(workers: int, entorno: dict) -> tuple:
+    puerto = _puerto_libre()
+    proceso = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(puerto),
+         "--workers", str(workers), "--log-level", "warning", "--no-access-log"],
+        cwd=RUTA_APP, env={**os.environ, **entorno},
+    )
+    url = f"http://127.0.0.1:{puerto}"
+    _esperar(url + "/ready", proceso)
+    return proceso, url
+
+
+async def correr_en_proceso(rps_lista: list, args, entorno: dict) -> list:
+    """La app corre en este mismo event loop (un solo worker, sin red)."""
+    os.environ.update(entorno)
+    os.environ["SESIONES_ALMACEN"] = "memoria"
+    sys.path.append(str(RUTA_APP))
+    import main
+
+    filas = []
+    transporte = httpx.ASGITransport(app=main.app)
+    async with main.app.router.lifespan_context(main.app):
+        for rps in rps_lista:
+            filas.append({"workers": 1, "rps_objetivo": rps, **await correr("http://app", rps, args, transporte)})
+    return filas
+
+
+def imprimir(filas: list, slo_p99: float, max_error: float):
+    print(f"\n{'workers':>7}{'rps obj':>9}{'rps ok':>9}{'por worker':>11}{'p50 ms':>9}{'p99 ms':>9}"
+          f"{'error':>8}  endpoints (p99 ms / error)")
+    for fila in filas:
+        total = fila["total"]
+        detalle = "  ".join(f"{e}: {d['p99_ms']}/{d['tasa_error']:.1%}" for e, d in fila.items() if e.startswith("/"))
+        print(f"{fila['workers']:>7}{fila['rps_objetivo']:>9}{total['throughput_rps']:>9}"
+              f"{round(total['throughput_rps'] / fila['workers'], 1):>11}{total['p50_ms']:>9}{total['p99_ms']:>9}"
+              f"{total['tasa_error']:>8.1%}  {detalle}")
+    print(f"\nTasa máxima dentro del SLO (p99 <= {slo_p99} ms, error <= {max_error:.0%}), núcleos: {os.cpu_count()}")
+    for workers in sorted({f["workers"] for f in filas}):
+        dentro = [f for f in filas if f["workers"] == workers
+                  and f["total"]["p99_ms"] <= slo_p99 and f["total"]["tasa_error"] <= max_error]
+        mejor = max((f["total"]["throughput_rps"] for f in dentro), default=None)
+        print(f"  {workers} worker(s): {mejor if mejor is not None else 'ninguna'} rps")
+
+
+def _lista(texto: str, tipo) -> list:
+    return [tipo(valor) for valor in texto.split(",") if valor.strip()]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prueba de carga del chatbot con Groq falso")
+    parser.add_argument("--rps", default="10,25,50", help="Tasas objetivo separadas por coma")
+    parser.add_argument("--workers", default="1", help="Workers de uvicorn separados por coma")
+    parser.add_argument("--duracion", type=float, default=20.0, help="Segundos medidos por tasa")
+    parser.add_argument("--calentamiento", type=float, default=3.0, help="Segundos de tráfico no medido")
+    parser.add_argument("--mezcla-ia", type=float, default=0.3, help="Fracción de peticiones a /ai/generate")
+    parser.add_argument("--unicas", type=float, default=0.5, help="Fracción de preguntas a la IA sin repetir")
+    parser.add_argument("--uniforme", action="store_true", help="Llegadas a intervalo fijo (por defecto Poisson)")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--semilla", type=int)
+    parser.add_argument("--slo-p99", type=float, default=2000.0, help="p99 máximo aceptable (ms)")
+    parser.add_argument("--max-error", type=float, default=0.01)
+    parser.add_argument("--en-proceso", action="store_true", help="Corre la app en este proceso (ASGI, sin red)")
+    parser.add_argument("--url", help="Usa una app ya levantada en lugar de iniciar uvicorn")
+    parser.add_argument("--groq-url", help="Usa un servidor compatible ya levantado en lugar de bench/groq_falso.py")
+    parser.add_argument("--database-url", help="BD de la app (por defecto un SQLite temporal con datos de prueba)")
+    parser.add_argument("--cuotas-reales", action="store_true", help="Conserva GROQ_RPM/GROQ_TPM del entorno")
+    parser.add_argument("--json", help="Guarda los resultados en este archivo")
+    agregar_argumentos(parser)
+    args = parser.parse_args()
+
+    rps_lista = _lista(args.rps, float)
+    filas = []
+    procesos = []
+    with tempfile.TemporaryDirectory(prefix="carga_") as directorio:
+        try:
+            if args.url:
+                for rps in rps_lista:
+                    filas.append({"workers": 1, "rps_objetivo": rps, **asyncio.run(correr(args.url, rps, args))})
+            else:
+                groq_url = args.groq_url
+                if not groq_url:
+                    proceso, groq_url = iniciar_groq_falso(args)
+                    procesos.append(proceso)
+                entorno = entorno_app(args, groq_url, directorio)
+                if not args.database_url:
+                    preparar_bd(entorno["DATABASE_URL"])
+                if args.en_proceso:
+                    filas = asyncio.run(correr_en_proceso(rps_lista, args, entorno))
+                else:
+                    for workers in _lista(args.workers, int):
+                        proceso, url = iniciar_app(workers, entorno)
+                        try:
+                            for rps in rps_lista:
+                                resumen = asyncio.run(correr(url, rps, args))
+                                filas.append({"workers": workers, "rps_objetivo": rps, **resumen})
+                                print(f"workers={workers} rps={rps}: {resumen['total']}", flush=True)
+                        finally:
+                            _detener(proceso)
+        finally:
+            for proceso in procesos:
+                _detener(proceso)
+
+    imprimir(filas, args.slo_p99, args.max_error)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(filas, f, ensure_ascii=False, indent=2)
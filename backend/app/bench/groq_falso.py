@@ -0,0 +1,227 @@
+"""Servidor falso compatible con la API de Groq/OpenAI para pruebas de carga.
+
+Responde ``POST /openai/v1/chat/completions`` (normal y streaming) con latencia
+configurable, velocidad de generación en tokens por segundo e inyección de
+fallos (429, 500, 404 por modelo y timeouts). La configuración se puede cambiar
+en caliente con ``POST /falso/config``; ``GET /falso/estadisticas`` cuenta las
+respuestas por resultado.
+
+Uso (desde backend/app):
+    python -m bench.groq_falso --puerto 8790 --latencia 300 --distribucion lognormal --tasa-429 0.05
+    GROQ_BASE_URL=http://127.0.0.1:8790 GROQ_API_KEY=falso uvicorn main:app
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import threading
+import time
+from dataclasses import asdict, dataclass, field, fields
+from typing import List
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+TEXTO_BASE = (
+    "Para resolver tu consulta ingresa al portal institucional con tu usuario y contraseña, "
+    "revisa la sección correspondiente y si el problema continúa escribe a la mesa de ayuda. "
+)
+
+
+@dataclass
+class ConfigFalso:
+    latencia_ms: float = 250.0  # mediana hasta el primer token
+    distribucion: str = "lognormal"  # fija | normal | lognormal | exponencial
+    dispersion: float = 0.5  # desviación (normal: fracción de la latencia; lognormal: sigma)
+    tokens_por_segundo: float = 400.0  # velocidad de generación
+    tokens_respuesta: int = 80  # tokens generados (limitados por max_tokens)
+    tasa_429: float = 0.0
+    tasa_500: float = 0.0
+    tasa_timeout: float = 0.0  # la petición se queda colgada ``espera_timeout`` segundos
+    espera_timeout: float = 120.0
+    reintentar_en: float = 1.0  # cabecera retry-after de los 429
+    modelos_caidos: List[str] = field(default_factory=list)  # responden 404
+
+    def actualizar(self, cambios: dict):
+        validos = {f.name for f in fields(self)}
+        for clave, valor in cambios.items():
+            if clave not in validos:
+                raise ValueError(f"Parámetro desconocido: {clave}")
+            setattr(self, clave, valor)
+
+
+class ServidorFalso:
+    def __init__(self, config: ConfigFalso = None, semilla: int = None):
+        self.config = config or ConfigFalso()
+        self._azar = random.Random(semilla)
+        self._lock = threading.Lock()
+        self._contador = 0
+        self.resultados = {}
+
+    def _contar(self, resultado: str):
+        with self._lock:
+            self.resultados[resultado] = self.resultados.get(resultado, 0) + 1
+
+    def _nuevo_id(self) -> str:
+        with self._lock:
+            self._contador += 1
+            return f"chatcmpl-falso-{self._contador}"
+
+    def latencia(self) -> float:
+        """Segundos hasta el primer token según la distribución configurada."""
+        c = self.config
+        base = c.latencia_ms / 1000
+        if c.distribucion == "fija":
+            return base
+        if c.distribucion == "normal":
+            return max(0.0, self._azar.gauss(base, base * c.dispersion))
+        if c.distribucion == "exponencial":
+            return self._azar.expovariate(1 / base) if base > 0 else 0.0
+        # lognormal con mediana ``base``: cola larga como la de un proveedor real
+        return base * math.exp(self._azar.gauss(0, c.dispersion))
+
+    def _falla(self, modelo: str):
+        """Respuesta de error a inyectar (o None)."""
+        c = self.config
+        if modelo in c.modelos_caidos:
+            return 404, {"error": {"message": f"The model `{modelo}` does not exist", "type": "invalid_request_error",
+                                   "code": "model_not_found"}}
+        sorteo = self._azar.random()
+        if sorteo < c.tasa_429:
+            return 429, {"error": {"message": "Rate limit reached", "type": "tokens", "code": "rate_limit_exceeded"}}
+        if sorteo < c.tasa_429 + c.tasa_500:
+            return 500, {"error": {"message": "Internal server error", "type": "internal_server_error"}}
+        if sorteo < c.tasa_429 + c.tasa_500 + c.tasa_timeout:
+            return "timeout", None
+        return None
+
+    @staticmethod
+    def _texto(tokens: int) -> List[str]:
+        palabras = TEXTO_BASE.split()
+        return [palabras[i % len(palabras)] + " " for i in range(tokens)]
+
+    async def completar(self, cuerpo: dict):
+        modelo = cuerpo.get("model", "")
+        prompt = " ".join(str(m.get("content", "")) for m in cuerpo.get("messages", []))
+        prompt_tokens = max(1, len(prompt) // 4)
+        max_tokens = cuerpo.get("max_tokens") or self.config.tokens_respuesta
+        tokens = min(self.config.tokens_respuesta, max_tokens)
+        finish_reason = "length" if max_tokens < self.config.tokens_respuesta else "stop"
+        uso = {"prompt_tokens": prompt_tokens, "completion_tokens": tokens, "total_tokens": prompt_tokens + tokens}
+
+        falla = self._falla(modelo)
+        if falla is not None:
+            estado, error = falla
+            self._contar(str(estado))
+            if estado == "timeout":
+                await asyncio.sleep(self.config.espera_timeout)
+                return JSONResponse({"error": {"message": "timeout"}}, status_code=504)
+            cabeceras = {"retry-after": str(self.config.reintentar_en)} if estado == 429 else None
+            return JSONResponse(error, status_code=estado, headers=cabeceras)
+
+        await asyncio.sleep(self.latencia())
+        id_respuesta = self._nuevo_id()
+        creado = int(time.time())
+        if cuerpo.get("stream"):
+            self._contar("ok_stream")
+            return StreamingResponse(
+                self._eventos(id_respuesta, creado, modelo, tokens, finish_reason, uso),
+                media_type="text/event-stream",
+            )
+        self._contar("ok")
+        tps = self.config.tokens_por_segundo
+        if tps > 0:
+            await asyncio.sleep(tokens / tps)
+        return JSONResponse({
+            "id": id_respuesta,
+            "object": "chat.completion",
+            "created": creado,
+            "model": modelo,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(self._texto(tokens))},
+                         "finish_reason": finish_reason}],
+            "usage": uso,
+        })
+
+    async def _eventos(self, id_respuesta, creado, modelo, tokens, finish_reason, uso):
+        def chunk(delta, fin=None, extra=None):
+            datos = {"id": id_respuesta, "object": "chat.completion.chunk", "created": creado, "model": modelo,
+                     "choices": [{"index": 0, "delta": delta, "finish_reason": fin}], **(extra or {})}
+            return f"data: {json.dumps(datos)}\n\n"
+
+        yield chunk({"role": "assistant", "content": ""}, extra={"x_groq": {"id": id_respuesta}})
+        tps = self.config.tokens_por_segundo
+        for palabra in self._texto(tokens):
+            if tps > 0:
+                await asyncio.sleep(1 / tps)
+            yield chunk({"content": palabra})
+        yield chunk({}, finish_reason, {"x_groq": {"id": id_respuesta, "usage": uso}})
+        yield "data: [DONE]\n\n"
+
+
+def crear_app(servidor: ServidorFalso) -> FastAPI:
+    app = FastAPI(title="Groq falso")
+
+    @app.post("/openai/v1/chat/completions")
+    async def chat_completions(request: Request):
+        return await servidor.completar(await request.json())
+
+    @app.get("/openai/v1/models")
+    async def modelos():
+        return {"object": "list", "data": []}
+
+    @app.get("/falso/config")
+    async def ver_config():
+        return asdict(servidor.config)
+
+    @app.post("/falso/config")
+    async def cambiar_config(cambios: dict):
+        try:
+            servidor.config.actualizar(cambios)
+        except ValueError as e:
+            return JSONResponse({"detail": str(e)}, status_code=400)
+        return asdict(servidor.config)
+
+    @app.get("/falso/estadisticas")
+    async def estadisticas():
+        return dict(servidor.resultados)
+
+    return app
+
+
+def config_desde_args(args) -> ConfigFalso:
+    return ConfigFalso(
+        latencia_ms=args.latencia, distribucion=args.distribucion, dispersion=args.dispersion,
+        tokens_por_segundo=args.tokens_por_segundo, tokens_respuesta=args.tokens_respuesta,
+        tasa_429=args.tasa_429, tasa_500=args.tasa_500, tasa_timeout=args.tasa_timeout,
+        espera_timeout=args.espera_timeout, reintentar_en=args.reintentar_en,
+        modelos_caidos=args.modelo_caido or [],
+    )
+
+
+def agregar_argumentos(parser: argparse.ArgumentParser):
+    """Opciones del servidor falso (también las usa bench/carga.py)."""
+    parser.add_argument("--latencia", type=float, default=250.0, help="Mediana hasta el primer token (ms)")
+    parser.add_argument("--distribucion", choices=["fija", "normal", "lognormal", "exponencial"], default="lognormal")
+    parser.add_argument("--dispersion", type=float, default=0.5)
+    parser.add_argument("--tokens-por-segundo", type=float, default=400.0)
+    parser.add_argument("--tokens-respuesta", type=int, default=80)
+    parser.add_argument("--tasa-429", type=float, default=0.0)
+    parser.add_argument("--tasa-500", type=float, default=0.0)
+    parser.add_argument("--tasa-timeout", type=float, default=0.0)
+    parser.add_argument("--espera-timeout", type=float, default=120.0)
+    parser.add_argument("--reintentar-en", type=float, default=1.0)
+    parser.add_argument("--modelo-caido", action="append", help="Modelo que responde 404 (repetible)")
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Servidor falso compatible con Groq")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=8790)
+    parser.add_argument("--semilla", type=int)
+    agregar_argumentos(parser)
+    args = parser.parse_args()
+    servidor = ServidorFalso(config_desde_args(args), args.semilla)
+    uvicorn.run(crear_app(servidor), host=args.host, port=args.puerto, log_level="warning")
@@ -0,0 +1,137 @@
+"""Benchmark de la carga masiva de matrículas (controller/ingesta.py).
+
+Genera un archivo con ``--filas`` matrículas (CSV o JSONL) más un porcentaje de
+filas inválidas, carga primero las materias y luego las matrículas, y compara
+las filas por segundo con ``crud.crear_estudiante_materia`` (commit por fila)
+sobre una muestra. Una segunda carga del mismo archivo comprueba que el upsert
+no duplica filas.
+
+Uso (desde backend/app):
+    python -m bench.ingesta
+    python -m bench.ingesta --filas 500000 --formato jsonl
+    BENCH_DATABASE_URL=postgresql://... python -m bench.ingesta --borrar   # BD de pruebas: se vacía
+"""
+import argparse
+import atexit
+import io
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# La BD se define antes de importar la app (por defecto un SQLite temporal)
+_directorio = tempfile.mkdtemp(prefix="ingesta_")
+atexit.register(shutil.rmtree, _directorio, ignore_errors=True)
+os.environ["DATABASE_URL"] = os.getenv("BENCH_DATABASE_URL", f"sqlite:///{_directorio}/ingesta.db")
+
+ruta = Path(__file__).resolve().parent.parent
+sys.path.append(str(ruta))
+
+from sqlalchemy import func, select
+
+from controller import crud, ingesta, migraciones, models, schemas
+from controller.databaseconfig import engine, session_local
+
+MATERIAS = 600
+MATRICULAS_POR_ESTUDIANTE = 6
+# Filas con errores (tipos, referencias) mezcladas en el archivo
+PORCENTAJE_INVALIDAS = 1
+
+
+def preparar(filas: int, semilla: int = 7) -> list:
+    """Esquema vacío con los estudiantes de la carga. Retorna los documentos."""
+    models.Base.metadata.drop_all(bind=engine)
+    models.Base.metadata.create_all(bind=engine)
+    migraciones.aplicar(engine)
+    documentos = [100_000 + i for i in range(max(1, filas // MATRICULAS_POR_ESTUDIANTE))]
+    with engine.begin() as conexion:
+        tabla = models.Estudiante.__table__
+        for i in range(0, len(documentos), 5000):
+            conexion.execute(tabla.insert(), [{"id": d, "nombre": "Nombre", "apellidos": "Apellido", "tipo_id": "CC"}
+                                              for d in documentos[i:i + 5000]])
+    return documentos
+
+
+def generar(filas: list, formato: str) -> bytes:
+    buffer = io.StringIO()
+    if formato == "jsonl":
+        for fila in filas:
+            buffer.write(json.dumps(fila, ensure_ascii=False) + "\n")
+    else:
+        columnas = list(filas[0])
+        buffer.write(",".join(columnas) + "\n")
+        for fila in filas:
+            buffer.write(",".join(str(fila[c]) for c in columnas) + "\n")
+    return buffer.getvalue().encode("utf-8")
+
+
+def matriculas(documentos: list, filas: int, semilla: int = 7) -> list:
+    azar = random.Random(semilla)
+    resultado = []
+    for documento in documentos:
+        for materia in azar.sample(range(1, MATERIAS + 1), MATRICULAS_POR_ESTUDIANTE):
+            resultado.append({"id_estudiante": str(documento), "id_materia": materia})
+    resultado = resultado[:filas]
+    for i in azar.sample(range(len(resultado)), len(resultado) * PORCENTAJE_INVALIDAS // 100):
+        resultado[i] = azar.choice([
+            {"id_estudiante": resultado[i]["id_estudiante"], "id_materia": "x"},
+            {"id_estudiante": "999", "id_materia": 1},
+            {"id_estudiante": resultado[i]["id_estudiante"], "id_materia": MATERIAS + 1},
+        ])
+    return resultado
+
+
+def cargar(tabla: str, contenido: bytes, formato: str) -> dict:
+    db = session_local()
+    try:
+        return ingesta.ingerir(db, tabla, io.BytesIO(contenido), formato).como_dict()
+    finally:
+        db.close()
+
+
+def por_fila(documentos: list, muestra: int) -> float:
+    """Filas por segundo con crud.crear_estudiante_materia (una transacción por fila)."""
+    db = session_local()
+    try:
+        inicio = time.perf_counter()
+        for i in range(muestra):
+            crud.crear_estudiante_materia(db, schemas.EstudianteMateriaCreate(
+                id_estudiante=str(documentos[i % len(documentos)]), id_materia=MATERIAS + 1 + i // len(documentos)))
+        return muestra / (time.perf_counter() - inicio)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de la carga masiva de matrículas")
+    parser.add_argument("--filas", type=int, default=200_000)
+    parser.add_argument("--formato", choices=("csv", "jsonl"), default="csv")
+    parser.add_argument("--muestra", type=int, default=2000, help="Filas de la comparación con crud por fila")
+    parser.add_argument("--borrar", action="store_true", help="Confirma que se borren las tablas de BENCH_DATABASE_URL")
+    args = parser.parse_args()
+    if os.getenv("BENCH_DATABASE_URL") and not args.borrar:
+        parser.error("BENCH_DATABASE_URL se borra y se vuelve a poblar: confirma con --borrar")
+
+    documentos = preparar(args.filas)
+    materias = [{"id_materia": i, "nombre_materia": f"Materia {i}", "creditos": 1 + i % 5} for i in range(1, MATERIAS + 1)]
+    contenido = generar(matriculas(documentos, args.filas), args.formato)
+    print(f"BD {engine.dialect.name}, {args.filas} matrículas ({len(contenido) / 1e6:.1f} MB {args.formato})\n")
+
+    reporte = cargar("materias", generar(materias, args.formato), args.formato)
+    print(f"materias             {reporte['escritas']} escritas en {reporte['segundos']} s")
+    for intento in ("primera carga", "repetida"):
+        reporte = cargar("estudiante_materias", contenido, args.formato)
+        print(f"{intento:20} {reporte['filas_por_segundo']} filas/s  ({reporte['escritas']} escritas, "
+              f"{reporte['rechazadas']} rechazadas, {reporte['segundos']} s)")
+    with engine.connect() as conexion:
+        total = conexion.execute(select(func.count()).select_from(models.EstudianteMateria)).scalar()
+    print(f"filas en la tabla    {total} (sin duplicados: {total == reporte['escritas']})")
+
+    materias_extra = [{"id_materia": MATERIAS + 1 + i, "nombre_materia": "Extra", "creditos": 1}
+                      for i in range(args.muestra // len(documentos) + 1)]
+    cargar("materias", generar(materias_extra, "csv"), "csv")
+    print(f"crud por fila        {por_fila(documentos, args.muestra):.0f} filas/s  (muestra de {args.muestra})")
@@ -0,0 +1,288 @@
+"""Verificación de los planes de consulta con un volumen de datos realista.
+
+Carga una BD con decenas de miles de usuarios, matrículas, sugerencias e
+historial, aplica las migraciones y ejecuta cada consulta de ``crud`` y
+``BaseDatos``. Las sentencias SQL se capturan tal como las emite la app y se
+pasan por ``EXPLAIN QUERY PLAN`` (SQLite) o ``EXPLAIN`` (PostgreSQL). Una
+consulta falla si recorre completa una tabla grande (``SCAN tabla`` /
+``Seq Scan``) o si ordena en memoria cuando el índice debía darle el orden.
+
+Termina con código 1 si algún plan no usa índices: sirve de prueba de regresión
+en CI al agregar consultas o cambiar el esquema.
+
+Uso (desde backend/app):
+    python -m bench.planes_consulta
+    python -m bench.planes_consulta --escala 0.1 --mostrar
+    python -m bench.planes_consulta --sin-migraciones      # debe fallar: demuestra la detección
+    BENCH_DATABASE_URL=postgresql://... python -m bench.planes_consulta --borrar   # BD de pruebas: se vacía
+"""
+import argparse
+import atexit
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, List
+
+# La BD se define antes de importar la app (por defecto un SQLite temporal)
+_directorio = tempfile.mkdtemp(prefix="planes_")
+atexit.register(shutil.rmtree, _directorio, ignore_errors=True)
+os.environ["DATABASE_URL"] = os.getenv("BENCH_DATABASE_URL", f"sqlite:///{_directorio}/planes.db")
+os.environ["OUTBOX_HABILITADO"] = "0"
+
+ruta = Path(__file__).resolve().parent.parent
+sys.path.append(str(ruta))
+
+from sqlalchemy import event
+
+from controller import busqueda, crud, encuestas, migraciones, models
+from controller.base_datos import BaseDatos
+from controller.databaseconfig import engine, engine_lectura, session_local
+
+# Filas por tabla con --escala 1
+VOLUMEN = {
+    "usuarios": 30_000,
+    "materias": 600,
+    "matriculas_por_estudiante": 6,
+    "sugerencias": 30_000,
+    "historial": 300_000,
+    "profesores": 1_500,
+}
+# Textos para la búsqueda de texto completo
+DESCRIPCIONES = ("Descripción de la sugerencia", "La biblioteca cierra muy temprano", "Precios altos en la cafetería",
+                 "No pude hacer la inscripción de materias", "Faltan computadores en la sala de sistemas")
+MENSAJES = ("1", "2", "¿Cómo es el proceso de matrícula?", "horario de la biblioteca", "quiero cancelar una materia")
+ESTUDIANTE = 1001
+PROFESOR = 2002
+
+
+@dataclass
+class Caso:
+    """Una consulta de la app y lo que se espera de su plan."""
+    nombre: str
+    ejecutar: Callable
+    ordenado: bool = False  # el índice debe dar el orden (sin sort en memoria)
+    permitir_scan: tuple = ()  # tablas pequeñas o listados completos a propósito
+
+
+@dataclass
+class Resultado:
+    caso: Caso
+    sentencias: List[tuple] = field(default_factory=list)
+    planes: List[str] = field(default_factory=list)
+    problemas: List[str] = field(default_factory=list)
+
+
+CASOS = [
+    Caso("BaseDatos.buscar_id", lambda db: BaseDatos.buscar_id(ESTUDIANTE, db)),
+    Caso("BaseDatos.buscar_materias_de_estudiante", lambda db: BaseDatos.buscar_materias_de_estudiante(ESTUDIANTE, db)),
+    Caso("BaseDatos.buscar_materias_por_id", lambda db: BaseDatos.buscar_materias_por_id(7, db)),
+    Caso("BaseDatos.obtener_link_hoja", lambda db: BaseDatos.obtener_link_hoja(PROFESOR, db)),
+    Caso("crud.obtener_materia", lambda db: crud.obtener_materia(db, 7)),
+    Caso("crud.obtener_materias_estudiante", lambda db: crud.obtener_materias_estudiante(db, ESTUDIANTE)),
+    Caso("crud.obtener_materias_priorizadas", lambda db: crud.obtener_materias_priorizadas(db, ESTUDIANTE)),
+    Caso("crud.obtener_materias_estudiante_ordenadas",
+         lambda db: crud.obtener_materias_estudiante_ordenadas(db, ESTUDIANTE, "creditos")),
+    Caso("crud.obtener_sugerencia", lambda db: crud.obtener_sugerencia(db, 10)),
+    Caso("crud.obtener_sugerencias_por_estudiante",
+         lambda db: crud.obtener_sugerencias_por_estudiante(db, str(ESTUDIANTE)), ordenado=True),
+    Caso("crud.obtener_todas_sugerencias", lambda db: crud.obtener_todas_sugerencias(db, 0, 50), ordenado=True),
+    Caso("crud.get_usuario_por_documento", lambda db: crud.get_usuario_por_documento(db, "CC", str(ESTUDIANTE))),
+    Caso("crud.obtener_link_hoja", lambda db: crud.obtener_link_hoja(PROFESOR, db)),
+    Caso("crud.obtener_todas_materias", lambda db: crud.obtener_todas_materias(db), permitir_scan=("materias",)),
+    # Listados por cursor: primera página y una profunda (la segunda consulta lleva el cursor)
+    Caso("crud.listar_sugerencias", lambda db: crud.listar_sugerencias(
+        db, cursor=crud.listar_sugerencias(db, limite=200)["siguiente"]), ordenado=True),
+    Caso("crud.listar_sugerencias(documento)", lambda db: crud.listar_sugerencias(
+        db, documento=str(ESTUDIANTE), limite=5), ordenado=True),
+    Caso("crud.listar_sugerencias(desde, hasta)", lambda db: crud.listar_sugerencias(
+        db, desde=datetime(2026, 1, 1), hasta=datetime(2026, 2, 1)), ordenado=True),
+    Caso("crud.listar_historial", lambda db: crud.listar_historial(
+        db, cursor=crud.listar_historial(db, limite=200)["siguiente"]), ordenado=True),
+    Caso("crud.listar_historial(documento)", lambda db: crud.listar_historial(
+        db, documento=str(ESTUDIANTE), limite=5), ordenado=True),
+    # Primera página: recorre la llave primaria en orden y se detiene en el límite
+    Caso("crud.listar_materias", lambda db: crud.listar_materias(
+        db, cursor=crud.listar_materias(db, limite=100)["siguiente"]), ordenado=True, permitir_scan=("materias",)),
+    Caso("crud.listar_materias(documento)", lambda db: crud.listar_materias(db, documento=str(ESTUDIANTE)),
+         ordenado=True),
+    # Texto completo: el índice da las filas; ordenar por relevancia en memoria es inevitable
+    Caso("crud.buscar_sugerencias", lambda db: crud.buscar_sugerencias(db, "biblioteca cerrada", estado="Pendiente")),
+    Caso("crud.buscar_historial", lambda db: crud.buscar_historial(db, "matrícula", documento=str(ESTUDIANTE))),
+    # Lee solo los contadores (pocas filas): nunca la tabla encuesta
+    Caso("encuestas.resumen", lambda db: encuestas.resumen(db, facultad="Diseño"),
+         permitir_scan=("encuesta_resumen",)),
+    # Sin caso: get_user*, leer_encuesta y obtener_materias_prioritarias usan modelos o
+    # columnas que no existen en models.py (User, Survey, EstudianteMateria.estado)
+    Caso("crud.obtener_historial_reciente",
+         lambda db: crud.obtener_historial_reciente(db, str(ESTUDIANTE)), ordenado=True),
+]
+
+
+# --- Datos --------------------------------------------------------------------
+
+def _insertar(conexion, tabla, filas, lote: int = 5000):
+    for i in range(0, len(filas), lote):
+        conexion.execute(tabla.insert(), filas[i:i + lote])
+
+
+def poblar(escala: float = 1.0, semilla: int = 7):
+    """Esquema, migraciones y datos sintéticos con la forma de los reales."""
+    azar = random.Random(semilla)
+    n = {clave: max(10, int(valor * escala)) for clave, valor in VOLUMEN.items()}
+    n["matriculas_por_estudiante"] = VOLUMEN["matriculas_por_estudiante"]
+    models.Base.metadata.drop_all(bind=engine)
+    models.Base.metadata.create_all(bind=engine)
+    ahora = datetime(2026, 6, 1)
+    roles = ["estudiante"] * 9 + ["profesor"]
+    ids = [ESTUDIANTE, PROFESOR] + [100_000 + i for i in range(n["usuarios"])]
+    tablas = models.Base.metadata.tables
+    with engine.begin() as conexion:
+        _insertar(conexion, tablas["usuarios"], [
+            {"id": i, "nombre": f"Nombre {i}", "apellidos": f"Apellido {i}", "rol": azar.choice(roles), "tipo_id": "CC"}
+            for i in ids])
+        _insertar(conexion, tablas["estudiante"], [
+            {"id": i, "nombre": f"Nombre {i}", "apellidos": f"Apellido {i}", "tipo_id": "CC"} for i in ids])
+        _insertar(conexion, tablas["materias"], [
+            {"id_materia": i, "nombre_materia": f"Materia {i}", "creditos": azar.randint(1, 5)}
+            for i in range(1, n["materias"] + 1)])
+        _insertar(conexion, tablas["estudiante_materias"], [
+            {"id_estudiante": str(i), "id_materia": m}
+            for i in ids for m in azar.sample(range(1, n["materias"] + 1), n["matriculas_por_estudiante"])])
+        _insertar(conexion, tablas["profesores"], [
+            {"id": i, "link_hoja": f"https://docs.google.com/spreadsheets/d/{i}"}
+            for i in [PROFESOR] + ids[2:n["profesores"]]])
+        _insertar(conexion, tablas["buzon_de_sugerencias"], [
+            {"id_estudiante": str(azar.choice(ids)), "tipo_documento": "CC", "tipo_sugerencia": "Sugerencia",
+             "asunto": "Asunto", "descripcion": azar.choice(DESCRIPCIONES), "estado": "Pendiente",
+             "created_at": ahora - timedelta(minutes=azar.randint(0, 525_600))}
+            for _ in range(n["sugerencias"])])
+        _insertar(conexion, tablas["chat_history"], [
+            {"tipo_documento": "CC", "numero_documento": str(azar.choice(ids)), "mensaje": azar.choice(MENSAJES),
+             "respuesta": "['Opción']", "estado": "en_opciones",
+             "created_at": ahora - timedelta(seconds=azar.randint(0, 31_536_000))}
+            for _ in range(n["historial"])])
+    return n
+
+
+def estadisticas():
+    """Estadísticas para el planificador (como tras la importación o un VACUUM ANALYZE)."""
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conexion:
+        conexion.exec_driver_sql("ANALYZE")
+
+
+def quitar_indices():
+    """Elimina los índices de las migraciones (para comprobar que la verificación falla)."""
+    nombres = [nombre for nombre, _, _ in (migraciones.INDICES_CONSULTAS + migraciones.INDICES_PAGINACION
+                                           + migraciones.INDICES_UNICOS)]
+    if engine.dialect.name != "sqlite":
+        # En SQLite la tabla FTS5 es la búsqueda misma: no hay un índice aparte que quitar
+        nombres += [f"ix_{indice.fts}" for indice in busqueda.INDICES.values()]
+    with engine.begin() as conexion:
+        for nombre in nombres:
+            conexion.exec_driver_sql(f"DROP INDEX IF EXISTS {nombre}")
+
+
+# --- Planes -------------------------------------------------------------------
+
+class CapturaSentencias:
+    """Guarda las sentencias SQL (con sus parámetros) que emiten los motores de la app."""
+
+    def __init__(self, *motores):
+        self.sentencias = []
+        for motor in {id(m): m for m in motores}.values():
+            event.listen(motor, "before_cursor_execute", self._capturar)
+
+    def _capturar(self, conn, cursor, sentencia, parametros, contexto, executemany):
+        if sentencia.lstrip().upper().startswith("SELECT"):
+            self.sentencias.append((sentencia, parametros))
+
+
+def explicar(sentencia: str, parametros) -> str:
+    """Plan de una sentencia con los mismos parámetros con los que se ejecutó."""
+    conexion = engine.raw_connection()
+    try:
+        cursor = conexion.cursor()
+        if engine.dialect.name == "sqlite":
+            cursor.execute("EXPLAIN QUERY PLAN " + sentencia, parametros)
+            return "\n".join(fila[-1] for fila in cursor.fetchall())
+        cursor.execute("EXPLAIN " + sentencia, parametros)
+        return "\n".join(fila[0] for fila in cursor.fetchall())
+    finally:
+        conexion.close()
+
+
+def problemas_del_plan(plan: str, caso: Caso) -> List[str]:
+    problemas = []
+    if engine.dialect.name == "sqlite":
+        # "SCAN tabla" sin índice es un recorrido completo; "SCAN tabla USING INDEX" recorre el índice en orden
+        # y "SCAN fts VIRTUAL TABLE INDEX 0:M..." consulta el índice de texto completo (MATCH)
+        for tabla in re.findall(r"\bSCAN (\w+)\b(?! USING| VIRTUAL TABLE INDEX \d+:M)", plan):
+            if tabla not in caso.permitir_scan:
+                problemas.append(f"recorrido completo de {tabla}")
+        if caso.ordenado and "USE TEMP B-TREE FOR ORDER BY" in plan:
+            problemas.append("ordena en memoria")
+    else:
+        for tabla in re.findall(r"Seq Scan on (\w+)", plan):
+            if tabla not in caso.permitir_scan:
+                problemas.append(f"recorrido completo de {tabla}")
+        if caso.ordenado and re.search(r"^\s*(->\s*)?(Incremental )?Sort\b", plan, re.M):
+            problemas.append("ordena en memoria")
+    return problemas
+
+
+def verificar(casos=CASOS) -> List[Resultado]:
+    captura = CapturaSentencias(engine, engine_lectura)
+    resultados = []
+    for caso in casos:
+        captura.sentencias.clear()
+        db = session_local()
+        try:
+            caso.ejecutar(db)
+        finally:
+            db.close()
+        resultado = Resultado(caso, list(captura.sentencias))
+        for sentencia, parametros in resultado.sentencias:
+            plan = explicar(sentencia, parametros)
+            resultado.planes.append(plan)
+            resultado.problemas += problemas_del_plan(plan, caso)
+        if not resultado.sentencias:
+            resultado.problemas.append("no se capturó ninguna consulta")
+        resultados.append(resultado)
+    return resultados
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Verifica que las consultas de la app usen índices")
+    parser.add_argument("--escala", type=float, default=1.0, help="Multiplica el volumen de datos")
+    parser.add_argument("--sin-migraciones", action="store_true", help="Quita los índices de las migraciones")
+    parser.add_argument("--mostrar", action="store_true", help="Imprime el plan de cada consulta")
+    parser.add_argument("--borrar", action="store_true", help="Confirma que se borren las tablas de BENCH_DATABASE_URL")
+    args = parser.parse_args()
+    if os.getenv("BENCH_DATABASE_URL") and not args.borrar:
+        parser.error("BENCH_DATABASE_URL se borra y se vuelve a poblar: confirma con --borrar")
+
+    inicio = time.perf_counter()
+    volumen = poblar(args.escala)
+    migraciones.aplicar(engine)
+    if args.sin_migraciones:
+        quitar_indices()
+    estadisticas()
+    print(f"BD {engine.dialect.name} con {volumen} en {time.perf_counter() - inicio:.1f} s\n")
+
+    resultados = verificar()
+    for r in resultados:
+        print(f"{'OK   ' if not r.problemas else 'FALLA'}  {r.caso.nombre}"
+              + (f"  ({'; '.join(r.problemas)})" if r.problemas else ""))
+        if args.mostrar or r.problemas:
+            for plan in r.planes:
+                print("       " + plan.replace("\n", "\n       "))
+    fallas = sum(1 for r in resultados if r.problemas)
+    print(f"\n{len(resultados) - fallas}/{len(resultados)} consultas usan índices")
+    sys.exit(1 if fallas else 0)
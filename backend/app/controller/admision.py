@@ -0,0 +1,139 @@
+import asyncio
+import os
+import time
+from typing import Dict
+
+# Cuotas de Groq (peticiones y tokens por minuto)
+GROQ_RPM = float(os.getenv("GROQ_RPM", "30"))
+GROQ_TPM = float(os.getenv("GROQ_TPM", "6000"))
+# Peticiones esperando turno como máximo y espera máxima por defecto (segundos)
+ADMISION_COLA_MAX = int(os.getenv("ADMISION_COLA_MAX", "50"))
+ADMISION_ESPERA_MAX = float(os.getenv("ADMISION_ESPERA_MAX", "8"))
+
+
+class SolicitudDescartada(Exception):
+    """La petición no se envía al modelo (cola llena o plazo imposible de cumplir)."""
+
+    def __init__(self, motivo: str, reintentar_en: float = 0.0):
+        super().__init__(motivo)
+        self.motivo = motivo
+        self.reintentar_en = reintentar_en
+
+
+class CuboTokens:
+    """Token bucket: ``capacidad`` unidades que se recargan de forma continua."""
+
+    def __init__(self, capacidad: float, por_segundo: float):
+        self.capacidad = capacidad
+        self.por_segundo = por_segundo
+        self._nivel = capacidad
+        self._actualizado = time.monotonic()
+
+    def _recargar(self):
+        ahora = time.monotonic()
+        self._nivel = min(self.capacidad, self._nivel + (ahora - self._actualizado) * self.por_segundo)
+        self._actualizado = ahora
+
+    @property
+    def nivel(self) -> float:
+        self._recargar()
+        return self._nivel
+
+    def tiempo_para(self, cantidad: float) -> float:
+        """Segundos hasta tener ``cantidad`` disponible."""
+        faltante = min(cantidad, self.capacidad) - self.nivel
+        return max(0.0, faltante / self.por_segundo) if self.por_segundo else float("inf")
+
+    def consumir(self, cantidad: float):
+        """Descuenta ``cantidad``; puede quedar en negativo (deuda) al ajustar por el uso real."""
+        self._recargar()
+        self._nivel -= cantidad
+
+
+class ControlAdmision:
+    """Admisión de llamadas al modelo según las cuotas RPM/TPM.
+
+    Las peticiones toman turno en orden de llegada (cola acotada). Si la cola
+    está llena, o la espera necesaria supera el plazo de la petición, se
+    descarta de inmediato con ``SolicitudDescartada`` en lugar de esperar.
+    """
+
+    def __init__(self, rpm: float = GROQ_RPM, tpm: float = GROQ_TPM,
+                 cola_max: int = ADMISION_COLA_MAX, espera_max: float = ADMISION_ESPERA_MAX):
+        self.peticiones = CuboTokens(rpm, rpm / 60)
+        self.tokens = CuboTokens(tpm, tpm / 60)
+        self.cola_max = cola_max
+        self.espera_max = espera_max
+        self._turno = asyncio.Lock()
+        self.en_cola = 0
+        self.admitidas = 0
+        self.descartadas: Dict[str, int] = {}
+        self._espera_total = 0.0
+
+    def _descartar(self, motivo: str, reintentar_en: float):
+        self.descartadas[motivo] = self.descartadas.get(motivo, 0) + 1
+        return SolicitudDescartada(motivo, round(reintentar_en, 1))
+
+    def _espera_necesaria(self, tokens: float) -> float:
+        return max(self.peticiones.tiempo_para(1), self.tokens.tiempo_para(tokens))
+
+    async def admitir(self, tokens_estimados: int, plazo: float = None):
+        """Espera turno y cuota para una llamada de ``tokens_estimados``; lanza SolicitudDescartada."""
+        plazo = self.espera_max if plazo is None else plazo
+        inicio = time.monotonic()
+        limite = inicio + plazo
+        if self.en_cola >= self.cola_max:
+            raise self._descartar("cola_llena", self._espera_necesaria(tokens_estimados))
+
+        self.en_cola += 1
+        try:
+            try:
+                await asyncio.wait_for(self._turno.acquire(), timeout=max(0.0, limite - time.monotonic()))
+            except asyncio.TimeoutError:
+                raise self._descartar("plazo_vencido", self._espera_necesaria(tokens_estimados))
+            try:
+                espera = self._espera_necesaria(tokens_estimados)
+                if time.monotonic() + espera > limite:
+                    raise self._descartar("plazo_insuficiente", espera)
+                if espera > 0:
+                    await asyncio.sleep(espera)
+                self.peticiones.consumir(1)
+                self.tokens.consumir(tokens_estimados)
+            finally:
+                self._turno.release()
+        finally:
+            self.en_cola -= 1
+        self.admitidas += 1
+        self._espera_total += time.monotonic() - inicio
+
+    def ajustar(self, tokens_estimados: int, tokens_reales: int):
+        """Corrige el cubo de tokens con el uso real que reportó el modelo."""
+        if tokens_reales is not None:
+            self.tokens.consumir(tokens_reales - tokens_estimados)
+
+    def cobrar_intento(self):
+        """Descuenta una petición por cada intento adicional (otro modelo) de una llamada ya admitida."""
+        self.peticiones.consumir(1)
+
+    def devolver(self, tokens_estimados: int = 0, peticiones: int = 1):
+        """Devuelve cuota reservada que no llegó a Groq (conexión rechazada, modelo inexistente).
+
+        Lo que Groq recibió (aunque respondiera 429 o se venciera el timeout) no
+        se devuelve: ya cuenta en su cuota.
+        """
+        self.peticiones.consumir(-peticiones)
+        self.tokens.consumir(-tokens_estimados)
+
+    def estadisticas(self) -> dict:
+        return {
+            "en_cola": self.en_cola,
+            "cola_max": self.cola_max,
+            "admitidas": self.admitidas,
+            "descartadas": dict(self.descartadas),
+            "espera_promedio_s": round(self._espera_total / self.admitidas, 3) if self.admitidas else 0.0,
+            "peticiones_disponibles": round(self.peticiones.nivel, 2),
+            "tokens_disponibles": round(self.tokens.nivel),
+        }
+
+
+control_admision = ControlAdmision()
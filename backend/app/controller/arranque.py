@@ -0,0 +1,187 @@
+"""Calentamiento explícito al iniciar la app.
+
+Importar ``main`` ya no toca la BD: el esquema y sus migraciones, el pool de
+conexiones, los árboles de opciones, los índices de PLN y el cliente de Groq
+se preparan aquí, en el lifespan, y ``GET /ready`` reporta cuándo terminó. Con
+``ARRANQUE_EN_FONDO=1`` la app acepta peticiones de inmediato y calienta en
+segundo plano (``/ready`` responde 503 mientras tanto); si no, uvicorn no abre
+el puerto hasta que todo está listo.
+"""
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+from controller.metricas import arranque_etapa_segundos, errores_total
+
+logger = logging.getLogger(__name__)
+
+# "0" cuando el esquema lo gestionan las migraciones o un DBA (sin DDL al iniciar)
+DB_CREAR_ESQUEMA = os.getenv("DB_CREAR_ESQUEMA", "1") == "1"
+# Aplica las migraciones pendientes (índices nuevos) al iniciar
+DB_MIGRAR = os.getenv("DB_MIGRAR", "1") == "1"
+ARRANQUE_EN_FONDO = os.getenv("ARRANQUE_EN_FONDO", "0") == "1"
+# Conexiones que se abren de antemano (por defecto el tamaño del pool)
+ARRANQUE_CONEXIONES = int(os.getenv("ARRANQUE_CONEXIONES", os.getenv("DB_POOL_SIZE", "5")))
+# Abre la conexión TLS con Groq (GET /models) para que la primera pregunta no la pague
+ARRANQUE_CONECTAR_GROQ = os.getenv("ARRANQUE_CONECTAR_GROQ", "1") == "1"
+ARRANQUE_TIMEOUT_GROQ = float(os.getenv("ARRANQUE_TIMEOUT_GROQ", "5"))
+
+
+def _crear_esquema():
+    if not DB_CREAR_ESQUEMA:
+        return "omitido"
+    from controller import models
+    from controller.databaseconfig import engine
+    models.Base.metadata.create_all(bind=engine)
+
+
+def _migrar():
+    if not DB_MIGRAR:
+        return "omitido"
+    from controller import migraciones
+    aplicadas = migraciones.aplicar()
+    return f"aplicadas {aplicadas}" if aplicadas else None
+
+
+def _abrir_conexiones(motor, cantidad: int) -> int:
+    """Abre ``cantidad`` conexiones a la vez (en paralelo) y las devuelve al pool."""
+    from sqlalchemy import text
+
+    def abrir(_):
+        conexion = motor.connect()
+        conexion.execute(text("SELECT 1"))
+        return conexion
+
+    cantidad = max(1, cantidad)
+    with ThreadPoolExecutor(max_workers=cantidad) as hilos:
+        conexiones = list(hilos.map(abrir, range(cantidad)))
+    for conexion in conexiones:
+        conexion.close()
+    return len(conexiones)
+
+
+def _abrir_pool():
+    from controller.databaseconfig import SQLITE_POOL_LECTURA, engine, engine_lectura
+    abiertas = _abrir_conexiones(engine, ARRANQUE_CONEXIONES)
+    if engine_lectura is not engine:
+        abiertas += _abrir_conexiones(engine_lectura, min(ARRANQUE_CONEXIONES, SQLITE_POOL_LECTURA))
+    return f"{abiertas} conexiones"
+
+
+def _compilar_arboles():
+    from model.arbol_opciones import registro_opciones
+    registro_opciones.cargar()
+    return f"{len(registro_opciones.arboles())} árboles"
+
+
+def _indices_pln():
+    from model.arbol_opciones import registro_opciones
+    from model.pln import registro_pln
+    registro_pln.calentar(registro_opciones.arboles().values())
+
+
+def _iniciar_outbox():
+    # Re-procesa el spool pendiente: requiere el esquema
+    from controller.outbox import outbox
+    outbox.iniciar()
+
+
+def _iniciar_groq():
+    from controller.cliente_groq import cliente_groq
+    cliente_groq.iniciar()
+
+
+async def _conectar_groq():
+    from controller.cliente_groq import cliente_groq
+    if not ARRANQUE_CONECTAR_GROQ or not cliente_groq.iniciado:
+        return "omitido"
+    await asyncio.wait_for(cliente_groq.obtener().models.list(), ARRANQUE_TIMEOUT_GROQ)
+
+
+# (nombre, función, crítica): si una etapa crítica falla la app no queda lista
+ETAPAS = (
+    ("esquema", _crear_esquema, True),
+    ("migraciones", _migrar, True),
+    ("pool_db", _abrir_pool, True),
+    ("arboles", _compilar_arboles, True),
+    ("pln", _indices_pln, False),
+    ("outbox", _iniciar_outbox, False),
+    ("cliente_groq", _iniciar_groq, False),
+    ("conexion_groq", _conectar_groq, False),
+)
+
+
+class Calentamiento:
+    """Ejecuta las etapas en orden y guarda su duración y resultado."""
+
+    def __init__(self, etapas=ETAPAS):
+        self.etapas = etapas
+        self.estado = "pendiente"  # pendiente | calentando | listo | error
+        self.resultados: Dict[str, dict] = {}
+        self.creado = time.perf_counter()
+        self.segundos: Optional[float] = None
+        self._tarea: Optional[asyncio.Task] = None
+
+    @property
+    def listo(self) -> bool:
+        return self.estado == "listo"
+
+    async def _etapa(self, nombre: str, funcion, critica: bool) -> bool:
+        inicio = time.perf_counter()
+        try:
+            if asyncio.iscoroutinefunction(funcion):
+                detalle = await funcion()
+            else:
+                # Las etapas bloqueantes no detienen el event loop (modo en fondo)
+                detalle = await asyncio.to_thread(funcion)
+            resultado = {"ok": True}
+            if detalle:
+                resultado["detalle"] = detalle
+        except Exception as e:
+            errores_total.inc("arranque")
+            logger.warning(f"Calentamiento '{nombre}' falló: {e}")
+            resultado = {"ok": False, "error": str(e)}
+        duracion = time.perf_counter() - inicio
+        arranque_etapa_segundos.observar(duracion, nombre)
+        self.resultados[nombre] = {**resultado, "ms": round(duracion * 1000, 1)}
+        return resultado["ok"] or not critica
+
+    async def ejecutar(self):
+        self.estado = "calentando"
+        inicio = time.perf_counter()
+        correcto = True
+        for nombre, funcion, critica in self.etapas:
+            correcto = await self._etapa(nombre, funcion, critica) and correcto
+        self.segundos = round(time.perf_counter() - inicio, 3)
+        self.estado = "listo" if correcto else "error"
+        logger.info(f"Calentamiento {self.estado} en {self.segundos} s")
+
+    async def iniciar(self, en_fondo: bool = ARRANQUE_EN_FONDO):
+        if en_fondo:
+            self._tarea = asyncio.create_task(self.ejecutar())
+        else:
+            await self.ejecutar()
+
+    async def detener(self):
+        if self._tarea is not None and not self._tarea.done():
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+        self._tarea = None
+
+    def reporte(self) -> dict:
+        return {
+            "estado": self.estado,
+            "listo": self.listo,
+            "segundos_calentamiento": self.segundos,
+            "segundos_desde_inicio": round(time.perf_counter() - self.creado, 3),
+            "etapas": self.resultados,
+        }
+
+
+calentamiento = Calentamiento()
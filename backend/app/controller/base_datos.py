@@ -1,11 +1,13 @@
 from sqlalchemy.orm import Session
 from sqlalchemy import text
+from contextlib import contextmanager
 import sys
 from pathlib import Path
 
 # Importar la configuración de base de datos
 #sys.path.append(str(Path(__file__).resolve().parent.parent))
-from .databaseconfig import session_local, engine
+from .databaseconfig import session_local, session_lectura, engine
+from .metricas import medir_db
 
 
 class BaseDatos:
@@ -16,10 +18,33 @@ class BaseDatos:
         return session_local()
 
     @staticmethod
-    def buscar_id(id: int):
-        """Buscar estudiante por ID"""
-        db = BaseDatos.get_session()
+    @contextmanager
+    def sesion(db: Session = None, lectura: bool = False):
+        """Usa la sesión de la petición si se pasa; si no, abre una y la cierra al final.
+
+        Con ``lectura`` la sesión nueva sale del pool de solo lectura (SQLite embebida).
+        Si la consulta falla sobre la sesión de la petición se hace rollback: en
+        PostgreSQL la transacción queda abortada y las consultas siguientes de la
+        misma petición fallarían con InFailedSqlTransaction.
+        """
+        if db is not None:
+            try:
+                yield db
+            except Exception:
+                db.rollback()
+                raise
+            return
+        db = session_lectura() if lectura else session_local()
         try:
+            yield db
+        finally:
+            db.close()
+
+    @staticmethod
+    @medir_db
+    def buscar_id(id: int, db: Session = None):
+        """Buscar estudiante por ID"""
+        with BaseDatos.sesion(db, lectura=True) as db:
             # Buscar en usuarios, sigue igual
             consulta = text("SELECT nombre FROM usuarios WHERE id = :id")
             result = db.execute(consulta, {"id": id})
@@ -27,75 +52,67 @@ class BaseDatos:
             if resultado:
                 return resultado
             return None
-        finally:
-            db.close()
 
     @staticmethod
-    def buscar_materias_de_estudiante(id: int):
+    @medir_db
+    def buscar_materias_de_estudiante(id: int, db: Session = None):
         """Buscar todas las materias de un estudiante"""
-        db = BaseDatos.get_session()
-        try:
+        with BaseDatos.sesion(db, lectura=True) as db:
             # Cambié 'like' por '=' y aseguré que el tipo sea integer
             consulta = text("SELECT id_materia FROM estudiante_materias WHERE id_estudiante = :id")
             result = db.execute(consulta, {"id": id})
             resultado = result.fetchall()
             return resultado
-        finally:
-            db.close()
 
     @staticmethod
-    def buscar_materias_por_id(id_materia: int):
+    @medir_db
+    def buscar_materias_por_id(id_materia: int, db: Session = None):
         """Buscar información de una materia por su ID"""
-        db = BaseDatos.get_session()
-        try:
+        with BaseDatos.sesion(db, lectura=True) as db:
             consulta = text("SELECT id_materia, nombre_materia, creditos FROM materias WHERE id_materia = :id")
             result = db.execute(consulta, {"id": id_materia})
             resultado = result.fetchall()
             return resultado
-        finally:
-            db.close()
 
     @staticmethod
-    def ejecutar_consulta(query: str, params: dict = None):
+    @medir_db
+    def ejecutar_consulta(query: str, params: dict = None, db: Session = None):
         """Ejecutar cualquier consulta SQL"""
-        db = BaseDatos.get_session()
-        try:
-            consulta = text(query)
-            if params:
-                result = db.execute(consulta, params)
-            else:
-                result = db.execute(consulta)
-            db.commit()
-            return result.fetchall()
-        except Exception as e:
-            db.rollback()
-            raise e
-        finally:
-            db.close()
+        with BaseDatos.sesion(db) as db:
+            try:
+                consulta = text(query)
+                if params:
+                    result = db.execute(consulta, params)
+                else:
+                    result = db.execute(consulta)
+                db.commit()
+                return result.fetchall()
+            except Exception as e:
+                db.rollback()
+                raise e
 
     @staticmethod
-    def ejecutar_insert(query: str, params: dict = None):
+    @medir_db
+    def ejecutar_insert(query: str, params: dict = None, db: Session = None):
         """Ejecutar un INSERT/UPDATE/DELETE"""
-        db = BaseDatos.get_session()
-        try:
-            consulta = text(query)
-            if params:
-                db.execute(consulta, params)
-            else:
-                db.execute(consulta)
-            db.commit()
-            return True
-        except Exception as e:
-            db.rollback()
-            raise e
-        finally:
-            db.close()
+        with BaseDatos.sesion(db) as db:
+            try:
+                consulta = text(query)
+                if params:
+                    db.execute(consulta, params)
+                else:
+                    db.execute(consulta)
+                db.commit()
+                return True
+            except Exception as e:
+                db.rollback()
+                raise e
 
     @staticmethod
-    def obtener_link_hoja(id: int) -> str | None:
+    @medir_db
+    def obtener_link_hoja(id: int, db: Session = None) -> str | None:
         """Retorna el link de la hoja de calificaciones para un usuario"""
-        session = BaseDatos.get_session()
-        try:
+        with BaseDatos.sesion(db, lectura=True) as session:
             resultado = session.execute(
                 text("SELECT link_hoja FROM profesores WHERE id = :id"),
                 {"id": id}
@@ -103,5 +120,3 @@ class BaseDatos:
             if resultado:
                 return resultado[0]
             return None
-        finally:
-            session.close()
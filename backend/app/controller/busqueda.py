@@ -0,0 +1,200 @@
+"""Búsqueda de texto completo en el buzón de sugerencias y el historial de chat.
+
+Índices (migración 6, mantenidos por la BD en cada INSERT/UPDATE/DELETE):
+
+- PostgreSQL: índice GIN sobre la expresión ``tsvector`` con la configuración
+  ``spanish`` (raíces y palabras vacías del español) y pesos por columna; la
+  consulta es ``to_tsquery`` con las mismas palabras que en SQLite, cada una
+  como prefijo de su raíz, y ordena con ``ts_rank_cd``.
+- SQLite (modo embebido): tabla FTS5 de contenido externo por tabla, con
+  triggers que la actualizan. FTS5 no trae raíces del español: el tokenizador
+  quita tildes y aquí cada palabra se busca por su raíz aproximada como prefijo
+  (``normalizacion.raiz``: "bibliotecas" -> ``"bibliotec"*``). Ordena con ``bm25``.
+
+Los resultados se paginan por cursor sobre (relevancia, id). Por HTTP se
+exponen en ``/datos/buscar/*``, con el token de administración del resto de
+``/datos``: los fragmentos traen texto de las conversaciones.
+
+Uso (desde backend/app):
+    python -m controller.busqueda sugerencias "biblioteca cerrada"
+    python -m controller.busqueda reconstruir     # vuelve a indexar todas las filas
+"""
+import argparse
+import json
+import os
+import re
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import Double, Float, String, cast, column, func, literal_column, select, table
+
+ruta = Path(__file__).resolve().parent.parent
+sys.path.append(str(ruta))
+
+from controller import models, normalizacion
+from controller.paginacion import paginar
+
+# Configuración de búsqueda de texto de PostgreSQL
+BUSQUEDA_IDIOMA_PG = os.getenv("BUSQUEDA_IDIOMA_PG", "spanish")
+BUSQUEDA_MAX_TERMINOS = int(os.getenv("BUSQUEDA_MAX_TERMINOS", "8"))
+
+if not re.fullmatch(r"\w+", BUSQUEDA_IDIOMA_PG):
+    raise ValueError(f"BUSQUEDA_IDIOMA_PG inválido: {BUSQUEDA_IDIOMA_PG}")
+
+
+class ConsultaVacia(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class Indice:
+    tabla: str
+    fts: str  # tabla FTS5 en SQLite; el índice de PostgreSQL es ix_<fts>
+    columnas: Tuple[str, ...]
+    pesos: Tuple[float, ...]  # bm25 en SQLite; >= 2 es el peso "A" de PostgreSQL
+
+
+INDICES: Dict[str, Indice] = {
+    "sugerencias": Indice("buzon_de_sugerencias", "buzon_fts", ("asunto", "descripcion"), (2.0, 1.0)),
+    "historial": Indice("chat_history", "chat_history_fts", ("mensaje", "respuesta"), (1.0, 1.0)),
+}
+
+
+# --- Términos ------------------------------------------------------------------
+
+def terminos(texto: str) -> List[str]:
+    """Palabras de la búsqueda sin tildes ni palabras vacías."""
+    return list(dict.fromkeys(normalizacion.palabras(texto)))[:BUSQUEDA_MAX_TERMINOS]
+
+
+def consulta_fts5(palabras: Sequence[str]) -> str:
+    """Expresión MATCH de FTS5: todas las palabras, cada una como prefijo de su raíz."""
+    return " ".join(f'"{normalizacion.raiz(p)}"*' for p in palabras)
+
+
+def consulta_pg(palabras: Sequence[str]) -> str:
+    """Expresión de ``to_tsquery``: todas las palabras, cada una como prefijo (la raíz la saca PostgreSQL)."""
+    # normalizar_prompt deja solo [a-z0-9ñ]: no quedan operadores de tsquery en las palabras
+    return " & ".join(f"{p}:*" for p in palabras)
+
+
+def _vector_pg(indice: Indice) -> str:
+    """SQL del tsvector: debe ser idéntico en el índice y en la consulta."""
+    return " || ".join(
+        f"setweight(to_tsvector('{BUSQUEDA_IDIOMA_PG}'::regconfig, coalesce({c}, '')), '{'A' if p >= 2 else 'B'}')"
+        for c, p in zip(indice.columnas, indice.pesos)
+    )
+
+
+# --- Índices -------------------------------------------------------------------
+
+def _crear_fts5(conexion, indice: Indice):
+    columnas = ", ".join(indice.columnas)
+    nuevos = ", ".join(f"new.{c}" for c in indice.columnas)
+    viejos = ", ".join(f"old.{c}" for c in indice.columnas)
+    fts, tabla = indice.fts, indice.tabla
+    borrar = f"INSERT INTO {fts}({fts}, rowid, {columnas}) VALUES ('delete', old.id, {viejos});"
+    insertar = f"INSERT INTO {fts}(rowid, {columnas}) VALUES (new.id, {nuevos});"
+    conexion.exec_driver_sql(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({columnas}, content='{tabla}', "
+        f"content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+    )
+    conexion.exec_driver_sql(f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {tabla} BEGIN {insertar} END")
+    conexion.exec_driver_sql(f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {tabla} BEGIN {borrar} END")
+    conexion.exec_driver_sql(
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {columnas} ON {tabla} BEGIN {borrar} {insertar} END"
+    )
+
+
+def crear_indices(conexion):
+    """Crea los índices de búsqueda (idempotente) e indexa las filas existentes."""
+    from controller.migraciones import crear_indice
+    for indice in INDICES.values():
+        if conexion.dialect.name == "sqlite":
+            _crear_fts5(conexion, indice)
+            conexion.exec_driver_sql(f"INSERT INTO {indice.fts}({indice.fts}) VALUES ('rebuild')")
+        else:
+            # CONCURRENTLY, y si un intento anterior dejó el índice inválido se vuelve a crear
+            crear_indice(conexion, f"ix_{indice.fts}", indice.tabla, [f"({_vector_pg(indice)})"], metodo="gin")
+
+
+def reconstruir(conexion):
+    """Vuelve a indexar todas las filas (FTS5 'rebuild' + 'optimize', REINDEX en PostgreSQL)."""
+    for indice in INDICES.values():
+        if conexion.dialect.name == "sqlite":
+            conexion.exec_driver_sql(f"INSERT INTO {indice.fts}({indice.fts}) VALUES ('rebuild')")
+            conexion.exec_driver_sql(f"INSERT INTO {indice.fts}({indice.fts}) VALUES ('optimize')")
+        else:
+            conexion.exec_driver_sql(f"REINDEX INDEX ix_{indice.fts}")
+
+
+# --- Búsqueda ------------------------------------------------------------------
+
+def buscar(db, nombre: str, texto: str, condiciones: Sequence = (), filtros: Optional[dict] = None,
+           cursor: Optional[str] = None, limite: int = 50) -> dict:
+    """Filas de ``INDICES[nombre]`` que contienen todas las palabras de ``texto``, de la más relevante.
+
+    Cada fila trae ``relevancia`` (mayor es mejor) y ``fragmento`` (texto con
+    las coincidencias entre corchetes). ``condiciones`` son filtros adicionales
+    sobre la tabla.
+    """
+    indice = INDICES[nombre]
+    palabras = terminos(texto)
+    if not palabras:
+        raise ConsultaVacia("La búsqueda no tiene palabras para buscar")
+    tabla = models.Base.metadata.tables[indice.tabla]
+    sqlite = db.get_bind().dialect.name == "sqlite"
+    if sqlite:
+        fts = table(indice.fts, column("rowid"))
+        pesos = ", ".join(str(p) for p in indice.pesos)
+        relevancia = literal_column(f"bm25({indice.fts}, {pesos})", Float).label("relevancia")
+        fragmento = literal_column(f"snippet({indice.fts}, -1, '[', ']', '…', 16)", String).label("fragmento")
+        consulta = select(tabla, relevancia, fragmento)\
+            .select_from(tabla.join(fts, fts.c.rowid == tabla.c.id))\
+            .where(literal_column(indice.fts).op("MATCH")(consulta_fts5(palabras)))
+    else:
+        idioma = literal_column(f"'{BUSQUEDA_IDIOMA_PG}'::regconfig")
+        vector = literal_column(f"({_vector_pg(indice)})")
+        consulta_ts = func.to_tsquery(idioma, consulta_pg(palabras))
+        documento = literal_column(" || ' ' || ".join(f"coalesce({c}, '')" for c in indice.columnas))
+        # real -> double: el valor que vuelve en el cursor se compara exacto
+        relevancia = cast(func.ts_rank_cd(vector, consulta_ts), Double).label("relevancia")
+        fragmento = func.ts_headline(idioma, documento, consulta_ts,
+                                     "StartSel=[, StopSel=], MaxWords=30, MinWords=10, MaxFragments=2",
+                                     type_=String).label("fragmento")
+        consulta = select(tabla, relevancia, fragmento).where(vector.op("@@")(consulta_ts))
+    for condicion in condiciones:
+        consulta = consulta.where(condicion)
+    # bm25 es menor mientras más relevante; ts_rank_cd, mayor
+    pagina = paginar(db, consulta, [relevancia, tabla.c.id], {**(filtros or {}), "q": texto}, cursor, limite,
+                     descendente=not sqlite)
+    for fila in pagina["items"]:
+        fila["relevancia"] = -fila["relevancia"] if sqlite else fila["relevancia"]
+    return pagina
+
+
+if __name__ == "__main__":
+    from controller.databaseconfig import engine, session_local
+
+    parser = argparse.ArgumentParser(description="Búsqueda de texto completo")
+    parser.add_argument("indice", choices=list(INDICES) + ["reconstruir"])
+    parser.add_argument("texto", nargs="?", default="")
+    parser.add_argument("--limite", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.indice == "reconstruir":
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conexion:
+            reconstruir(conexion)
+        print("Índices de búsqueda reconstruidos")
+    else:
+        db = session_local()
+        try:
+            for fila in buscar(db, args.indice, args.texto, limite=args.limite)["items"]:
+                print(json.dumps({"id": fila["id"], "relevancia": fila["relevancia"], "fragmento": fila["fragmento"]},
+                                 ensure_ascii=False))
+        except ConsultaVacia as e:
+            sys.exit(str(e))
+        finally:
+            db.close()
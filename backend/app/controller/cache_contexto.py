@@ -0,0 +1,95 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+CONTEXTO_TTL_USUARIO = float(os.getenv("CONTEXTO_TTL_USUARIO", "120"))
+CONTEXTO_TTL_GLOBAL = float(os.getenv("CONTEXTO_TTL_GLOBAL", "300"))
+CONTEXTO_MAX_USUARIOS = int(os.getenv("CONTEXTO_MAX_USUARIOS", "5000"))
+
+
+class CacheContexto:
+    """Instantáneas del contexto de BD que se inyecta en el prompt de la IA.
+
+    Guarda una sección por identificación (datos del usuario, matrícula y
+    priorización) y una sección global (materias y usuarios del sistema),
+    cada una con su TTL. Las escrituras de ``crud`` invalidan lo afectado.
+    """
+
+    def __init__(self, ttl_usuario: float = CONTEXTO_TTL_USUARIO, ttl_global: float = CONTEXTO_TTL_GLOBAL,
+                 max_usuarios: int = CONTEXTO_MAX_USUARIOS):
+        self.ttl_usuario = ttl_usuario
+        self.ttl_global = ttl_global
+        self.max_usuarios = max_usuarios
+        self._usuarios: "OrderedDict[str, tuple]" = OrderedDict()
+        self._global: Optional[tuple] = None
+        # Se incrementa en cada invalidación para descartar cargas que empezaron antes
+        self._generacion = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def usuario(self, identificacion, cargar: Callable[[], object]):
+        """Sección del usuario; llama a ``cargar()`` si no está o expiró."""
+        clave = str(identificacion)
+        with self._lock:
+            entrada = self._usuarios.get(clave)
+            if entrada is not None and entrada[0] >= time.monotonic():
+                self._usuarios.move_to_end(clave)
+                self.hits += 1
+                return entrada[1]
+            self.misses += 1
+            generacion = self._generacion
+
+        valor = cargar()
+        with self._lock:
+            if generacion == self._generacion:
+                self._usuarios[clave] = (time.monotonic() + self.ttl_usuario, valor)
+                self._usuarios.move_to_end(clave)
+                while len(self._usuarios) > self.max_usuarios:
+                    self._usuarios.popitem(last=False)
+        return valor
+
+    def global_(self, cargar: Callable[[], object]):
+        """Sección compartida por todos los usuarios."""
+        with self._lock:
+            entrada = self._global
+            if entrada is not None and entrada[0] >= time.monotonic():
+                self.hits += 1
+                return entrada[1]
+            self.misses += 1
+            generacion = self._generacion
+
+        valor = cargar()
+        with self._lock:
+            if generacion == self._generacion:
+                self._global = (time.monotonic() + self.ttl_global, valor)
+        return valor
+
+    def invalidar_usuario(self, identificacion):
+        with self._lock:
+            self._generacion += 1
+            self._usuarios.pop(str(identificacion), None)
+
+    def invalidar_global(self):
+        with self._lock:
+            self._generacion += 1
+            self._global = None
+
+    def invalidar_todo(self):
+        with self._lock:
+            self._generacion += 1
+            self._usuarios.clear()
+            self._global = None
+
+    def estadisticas(self) -> dict:
+        return {
+            "usuarios": len(self._usuarios),
+            "global": self._global is not None,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+cache_contexto = CacheContexto()
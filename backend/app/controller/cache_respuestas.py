@@ -0,0 +1,156 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from controller.normalizacion import normalizar_prompt
+
+CACHE_IA_MAX = int(os.getenv("CACHE_IA_MAX", "1000"))
+CACHE_IA_TTL = float(os.getenv("CACHE_IA_TTL", "3600"))
+CACHE_IA_SIMILITUD = float(os.getenv("CACHE_IA_SIMILITUD", "0.85"))
+CACHE_IA_APROXIMADO = os.getenv("CACHE_IA_APROXIMADO", "1") == "1"
+# Máximo de entradas revisadas por búsqueda aproximada (las más recientes)
+CACHE_IA_MAX_COMPARACIONES = int(os.getenv("CACHE_IA_MAX_COMPARACIONES", "300"))
+
+
+def bucket_temperatura(temperatura: float, ancho: float = 0.25) -> float:
+    return round(round(temperatura / ancho) * ancho, 2)
+
+
+def huella(*partes: str) -> str:
+    h = hashlib.sha1()
+    for parte in partes:
+        h.update((parte or "").encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()[:16]
+
+
+def _trigramas(texto: str) -> frozenset:
+    texto = f"  {texto} "
+    return frozenset(texto[i:i + 3] for i in range(len(texto) - 2))
+
+
+def _similitud(a: frozenset, b: frozenset) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class _Entrada:
+    __slots__ = ("valor", "expira", "trigramas")
+
+    def __init__(self, valor, expira: float, trigramas: frozenset):
+        self.valor = valor
+        self.expira = expira
+        self.trigramas = trigramas
+
+
+class CacheRespuestas:
+    """Caché LRU + TTL de respuestas del modelo.
+
+    La clave es (modelo, temperatura redondeada, huella del contexto inyectado,
+    identificación) + prompt normalizado. Con ``aproximado`` también reutiliza
+    respuestas de prompts casi iguales dentro de la misma partición, nunca
+    para prompts personalizados.
+    """
+
+    def __init__(self, max_entradas: int = CACHE_IA_MAX, ttl: float = CACHE_IA_TTL,
+                 umbral_similitud: float = CACHE_IA_SIMILITUD, aproximado: bool = CACHE_IA_APROXIMADO):
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self.umbral_similitud = umbral_similitud
+        self.aproximado = aproximado
+        self._entradas: "OrderedDict[Tuple[tuple, str], _Entrada]" = OrderedDict()
+        self._particiones: dict = {}
+        self._lock = threading.Lock()
+        self.hits_exactos = 0
+        self.hits_aproximados = 0
+        self.misses = 0
+
+    @staticmethod
+    def particion(modelo: Optional[str], temperatura: float, huella_contexto: str,
+                  identificacion: Optional[str]) -> tuple:
+        return (modelo or "auto", bucket_temperatura(temperatura), huella_contexto or "", identificacion or "")
+
+    def _eliminar(self, clave):
+        self._entradas.pop(clave, None)
+        claves = self._particiones.get(clave[0])
+        if claves is not None:
+            claves.pop(clave[1], None)
+            if not claves:
+                del self._particiones[clave[0]]
+
+    def obtener(self, prompt: str, particion: tuple):
+        """Retorna (valor, "exacto" | "aproximado") o (None, None)."""
+        texto = normalizar_prompt(prompt)
+        ahora = time.monotonic()
+        with self._lock:
+            clave = (particion, texto)
+            entrada = self._entradas.get(clave)
+            if entrada is not None:
+                if entrada.expira >= ahora:
+                    self._entradas.move_to_end(clave)
+                    self.hits_exactos += 1
+                    return entrada.valor, "exacto"
+                self._eliminar(clave)
+
+            personalizado = bool(particion[3])
+            if self.aproximado and not personalizado:
+                encontrada = self._buscar_aproximada(particion, texto, ahora)
+                if encontrada is not None:
+                    self.hits_aproximados += 1
+                    return encontrada.valor, "aproximado"
+
+            self.misses += 1
+            return None, None
+
+    def _buscar_aproximada(self, particion: tuple, texto: str, ahora: float) -> Optional[_Entrada]:
+        claves = self._particiones.get(particion)
+        if not claves:
+            return None
+        trigramas = _trigramas(texto)
+        mejor, mejor_similitud = None, self.umbral_similitud
+        for i, otro in enumerate(reversed(claves)):
+            if i >= CACHE_IA_MAX_COMPARACIONES:
+                break
+            entrada = self._entradas.get((particion, otro))
+            if entrada is None or entrada.expira < ahora:
+                continue
+            similitud = _similitud(trigramas, entrada.trigramas)
+            if similitud >= mejor_similitud:
+                mejor, mejor_similitud = entrada, similitud
+        return mejor
+
+    def guardar(self, prompt: str, particion: tuple, valor):
+        texto = normalizar_prompt(prompt)
+        clave = (particion, texto)
+        with self._lock:
+            self._entradas[clave] = _Entrada(valor, time.monotonic() + self.ttl, _trigramas(texto))
+            self._entradas.move_to_end(clave)
+            claves = self._particiones.setdefault(particion, OrderedDict())
+            claves[texto] = None
+            claves.move_to_end(texto)
+            while len(self._entradas) > self.max_entradas:
+                self._eliminar(next(iter(self._entradas)))
+
+    def limpiar(self):
+        with self._lock:
+            self._entradas.clear()
+            self._particiones.clear()
+
+    def estadisticas(self) -> dict:
+        consultas = self.hits_exactos + self.hits_aproximados + self.misses
+        return {
+            "entradas": len(self._entradas),
+            "hits_exactos": self.hits_exactos,
+            "hits_aproximados": self.hits_aproximados,
+            "misses": self.misses,
+            "tasa_aciertos": round((self.hits_exactos + self.hits_aproximados) / consultas, 4) if consultas else 0.0,
+            "aproximado": self.aproximado,
+            "umbral_similitud": self.umbral_similitud,
+        }
+
+
+cache_respuestas = CacheRespuestas()
@@ -0,0 +1,77 @@
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+def _config_float(nombre: str, defecto: str) -> float:
+    return float(os.getenv(nombre, defecto))
+
+
+# Máximo que una petición puede pedir en ``timeout`` (segundos): ocupa una conexión y un cupo de admisión
+GROQ_TIMEOUT_MAX = _config_float("GROQ_TIMEOUT_MAX", "60")
+
+
+class ClienteGroq:
+    """Cliente asíncrono de Groq compartido por todo el proceso.
+
+    Se crea una sola vez (al iniciar la app) con un pool de conexiones
+    keep-alive, en lugar de un cliente y un pool nuevos por petición.
+    """
+
+    def __init__(self):
+        self._cliente = None
+        self._http = None
+        self.timeout = None
+
+    @property
+    def iniciado(self) -> bool:
+        return self._cliente is not None
+
+    def iniciar(self, api_key: str = None):
+        """Crea el cliente. Lanza RuntimeError si falta la API key o el paquete."""
+        if self._cliente is not None:
+            return self._cliente
+        api_key = api_key or os.getenv("GROQ_API_KEY", "")
+        if not api_key:
+            raise RuntimeError(
+                "GROQ_API_KEY no configurada. Obtén una en https://console.groq.com/ y configúrala como variable de entorno."
+            )
+        try:
+            import httpx
+            from groq import AsyncGroq
+        except ImportError:
+            raise RuntimeError("Paquete 'groq' no instalado. Ejecuta: pip install groq")
+
+        self.timeout = _config_float("GROQ_TIMEOUT", "30")
+        limites = httpx.Limits(
+            max_connections=int(os.getenv("GROQ_MAX_CONEXIONES", "20")),
+            max_keepalive_connections=int(os.getenv("GROQ_MAX_KEEPALIVE", "10")),
+            keepalive_expiry=_config_float("GROQ_KEEPALIVE_EXPIRY", "30"),
+        )
+        timeout = httpx.Timeout(self.timeout, connect=_config_float("GROQ_TIMEOUT_CONEXION", "5"))
+        self._http = httpx.AsyncClient(limits=limites, timeout=timeout)
+        # Otro servidor compatible (p. ej. bench/groq_falso.py en las pruebas de carga)
+        base_url = os.getenv("GROQ_BASE_URL") or None
+        self._cliente = AsyncGroq(
+            api_key=api_key,
+            base_url=base_url,
+            http_client=self._http,
+            timeout=timeout,
+            max_retries=int(os.getenv("GROQ_MAX_REINTENTOS", "1")),
+        )
+        logger.info(f"Cliente Groq iniciado (máx. {limites.max_connections} conexiones{', ' + base_url if base_url else ''})")
+        return self._cliente
+
+    def obtener(self):
+        """Retorna el cliente compartido, creándolo si aún no existe."""
+        return self._cliente or self.iniciar()
+
+    async def cerrar(self):
+        if self._cliente is not None:
+            await self._cliente.close()
+        self._cliente = None
+        self._http = None
+
+
+cliente_groq = ClienteGroq()
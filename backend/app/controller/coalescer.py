@@ -0,0 +1,49 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable
+
+
+class Coalescedor:
+    """Single-flight: peticiones concurrentes con la misma clave comparten una llamada.
+
+    La primera petición (líder) crea la tarea; las demás esperan la misma tarea
+    con ``asyncio.shield``, así cancelar a un solo cliente no cancela la llamada
+    de los otros. La clave se libera cuando la tarea termina.
+    """
+
+    def __init__(self):
+        self._en_vuelo: Dict[Hashable, asyncio.Task] = {}
+        self.lideres = 0
+        self.deduplicadas = 0
+        self.errores = 0
+
+    def _liberar(self, clave: Hashable, tarea: asyncio.Task):
+        if self._en_vuelo.get(clave) is tarea:
+            del self._en_vuelo[clave]
+        if not tarea.cancelled() and tarea.exception() is not None:
+            # Se marca como leída para que asyncio no la reporte si nadie esperaba
+            self.errores += 1
+
+    async def ejecutar(self, clave: Hashable, llamada: Callable[[], Awaitable]):
+        """Ejecuta ``llamada()`` una sola vez por clave en vuelo y retorna su resultado."""
+        tarea = self._en_vuelo.get(clave)
+        if tarea is None:
+            tarea = asyncio.ensure_future(llamada())
+            self._en_vuelo[clave] = tarea
+            tarea.add_done_callback(lambda t: self._liberar(clave, t))
+            self.lideres += 1
+        else:
+            self.deduplicadas += 1
+        return await asyncio.shield(tarea)
+
+    def estadisticas(self) -> dict:
+        total = self.lideres + self.deduplicadas
+        return {
+            "en_vuelo": len(self._en_vuelo),
+            "llamadas": self.lideres,
+            "deduplicadas": self.deduplicadas,
+            "errores": self.errores,
+            "tasa_deduplicacion": round(self.deduplicadas / total, 4) if total else 0.0,
+        }
+
+
+coalescedor = Coalescedor()
@@ -3,8 +3,12 @@ from controller import models
 import schemas
 from typing import List, Optional
 from pathlib import Path
-from sqlalchemy import text
+from sqlalchemy import select, text
 from controller.base_datos import BaseDatos
+from controller.cache_contexto import cache_contexto
+from controller.metricas import medir_db
+from controller.paginacion import fecha_para, paginar
+from controller import busqueda, encuestas
 import sys
 
 from controller import models
@@ -15,19 +19,24 @@ from controller import schemas
 import schemas"""
 
 # CRUD para Materia
+@medir_db
 def crear_materia(db: Session, materia: schemas.MateriaCreate):
     db_materia = models.Materia(**materia.dict())
     db.add(db_materia)
     db.commit()
     db.refresh(db_materia)
+    # Las materias aparecen en el contexto global y en el de cada estudiante
+    cache_contexto.invalidar_todo()
     return db_materia
 
+@medir_db
 def obtener_materia(db: Session, id_materia: int):
     """Obtener una materia por ID"""
     return db.query(models.Materia)\
         .filter(models.Materia.id_materia == id_materia)\
         .first()
 
+@medir_db
 def obtener_todas_materias(db: Session, skip: int = 0, limit: int = 100):
     """Obtener todas las materias"""
     return db.query(models.Materia)\
@@ -36,13 +45,16 @@ def obtener_todas_materias(db: Session, skip: int = 0, limit: int = 100):
         .all()
 
 # CRUD para Estudiante_Materia (Matrícula)
+@medir_db
 def crear_estudiante_materia(db: Session, estudiante_materia: schemas.EstudianteMateriaCreate):
     db_estudiante_materia = models.EstudianteMateria(**estudiante_materia.dict())
     db.add(db_estudiante_materia)
     db.commit()
     db.refresh(db_estudiante_materia)
+    cache_contexto.invalidar_usuario(db_estudiante_materia.id_estudiante)
     return db_estudiante_materia
 
+@medir_db
 def obtener_materias_estudiante(db: Session, id_estudiante: int):
     """
     Obtener todas las materias de un estudiante con información completa
@@ -52,6 +64,19 @@ def obtener_materias_estudiante(db: Session, id_estudiante: int):
         .filter(models.EstudianteMateria.id_estudiante == id_estudiante)\
         .all()
 
+@medir_db
+def obtener_materias_priorizadas(db: Session, id_estudiante):
+    """
+    Obtener id, nombre y créditos de las materias de un estudiante en una sola
+    consulta (join con matrícula), ordenadas de mayor a menor número de créditos
+    """
+    return db.query(models.Materia.id_materia, models.Materia.nombre_materia, models.Materia.creditos)\
+        .join(models.EstudianteMateria, models.EstudianteMateria.id_materia == models.Materia.id_materia)\
+        .filter(models.EstudianteMateria.id_estudiante == str(id_estudiante))\
+        .order_by(models.Materia.creditos.desc(), models.Materia.id_materia)\
+        .all()
+
+@medir_db
 def obtener_materias_estudiante_ordenadas(
     db: Session, 
     id_estudiante: int,
@@ -101,6 +126,7 @@ def obtener_materias_estudiante_ordenadas(
     
     return query.all()
 
+@medir_db
 def obtener_materias_prioritarias(db: Session, id_estudiante: int, limite: int = 5):
     """
     Obtener las materias más prioritarias para el estudiante
@@ -127,20 +153,39 @@ def obtener_materias_prioritarias(db: Session, id_estudiante: int, limite: int =
         .limit(limite)\
         .all()
 
+@medir_db
+def listar_materias(db: Session, documento: Optional[str] = None, creditos: Optional[int] = None,
+                    cursor: Optional[str] = None, limite: int = 50):
+    """Materias por id (paginación por cursor); con documento, solo las del estudiante"""
+    tabla = models.Materia.__table__
+    consulta = select(tabla.c.id_materia, tabla.c.nombre_materia, tabla.c.creditos)
+    if documento:
+        matriculas = select(models.EstudianteMateria.id_materia)\
+            .where(models.EstudianteMateria.id_estudiante == documento)
+        consulta = consulta.where(tabla.c.id_materia.in_(matriculas))
+    if creditos is not None:
+        consulta = consulta.where(tabla.c.creditos == creditos)
+    filtros = {"documento": documento, "creditos": creditos}
+    return paginar(db, consulta, [tabla.c.id_materia], filtros, cursor, limite, descendente=False)
+
 # CRUD para Encuesta
+@medir_db
 def crear_encuesta(db: Session, encuesta: schemas.EncuestaCreate):
     """Crear una nueva encuesta"""
     db_encuesta = models.Encuesta(**encuesta.dict())
     db.add(db_encuesta)
+    encuestas.acumular(db, [encuesta.dict()])
     db.commit()
     db.refresh(db_encuesta)
     return db_encuesta
 
+@medir_db
 def leer_encuesta(db: Session, survey_id: int):
     """Obtener una encuesta por ID"""
     return db.query(models.Survey).filter(models.Survey.id == survey_id).first()
 
 # CRUD para BuzonSugerencias
+@medir_db
 def crear_sugerencia(db: Session, sugerencia: schemas.BuzonSugerenciasCreate):
     """Crear una nueva sugerencia"""
     db_sugerencia = models.BuzonSugerencias(**sugerencia.dict())
@@ -149,12 +194,14 @@ def crear_sugerencia(db: Session, sugerencia: schemas.BuzonSugerenciasCreate):
     db.refresh(db_sugerencia)
     return db_sugerencia
 
+@medir_db
 def obtener_sugerencia(db: Session, sugerencia_id: int):
     """Obtener una sugerencia por ID"""
     return db.query(models.BuzonSugerencias)\
         .filter(models.BuzonSugerencias.id == sugerencia_id)\
         .first()
 
+@medir_db
 def obtener_sugerencias_por_estudiante(db: Session, id_estudiante: str):
     """Obtener todas las sugerencias de un estudiante"""
     return db.query(models.BuzonSugerencias)\
@@ -162,6 +209,7 @@ def obtener_sugerencias_por_estudiante(db: Session, id_estudiante: str):
         .order_by(models.BuzonSugerencias.created_at.desc())\
         .all()
 
+@medir_db
 def obtener_todas_sugerencias(db: Session, skip: int = 0, limit: int = 100):
     """Obtener todas las sugerencias"""
     return db.query(models.BuzonSugerencias)\
@@ -170,6 +218,41 @@ def obtener_todas_sugerencias(db: Session, skip: int = 0, limit: int = 100):
         .limit(limit)\
         .all()
 
+@medir_db
+def listar_sugerencias(db: Session, estado: Optional[str] = None, tipo_sugerencia: Optional[str] = None,
+                       documento: Optional[str] = None, desde=None, hasta=None,
+                       cursor: Optional[str] = None, limite: int = 50):
+    """Sugerencias de la más reciente a la más antigua (paginación por cursor)"""
+    tabla = models.BuzonSugerencias.__table__
+    consulta = select(tabla)
+    if estado:
+        consulta = consulta.where(tabla.c.estado == estado)
+    if tipo_sugerencia:
+        consulta = consulta.where(tabla.c.tipo_sugerencia == tipo_sugerencia)
+    if documento:
+        consulta = consulta.where(tabla.c.id_estudiante == documento)
+    if desde:
+        consulta = consulta.where(tabla.c.created_at >= fecha_para(db, desde))
+    if hasta:
+        consulta = consulta.where(tabla.c.created_at < fecha_para(db, hasta))
+    filtros = {"estado": estado, "tipo_sugerencia": tipo_sugerencia, "documento": documento,
+               "desde": desde, "hasta": hasta}
+    return paginar(db, consulta, [tabla.c.created_at, tabla.c.id], filtros, cursor, limite)
+
+@medir_db
+def buscar_sugerencias(db: Session, texto: str, estado: Optional[str] = None, tipo_sugerencia: Optional[str] = None,
+                       cursor: Optional[str] = None, limite: int = 50):
+    """Sugerencias cuyo asunto o descripción contienen ``texto``, de la más relevante"""
+    tabla = models.BuzonSugerencias.__table__
+    condiciones = []
+    if estado:
+        condiciones.append(tabla.c.estado == estado)
+    if tipo_sugerencia:
+        condiciones.append(tabla.c.tipo_sugerencia == tipo_sugerencia)
+    filtros = {"estado": estado, "tipo_sugerencia": tipo_sugerencia}
+    return busqueda.buscar(db, "sugerencias", texto, condiciones, filtros, cursor, limite)
+
+@medir_db
 def actualizar_estado_sugerencia(db: Session, sugerencia_id: int, nuevo_estado: str):
     """Actualizar el estado de una sugerencia"""
     sugerencia = obtener_sugerencia(db, sugerencia_id)
@@ -180,6 +263,7 @@ def actualizar_estado_sugerencia(db: Session, sugerencia_id: int, nuevo_estado:
     return sugerencia
 
 # CRUD para historial de chat
+@medir_db
 def crear_historial_chat(db: Session, chat: schemas.ChatHistorialCreate):
     """Guardar historial de chat"""
     db_chat = models.ChatHistory(**chat.dict())
@@ -188,15 +272,61 @@ def crear_historial_chat(db: Session, chat: schemas.ChatHistorialCreate):
     db.refresh(db_chat)
     return db_chat
 
+@medir_db
+def obtener_historial_reciente(db: Session, numero_documento: str, limite: int = 20):
+    """Últimos mensajes de un usuario (índice numero_documento, created_at)"""
+    return db.query(models.ChatHistory)\
+        .filter(models.ChatHistory.numero_documento == numero_documento)\
+        .order_by(models.ChatHistory.created_at.desc())\
+        .limit(limite)\
+        .all()
+
+@medir_db
+def listar_historial(db: Session, documento: Optional[str] = None, tipo_documento: Optional[str] = None,
+                     estado: Optional[str] = None, desde=None, hasta=None,
+                     cursor: Optional[str] = None, limite: int = 50):
+    """Historial del más reciente al más antiguo (paginación por cursor)"""
+    tabla = models.ChatHistory.__table__
+    consulta = select(tabla)
+    if documento:
+        consulta = consulta.where(tabla.c.numero_documento == documento)
+    if tipo_documento:
+        consulta = consulta.where(tabla.c.tipo_documento == tipo_documento)
+    if estado:
+        consulta = consulta.where(tabla.c.estado == estado)
+    if desde:
+        consulta = consulta.where(tabla.c.created_at >= fecha_para(db, desde))
+    if hasta:
+        consulta = consulta.where(tabla.c.created_at < fecha_para(db, hasta))
+    filtros = {"documento": documento, "tipo_documento": tipo_documento, "estado": estado,
+               "desde": desde, "hasta": hasta}
+    return paginar(db, consulta, [tabla.c.created_at, tabla.c.id], filtros, cursor, limite)
+
+@medir_db
+def buscar_historial(db: Session, texto: str, documento: Optional[str] = None, estado: Optional[str] = None,
+                     cursor: Optional[str] = None, limite: int = 50):
+    """Mensajes del historial (pregunta o respuesta) que contienen ``texto``, del más relevante"""
+    tabla = models.ChatHistory.__table__
+    condiciones = []
+    if documento:
+        condiciones.append(tabla.c.numero_documento == documento)
+    if estado:
+        condiciones.append(tabla.c.estado == estado)
+    filtros = {"documento": documento, "estado": estado}
+    return busqueda.buscar(db, "historial", texto, condiciones, filtros, cursor, limite)
+
 # CRUD para User
+@medir_db
 def crear_estudiante(db: Session, user: schemas.EstudianteCreate):
     """Crear un nuevo usuario"""
     db_user = models.Estudiante(**user.dict())
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
+    cache_contexto.invalidar_usuario(db_user.id)
     return db_user
 
+@medir_db
 def get_user_by_documento(db: Session, tipo_documento: str, numero_documento: str):
     """Obtener usuario por documento"""
     return db.query(models.User)\
@@ -206,10 +336,12 @@ def get_user_by_documento(db: Session, tipo_documento: str, numero_documento: st
         )\
         .first()
 
+@medir_db
 def get_user(db: Session, user_id: int):
     """Obtener usuario por ID"""
     return db.query(models.User).filter(models.User.id == user_id).first()
 
+@medir_db
 def update_user(db: Session, user_id: int, user_update: schemas.EstudianteUpdate):
     """Actualizar usuario"""
     db_user = get_user(db, user_id)
@@ -218,12 +350,17 @@ def update_user(db: Session, user_id: int, user_update: schemas.EstudianteUpdate
             setattr(db_user, key, value)
         db.commit()
         db.refresh(db_user)
+        # Los usuarios aparecen en el contexto global y en el propio
+        cache_contexto.invalidar_global()
+        cache_contexto.invalidar_usuario(user_id)
     return db_user
 
+@medir_db
 def get_users(db: Session, skip: int = 0, limit: int = 100):
     """Obtener todos los usuarios con paginación"""
     return db.query(models.User).offset(skip).limit(limit).all()
 
+@medir_db
 def get_usuario_por_documento(db: Session, tipo_id: str, id: str):
     """Obtener usuario por documento"""
     return db.query(models.Usuario).filter(
@@ -232,25 +369,25 @@ def get_usuario_por_documento(db: Session, tipo_id: str, id: str):
     ).first()
 
 
-def obtener_link_hoja(profesor_id: int):
+@medir_db
+def obtener_link_hoja(profesor_id: int, db: Session = None):
     """
     Retorna el link de la hoja de calificaciones del profesor según su ID.
     """
-    db = BaseDatos.get_session()
-    try:
+    with BaseDatos.sesion(db, lectura=True) as db:
         consulta = text("SELECT link_hoja FROM profesores WHERE id = :id")
         result = db.execute(consulta, {"id": profesor_id})
         row = result.fetchone()
         if row and row[0]:
             return row[0]
         return None  # Si no hay link asignado
-    finally:
-        db.close()
 
+@medir_db
 def get_users(db: Session, skip: int = 0, limit: int = 100):
     """Obtener todos los usuarios con paginación"""
     return db.query(models.User).offset(skip).limit(limit).all()
 
+@medir_db
 def get_usuario_por_documento(db: Session, tipo_id: str, id: str):
     """Obtener usuario por documento"""
     return db.query(models.Usuario).filter(
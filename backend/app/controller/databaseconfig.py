@@ -1,22 +1,138 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, declarative_base
 from pathlib import Path
+import os
 import sys
 # Agregar el directorio raíz del backend al PATH
 backend_path = Path(__file__).resolve().parent.parent.parent
 sys.path.append(str(backend_path))
 
-import secretconfig as sc
 """coneccion con base de datos"""
-DATABASE_URL = f"postgresql://{sc.PGUSER}:{sc.PGPASSWORD}@{sc.PGHOST}/{sc.PGDATABASE}?sslmode={sc.PGSSLMODE}&channel_binding={sc.PGCHANNELBINDING}"
+# postgres (servidor remoto) | sqlite (embebida: kioscos, instalaciones de un solo nodo)
+DB_MODO = os.getenv("DB_MODO", "postgres")
+SQLITE_RUTA = os.getenv("SQLITE_RUTA", str(backend_path / "database" / "chatbot.db"))
+DATABASE_URL = os.getenv("DATABASE_URL")
+if not DATABASE_URL and DB_MODO == "sqlite":
+    DATABASE_URL = f"sqlite:///{SQLITE_RUTA}"
+if not DATABASE_URL:
+    # Las credenciales solo se necesitan si no se indica otra BD (p. ej. SQLite en los benchmarks)
+    import secretconfig as sc
+    DATABASE_URL = f"postgresql://{sc.PGUSER}:{sc.PGPASSWORD}@{sc.PGHOST}/{sc.PGDATABASE}?sslmode={sc.PGSSLMODE}&channel_binding={sc.PGCHANNELBINDING}"
+
+"""configuración del pool de conexiones"""
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))  # segundos esperando una conexión libre
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # el servidor cierra conexiones inactivas
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "15000"))  # 0 = sin límite
+
+"""ajustes de SQLite"""
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))  # espera por el bloqueo de escritura
+SQLITE_CACHE_KB = int(os.getenv("SQLITE_CACHE_KB", "20000"))
+SQLITE_MMAP_BYTES = int(os.getenv("SQLITE_MMAP_BYTES", str(256 * 1024 * 1024)))
+SQLITE_POOL_LECTURA = int(os.getenv("SQLITE_POOL_LECTURA", "8"))  # conexiones de solo lectura
+
+
+def _es_sqlite_archivo(url: str) -> bool:
+    return url.startswith("sqlite") and url not in ("sqlite://", "sqlite:///:memory:") and "mode=memory" not in url
+
+
+def _opciones_motor(url: str) -> dict:
+    # En SQLite no hay red que corte conexiones: el ping solo agrega una consulta por checkout
+    opciones = {"pool_pre_ping": DB_POOL_PRE_PING and not url.startswith("sqlite")}
+    if url.startswith("sqlite") and not _es_sqlite_archivo(url):
+        return opciones
+    opciones.update(
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+    )
+    if url.startswith("postgresql") and DB_STATEMENT_TIMEOUT_MS > 0:
+        opciones["connect_args"] = {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"}
+    return opciones
+
 
 """motor de base de datos"""
 engine = create_engine(
-    DATABASE_URL
+    DATABASE_URL,
+    **_opciones_motor(DATABASE_URL)
 )
 
+def _pragmas_sqlite(solo_lectura: bool = False):
+    """Pragmas que se aplican a cada conexión nueva de SQLite."""
+    def aplicar(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        # WAL: los lectores no bloquean al escritor ni al revés
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_KB}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_BYTES}")
+        if solo_lectura:
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+    return aplicar
+
+
+if _es_sqlite_archivo(DATABASE_URL):
+    event.listen(engine, "connect", _pragmas_sqlite())
+    # Pool aparte de conexiones de solo lectura para las consultas
+    engine_lectura = create_engine(
+        DATABASE_URL,
+        pool_size=SQLITE_POOL_LECTURA,
+        max_overflow=0,
+        pool_timeout=DB_POOL_TIMEOUT,
+    )
+    event.listen(engine_lectura, "connect", _pragmas_sqlite(solo_lectura=True))
+else:
+    # En PostgreSQL las lecturas comparten el pool principal
+    engine_lectura = engine
+
+"""contadores del pool"""
+_contadores_pool = {"conexiones_creadas": 0, "checkouts": 0, "invalidadas": 0}
+
+
+@event.listens_for(engine, "connect")
+def _al_conectar(dbapi_connection, connection_record):
+    _contadores_pool["conexiones_creadas"] += 1
+
+
+@event.listens_for(engine, "checkout")
+def _al_tomar(dbapi_connection, connection_record, connection_proxy):
+    _contadores_pool["checkouts"] += 1
+
+
+@event.listens_for(engine, "invalidate")
+def _al_invalidar(dbapi_connection, connection_record, exception):
+    _contadores_pool["invalidadas"] += 1
+
+
+def estadisticas_pool() -> dict:
+    """Uso actual del pool de conexiones."""
+    pool = engine.pool
+    estadisticas = {"pool": type(pool).__name__, **_contadores_pool}
+    if hasattr(pool, "checkedout"):
+        tamano = pool.size()
+        estadisticas.update(
+            tamano=tamano,
+            max_overflow=DB_MAX_OVERFLOW,
+            en_uso=pool.checkedout(),
+            libres=pool.checkedin(),
+            overflow=max(0, pool.overflow()),
+            utilizacion=round(pool.checkedout() / (tamano + DB_MAX_OVERFLOW), 4) if tamano + DB_MAX_OVERFLOW else 0.0,
+        )
+    if engine_lectura is not engine:
+        estadisticas["lectura"] = {"tamano": engine_lectura.pool.size(), "en_uso": engine_lectura.pool.checkedout()}
+    return estadisticas
+
+
 """se crea la secion"""
 session_local = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+session_lectura = sessionmaker(autocommit=False, autoflush=False, bind=engine_lectura)
 
 """base para los modelos"""
 base = declarative_base()
@@ -26,4 +142,13 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+def get_db_lectura():
+    """Sesión para endpoints que solo leen (pool de lectura en SQLite)."""
+    db = session_lectura()
+    try:
+        yield db
+    finally:
+        db.close()
@@ -0,0 +1,235 @@
+"""Respuestas de encuestas por clave y contadores precalculados.
+
+Las preguntas salen de la cadena ``pregunta_encuesta`` / ``siguiente`` del
+árbol de opciones: cada pregunta se identifica por el ``dato_clave`` de sus
+respuestas, así que una encuesta puede tener cualquier cantidad de preguntas.
+Cada encuesta guarda sus respuestas como JSON compacto en
+``encuesta.respuestas`` (las columnas ``facultad`` y ``satisfaccion`` se siguen
+llenando para los reportes existentes).
+
+``encuesta_resumen`` lleva un contador por (pregunta, respuesta, facultad) que
+se incrementa en la misma transacción que inserta las encuestas (outbox o
+crud), así ``resumen`` lee unas pocas filas sin importar cuántas encuestas hay.
+
+Uso (desde backend/app):
+    python -m controller.encuestas resumen [--facultad Diseño]
+    python -m controller.encuestas recalcular   # reconstruye los contadores desde la tabla
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import sys
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import delete, select, update
+
+ruta = Path(__file__).resolve().parent.parent
+sys.path.append(str(ruta))
+
+from controller import models
+
+logger = logging.getLogger(__name__)
+
+# dato_clave de la pregunta que define la facultad de quien responde
+ENCUESTA_CLAVE_FACULTAD = os.getenv("ENCUESTA_CLAVE_FACULTAD", "Facultad")
+ENCUESTA_CLAVE_SATISFACCION = os.getenv("ENCUESTA_CLAVE_SATISFACCION", "Satisfaccion")
+
+# Fila del resumen que cuenta encuestas (no respuestas) por facultad
+TOTAL = "*"
+
+_resumen = models.EncuestaResumen.__table__
+
+
+# --- Preguntas -----------------------------------------------------------------
+
+def preguntas(arbol) -> List[dict]:
+    """Preguntas de encuesta del árbol compilado, en orden: clave, texto y respuestas."""
+    encontradas: Dict[str, dict] = {}
+    for nodo in arbol.nodos.values():
+        if nodo.tipo != "encuesta":
+            continue
+        opciones = list(nodo.datos.get("respuestas_encuesta", {}).values())
+        if not opciones:
+            continue
+        clave = opciones[0]["dato_clave"]
+        pregunta = encontradas.setdefault(clave, {"clave": clave, "pregunta": nodo.datos["pregunta_encuesta"],
+                                                  "respuestas": []})
+        for opcion in opciones:
+            if opcion["texto"] not in pregunta["respuestas"]:
+                pregunta["respuestas"].append(opcion["texto"])
+    return list(encontradas.values())
+
+
+# --- Filas ---------------------------------------------------------------------
+
+def fila_encuesta(id_estudiante, respuestas: dict) -> dict:
+    """Fila de ``encuesta`` para las respuestas ``{dato_clave: texto}``."""
+    valores = list(respuestas.values())
+    facultad = respuestas.get(ENCUESTA_CLAVE_FACULTAD, valores[0] if valores else None)
+    satisfaccion = respuestas.get(ENCUESTA_CLAVE_SATISFACCION, valores[1] if len(valores) > 1 else None)
+    return {
+        "id_estudiante": id_estudiante,
+        "facultad": facultad[:20] if facultad else None,
+        "satisfaccion": satisfaccion[:20] if satisfaccion else None,
+        "respuestas": json.dumps(respuestas, ensure_ascii=False, separators=(",", ":")),
+    }
+
+
+def respuestas_de_fila(fila) -> dict:
+    """Respuestas por clave de una fila; las anteriores a la columna salen de facultad/satisfaccion."""
+    texto = fila.get("respuestas") if isinstance(fila, dict) else fila.respuestas
+    if texto:
+        try:
+            return json.loads(texto)
+        except ValueError:
+            logger.warning(f"Encuesta con respuestas ilegibles: {texto!r}")
+            return {}
+    facultad = fila.get("facultad") if isinstance(fila, dict) else fila.facultad
+    satisfaccion = fila.get("satisfaccion") if isinstance(fila, dict) else fila.satisfaccion
+    legado = {ENCUESTA_CLAVE_FACULTAD: facultad, ENCUESTA_CLAVE_SATISFACCION: satisfaccion}
+    return {clave: valor for clave, valor in legado.items() if valor}
+
+
+def _contar(filas: Iterable) -> Counter:
+    conteo: Counter = Counter()
+    for fila in filas:
+        respuestas = respuestas_de_fila(fila)
+        facultad = str(respuestas.get(ENCUESTA_CLAVE_FACULTAD) or "")[:100]
+        conteo[(TOTAL, "", facultad)] += 1
+        for clave, valor in respuestas.items():
+            conteo[(str(clave)[:100], str(valor)[:200], facultad)] += 1
+    return conteo
+
+
+# --- Contadores ----------------------------------------------------------------
+
+def _insert_con_conflicto(dialecto: str):
+    if dialecto == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialecto == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return None
+    return insert
+
+
+def _sumar(ejecutor, conteo: Counter):
+    """Suma ``conteo`` a los contadores con un upsert multi-fila."""
+    if not conteo:
+        return
+    # Orden fijo de las claves: dos transacciones concurrentes no se bloquean en cruz
+    filas = [{"pregunta": p, "respuesta": r, "facultad": f, "total": n} for (p, r, f), n in sorted(conteo.items())]
+    insert = _insert_con_conflicto(ejecutor.get_bind().dialect.name if hasattr(ejecutor, "get_bind")
+                                   else ejecutor.dialect.name)
+    if insert is not None:
+        sentencia = insert(_resumen).values(filas)
+        ejecutor.execute(sentencia.on_conflict_do_update(
+            index_elements=[_resumen.c.pregunta, _resumen.c.respuesta, _resumen.c.facultad],
+            set_={"total": _resumen.c.total + sentencia.excluded.total},
+        ))
+        return
+    for fila in filas:
+        clave = ((_resumen.c.pregunta == fila["pregunta"]) & (_resumen.c.respuesta == fila["respuesta"])
+                 & (_resumen.c.facultad == fila["facultad"]))
+        if not ejecutor.execute(update(_resumen).where(clave).values(total=_resumen.c.total + fila["total"])).rowcount:
+            ejecutor.execute(_resumen.insert().values(**fila))
+
+
+def acumular(ejecutor, filas: Iterable):
+    """Incrementa los contadores con las encuestas ``filas`` (sin commit: va en la transacción del insert)."""
+    _sumar(ejecutor, _contar(filas))
+
+
+def recalcular(ejecutor) -> int:
+    """Reconstruye los contadores leyendo toda la tabla ``encuesta``. Retorna las encuestas leídas.
+
+    Pensado para la migración o para reparar: las encuestas que se inserten
+    mientras corre pueden quedar fuera.
+    """
+    tabla = models.Encuesta.__table__
+    consulta = select(tabla.c.facultad, tabla.c.satisfaccion, tabla.c.respuestas).execution_options(yield_per=1000)
+    conteo = _contar(dict(fila._mapping) for fila in ejecutor.execute(consulta))
+    ejecutor.execute(delete(_resumen))
+    _sumar(ejecutor, conteo)
+    return sum(n for (pregunta, _, _), n in conteo.items() if pregunta == TOTAL)
+
+
+# --- Reporte -------------------------------------------------------------------
+
+def _promedio(respuestas: Dict[str, int]) -> Optional[float]:
+    """Promedio si todas las respuestas empiezan con un número (p. ej. "4 (Satisfecho)")."""
+    suma = cantidad = 0
+    for texto, total in respuestas.items():
+        numero = re.match(r"\s*(\d+)", texto)
+        if numero is None:
+            return None
+        suma += int(numero.group(1)) * total
+        cantidad += total
+    return round(suma / cantidad, 2) if cantidad else None
+
+
+def resumen(db, arbol=None, facultad: Optional[str] = None) -> dict:
+    """Totales por pregunta y respuesta (de una facultad o de todas) desde los contadores."""
+    # Orden fijo: las respuestas que no están en el árbol salen igual sin importar cómo se insertaron
+    consulta = select(_resumen.c.pregunta, _resumen.c.respuesta, _resumen.c.facultad, _resumen.c.total)\
+        .order_by(_resumen.c.pregunta, _resumen.c.respuesta)
+    if facultad is not None:
+        consulta = consulta.where(_resumen.c.facultad == facultad)
+    por_pregunta: Dict[str, Counter] = {}
+    facultades: Counter = Counter()
+    for pregunta, respuesta, fac, total in db.execute(consulta):
+        if pregunta == TOTAL:
+            facultades[fac] += total
+        else:
+            por_pregunta.setdefault(pregunta, Counter())[respuesta] += total
+
+    # Las preguntas del árbol van primero y con sus respuestas en cero
+    definidas = preguntas(arbol) if arbol is not None else []
+    resultado = []
+    for definida in definidas + [{"clave": c, "pregunta": None, "respuestas": []}
+                                 for c in por_pregunta if c not in {d["clave"] for d in definidas}]:
+        conteo = por_pregunta.get(definida["clave"], Counter())
+        textos = definida["respuestas"] + [r for r in conteo if r not in definida["respuestas"]]
+        total = sum(conteo.values())
+        resultado.append({
+            "clave": definida["clave"],
+            "pregunta": definida["pregunta"],
+            "total": total,
+            "promedio": _promedio({t: conteo[t] for t in textos if conteo[t]}),
+            "respuestas": [{"respuesta": t, "total": conteo[t],
+                            "porcentaje": round(100 * conteo[t] / total, 1) if total else 0.0} for t in textos],
+        })
+    return {
+        "facultad": facultad,
+        "encuestas": sum(facultades.values()),
+        "por_facultad": dict(facultades) if facultad is None else None,
+        "preguntas": resultado,
+    }
+
+
+if __name__ == "__main__":
+    from controller.databaseconfig import session_local
+    from model.arbol_opciones import registro_opciones
+
+    parser = argparse.ArgumentParser(description="Resumen de encuestas")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    ver = sub.add_parser("resumen")
+    ver.add_argument("--facultad")
+    sub.add_parser("recalcular", help="Reconstruye encuesta_resumen desde la tabla encuesta")
+    args = parser.parse_args()
+
+    db = session_local()
+    try:
+        if args.comando == "resumen":
+            datos = resumen(db, registro_opciones.arbol("general"), args.facultad)
+            print(json.dumps(datos, ensure_ascii=False, indent=2))
+        if args.comando == "recalcular":
+            leidas = recalcular(db)
+            db.commit()
+            print(f"Contadores recalculados desde {leidas} encuestas")
+    finally:
+        db.close()
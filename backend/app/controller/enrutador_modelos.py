@@ -0,0 +1,252 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+# Muestras recientes por modelo para latencia y tasa de error
+ENRUTADOR_VENTANA = int(os.getenv("ENRUTADOR_VENTANA", "50"))
+ENRUTADOR_VENTANA_SEGUNDOS = float(os.getenv("ENRUTADOR_VENTANA_SEGUNDOS", "300"))
+# Circuito: se abre con N fallos seguidos o con tasa de error alta sobre suficientes muestras
+ENRUTADOR_FALLOS_APERTURA = int(os.getenv("ENRUTADOR_FALLOS_APERTURA", "3"))
+ENRUTADOR_TASA_ERROR_APERTURA = float(os.getenv("ENRUTADOR_TASA_ERROR_APERTURA", "0.5"))
+ENRUTADOR_MIN_MUESTRAS = int(os.getenv("ENRUTADOR_MIN_MUESTRAS", "10"))
+ENRUTADOR_ENFRIAMIENTO = float(os.getenv("ENRUTADOR_ENFRIAMIENTO", "30"))
+ENRUTADOR_ENFRIAMIENTO_MAX = float(os.getenv("ENRUTADOR_ENFRIAMIENTO_MAX", "600"))
+# Preguntas de hasta N tokens sin identificación se consideran ligeras
+ENRUTADOR_TOKENS_LIGERA = int(os.getenv("ENRUTADOR_TOKENS_LIGERA", "24"))
+
+# Modelos preferidos por clase de petición (en orden); el resto queda de respaldo
+MODELOS_POR_CLASE = {
+    "ligera": ["llama-3.1-8b-instant"],
+    "completa": ["llama-3.3-70b-versatile", "llama-3.1-70b-versatile", "mixtral-8x7b-32768"],
+}
+
+CERRADO = "cerrado"
+ABIERTO = "abierto"
+SEMIABIERTO = "semiabierto"
+
+
+def tipo_error(error: Exception) -> str:
+    """Clasifica un error de Groq: 'no_encontrado', 'reintentable' o 'definitivo'."""
+    estado = getattr(error, "status_code", None)
+    nombre = type(error).__name__
+    mensaje = str(error).lower()
+    if estado == 404 or ("model" in mensaje and "not found" in mensaje):
+        return "no_encontrado"
+    if (estado in (408, 409, 429) or (estado is not None and estado >= 500)
+            or isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError))
+            or "Timeout" in nombre or "Connection" in nombre):
+        return "reintentable"
+    return "definitivo"
+
+
+# Causas (httpx / socket) de un error que ocurrió antes de enviar la petición
+_SIN_CONEXION = ("ConnectError", "ConnectTimeout", "ConnectionRefusedError")
+
+
+def no_enviada(error: Exception) -> bool:
+    """True si la petición no llegó a Groq (modelo inexistente o conexión rechazada): no cuenta en su cuota.
+
+    Un timeout o un 429 sí cuentan: Groq ya recibió la petición.
+    """
+    if tipo_error(error) == "no_encontrado":
+        return True
+    causa = error
+    for _ in range(5):
+        if causa is None:
+            break
+        if type(causa).__name__ in _SIN_CONEXION:
+            return True
+        causa = causa.__cause__ or causa.__context__
+    return False
+
+
+class EstadoModelo:
+    """Latencia y errores recientes de un modelo, con su circuit breaker."""
+
+    def __init__(self, nombre: str):
+        self.nombre = nombre
+        self.muestras: deque = deque(maxlen=ENRUTADOR_VENTANA)  # (instante, latencia, ok)
+        self.circuito = CERRADO
+        self.fallos_seguidos = 0
+        self.abierto_hasta = 0.0
+        self.enfriamiento = ENRUTADOR_ENFRIAMIENTO
+        self.prueba_en_curso = False
+        self.prueba_desde = 0.0
+        # Modelo inexistente o retirado (404): se vuelve a probar tras el enfriamiento máximo
+        self.no_disponible_hasta = 0.0
+        self.selecciones = 0
+        self.exitos = 0
+        self.errores = 0
+
+    def _recientes(self, ahora: float) -> List[tuple]:
+        return [m for m in self.muestras if ahora - m[0] <= ENRUTADOR_VENTANA_SEGUNDOS]
+
+    def latencia_p50(self, ahora: float = None) -> Optional[float]:
+        latencias = sorted(m[1] for m in self._recientes(ahora or time.monotonic()) if m[2])
+        return latencias[len(latencias) // 2] if latencias else None
+
+    def tasa_error(self, ahora: float = None) -> float:
+        recientes = self._recientes(ahora or time.monotonic())
+        return sum(1 for m in recientes if not m[2]) / len(recientes) if recientes else 0.0
+
+    @property
+    def no_disponible(self) -> bool:
+        return time.monotonic() < self.no_disponible_hasta
+
+    def disponible(self, ahora: float) -> bool:
+        """Si puede recibir tráfico; al vencer el enfriamiento deja pasar una prueba."""
+        if self.no_disponible:
+            return False
+        if self.circuito == ABIERTO:
+            if ahora < self.abierto_hasta:
+                return False
+            self.circuito = SEMIABIERTO
+        if self.circuito == SEMIABIERTO:
+            # Una prueba que nunca reportó (petición cancelada) no bloquea para siempre
+            return not self.prueba_en_curso or ahora - self.prueba_desde > self.enfriamiento
+        return True
+
+    def _abrir(self, ahora: float):
+        if self.circuito == SEMIABIERTO:
+            # Falló la prueba: se duplica el tiempo de espera
+            self.enfriamiento = min(self.enfriamiento * 2, ENRUTADOR_ENFRIAMIENTO_MAX)
+        self.circuito = ABIERTO
+        self.abierto_hasta = ahora + self.enfriamiento
+
+    def registrar(self, latencia: float, ok: bool):
+        ahora = time.monotonic()
+        self.muestras.append((ahora, latencia, ok))
+        self.prueba_en_curso = False
+        if ok:
+            self.exitos += 1
+            self.fallos_seguidos = 0
+            if self.circuito != CERRADO:
+                self.circuito = CERRADO
+                self.enfriamiento = ENRUTADOR_ENFRIAMIENTO
+            return
+        self.errores += 1
+        self.fallos_seguidos += 1
+        recientes = self._recientes(ahora)
+        tasa_alta = len(recientes) >= ENRUTADOR_MIN_MUESTRAS and self.tasa_error(ahora) >= ENRUTADOR_TASA_ERROR_APERTURA
+        if self.circuito == SEMIABIERTO or self.fallos_seguidos >= ENRUTADOR_FALLOS_APERTURA or tasa_alta:
+            self._abrir(ahora)
+
+    def to_dict(self) -> dict:
+        ahora = time.monotonic()
+        p50 = self.latencia_p50(ahora)
+        return {
+            "circuito": "no_disponible" if self.no_disponible else self.circuito,
+            "reabre_en": round(max(0.0, self.abierto_hasta - ahora), 1) if self.circuito == ABIERTO else 0.0,
+            "latencia_p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "tasa_error": round(self.tasa_error(ahora), 4),
+            "muestras": len(self._recientes(ahora)),
+            "fallos_seguidos": self.fallos_seguidos,
+            "selecciones": self.selecciones,
+            "exitos": self.exitos,
+            "errores": self.errores,
+        }
+
+
+class EnrutadorModelos:
+    """Elige el orden de modelos a intentar según la clase de petición y su salud."""
+
+    def __init__(self, modelos: List[str], modelos_por_clase: Dict[str, List[str]] = None):
+        self.modelos = list(modelos)
+        self.modelos_por_clase = modelos_por_clase or MODELOS_POR_CLASE
+        self._estados = {modelo: EstadoModelo(modelo) for modelo in self.modelos}
+        self._lock = threading.Lock()
+        self.motivos: Dict[str, int] = {}
+
+    def _estado(self, modelo: str) -> EstadoModelo:
+        estado = self._estados.get(modelo)
+        if estado is None:
+            estado = self._estados.setdefault(modelo, EstadoModelo(modelo))
+        return estado
+
+    @staticmethod
+    def clasificar(tokens_pregunta: int, personalizada: bool) -> str:
+        """'ligera' para preguntas cortas sin datos del usuario; 'completa' en otro caso."""
+        if not personalizada and tokens_pregunta <= ENRUTADOR_TOKENS_LIGERA:
+            return "ligera"
+        return "completa"
+
+    def _orden_preferido(self, clase: str) -> List[str]:
+        preferidos = [m for m in self.modelos_por_clase.get(clase, []) if m in self._estados]
+        respaldo = [m for m in self.modelos if m not in preferidos]
+        # Dentro de cada grupo, los modelos con latencia reciente mucho menor van primero
+        return self._por_latencia(preferidos) + self._por_latencia(respaldo)
+
+    def _por_latencia(self, modelos: List[str]) -> List[str]:
+        ahora = time.monotonic()
+        latencias = {m: self._estados[m].latencia_p50(ahora) for m in modelos}
+        conocidas = [l for l in latencias.values() if l is not None]
+        if len(conocidas) < 2:
+            return modelos
+        minima = min(conocidas)
+        # Solo se reordena un modelo degradado (más del doble de lento que el mejor)
+        return sorted(modelos, key=lambda m: latencias[m] is not None and latencias[m] > 2 * minima)
+
+    def candidatos(self, clase: str, modelo_solicitado: str = None) -> Tuple[List[str], str]:
+        """Retorna (modelos a intentar en orden, motivo de la elección)."""
+        if modelo_solicitado:
+            return [modelo_solicitado], "solicitado"
+        ahora = time.monotonic()
+        with self._lock:
+            orden = self._orden_preferido(clase)
+            sanos = [m for m in orden if self._estados[m].disponible(ahora)]
+            if not sanos:
+                return [], "sin_modelos_disponibles"
+            # Primer modelo de la clase sin considerar salud ni latencia
+            preferido = next((m for m in self.modelos_por_clase.get(clase, []) if m in self._estados), self.modelos[0])
+            if sanos[0] == preferido:
+                motivo = f"clase_{clase}"
+            elif self._estados[preferido].no_disponible:
+                motivo = f"clase_{clase}: {preferido} no disponible"
+            elif preferido in sanos:
+                motivo = f"clase_{clase}: {preferido} con latencia degradada"
+            else:
+                motivo = f"clase_{clase}: circuito abierto en {preferido}"
+        return sanos, motivo
+
+    def intentar(self, modelo: str) -> bool:
+        """Reserva un intento con ``modelo``; en semiabierto solo pasa una petición de prueba."""
+        ahora = time.monotonic()
+        with self._lock:
+            estado = self._estado(modelo)
+            if not estado.disponible(ahora):
+                return False
+            if estado.circuito == SEMIABIERTO:
+                estado.prueba_en_curso = True
+                estado.prueba_desde = ahora
+            return True
+
+    def registrar(self, modelo: str, latencia: float, error: Exception = None):
+        with self._lock:
+            estado = self._estado(modelo)
+            if error is None:
+                estado.registrar(latencia, True)
+                return
+            tipo = tipo_error(error)
+            if tipo == "no_encontrado":
+                estado.no_disponible_hasta = time.monotonic() + ENRUTADOR_ENFRIAMIENTO_MAX
+                estado.prueba_en_curso = False
+            elif tipo == "reintentable":
+                estado.registrar(latencia, False)
+            else:
+                # Errores de la petición (auth, formato): no son culpa del modelo
+                estado.prueba_en_curso = False
+
+    def registrar_eleccion(self, modelo: str, motivo: str):
+        with self._lock:
+            self._estado(modelo).selecciones += 1
+            self.motivos[motivo] = self.motivos.get(motivo, 0) + 1
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            return {
+                "modelos": {modelo: estado.to_dict() for modelo, estado in self._estados.items()},
+                "motivos": dict(self.motivos),
+            }
@@ -0,0 +1,603 @@
+"""Almacenamiento del historial de chat por particiones mensuales.
+
+``chat_history`` solo guarda los meses recientes (``HISTORIAL_MESES_CALIENTES``):
+las consultas del historial reciente usan el índice (numero_documento,
+created_at) sobre una tabla de tamaño acotado. Los meses anteriores se
+compactan en un archivo columnar comprimido por mes en ``HISTORIAL_DIR`` y se
+borran de la tabla; el catálogo ``historial_particiones`` guarda filas, tamaño,
+suma de verificación y hasta cuándo se retiene cada partición (ajustable por
+partición). ``purgar`` elimina las particiones vencidas.
+
+``respuesta`` se guarda como JSON compacto (la lista de mensajes) en lugar del
+``str()`` de la lista; ``decodificar_respuesta`` lee ambos formatos.
+
+Uso (desde backend/app; p. ej. en un cron diario):
+    python -m controller.historial mantenimiento          # compactar + purgar
+    python -m controller.historial estado
+    python -m controller.historial retener 2025-03 --hasta 2030-12-31
+    python -m controller.historial retener 2025-03 --siempre
+    python -m controller.historial leer 2025-03 --documento 1001
+    python -m controller.historial recodificar            # filas antiguas con str(lista)
+"""
+import argparse
+import ast
+import contextlib
+import gzip
+import hashlib
+import heapq
+import json
+import logging
+import os
+import sys
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional
+
+from sqlalchemy import func, select
+
+ruta = Path(__file__).resolve().parent.parent
+sys.path.append(str(ruta))
+
+from controller import crud, models
+from controller.databaseconfig import engine, session_local
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+HISTORIAL_DIR = os.getenv("HISTORIAL_DIR", str(ruta.parent / "database" / "historial"))
+HISTORIAL_MESES_CALIENTES = int(os.getenv("HISTORIAL_MESES_CALIENTES", "3"))  # meses que quedan en la tabla
+HISTORIAL_RETENCION_MESES = int(os.getenv("HISTORIAL_RETENCION_MESES", "24"))  # 0 = indefinida
+HISTORIAL_LOTE_BORRADO = int(os.getenv("HISTORIAL_LOTE_BORRADO", "5000"))
+HISTORIAL_LOTE_ARCHIVO = int(os.getenv("HISTORIAL_LOTE_ARCHIVO", "5000"))  # filas por bloque del archivo
+
+FORMATO = "historial-columnar/2"
+FORMATO_V1 = "historial-columnar/1"  # un solo documento JSON; se sigue leyendo
+COLUMNAS = ("id", "tipo_documento", "numero_documento", "mensaje", "respuesta", "estado", "created_at")
+
+
+# --- Codificación de respuesta -------------------------------------------------
+
+def codificar_respuesta(respuesta) -> str:
+    """JSON compacto de los mensajes (o del texto) de una respuesta del chatbot."""
+    if isinstance(respuesta, dict):
+        respuesta = respuesta.get("mensajes", [])
+    return json.dumps(respuesta, ensure_ascii=False, separators=(",", ":"))
+
+
+def decodificar_respuesta(texto: Optional[str]):
+    """Lee el formato JSON y el anterior (``str`` de una lista de Python)."""
+    if texto is None:
+        return None
+    try:
+        valor = json.loads(texto)
+    except ValueError:
+        try:
+            valor = ast.literal_eval(texto)
+        except (ValueError, SyntaxError):
+            return texto
+    return valor if isinstance(valor, (list, str, dict)) else texto
+
+
+def historial_reciente(db, numero_documento: str, limite: int = 20) -> List[dict]:
+    """Últimos mensajes de un usuario, del más reciente al más antiguo."""
+    return [{
+        "id": fila.id,
+        "mensaje": fila.mensaje,
+        "respuesta": decodificar_respuesta(fila.respuesta),
+        "estado": fila.estado,
+        "created_at": fila.created_at,
+    } for fila in crud.obtener_historial_reciente(db, numero_documento, limite)]
+
+
+# --- Periodos -----------------------------------------------------------------
+
+def _periodo(momento: datetime) -> str:
+    return f"{momento.year:04d}-{momento.month:02d}"
+
+
+def _siguiente(periodo: str) -> str:
+    anio, mes = map(int, periodo.split("-"))
+    return f"{anio + mes // 12:04d}-{mes % 12 + 1:02d}"
+
+
+def _inicio(periodo: str) -> datetime:
+    anio, mes = map(int, periodo.split("-"))
+    return datetime(anio, mes, 1, tzinfo=timezone.utc)
+
+
+def _restar_meses(periodo: str, meses: int) -> str:
+    anio, mes = map(int, periodo.split("-"))
+    total = anio * 12 + (mes - 1) - meses
+    return f"{total // 12:04d}-{total % 12 + 1:02d}"
+
+
+def _rango(periodo: str):
+    # SQLite guarda fechas sin zona: se compara con UTC sin tzinfo
+    inicio, fin = _inicio(periodo), _inicio(_siguiente(periodo))
+    if engine.dialect.name == "sqlite":
+        inicio, fin = inicio.replace(tzinfo=None), fin.replace(tzinfo=None)
+    return inicio, fin
+
+
+def _en_periodo(periodo: str):
+    inicio, fin = _rango(periodo)
+    return (models.ChatHistory.created_at >= inicio) & (models.ChatHistory.created_at < fin)
+
+
+def retencion_por_defecto(periodo: str) -> Optional[date]:
+    if HISTORIAL_RETENCION_MESES <= 0:
+        return None
+    return _inicio(_restar_meses(periodo, -(HISTORIAL_RETENCION_MESES + 1))).date()
+
+
+def periodos_en_tabla(db) -> List[str]:
+    """Meses con filas en chat_history (del más antiguo al actual)."""
+    primera = db.execute(select(func.min(models.ChatHistory.created_at))).scalar()
+    if primera is None:
+        return []
+    if isinstance(primera, str):
+        primera = datetime.fromisoformat(primera)
+    periodos, periodo, actual = [], _periodo(primera), _periodo(datetime.now(timezone.utc))
+    while periodo <= actual:
+        periodos.append(periodo)
+        periodo = _siguiente(periodo)
+    return periodos
+
+
+# --- Archivo columnar ---------------------------------------------------------
+# JSON Lines con gzip: encabezado, un bloque columnar por cada ``HISTORIAL_LOTE_ARCHIVO``
+# filas y un pie con la cantidad y la huella de las filas. Se escribe y se lee
+# bloque por bloque, sin tener el mes completo en memoria.
+
+_EPOCA = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSEGUNDO = timedelta(microseconds=1)
+
+
+def _microsegundos(momento) -> Optional[int]:
+    if momento is None:
+        return None
+    if isinstance(momento, str):
+        momento = datetime.fromisoformat(momento)
+    if momento.tzinfo is None:
+        momento = momento.replace(tzinfo=timezone.utc)
+    # Aritmética entera: con timestamp() (float) se pierde el último microsegundo
+    return (momento - _EPOCA) // _MICROSEGUNDO
+
+
+def _codificar_columna(valores: list) -> dict:
+    """Delta para enteros, diccionario para texto repetido y plano para el resto."""
+    if valores and all(isinstance(v, int) for v in valores):
+        return {"tipo": "delta", "valores": [valores[0]] + [b - a for a, b in zip(valores, valores[1:])]}
+    if all(v is None or isinstance(v, str) for v in valores):
+        distintos = list(dict.fromkeys(valores))
+        if len(distintos) <= len(valores) // 2:
+            posicion = {v: i for i, v in enumerate(distintos)}
+            return {"tipo": "diccionario", "diccionario": distintos, "indices": [posicion[v] for v in valores]}
+    return {"tipo": "plano", "valores": valores}
+
+
+def _decodificar_columna(columna: dict) -> list:
+    if columna["tipo"] == "delta":
+        valores, acumulado = [], 0
+        for i, delta in enumerate(columna["valores"]):
+            acumulado = delta if i == 0 else acumulado + delta
+            valores.append(acumulado)
+        return valores
+    if columna["tipo"] == "diccionario":
+        return [columna["diccionario"][i] for i in columna["indices"]]
+    return columna["valores"]
+
+
+def _valores_archivo(fila: dict) -> list:
+    """Valores de la fila en el orden de COLUMNAS tal como se guardan (fecha en µs, respuesta decodificada)."""
+    valores = []
+    for nombre in COLUMNAS:
+        valor = fila.get(nombre)
+        if nombre == "created_at":
+            valor = _microsegundos(valor)
+        elif nombre == "respuesta" and isinstance(valor, str):
+            valor = decodificar_respuesta(valor)
+        valores.append(valor)
+    return valores
+
+
+def _fila_de_valores(valores: list) -> dict:
+    fila = dict(zip(COLUMNAS, valores))
+    if fila.get("created_at") is not None:
+        fila["created_at"] = _EPOCA + fila["created_at"] * _MICROSEGUNDO
+    return fila
+
+
+class _Huella:
+    """Cantidad, último id y sha256 de las filas en orden (para comparar tabla y archivo)."""
+
+    def __init__(self):
+        self.filas = 0
+        self.ultimo_id = None
+        self._sha = hashlib.sha256()
+
+    def agregar(self, valores: list):
+        if self.ultimo_id is not None and valores[0] <= self.ultimo_id:
+            raise ValueError(f"Filas fuera de orden de id: {valores[0]} después de {self.ultimo_id}")
+        self.filas += 1
+        self.ultimo_id = valores[0]
+        self._sha.update(json.dumps(valores, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n")
+
+    def como_dict(self) -> dict:
+        return {"filas": self.filas, "ultimo_id": self.ultimo_id, "sha256_filas": self._sha.hexdigest()}
+
+
+def _escribir_linea(archivo, registro: dict):
+    archivo.write(json.dumps(registro, ensure_ascii=False, separators=(",", ":")))
+    archivo.write("\n")
+
+
+def _escribir_bloque(archivo, bloque: List[list]):
+    columnas = {nombre: _codificar_columna(list(valores)) for nombre, valores in zip(COLUMNAS, zip(*bloque))}
+    _escribir_linea(archivo, {"filas": len(bloque), "columnas": columnas})
+
+
+def escribir_archivo(ruta_archivo: str, periodo: str, filas: Iterable[dict],
+                     lote: int = HISTORIAL_LOTE_ARCHIVO) -> dict:
+    """Guarda las filas (en orden de id) por bloques columnares, de forma atómica. Retorna el pie."""
+    os.makedirs(os.path.dirname(ruta_archivo), exist_ok=True)
+    temporal = ruta_archivo + ".tmp"
+    huella = _Huella()
+    try:
+        with gzip.open(temporal, "wt", encoding="utf-8", compresslevel=9) as f:
+            _escribir_linea(f, {"formato": FORMATO, "tabla": "chat_history", "periodo": periodo})
+            bloque = []
+            for fila in filas:
+                valores = _valores_archivo(fila)
+                huella.agregar(valores)
+                bloque.append(valores)
+                if len(bloque) >= lote:
+                    _escribir_bloque(f, bloque)
+                    bloque = []
+            if bloque:
+                _escribir_bloque(f, bloque)
+            pie = huella.como_dict()
+            _escribir_linea(f, {"pie": pie})
+    except BaseException:
+        os.remove(temporal)
+        raise
+    os.replace(temporal, ruta_archivo)
+    return pie
+
+
+def _filas_de_columnas(columnas: dict, cantidad: int) -> Iterator[list]:
+    decodificadas = [_decodificar_columna(columnas[nombre]) for nombre in COLUMNAS]
+    for i in range(cantidad):
+        yield [columna[i] for columna in decodificadas]
+
+
+def _leer_valores(ruta_archivo: str, pie: Optional[dict] = None) -> Iterator[list]:
+    """Valores de cada fila del archivo, bloque por bloque. Copia el pie en ``pie`` si se pasa."""
+    with gzip.open(ruta_archivo, "rt", encoding="utf-8") as f:
+        encabezado = json.loads(f.readline())
+        if encabezado.get("formato") == FORMATO_V1:
+            # Formato anterior: un solo documento con todas las columnas
+            yield from _filas_de_columnas(encabezado["columnas"], encabezado["filas"])
+            if pie is not None:
+                pie["filas"] = encabezado["filas"]
+            return
+        if encabezado.get("formato") != FORMATO:
+            raise ValueError(f"Formato desconocido en {ruta_archivo}: {encabezado.get('formato')}")
+        for linea in f:
+            registro = json.loads(linea)
+            if "pie" in registro:
+                if pie is not None:
+                    pie.update(registro["pie"])
+                return
+            yield from _filas_de_columnas(registro["columnas"], registro["filas"])
+    raise ValueError(f"{ruta_archivo} está incompleto (sin pie)")
+
+
+def iterar_archivo(ruta_archivo: str) -> Iterator[dict]:
+    """Filas de un archivo compactado en orden de id (``respuesta`` ya decodificada)."""
+    for valores in _leer_valores(ruta_archivo):
+        yield _fila_de_valores(valores)
+
+
+def leer_archivo(ruta_archivo: str) -> List[dict]:
+    """Todas las filas de un archivo compactado."""
+    return list(iterar_archivo(ruta_archivo))
+
+
+def verificar_archivo(ruta_archivo: str) -> dict:
+    """Relee el archivo y calcula la huella de sus filas; falla si no coincide con el pie."""
+    pie, huella = {}, _Huella()
+    for valores in _leer_valores(ruta_archivo, pie):
+        huella.agregar(valores)
+    calculada = huella.como_dict()
+    if "sha256_filas" in pie and pie != calculada:
+        raise ValueError(f"{ruta_archivo}: el contenido no coincide con el pie")
+    return calculada
+
+
+def _sha256(ruta_archivo: str) -> str:
+    sha = hashlib.sha256()
+    with open(ruta_archivo, "rb") as f:
+        for parte in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(parte)
+    return sha.hexdigest()
+
+
+# --- Compactación y retención --------------------------------------------------
+
+class PeriodoOcupado(RuntimeError):
+    """Otro proceso compacta o purga el mismo periodo."""
+
+
+@contextlib.contextmanager
+def _bloqueo(periodo: str):
+    """Bloqueo exclusivo del periodo entre procesos (dos cron solapados).
+
+    Es un bloqueo del sistema operativo sobre ``chat_history_<periodo>.lock``:
+    se libera solo si el proceso muere.
+    """
+    os.makedirs(HISTORIAL_DIR, exist_ok=True)
+    with open(os.path.join(HISTORIAL_DIR, f"chat_history_{periodo}.lock"), "a+") as archivo:
+        try:
+            if fcntl is not None:
+                fcntl.flock(archivo.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                msvcrt.locking(archivo.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            raise PeriodoOcupado(f"El historial de {periodo} se está compactando o purgando en otro proceso")
+        yield
+
+
+def _hay_filas(db, periodo: str) -> bool:
+    tabla = models.ChatHistory.__table__
+    return db.execute(select(tabla.c.id).where(_en_periodo(periodo)).limit(1)).first() is not None
+
+
+def _filas_de_periodo(db, periodo: str, lote: int = HISTORIAL_LOTE_ARCHIVO) -> Iterator[dict]:
+    """Filas del periodo en orden de id, leídas por rangos de id de ``lote`` filas."""
+    tabla = models.ChatHistory.__table__
+    consulta = select(*[tabla.c[nombre] for nombre in COLUMNAS]).where(_en_periodo(periodo))\
+        .order_by(tabla.c.id).limit(lote)
+    ultimo = None
+    while True:
+        pagina = consulta if ultimo is None else consulta.where(tabla.c.id > ultimo)
+        filas = [dict(fila._mapping) for fila in db.execute(pagina)]
+        yield from filas
+        if len(filas) < lote:
+            return
+        ultimo = filas[-1]["id"]
+
+
+def _unir_por_id(*fuentes: Iterable[dict]) -> Iterator[dict]:
+    """Une fuentes ordenadas por id; un id repetido se toma de la primera fuente.
+
+    Si el mismo id trae otro contenido (SQLite reutiliza ids al borrar los más
+    altos) se detiene: borrar la fila de la tabla la perdería.
+    """
+    anterior = None
+    for fila in heapq.merge(*fuentes, key=lambda f: f["id"]):
+        if anterior is not None and fila["id"] == anterior["id"]:
+            if _valores_archivo(fila) != _valores_archivo(anterior):
+                raise RuntimeError(f"La fila {fila['id']} de la tabla no coincide con la archivada; no se borra nada")
+            continue
+        anterior = fila
+        yield fila
+
+
+def _borrar_de_tabla(db, periodo: str, hasta_id: Optional[int] = None) -> int:
+    """Borra las filas del periodo (con id <= ``hasta_id`` si se indica) en lotes (transacciones cortas)."""
+    tabla = models.ChatHistory.__table__
+    condicion = _en_periodo(periodo)
+    if hasta_id is not None:
+        condicion = condicion & (tabla.c.id <= hasta_id)
+    borradas = 0
+    while True:
+        ids = select(tabla.c.id).where(condicion).limit(HISTORIAL_LOTE_BORRADO).scalar_subquery()
+        cantidad = db.execute(tabla.delete().where(tabla.c.id.in_(ids))).rowcount
+        db.commit()
+        borradas += cantidad
+        if cantidad < HISTORIAL_LOTE_BORRADO:
+            return borradas
+
+
+def compactar_periodo(db, periodo: str) -> dict:
+    """Archiva un mes y lo borra de la tabla. Se puede repetir si se interrumpe.
+
+    Las filas pasan de la tabla al archivo por rangos de id; antes de borrar se
+    relee el archivo y su huella (cantidad, último id y sha256 de las filas)
+    debe coincidir con la de las filas que se escribieron. Un mes sin filas en
+    la tabla no se reescribe.
+    """
+    with _bloqueo(periodo):
+        return _compactar_periodo(db, periodo)
+
+
+def _compactar_periodo(db, periodo: str) -> dict:
+    particion = db.get(models.HistorialParticion, periodo)
+    if not _hay_filas(db, periodo):
+        if particion is not None and particion.estado == "archivando":
+            # Se interrumpió después de borrar todo: el archivo ya se verificó
+            particion.estado = "archivada"
+            db.commit()
+        return {"periodo": periodo, "filas": 0}
+    ruta_archivo = os.path.join(HISTORIAL_DIR, f"chat_history_{periodo}.json.gz")
+    fuentes = [_filas_de_periodo(db, periodo)]
+    # Si una compactación anterior no terminó de borrar, se une con lo ya archivado
+    if particion is not None and particion.estado in ("archivando", "archivada") and os.path.exists(ruta_archivo):
+        fuentes.insert(0, iterar_archivo(ruta_archivo))
+    escritas = escribir_archivo(ruta_archivo + ".nuevo", periodo, _unir_por_id(*fuentes))
+    if not escritas["filas"]:
+        os.remove(ruta_archivo + ".nuevo")
+        return {"periodo": periodo, "filas": 0}
+    try:
+        if verificar_archivo(ruta_archivo + ".nuevo") != escritas:
+            raise RuntimeError(f"El archivo de {periodo} no coincide con la tabla; no se borra nada")
+    except (ValueError, RuntimeError):
+        os.remove(ruta_archivo + ".nuevo")
+        raise
+    os.replace(ruta_archivo + ".nuevo", ruta_archivo)
+
+    if particion is None:
+        particion = models.HistorialParticion(periodo=periodo, retener_hasta=retencion_por_defecto(periodo))
+        db.add(particion)
+    particion.estado = "archivando"
+    particion.filas = escritas["filas"]
+    particion.archivo = ruta_archivo
+    particion.bytes = os.path.getsize(ruta_archivo)
+    particion.sha256 = _sha256(ruta_archivo)
+    db.commit()
+
+    # Solo lo archivado: filas del mes que lleguen después (p. ej. del outbox) quedan para la próxima vez
+    borradas = _borrar_de_tabla(db, periodo, hasta_id=escritas["ultimo_id"])
+    particion.estado = "archivada"
+    db.commit()
+    logger.info(f"Historial {periodo}: {escritas['filas']} filas archivadas ({particion.bytes} bytes)")
+    return {"periodo": periodo, "filas": escritas["filas"], "borradas": borradas, "bytes": particion.bytes}
+
+
+def compactar(db, meses_calientes: int = HISTORIAL_MESES_CALIENTES) -> List[dict]:
+    """Compacta los meses anteriores a la ventana caliente (y los que quedaron a medias)."""
+    limite = _restar_meses(_periodo(datetime.now(timezone.utc)), meses_calientes - 1)
+    # periodos_en_tabla va del mes más antiguo al actual: los que ya no tienen filas se saltan
+    pendientes = {p for p in periodos_en_tabla(db) if p < limite and _hay_filas(db, p)}
+    pendientes |= {p.periodo for p in db.query(models.HistorialParticion).filter_by(estado="archivando")}
+    resultados = []
+    for periodo in sorted(pendientes):
+        try:
+            resultados.append(compactar_periodo(db, periodo))
+        except PeriodoOcupado as e:
+            logger.warning(str(e))
+            resultados.append({"periodo": periodo, "omitido": "en curso en otro proceso"})
+    return resultados
+
+
+def purgar(db, hoy: date = None) -> List[str]:
+    """Elimina las particiones cuya retención venció (archivo y filas que queden)."""
+    hoy = hoy or datetime.now(timezone.utc).date()
+    vencidas = db.query(models.HistorialParticion).filter(
+        models.HistorialParticion.estado != "eliminada",
+        models.HistorialParticion.retener_hasta.isnot(None),
+        models.HistorialParticion.retener_hasta <= hoy,
+    ).all()
+    eliminadas = []
+    for particion in vencidas:
+        try:
+            with _bloqueo(particion.periodo):
+                if particion.archivo and os.path.exists(particion.archivo):
+                    os.remove(particion.archivo)
+                _borrar_de_tabla(db, particion.periodo)
+                particion.estado = "eliminada"
+                db.commit()
+        except PeriodoOcupado as e:
+            logger.warning(str(e))
+            continue
+        logger.info(f"Historial {particion.periodo} eliminado (retención hasta {particion.retener_hasta})")
+        eliminadas.append(particion.periodo)
+    return eliminadas
+
+
+def fijar_retencion(db, periodo: str, hasta: Optional[date]):
+    """Retención propia de una partición (``None``: indefinida)."""
+    particion = db.get(models.HistorialParticion, periodo)
+    if particion is None:
+        # Partición aún caliente: la retención aplica cuando se archive
+        particion = models.HistorialParticion(periodo=periodo, estado="caliente")
+        db.add(particion)
+    particion.retener_hasta = hasta
+    db.commit()
+    return particion
+
+
+def recodificar(db, lote: int = 1000) -> int:
+    """Reescribe en JSON las respuestas guardadas con ``str(lista)``."""
+    tabla = models.ChatHistory.__table__
+    total, ultimo = 0, 0
+    while True:
+        filas = db.execute(select(tabla.c.id, tabla.c.respuesta).where(tabla.c.id > ultimo)
+                           .order_by(tabla.c.id).limit(lote)).all()
+        if not filas:
+            return total
+        for id_fila, respuesta in filas:
+            if respuesta and respuesta[:2] in ("['", '["') and not _es_json(respuesta):
+                db.execute(tabla.update().where(tabla.c.id == id_fila)
+                           .values(respuesta=codificar_respuesta(decodificar_respuesta(respuesta))))
+                total += 1
+        db.commit()
+        ultimo = filas[-1][0]
+
+
+def _es_json(texto: str) -> bool:
+    try:
+        json.loads(texto)
+        return True
+    except ValueError:
+        return False
+
+
+def estado(db) -> List[dict]:
+    tabla = models.ChatHistory.__table__
+    catalogo = {p.periodo: p for p in db.query(models.HistorialParticion)}
+    filas = []
+    for periodo in sorted(set(periodos_en_tabla(db)) | set(catalogo)):
+        en_tabla = db.execute(select(func.count()).select_from(tabla).where(_en_periodo(periodo))).scalar()
+        particion = catalogo.get(periodo)
+        retener_hasta = particion.retener_hasta if particion else retencion_por_defecto(periodo)
+        filas.append({
+            "periodo": periodo,
+            "estado": particion.estado if particion else "caliente",
+            "filas_tabla": en_tabla,
+            "filas_archivo": particion.filas if particion and particion.archivo else 0,
+            "bytes_archivo": particion.bytes if particion else None,
+            "retener_hasta": str(retener_hasta) if retener_hasta else "indefinida",
+        })
+    return filas
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Particiones, compactación y retención del historial de chat")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    sub.add_parser("mantenimiento", help="Compacta los meses fríos y purga los vencidos")
+    sub.add_parser("compactar")
+    sub.add_parser("purgar")
+    sub.add_parser("estado")
+    sub.add_parser("recodificar", help="Convierte las respuestas str(lista) a JSON")
+    retener = sub.add_parser("retener", help="Retención propia de una partición")
+    retener.add_argument("periodo", help="AAAA-MM")
+    grupo = retener.add_mutually_exclusive_group(required=True)
+    grupo.add_argument("--hasta", type=date.fromisoformat)
+    grupo.add_argument("--siempre", action="store_true")
+    leer = sub.add_parser("leer", help="Muestra filas archivadas")
+    leer.add_argument("periodo")
+    leer.add_argument("--documento")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    db = session_local()
+    try:
+        if args.comando in ("mantenimiento", "compactar"):
+            for resultado in compactar(db):
+                print(resultado)
+        if args.comando in ("mantenimiento", "purgar"):
+            print(f"Eliminadas: {purgar(db)}")
+        if args.comando == "estado":
+            for fila in estado(db):
+                print(fila)
+        if args.comando == "recodificar":
+            print(f"Respuestas recodificadas: {recodificar(db)}")
+        if args.comando == "retener":
+            particion = fijar_retencion(db, args.periodo, None if args.siempre else args.hasta)
+            print(f"{particion.periodo}: retener hasta {particion.retener_hasta or 'siempre'}")
+        if args.comando == "leer":
+            particion = db.get(models.HistorialParticion, args.periodo)
+            if particion is None or not particion.archivo or not os.path.exists(particion.archivo):
+                sys.exit(f"La partición {args.periodo} no está archivada")
+            for fila in iterar_archivo(particion.archivo):
+                if args.documento is None or fila["numero_documento"] == args.documento:
+                    print(json.dumps(fila, ensure_ascii=False, default=str))
+    finally:
+        db.close()
@@ -0,0 +1,350 @@
+"""Carga masiva de materias y matrículas (estudiante_materias).
+
+``crud.crear_materia`` y ``crud.crear_estudiante_materia`` hacen commit y
+refresh por fila; para un semestre completo eso son horas de idas y vueltas.
+Aquí el archivo (CSV con encabezado o JSONL) se lee en streaming y se procesa
+en bloques de ``INGESTA_BLOQUE`` filas: se validan los tipos, se verifican las
+referencias con una consulta por bloque, se quitan los duplicados del bloque y
+se escribe con un upsert multi-fila (en PostgreSQL con ``COPY`` a una tabla
+temporal y un solo ``INSERT ... SELECT ... ON CONFLICT``). Cada bloque hace
+su propio commit: si la carga se interrumpe se puede repetir sin duplicar.
+
+Las filas inválidas no detienen la carga: se cuentan y se reportan con su
+línea y el motivo. Al terminar cada bloque se invalida el contexto de la IA de
+los estudiantes afectados (cache_contexto).
+
+Uso (desde backend/app):
+    python -m controller.ingesta materias materias.csv
+    python -m controller.ingesta estudiante_materias matriculas.jsonl --rechazos rechazos.jsonl
+"""
+import argparse
+import csv
+import io
+import json
+import logging
+import os
+import sys
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, IO, Iterator, List, Optional, Tuple
+
+from sqlalchemy import select
+
+ruta = Path(__file__).resolve().parent.parent
+sys.path.append(str(ruta))
+
+from controller import models
+from controller.cache_contexto import cache_contexto
+
+logger = logging.getLogger(__name__)
+
+INGESTA_BLOQUE = int(os.getenv("INGESTA_BLOQUE", "5000"))
+# Rechazos que se guardan en el reporte (el total se cuenta siempre)
+INGESTA_MAX_RECHAZOS = int(os.getenv("INGESTA_MAX_RECHAZOS", "1000"))
+INGESTA_COPY = os.getenv("INGESTA_COPY", "1") == "1"
+# Con más estudiantes afectados que esto se vacía el caché completo
+INGESTA_MAX_INVALIDACIONES = int(os.getenv("INGESTA_MAX_INVALIDACIONES", "1000"))
+
+
+class FilaInvalida(ValueError):
+    pass
+
+
+# --- Validación ----------------------------------------------------------------
+
+def _entero(fila: dict, campo: str, minimo: int = None, maximo: int = None) -> int:
+    valor = fila.get(campo)
+    if valor is None or (isinstance(valor, str) and not valor.strip()):
+        raise FilaInvalida(f"falta {campo}")
+    if isinstance(valor, bool) or isinstance(valor, float) and not valor.is_integer():
+        raise FilaInvalida(f"{campo} no es un entero")
+    try:
+        numero = int(valor.strip() if isinstance(valor, str) else valor)
+    except (TypeError, ValueError):
+        raise FilaInvalida(f"{campo} no es un entero")
+    if (minimo is not None and numero < minimo) or (maximo is not None and numero > maximo):
+        raise FilaInvalida(f"{campo} fuera de rango")
+    return numero
+
+
+def _texto(fila: dict, campo: str, largo: int) -> str:
+    valor = fila.get(campo)
+    valor = str(valor).strip() if valor is not None else ""
+    if not valor:
+        raise FilaInvalida(f"falta {campo}")
+    if len(valor) > largo:
+        raise FilaInvalida(f"{campo} supera {largo} caracteres")
+    return valor
+
+
+def _validar_materia(fila: dict) -> dict:
+    return {
+        "id_materia": _entero(fila, "id_materia", 1),
+        "nombre_materia": _texto(fila, "nombre_materia", 100),
+        "creditos": _entero(fila, "creditos", 0, 60),
+    }
+
+
+def _validar_matricula(fila: dict) -> dict:
+    id_estudiante = _texto(fila, "id_estudiante", 10)
+    if not id_estudiante.isdigit():
+        raise FilaInvalida("id_estudiante no es un documento numérico")
+    return {"id_estudiante": id_estudiante, "id_materia": _entero(fila, "id_materia", 1)}
+
+
+def _existentes(db, columna, valores) -> set:
+    """Valores de ``valores`` que existen en ``columna`` (una consulta por bloque)."""
+    return set(db.execute(select(columna).where(columna.in_(list(valores)))).scalars()) if valores else set()
+
+
+@dataclass
+class Destino:
+    modelo: type
+    claves: Tuple[str, ...]  # índice único del upsert
+    validar: Callable[[dict], dict]
+    actualizar: bool  # ON CONFLICT DO UPDATE (si no, DO NOTHING)
+
+    @property
+    def tabla(self):
+        return self.modelo.__table__
+
+    @property
+    def columnas(self) -> List[str]:
+        return [c.name for c in self.tabla.columns if not (c.primary_key and c.autoincrement is True)]
+
+
+DESTINOS: Dict[str, Destino] = {
+    "materias": Destino(models.Materia, ("id_materia",), _validar_materia, actualizar=True),
+    "estudiante_materias": Destino(models.EstudianteMateria, ("id_estudiante", "id_materia"),
+                                   _validar_matricula, actualizar=False),
+}
+
+
+def _verificar_referencias(db, destino: Destino, bloque: List[tuple], conocidas: Dict[str, set]) -> List[tuple]:
+    """Separa las matrículas cuyo estudiante o materia no existe. Retorna (línea, fila, motivo) rechazadas."""
+    if destino.modelo is not models.EstudianteMateria:
+        return []
+    faltan_est = {int(f["id_estudiante"]) for _, f in bloque} - conocidas["estudiantes"]
+    faltan_mat = {f["id_materia"] for _, f in bloque} - conocidas["materias"]
+    conocidas["estudiantes"] |= _existentes(db, models.Estudiante.id, faltan_est)
+    conocidas["materias"] |= _existentes(db, models.Materia.id_materia, faltan_mat)
+    rechazadas, validas = [], []
+    for linea, fila in bloque:
+        if int(fila["id_estudiante"]) not in conocidas["estudiantes"]:
+            rechazadas.append((linea, fila, "el estudiante no existe"))
+        elif fila["id_materia"] not in conocidas["materias"]:
+            rechazadas.append((linea, fila, "la materia no existe"))
+        else:
+            validas.append((linea, fila))
+    bloque[:] = validas
+    return rechazadas
+
+
+# --- Lectura -------------------------------------------------------------------
+
+def detectar_formato(nombre: str) -> str:
+    return "jsonl" if nombre.lower().endswith((".jsonl", ".ndjson", ".json")) else "csv"
+
+
+def leer_filas(binario: IO[bytes], formato: str) -> Iterator[Tuple[int, object]]:
+    """(línea, fila) del archivo; la fila es un dict o el texto de una línea ilegible."""
+    texto = io.TextIOWrapper(binario, encoding="utf-8-sig", newline="")
+    if formato == "csv":
+        lector = csv.DictReader(texto)
+        for fila in lector:
+            yield lector.line_num, fila
+        return
+    for linea, contenido in enumerate(texto, 1):
+        if not contenido.strip():
+            continue
+        try:
+            fila = json.loads(contenido)
+        except ValueError:
+            yield linea, contenido.rstrip("\n")
+            continue
+        yield linea, fila if isinstance(fila, dict) else contenido.rstrip("\n")
+
+
+# --- Escritura -----------------------------------------------------------------
+
+def _copiar_pg(db, destino: Destino, filas: List[dict]) -> bool:
+    """COPY a una tabla temporal y un INSERT ... SELECT ... ON CONFLICT. False si el driver no tiene COPY."""
+    cursor = db.connection().connection.cursor()
+    if not hasattr(cursor, "copy_expert"):
+        cursor.close()
+        return False
+    columnas = destino.columnas
+    lista = ", ".join(columnas)
+    tabla = destino.tabla.name
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    for fila in filas:
+        escritor.writerow([fila[c] for c in columnas])
+    buffer.seek(0)
+    conflicto = ", ".join(destino.claves)
+    accion = "DO NOTHING"
+    if destino.actualizar:
+        cambios = ", ".join(f"{c} = EXCLUDED.{c}" for c in columnas if c not in destino.claves)
+        accion = f"DO UPDATE SET {cambios}"
+    try:
+        # La tabla temporal vive en la conexión: se reutiliza en los bloques siguientes
+        cursor.execute(f"CREATE TEMP TABLE IF NOT EXISTS _ingesta_{tabla} AS SELECT {lista} FROM {tabla} WITH NO DATA")
+        cursor.execute(f"TRUNCATE _ingesta_{tabla}")
+        cursor.copy_expert(f"COPY _ingesta_{tabla} ({lista}) FROM STDIN WITH (FORMAT csv)", buffer)
+        cursor.execute(f"INSERT INTO {tabla} ({lista}) SELECT {lista} FROM _ingesta_{tabla} "
+                       f"ON CONFLICT ({conflicto}) {accion}")
+    finally:
+        cursor.close()
+    return True
+
+
+def _upsert(db, destino: Destino, filas: List[dict]):
+    dialecto = db.get_bind().dialect.name
+    if dialecto == "postgresql":
+        if INGESTA_COPY and _copiar_pg(db, destino, filas):
+            return
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialecto == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise ValueError(f"Carga masiva no soportada en {dialecto}")
+    sentencia = insert(destino.tabla)
+    if destino.actualizar:
+        sentencia = sentencia.on_conflict_do_update(
+            index_elements=list(destino.claves),
+            set_={c: sentencia.excluded[c] for c in destino.columnas if c not in destino.claves})
+    else:
+        sentencia = sentencia.on_conflict_do_nothing(index_elements=list(destino.claves))
+    db.execute(sentencia, filas)
+
+
+def _invalidar(destino: Destino, filas: List[dict]):
+    if destino.modelo is models.Materia:
+        # Las materias aparecen en el contexto global y en el de cada estudiante
+        cache_contexto.invalidar_todo()
+        return
+    estudiantes = {f["id_estudiante"] for f in filas}
+    if len(estudiantes) > INGESTA_MAX_INVALIDACIONES:
+        cache_contexto.invalidar_todo()
+        return
+    for id_estudiante in estudiantes:
+        cache_contexto.invalidar_usuario(id_estudiante)
+
+
+# --- Carga ---------------------------------------------------------------------
+
+@dataclass
+class Reporte:
+    tabla: str
+    leidas: int = 0
+    escritas: int = 0  # enviadas al upsert (las repetidas de la BD cuentan)
+    duplicadas: int = 0  # repetidas dentro del mismo bloque (gana la última)
+    rechazadas: int = 0
+    bloques: int = 0
+    segundos: float = 0.0
+    rechazos: List[dict] = field(default_factory=list)
+
+    def rechazar(self, linea: int, fila, motivo: str, salida: Optional[IO[str]] = None):
+        self.rechazadas += 1
+        rechazo = {"linea": linea, "motivo": motivo, "fila": fila}
+        if len(self.rechazos) < INGESTA_MAX_RECHAZOS:
+            self.rechazos.append(rechazo)
+        if salida is not None:
+            salida.write(json.dumps(rechazo, ensure_ascii=False, default=str) + "\n")
+
+    def como_dict(self) -> dict:
+        return {
+            "tabla": self.tabla,
+            "leidas": self.leidas,
+            "escritas": self.escritas,
+            "duplicadas": self.duplicadas,
+            "rechazadas": self.rechazadas,
+            "bloques": self.bloques,
+            "segundos": round(self.segundos, 3),
+            "filas_por_segundo": round(self.leidas / self.segundos) if self.segundos else None,
+            "rechazos": self.rechazos,
+        }
+
+
+def ingerir(db, tabla: str, binario: IO[bytes], formato: str = "csv", bloque: int = INGESTA_BLOQUE,
+            verificar_referencias: bool = True, salida_rechazos: Optional[IO[str]] = None) -> Reporte:
+    """Carga ``binario`` (CSV o JSONL) en ``tabla`` por bloques. Retorna el reporte."""
+    if tabla not in DESTINOS:
+        raise ValueError(f"Tabla no soportada: {tabla} (use {', '.join(DESTINOS)})")
+    destino = DESTINOS[tabla]
+    reporte = Reporte(tabla)
+    conocidas = {"estudiantes": set(), "materias": set()}
+    inicio = time.perf_counter()
+    pendientes: List[tuple] = []
+
+    def escribir():
+        if verificar_referencias:
+            for linea, fila, motivo in _verificar_referencias(db, destino, pendientes, conocidas):
+                reporte.rechazar(linea, fila, motivo, salida_rechazos)
+        unicas = {tuple(fila[c] for c in destino.claves): fila for _, fila in pendientes}
+        reporte.duplicadas += len(pendientes) - len(unicas)
+        pendientes.clear()
+        if not unicas:
+            return
+        filas = list(unicas.values())
+        try:
+            _upsert(db, destino, filas)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        reporte.escritas += len(filas)
+        reporte.bloques += 1
+        _invalidar(destino, filas)
+
+    for linea, fila in leer_filas(binario, formato):
+        reporte.leidas += 1
+        if not isinstance(fila, dict):
+            reporte.rechazar(linea, fila, "línea ilegible", salida_rechazos)
+            continue
+        try:
+            pendientes.append((linea, destino.validar(fila)))
+        except FilaInvalida as e:
+            reporte.rechazar(linea, fila, str(e), salida_rechazos)
+            continue
+        if len(pendientes) >= bloque:
+            escribir()
+    escribir()
+    reporte.segundos = time.perf_counter() - inicio
+    logger.info(f"Ingesta {tabla}: {reporte.escritas} escritas, {reporte.rechazadas} rechazadas "
+                f"en {reporte.segundos:.2f} s")
+    return reporte
+
+
+if __name__ == "__main__":
+    from controller.databaseconfig import session_local
+
+    parser = argparse.ArgumentParser(description="Carga masiva de materias y matrículas")
+    parser.add_argument("tabla", choices=list(DESTINOS))
+    parser.add_argument("archivo", help="CSV con encabezado o JSONL ('-' lee stdin)")
+    parser.add_argument("--formato", choices=("csv", "jsonl"), help="Por defecto según la extensión")
+    parser.add_argument("--bloque", type=int, default=INGESTA_BLOQUE)
+    parser.add_argument("--sin-referencias", action="store_true",
+                        help="No verifica que existan el estudiante y la materia de cada matrícula")
+    parser.add_argument("--rechazos", help="Archivo JSONL con todas las filas rechazadas")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    formato = args.formato or detectar_formato(args.archivo)
+    entrada = sys.stdin.buffer if args.archivo == "-" else open(args.archivo, "rb")
+    salida = open(args.rechazos, "w", encoding="utf-8") if args.rechazos else None
+    db = session_local()
+    try:
+        resultado = ingerir(db, args.tabla, entrada, formato, args.bloque, not args.sin_referencias, salida)
+        datos = resultado.como_dict()
+        rechazos = datos.pop("rechazos")
+        print(json.dumps(datos, ensure_ascii=False))
+        for rechazo in rechazos[:20]:
+            print(f"  línea {rechazo['linea']}: {rechazo['motivo']}")
+    finally:
+        db.close()
+        if salida is not None:
+            salida.close()
+        if entrada is not sys.stdin.buffer:
+            entrada.close()
@@ -0,0 +1,152 @@
+import functools
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Sequence, Tuple
+
+# Límites (en segundos) para latencias: de 0.5 ms a 30 s
+BUCKETS_LATENCIA = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+BUCKETS_TOKENS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+
+
+def _etiquetas(nombres: Sequence[str], valores: Tuple) -> str:
+    if not nombres:
+        return ""
+    pares = ",".join(f'{n}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+                     for n, v in zip(nombres, valores))
+    return "{" + pares + "}"
+
+
+class Contador:
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = ()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._valores: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *valores_etiquetas, cantidad: float = 1):
+        with self._lock:
+            self._valores[valores_etiquetas] = self._valores.get(valores_etiquetas, 0) + cantidad
+
+    def exportar(self) -> list:
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} counter"]
+        with self._lock:
+            for valores, total in sorted(self._valores.items()):
+                lineas.append(f"{self.nombre}{_etiquetas(self.etiquetas, valores)} {total}")
+        return lineas
+
+
+class Histograma:
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = (), buckets=BUCKETS_LATENCIA):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.buckets = tuple(buckets)
+        # Por combinación de etiquetas: [conteo por bucket..., +Inf], suma
+        self._series: Dict[Tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observar(self, valor: float, *valores_etiquetas):
+        indice = bisect_left(self.buckets, valor)
+        with self._lock:
+            serie = self._series.get(valores_etiquetas)
+            if serie is None:
+                serie = self._series[valores_etiquetas] = [[0] * (len(self.buckets) + 1), 0.0]
+            serie[0][indice] += 1
+            serie[1] += valor
+
+    @contextmanager
+    def medir(self, *valores_etiquetas):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(time.perf_counter() - inicio, *valores_etiquetas)
+
+    def exportar(self) -> list:
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} histogram"]
+        with self._lock:
+            series = [(valores, list(conteos), suma) for valores, (conteos, suma) in self._series.items()]
+        for valores, conteos, suma in sorted(series, key=lambda s: s[0]):
+            acumulado = 0
+            for limite, conteo in zip(self.buckets + ("+Inf",), conteos):
+                acumulado += conteo
+                etiquetas = _etiquetas(self.etiquetas + ("le",), valores + (limite,))
+                lineas.append(f"{self.nombre}_bucket{etiquetas} {acumulado}")
+            etiquetas = _etiquetas(self.etiquetas, valores)
+            lineas.append(f"{self.nombre}_sum{etiquetas} {suma}")
+            lineas.append(f"{self.nombre}_count{etiquetas} {acumulado}")
+        return lineas
+
+
+class RegistroMetricas:
+    def __init__(self):
+        self._metricas = []
+
+    def contador(self, *args, **kwargs) -> Contador:
+        metrica = Contador(*args, **kwargs)
+        self._metricas.append(metrica)
+        return metrica
+
+    def histograma(self, *args, **kwargs) -> Histograma:
+        metrica = Histograma(*args, **kwargs)
+        self._metricas.append(metrica)
+        return metrica
+
+    def exportar(self) -> str:
+        """Todas las métricas en formato de texto de Prometheus."""
+        lineas = []
+        for metrica in self._metricas:
+            lineas.extend(metrica.exportar())
+        return "\n".join(lineas) + "\n"
+
+
+registro_metricas = RegistroMetricas()
+
+# --- Métricas de la aplicación ------------------------------------------------
+
+http_peticion_segundos = registro_metricas.histograma(
+    "chatbot_http_peticion_segundos", "Duración de las peticiones HTTP por ruta", ("metodo", "ruta", "estado"))
+opciones_resolucion_segundos = registro_metricas.histograma(
+    "chatbot_opciones_resolucion_segundos", "Selección del árbol de opciones según el rol del usuario")
+chatbot_respuesta_segundos = registro_metricas.histograma(
+    "chatbot_respuesta_segundos", "ChatBot.respuesta por estado de la conversación", ("estado",))
+db_segundos = registro_metricas.histograma(
+    "chatbot_db_segundos", "Duración de cada función de acceso a datos (BaseDatos y crud)", ("funcion",))
+historial_escritura_segundos = registro_metricas.histograma(
+    "chatbot_historial_escritura_segundos", "Escrituras del historial y encuestas (encolar o lote)", ("etapa",))
+ia_contexto_segundos = registro_metricas.histograma(
+    "chatbot_ia_contexto_segundos", "Construcción del contexto y del prompt para la IA")
+ia_prompt_tokens = registro_metricas.histograma(
+    "chatbot_ia_prompt_tokens", "Tamaño estimado del prompt enviado al modelo", buckets=BUCKETS_TOKENS)
+ia_groq_segundos = registro_metricas.histograma(
+    "chatbot_ia_groq_segundos", "Latencia de la llamada a Groq por modelo (hasta la respuesta o el primer byte)",
+    ("modelo", "resultado"))
+ia_tokens_total = registro_metricas.contador(
+    "chatbot_ia_tokens_total", "Tokens reportados por Groq", ("modelo", "tipo"))
+ia_modelo_elegido_total = registro_metricas.contador(
+    "chatbot_ia_modelo_elegido_total", "Modelo elegido por el enrutador y clase de petición", ("modelo", "clase"))
+ia_cache_total = registro_metricas.contador(
+    "chatbot_ia_cache_total", "Consultas a la caché de respuestas de la IA", ("resultado",))
+ia_respaldo_total = registro_metricas.contador(
+    "chatbot_ia_respaldo_total", "Respuestas sin llamar al modelo (menú o carga)", ("motivo",))
+errores_total = registro_metricas.contador(
+    "chatbot_errores_total", "Errores por origen", ("origen",))
+arranque_etapa_segundos = registro_metricas.histograma(
+    "chatbot_arranque_etapa_segundos", "Duración de cada etapa del calentamiento al iniciar", ("etapa",))
+
+
+def medir_db(funcion):
+    """Decorador: registra la duración de una función de acceso a datos."""
+    nombre = funcion.__name__
+
+    @functools.wraps(funcion)
+    def envoltura(*args, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            return funcion(*args, **kwargs)
+        finally:
+            db_segundos.observar(time.perf_counter() - inicio, nombre)
+    return envoltura
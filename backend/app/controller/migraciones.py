@@ -0,0 +1,310 @@
+"""Migraciones versionadas del esquema.
+
+``create_all`` crea las tablas que faltan pero no cambia las existentes (p. ej.
+no agrega índices nuevos a una BD en producción). Cada migración se registra
+con ``@migracion(version, nombre)``, se aplica una sola vez y queda anotada en
+la tabla ``schema_version``.
+
+Las migraciones corren en autocommit (en PostgreSQL los índices se crean con
+``CONCURRENTLY`` para no bloquear escrituras) y deben ser idempotentes
+(``IF NOT EXISTS``): si una falla a mitad de camino se puede volver a aplicar.
+Un ``CREATE INDEX CONCURRENTLY`` que falla deja el índice marcado como
+inválido y ``IF NOT EXISTS`` lo daría por creado: ``crear_indice`` lo borra
+antes de volver a crearlo.
+
+Entre varios workers de PostgreSQL las aplica uno solo (bloqueo consultivo);
+los demás esperan sin transacción abierta, porque ``CONCURRENTLY`` espera a que
+terminen todas las transacciones en curso y se trabaría con ellos. La conexión
+de las migraciones quita el ``statement_timeout`` del pool: un índice sobre una
+tabla grande tarda más que una consulta de la app, y cancelado queda inválido.
+
+Las migraciones no borran datos: si la 5 encuentra matrículas repetidas falla
+y las reporta; se quitan con un paso explícito que respalda lo que borra.
+
+Uso (desde backend/app):
+    python -m controller.migraciones            # aplica las pendientes
+    python -m controller.migraciones --estado   # aplicadas y pendientes
+    python -m controller.migraciones --quitar-matriculas-repetidas respaldo.jsonl
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import IO, Callable, List, Optional, Sequence
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, func, inspect, select
+from sqlalchemy.exc import IntegrityError
+
+logger = logging.getLogger(__name__)
+
+# Metadatos propios: la tabla de versiones no se copia con importar_postgres
+_metadata = MetaData()
+schema_version = Table(
+    "schema_version", _metadata,
+    Column("version", Integer, primary_key=True),
+    Column("nombre", String(200), nullable=False),
+    Column("aplicada_en", DateTime(timezone=True), server_default=func.now()),
+)
+
+# Clave del bloqueo de PostgreSQL: varios workers pueden arrancar a la vez
+_BLOQUEO_PG = 72_020
+MIGRACIONES_ESPERA = float(os.getenv("MIGRACIONES_ESPERA", "600"))  # segundos esperando a otro worker
+MIGRACIONES_SONDEO = float(os.getenv("MIGRACIONES_SONDEO", "1.0"))
+# El motor de la app lleva statement_timeout (DB_STATEMENT_TIMEOUT_MS): las migraciones corren sin él,
+# pero con un límite para esperar bloqueos de tablas
+MIGRACIONES_LOCK_TIMEOUT_MS = int(os.getenv("MIGRACIONES_LOCK_TIMEOUT_MS", "60000"))
+
+
+@dataclass
+class Migracion:
+    version: int
+    nombre: str
+    aplicar: Callable
+
+
+MIGRACIONES: List[Migracion] = []
+
+
+def migracion(version: int, nombre: str):
+    """Registra una función ``f(conexion)`` como la migración ``version``."""
+    def registrar(funcion):
+        if any(m.version == version for m in MIGRACIONES):
+            raise ValueError(f"Migración {version} duplicada")
+        MIGRACIONES.append(Migracion(version, nombre, funcion))
+        MIGRACIONES.sort(key=lambda m: m.version)
+        return funcion
+    return registrar
+
+
+def indice_invalido(conexion, nombre: str) -> bool:
+    """True si el índice quedó inválido (PostgreSQL, tras un CREATE INDEX CONCURRENTLY fallido)."""
+    if conexion.dialect.name != "postgresql":
+        return False
+    return bool(conexion.exec_driver_sql(
+        "SELECT 1 FROM pg_index WHERE indexrelid = to_regclass(%(nombre)s) AND NOT indisvalid",
+        {"nombre": nombre},
+    ).first())
+
+
+def crear_indice(conexion, nombre: str, tabla: str, columnas: Sequence[str], unico: bool = False,
+                 metodo: Optional[str] = None):
+    """CREATE INDEX IF NOT EXISTS (CONCURRENTLY en PostgreSQL).
+
+    ``columnas`` pueden ser expresiones entre paréntesis; ``metodo`` es el tipo
+    de índice (p. ej. ``gin``). Si quedó un índice inválido de un intento
+    anterior se borra primero.
+    """
+    if indice_invalido(conexion, nombre):
+        logger.warning(f"Índice {nombre} inválido (creación interrumpida): se vuelve a crear")
+        borrar_indice(conexion, nombre)
+    concurrente = " CONCURRENTLY" if conexion.dialect.name == "postgresql" else ""
+    unique = "UNIQUE " if unico else ""
+    using = f" USING {metodo}" if metodo else ""
+    conexion.exec_driver_sql(
+        f"CREATE {unique}INDEX{concurrente} IF NOT EXISTS {nombre} ON {tabla}{using} ({', '.join(columnas)})"
+    )
+
+
+def borrar_indice(conexion, nombre: str):
+    """DROP INDEX IF EXISTS (CONCURRENTLY en PostgreSQL)."""
+    concurrente = " CONCURRENTLY" if conexion.dialect.name == "postgresql" else ""
+    conexion.exec_driver_sql(f"DROP INDEX{concurrente} IF EXISTS {nombre}")
+
+
+# --- Migraciones --------------------------------------------------------------
+# Los índices vigentes también están declarados en models.py, así que una BD
+# nueva los recibe con create_all y aquí no hacen nada.
+
+# (nombre, tabla, columnas)
+INDICES_CONSULTAS = (
+    # Matrícula por estudiante (cubre id_materia: la consulta no toca la tabla)
+    ("ix_estudiante_materias_estudiante", "estudiante_materias", ("id_estudiante", "id_materia")),
+    # Historial de un usuario en orden cronológico y barridos por fecha
+    ("ix_chat_history_documento_fecha", "chat_history", ("numero_documento", "created_at")),
+    ("ix_chat_history_created_at", "chat_history", ("created_at",)),
+    # Buzón: listado general por fecha y sugerencias de un estudiante por fecha
+    ("ix_buzon_created_at", "buzon_de_sugerencias", ("created_at",)),
+    ("ix_buzon_estudiante_fecha", "buzon_de_sugerencias", ("id_estudiante", "created_at")),
+)
+
+
+@migracion(1, "índices de las consultas frecuentes")
+def _indices_consultas_frecuentes(conexion):
+    for nombre, tabla, columnas in INDICES_CONSULTAS:
+        crear_indice(conexion, nombre, tabla, columnas)
+
+
+@migracion(2, "catálogo de particiones del historial")
+def _catalogo_historial(conexion):
+    from controller import models
+    models.HistorialParticion.__table__.create(bind=conexion, checkfirst=True)
+
+
+# Orden de los listados por cursor: (created_at, id) da el desempate en el índice
+INDICES_PAGINACION = (
+    ("ix_buzon_fecha_id", "buzon_de_sugerencias", ("created_at", "id")),
+    ("ix_chat_history_fecha_id", "chat_history", ("created_at", "id")),
+)
+
+
+@migracion(3, "índices de la paginación por cursor")
+def _indices_paginacion(conexion):
+    for nombre, tabla, columnas in INDICES_PAGINACION:
+        crear_indice(conexion, nombre, tabla, columnas)
+    # Los de solo created_at quedan cubiertos por los nuevos
+    borrar_indice(conexion, "ix_buzon_created_at")
+    borrar_indice(conexion, "ix_chat_history_created_at")
+
+
+@migracion(4, "respuestas por clave y resumen de encuestas")
+def _resumen_encuestas(conexion):
+    from controller import encuestas, models
+    if "respuestas" not in {c["name"] for c in inspect(conexion).get_columns("encuesta")}:
+        conexion.exec_driver_sql("ALTER TABLE encuesta ADD COLUMN respuestas TEXT")
+    models.EncuestaResumen.__table__.create(bind=conexion, checkfirst=True)
+    # Las encuestas existentes entran a los contadores (idempotente: se reconstruyen)
+    encuestas.recalcular(conexion)
+
+
+# Claves de los upsert de la carga masiva (controller/ingesta.py)
+INDICES_UNICOS = (
+    ("ux_estudiante_materias", "estudiante_materias", ("id_estudiante", "id_materia")),
+)
+
+
+def matriculas_repetidas(conexion) -> int:
+    """Matrículas que sobran: las filas repetidas de (id_estudiante, id_materia) menos una por par."""
+    return conexion.exec_driver_sql(
+        "SELECT COALESCE(SUM(n - 1), 0) FROM (SELECT COUNT(*) AS n FROM estudiante_materias "
+        "GROUP BY id_estudiante, id_materia HAVING COUNT(*) > 1) AS repetidas"
+    ).scalar()
+
+
+def quitar_matriculas_repetidas(motor, respaldo: IO[str]) -> int:
+    """Borra las matrículas repetidas (se conserva la de menor id). Retorna las filas borradas.
+
+    Cada fila se escribe en ``respaldo`` (JSONL) antes de borrarla, en la misma transacción.
+    """
+    from controller import models
+    tabla = models.EstudianteMateria.__table__
+    conservadas = select(func.min(tabla.c.id)).group_by(tabla.c.id_estudiante, tabla.c.id_materia)
+    with motor.begin() as conexion:
+        ids = []
+        for fila in conexion.execute(select(tabla).where(tabla.c.id.not_in(conservadas)).order_by(tabla.c.id)):
+            respaldo.write(json.dumps(dict(fila._mapping), ensure_ascii=False, default=str) + "\n")
+            ids.append(fila.id)
+        for i in range(0, len(ids), 1000):
+            conexion.execute(tabla.delete().where(tabla.c.id.in_(ids[i:i + 1000])))
+    logger.warning(f"Matrículas repetidas borradas: {len(ids)}")
+    return len(ids)
+
+
+@migracion(5, "matrícula única por estudiante y materia")
+def _matricula_unica(conexion):
+    # La clave única no se puede crear con repetidas; quitarlas es una decisión del operador
+    repetidas = matriculas_repetidas(conexion)
+    if repetidas:
+        raise RuntimeError(
+            f"estudiante_materias tiene {repetidas} matrículas repetidas: revíselas y quítelas con "
+            "python -m controller.migraciones --quitar-matriculas-repetidas <respaldo.jsonl>"
+        )
+    for nombre, tabla, columnas in INDICES_UNICOS:
+        crear_indice(conexion, nombre, tabla, columnas, unico=True)
+    # El índice no único de las mismas columnas queda cubierto
+    borrar_indice(conexion, "ix_estudiante_materias_estudiante")
+
+
+@migracion(6, "búsqueda de texto completo en el buzón y el historial")
+def _busqueda_texto(conexion):
+    # GIN sobre tsvector en PostgreSQL; FTS5 con triggers en SQLite (controller/busqueda.py)
+    from controller import busqueda
+    busqueda.crear_indices(conexion)
+
+
+# --- Aplicación ---------------------------------------------------------------
+
+def _versiones(conexion) -> set:
+    schema_version.create(bind=conexion, checkfirst=True)
+    return set(conexion.execute(select(schema_version.c.version)).scalars())
+
+
+def versiones_aplicadas(motor) -> set:
+    with motor.connect().execution_options(isolation_level="AUTOCOMMIT") as conexion:
+        return _versiones(conexion)
+
+
+def _tomar_bloqueo(conexion, espera: float = MIGRACIONES_ESPERA):
+    """Toma el bloqueo consultivo sondeando con pg_try_advisory_lock.
+
+    ``pg_advisory_lock`` dejaría la sentencia (y su transacción) abierta mientras
+    espera, y el CREATE INDEX CONCURRENTLY del worker que lo tiene esperaría a
+    su vez a esa transacción.
+    """
+    limite = time.monotonic() + espera
+    while not conexion.exec_driver_sql(f"SELECT pg_try_advisory_lock({_BLOQUEO_PG})").scalar():
+        if time.monotonic() >= limite:
+            raise TimeoutError(f"Otro proceso aplica las migraciones desde hace más de {espera:.0f} s")
+        time.sleep(MIGRACIONES_SONDEO)
+
+
+def aplicar(motor=None) -> List[int]:
+    """Aplica las migraciones pendientes en orden. Retorna las versiones aplicadas."""
+    if motor is None:
+        from controller.databaseconfig import engine as motor
+    aplicadas = []
+    with motor.connect().execution_options(isolation_level="AUTOCOMMIT") as conexion:
+        postgres = conexion.dialect.name == "postgresql"
+        bloqueado = False
+        if postgres:
+            # Se restauran en el finally: la conexión vuelve al pool de la app
+            conexion.exec_driver_sql("SET statement_timeout = 0")
+            conexion.exec_driver_sql(f"SET lock_timeout = {MIGRACIONES_LOCK_TIMEOUT_MS}")
+        try:
+            if postgres:
+                _tomar_bloqueo(conexion)
+                bloqueado = True
+            # Se consulta con el bloqueo tomado: otro worker pudo aplicarlas mientras tanto
+            hechas = _versiones(conexion)
+            for m in (m for m in MIGRACIONES if m.version not in hechas):
+                m.aplicar(conexion)
+                try:
+                    conexion.execute(schema_version.insert().values(version=m.version, nombre=m.nombre))
+                except IntegrityError:
+                    pass  # la registró otro proceso (SQLite no tiene bloqueo consultivo)
+                logger.info(f"Migración {m.version} aplicada: {m.nombre}")
+                aplicadas.append(m.version)
+        finally:
+            if bloqueado:
+                conexion.exec_driver_sql(f"SELECT pg_advisory_unlock({_BLOQUEO_PG})")
+            if postgres:
+                conexion.exec_driver_sql("RESET statement_timeout")
+                conexion.exec_driver_sql("RESET lock_timeout")
+    return aplicadas
+
+
+if __name__ == "__main__":
+    sys.path.append(str(Path(__file__).resolve().parent.parent))
+    from controller.databaseconfig import engine
+
+    parser = argparse.ArgumentParser(description="Migraciones del esquema de la BD")
+    parser.add_argument("--estado", action="store_true", help="Solo muestra las migraciones aplicadas y pendientes")
+    parser.add_argument("--quitar-matriculas-repetidas", metavar="RESPALDO",
+                        help="Borra las matrículas repetidas (requisito de la migración 5) y las guarda en RESPALDO")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if args.quitar_matriculas_repetidas:
+        with open(args.quitar_matriculas_repetidas, "a", encoding="utf-8") as respaldo:
+            borradas = quitar_matriculas_repetidas(engine, respaldo)
+        print(f"{borradas} matrículas repetidas borradas (respaldo en {args.quitar_matriculas_repetidas})")
+    elif args.estado:
+        aplicadas = versiones_aplicadas(engine)
+        for m in MIGRACIONES:
+            print(f"  {m.version:4}  {'aplicada ' if m.version in aplicadas else 'pendiente'}  {m.nombre}")
+    else:
+        versiones = aplicar(engine)
+        print(f"Aplicadas: {versiones}" if versiones else "El esquema está al día")
@@ -1,5 +1,5 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, Date, DateTime, Boolean, ForeignKey, Index
 from sqlalchemy.sql import func
 import sys
 from pathlib import Path
@@ -15,6 +15,12 @@ class EstudianteMateria(Base):
     id_estudiante = Column(String(10), ForeignKey("estudiante.id"), nullable=False)
     id_materia = Column(Integer, ForeignKey("materias.id_materia"))
 
+    # Los índices nuevos también van en una migración (controller/migraciones.py)
+    __table_args__ = (
+        # Única: clave del upsert de la carga masiva (cubre id_materia en las consultas)
+        Index("ux_estudiante_materias", "id_estudiante", "id_materia", unique=True),
+    )
+
 class Materia(Base):
     __tablename__ = "materias"
     
@@ -34,6 +40,11 @@ class BuzonSugerencias(Base):
     descripcion = Column(Text, nullable=False)  # La descripción detallada
     estado = Column(String(50), default="Pendiente")  # Pendiente, En Revisión, Resuelta
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_buzon_fecha_id", "created_at", "id"),
+        Index("ix_buzon_estudiante_fecha", "id_estudiante", "created_at"),
+    )
     
     def __repr__(self):
         return f"<BuzonSugerencias(id={self.id}, tipo={self.tipo_sugerencia})>"
@@ -46,11 +57,35 @@ class Encuesta(Base):
     id_estudiante = Column(String(30), index=True)
     facultad = Column(String(20), nullable=True)
     satisfaccion = Column(String(20))
+    # Respuestas por dato_clave en JSON compacto: {"Facultad": "Diseño", ...}
+    respuestas = Column(Text, nullable=True)
     
     def __repr__(self):
         return f"<Survey(id={self.id}, name={self.name})>"
 
 
+class EncuestaResumen(Base):
+    """Contadores de respuestas por pregunta, respuesta y facultad.
+
+    Se actualizan al insertar cada encuesta (controller/encuestas.py), así los
+    reportes no recorren la tabla ``encuesta``.
+    """
+    __tablename__ = "encuesta_resumen"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    pregunta = Column(String(100), nullable=False)  # dato_clave
+    respuesta = Column(String(200), nullable=False)
+    facultad = Column(String(100), nullable=False, default="")  # "" si no se respondió
+    total = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index("ux_encuesta_resumen_clave", "pregunta", "respuesta", "facultad", unique=True),
+    )
+
+    def __repr__(self):
+        return f"<EncuestaResumen({self.pregunta}={self.respuesta}, facultad={self.facultad}, total={self.total})>"
+
+
 class ChatHistory(Base):
     """Modelo para almacenar historial de conversaciones"""
     __tablename__ = "chat_history"
@@ -62,11 +97,33 @@ class ChatHistory(Base):
     respuesta = Column(Text, nullable=True)
     estado = Column(String(50), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_chat_history_documento_fecha", "numero_documento", "created_at"),
+        Index("ix_chat_history_fecha_id", "created_at", "id"),
+    )
     
     def __repr__(self):
         return f"<ChatHistory(id={self.id}, documento={self.numero_documento})>"
 
 
+class HistorialParticion(Base):
+    """Catálogo de particiones mensuales de chat_history (ver controller/historial.py)"""
+    __tablename__ = "historial_particiones"
+
+    periodo = Column(String(7), primary_key=True)  # AAAA-MM
+    estado = Column(String(20), nullable=False, default="caliente")  # caliente, archivando, archivada, eliminada
+    filas = Column(Integer, default=0)
+    archivo = Column(Text, nullable=True)
+    bytes = Column(Integer, nullable=True)
+    sha256 = Column(String(64), nullable=True)
+    retener_hasta = Column(Date, nullable=True)  # None: se conserva indefinidamente
+    actualizado_en = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<HistorialParticion(periodo={self.periodo}, estado={self.estado}, filas={self.filas})>"
+
+
 class Estudiante(Base):
     """Modelo para almacenar usuarios"""
     __tablename__ = "estudiante"
@@ -91,4 +148,14 @@ class Usuario(Base):
     tipo_id = Column(String(20))
 
     def __repr__(self):  # <-- doble guión bajo
-        return f"<Usuario(id={self.id}, nombre={self.nombre}, tipo_id={self.tipo_id})>"
\ No newline at end of file
+        return f"<Usuario(id={self.id}, nombre={self.nombre}, tipo_id={self.tipo_id})>"
+
+class Profesor(Base):
+    """Hoja de calificaciones de cada profesor (consultada con SQL directo en BaseDatos y crud)"""
+    __tablename__ = "profesores"
+
+    id = Column(Integer, primary_key=True, index=True)
+    link_hoja = Column(Text, nullable=True)
+
+    def __repr__(self):
+        return f"<Profesor(id={self.id})>"
@@ -0,0 +1,62 @@
+"""Normalización de texto en español compartida por la caché de respuestas, el
+presupuesto del prompt, el enrutador de intención (BM25) y la búsqueda de texto.
+
+``palabras`` da las palabras con contenido (sin tildes, signos, URLs ni
+palabras vacías) y ``raiz`` su raíz aproximada; cada módulo decide si agrega
+sinónimos o palabras vacías propias.
+"""
+import re
+import unicodedata
+from typing import AbstractSet, List
+
+_NO_ALFANUMERICO = re.compile(r"[^a-z0-9ñ ]+")
+_ESPACIOS = re.compile(r"\s+")
+_URL = re.compile(r"https?://\S+|www\.\S+")
+
+# Palabras vacías (ya normalizadas)
+PARADAS = frozenset("""
+a al algo algun alguna algunas alguno algunos ante antes aqui asi aun cada como con contra cual cuales
+cuando de del desde donde dos el ella ellas ellos en entre era es esa esas ese eso esos esta estan estar
+estas este esto estos estoy fue ha hay hacer haya he la las le les lo los mas me mi mis mucho muy nada
+ni no nos nuestra nuestro o otra otro para pero poco por porque puedo puede que quien quiero se sea ser
+si sin sobre solo son su sus tambien te tener tengo ti tiene todo tu tus un una unas uno unos ver vez y
+ya yo
+""".split())
+
+# Sufijos en orden de mayor a menor longitud (stemmer liviano para español)
+_SUFIJOS = (
+    "amientos", "imientos", "amiento", "imiento", "aciones", "uciones", "adoras", "adores", "ancias",
+    "mente", "acion", "ucion", "adora", "ador", "ancia", "ables", "ibles", "istas", "able", "ible", "ista",
+    "idad", "ivas", "ivos", "iva", "ivo", "ando", "iendo", "ados", "idos", "adas", "idas", "ado", "ido",
+    "ada", "ida", "ar", "er", "ir", "an", "en", "es", "os", "as", "s", "a", "o", "e",
+)
+
+
+def normalizar_prompt(texto: str) -> str:
+    """Minúsculas, sin tildes ni signos y con espacios simples."""
+    texto = texto.lower().replace("ñ", "\0")
+    texto = unicodedata.normalize("NFKD", texto)
+    texto = "".join(c for c in texto if not unicodedata.combining(c)).replace("\0", "ñ")
+    texto = _NO_ALFANUMERICO.sub(" ", texto)
+    return _ESPACIOS.sub(" ", texto).strip()
+
+
+def raiz(palabra: str) -> str:
+    """Quita el sufijo más largo que deje una raíz de al menos 4 letras."""
+    for sufijo in _SUFIJOS:
+        if palabra.endswith(sufijo) and len(palabra) - len(sufijo) >= 4:
+            return palabra[:-len(sufijo)]
+    return palabra
+
+
+def palabras(texto: str, paradas: AbstractSet[str] = PARADAS) -> List[str]:
+    """Palabras normalizadas del texto sin URLs ni palabras vacías (de 2 letras o más)."""
+    return [
+        palabra for palabra in normalizar_prompt(_URL.sub(" ", texto or "")).split()
+        if palabra not in paradas and len(palabra) > 1
+    ]
+
+
+def terminos(texto: str) -> List[str]:
+    """Raíces de las palabras con contenido, en orden."""
+    return [raiz(palabra) for palabra in palabras(texto)]
@@ -0,0 +1,343 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from sqlalchemy import insert
+from sqlalchemy.exc import OperationalError
+
+from controller import encuestas, models
+from controller.metricas import errores_total, historial_escritura_segundos
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_HABILITADO = os.getenv("OUTBOX_HABILITADO", "1") == "1"
+OUTBOX_MAX = int(os.getenv("OUTBOX_MAX", "10000"))  # filas en cola
+OUTBOX_LOTE = int(os.getenv("OUTBOX_LOTE", "200"))  # filas por INSERT
+OUTBOX_INTERVALO = float(os.getenv("OUTBOX_INTERVALO", "1.0"))  # segundos máx. antes de escribir
+OUTBOX_ESPERA = float(os.getenv("OUTBOX_ESPERA", "0.5"))  # espera con la cola llena antes de escribir directo
+OUTBOX_REINTENTO_MAX = float(os.getenv("OUTBOX_REINTENTO_MAX", "30"))  # segundos máx. entre reintentos sin BD
+OUTBOX_FSYNC = os.getenv("OUTBOX_FSYNC", "0") == "1"
+OUTBOX_SPOOL = os.getenv(
+    "OUTBOX_SPOOL",
+    str(Path(__file__).resolve().parent.parent.parent / "database" / "outbox.jsonl")
+)
+
+# Tablas que admiten escritura diferida
+TABLAS = {
+    "chat_history": models.ChatHistory,
+    "encuesta": models.Encuesta,
+    "buzon_de_sugerencias": models.BuzonSugerencias,
+}
+
+# Trabajo adicional en la misma transacción del lote: f(sesion, filas)
+AL_INSERTAR = {
+    "encuesta": encuestas.acumular,
+}
+
+
+def _con_fecha(modelo, fila: dict) -> dict:
+    """Conserva la hora real del evento (created_at) en lugar de la hora del flush."""
+    if "created_at" in modelo.__table__.c and "created_at" not in fila:
+        fila = {**fila, "created_at": datetime.now(timezone.utc).isoformat()}
+    return fila
+
+
+def _fila_para_insert(fila: dict) -> dict:
+    if isinstance(fila.get("created_at"), str):
+        fila = {**fila, "created_at": datetime.fromisoformat(fila["created_at"])}
+    return fila
+
+
+class Outbox:
+    """Escritura diferida (write-behind) de filas que no necesitan respuesta inmediata.
+
+    ``encolar`` deja la fila en una cola acotada y en un archivo spool (JSONL);
+    un hilo la inserta en lotes cuando se juntan ``lote`` filas o pasan
+    ``intervalo`` segundos. El spool se vacía cuando todo lo encolado quedó
+    en la BD y se re-procesa al iniciar si el proceso terminó antes (entrega
+    al menos una vez). Si la BD no está disponible el lote se reintenta con
+    espera creciente y no se toman filas nuevas hasta que se confirma.
+    """
+
+    def __init__(self, sesion_factory=None, ruta_spool: str = OUTBOX_SPOOL, max_filas: int = OUTBOX_MAX,
+                 lote: int = OUTBOX_LOTE, intervalo: float = OUTBOX_INTERVALO):
+        self._sesion_factory = sesion_factory
+        self.ruta_spool = Path(ruta_spool) if ruta_spool else None
+        self.lote = lote
+        self.intervalo = intervalo
+        self._cola: "queue.Queue[tuple]" = queue.Queue(maxsize=max_filas)
+        self._lock = threading.Lock()
+        self._spool = None
+        self._hilo: Optional[threading.Thread] = None
+        self._detener = threading.Event()
+        # Filas tomadas de la cola que aún no se confirman en la BD
+        self._en_vuelo = 0
+        # Filas que fallaron por conexión: siguen en el spool y en _en_vuelo hasta confirmarse
+        self._reintentos: List[tuple] = []
+        self.encoladas = 0
+        self.escritas = 0
+        self.lotes = 0
+        self.directas = 0
+        self.errores = 0
+
+    def _sesion(self):
+        if self._sesion_factory is None:
+            from controller.databaseconfig import session_local
+            self._sesion_factory = session_local
+        return self._sesion_factory()
+
+    # --- spool -------------------------------------------------------------
+
+    def _abrir_spool(self):
+        if self.ruta_spool is not None and self._spool is None:
+            self.ruta_spool.parent.mkdir(parents=True, exist_ok=True)
+            self._spool = open(self.ruta_spool, "a", encoding="utf-8")
+
+    def _escribir_spool(self, tabla: str, fila: dict):
+        if self._spool is None:
+            return
+        self._spool.write(json.dumps({"tabla": tabla, "fila": fila}, ensure_ascii=False, default=str) + "\n")
+        self._spool.flush()
+        if OUTBOX_FSYNC:
+            os.fsync(self._spool.fileno())
+
+    def _vaciar_spool_si_al_dia(self):
+        """Trunca el spool si no queda nada pendiente (todo está en la BD)."""
+        with self._lock:
+            if self._spool is not None and self._cola.empty() and self._en_vuelo == 0:
+                self._spool.truncate(0)
+                self._spool.seek(0)
+
+    def _leer_spool(self) -> List[tuple]:
+        if self.ruta_spool is None or not self.ruta_spool.exists():
+            return []
+        pendientes = []
+        with open(self.ruta_spool, encoding="utf-8") as archivo:
+            for linea in archivo:
+                try:
+                    registro = json.loads(linea)
+                    if registro["tabla"] in TABLAS:
+                        pendientes.append((registro["tabla"], registro["fila"]))
+                except (ValueError, KeyError):
+                    # Línea incompleta (el proceso murió a mitad de escritura)
+                    continue
+        return pendientes
+
+    # --- ciclo de vida -----------------------------------------------------
+
+    def iniciar(self):
+        """Re-procesa el spool pendiente y arranca el hilo escritor."""
+        with self._lock:
+            if self._hilo is not None and self._hilo.is_alive():
+                return
+            pendientes = self._leer_spool()
+            # Cuentan como en vuelo para que el spool no se trunque antes de escribirlas
+            self._en_vuelo += len(pendientes)
+            self._abrir_spool()
+            self._detener.clear()
+            self._hilo = threading.Thread(target=self._ciclo, name="outbox", daemon=True)
+            self._hilo.start()
+        if pendientes:
+            logger.info(f"Outbox: {len(pendientes)} filas pendientes del spool")
+            # Ya están en el spool: se escriben directo en lotes sin volver a encolarlas
+            for i in range(0, len(pendientes), self.lote):
+                self._confirmar(pendientes[i:i + self.lote])
+            self._vaciar_spool_si_al_dia()
+
+    def detener(self, timeout: float = 10.0):
+        """Escribe todo lo pendiente y detiene el hilo."""
+        hilo = self._hilo
+        if hilo is None:
+            return
+        self._detener.set()
+        hilo.join(timeout)
+        if hilo.is_alive():
+            logger.warning("Outbox: no terminó de escribir a tiempo; lo pendiente queda en el spool")
+            return
+        self._hilo = None
+        with self._lock:
+            if self._spool is not None:
+                self._spool.close()
+                self._spool = None
+
+    # --- API ---------------------------------------------------------------
+
+    def encolar(self, tabla: str, fila: dict):
+        """Agrega una fila para insertar después. Con la cola llena la inserta directo."""
+        with historial_escritura_segundos.medir("encolar"):
+            self._encolar(tabla, fila)
+
+    def _encolar(self, tabla: str, fila: dict):
+        modelo = TABLAS[tabla]
+        fila = _con_fecha(modelo, fila)
+        if not OUTBOX_HABILITADO:
+            self._escribir_directo(tabla, fila)
+            return
+        if self._hilo is None:
+            # Sin hilo escritor (antes del calentamiento o después de detener) no hay quien vacíe la cola
+            self._escribir_directo(tabla, fila)
+            return
+        # Con la cola llena (contrapresión) espera hasta OUTBOX_ESPERA a que el hilo libere
+        # espacio. Cola y spool se actualizan juntos bajo el lock (si no, el hilo podría
+        # escribir la fila y vaciar el spool antes, y la línea tardía se volvería a insertar
+        # en el próximo inicio), pero la espera va fuera: el hilo necesita el lock para
+        # sacar filas de la cola
+        limite = time.monotonic() + OUTBOX_ESPERA
+        while True:
+            with self._lock:
+                try:
+                    self._cola.put_nowait((tabla, fila))
+                except queue.Full:
+                    pass
+                else:
+                    self._escribir_spool(tabla, fila)
+                    self.encoladas += 1
+                    return
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                break
+            time.sleep(min(restante, 0.01))
+        self._escribir_directo(tabla, fila)
+
+    def _escribir_directo(self, tabla: str, fila: dict):
+        self.directas += 1
+        pendientes = self._escribir([(tabla, fila)])
+        if not pendientes:
+            return
+        with self._lock:
+            if self._hilo is None or self._spool is None:
+                logger.error(f"Outbox: BD no disponible, fila descartada de {tabla}: {fila}")
+                return
+            # El hilo la reintenta junto con el lote pendiente
+            self._escribir_spool(tabla, fila)
+            self._en_vuelo += 1
+            self._reintentos.extend(pendientes)
+
+    def pendientes(self) -> int:
+        return self._cola.qsize() + self._en_vuelo
+
+    # --- hilo escritor -----------------------------------------------------
+
+    def _tomar_lote(self) -> List[tuple]:
+        lote = []
+        limite = time.monotonic() + self.intervalo
+        while len(lote) < self.lote:
+            restante = limite - time.monotonic()
+            if self._detener.is_set():
+                restante = 0
+            try:
+                if restante <= 0:
+                    lote.append(self._cola.get_nowait())
+                else:
+                    lote.append(self._cola.get(timeout=restante))
+            except queue.Empty:
+                break
+            with self._lock:
+                self._en_vuelo += 1
+        return lote
+
+    def _confirmar(self, lote: List[tuple]):
+        """Escribe filas contadas en ``_en_vuelo``; las que fallan por conexión quedan para reintentar."""
+        pendientes = self._escribir(lote)
+        with self._lock:
+            self._en_vuelo -= len(lote) - len(pendientes)
+            self._reintentos.extend(pendientes)
+
+    def _reintentar(self) -> bool:
+        """Reintenta las filas pendientes por conexión. Retorna True si ya no queda ninguna."""
+        espera = self.intervalo
+        while self._reintentos:
+            with self._lock:
+                pendientes, self._reintentos = self._reintentos, []
+            for i in range(0, len(pendientes), self.lote):
+                self._confirmar(pendientes[i:i + self.lote])
+                if self._reintentos:
+                    # Sigue sin conexión: el resto espera al próximo intento sin probar lote por lote
+                    with self._lock:
+                        self._reintentos.extend(pendientes[i + self.lote:])
+                    break
+            if not self._reintentos:
+                logger.info(f"Outbox: BD disponible de nuevo, {len(pendientes)} filas pendientes escritas")
+                self._vaciar_spool_si_al_dia()
+                break
+            if self._detener.wait(espera):
+                logger.error(f"Outbox: BD no disponible, {len(self._reintentos)} filas quedan en el spool "
+                             "para el próximo inicio")
+                return False
+            espera = min(espera * 2, OUTBOX_REINTENTO_MAX)
+        return True
+
+    def _ciclo(self):
+        while True:
+            if not self._reintentar():
+                return
+            lote = self._tomar_lote()
+            if lote:
+                self._confirmar(lote)
+                self._vaciar_spool_si_al_dia()
+            elif self._detener.is_set():
+                return
+
+    def _escribir(self, lote: List[tuple], intentos: int = 3) -> List[tuple]:
+        """Inserta el lote con un INSERT multi-fila por tabla. Reintenta con espera.
+
+        Retorna las filas que no se escribieron porque la BD no está disponible
+        (las filas inválidas se descartan).
+        """
+        por_tabla: Dict[str, List[dict]] = {}
+        for tabla, fila in lote:
+            por_tabla.setdefault(tabla, []).append(_fila_para_insert(fila))
+
+        sin_conexion = False
+        for intento in range(intentos):
+            db = self._sesion()
+            inicio = time.perf_counter()
+            try:
+                for tabla, filas in por_tabla.items():
+                    db.execute(insert(TABLAS[tabla]), filas)
+                    if tabla in AL_INSERTAR:
+                        AL_INSERTAR[tabla](db, filas)
+                db.commit()
+                historial_escritura_segundos.observar(time.perf_counter() - inicio, "lote")
+                self.escritas += len(lote)
+                self.lotes += 1
+                return []
+            except Exception as e:
+                db.rollback()
+                self.errores += 1
+                errores_total.inc("outbox")
+                sin_conexion = isinstance(e, OperationalError)
+                logger.warning(f"Outbox: error escribiendo lote de {len(lote)} filas (intento {intento + 1}): {e}")
+                if intento + 1 < intentos:
+                    time.sleep(0.5 * 2 ** intento)
+            finally:
+                db.close()
+
+        if sin_conexion:
+            logger.error(f"Outbox: BD no disponible, {len(lote)} filas quedan pendientes de reintento")
+            return lote
+        if len(lote) > 1:
+            # Aislar las filas inválidas: el resto del lote se escribe igual
+            return [pendiente for fila in lote for pendiente in self._escribir([fila], intentos=1)]
+        logger.error(f"Outbox: fila descartada de {lote[0][0]}: {lote[0][1]}")
+        return []
+
+    def estadisticas(self) -> dict:
+        return {
+            "habilitado": OUTBOX_HABILITADO,
+            "pendientes": self.pendientes(),
+            "encoladas": self.encoladas,
+            "escritas": self.escritas,
+            "lotes": self.lotes,
+            "directas": self.directas,
+            "errores": self.errores,
+        }
+
+
+outbox = Outbox()
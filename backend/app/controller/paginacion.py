@@ -0,0 +1,114 @@
+"""Paginación por cursor (keyset) para los listados.
+
+En lugar de ``OFFSET`` (que lee y descarta todas las filas anteriores) cada
+página continúa desde los valores de orden de la última fila entregada:
+``WHERE (created_at, id) < (:c, :i) ORDER BY created_at DESC, id DESC LIMIT n``.
+Con un índice sobre las columnas de orden el costo es el mismo en la página 1
+y en la 10.000.
+
+El cursor es opaco para el cliente (JSON en base64 url-safe) e incluye una
+huella de los filtros: no se puede reutilizar con otros filtros.
+"""
+import base64
+import hashlib
+import json
+from datetime import date, datetime, timezone
+from typing import List, Optional, Sequence
+
+from sqlalchemy import String, literal, tuple_, type_coerce
+
+
+class CursorInvalido(ValueError):
+    pass
+
+
+def _huella(filtros: dict) -> str:
+    texto = json.dumps(filtros, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha1(texto.encode("utf-8")).hexdigest()[:10]
+
+
+def codificar_cursor(valores: Sequence, filtros: dict) -> str:
+    datos = {"v": [v.isoformat() if isinstance(v, (datetime, date)) else v for v in valores], "f": _huella(filtros)}
+    texto = json.dumps(datos, separators=(",", ":"), ensure_ascii=False)
+    return base64.urlsafe_b64encode(texto.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _es_fecha(columna) -> bool:
+    try:
+        return columna.type.python_type is datetime
+    except NotImplementedError:
+        return False
+
+
+def decodificar_cursor(cursor: str, columnas: Sequence, filtros: dict, cantidad: int = None) -> list:
+    """Valores de orden del cursor; las fechas se convierten según ``columnas``."""
+    try:
+        texto = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        datos = json.loads(texto)
+        valores = datos["v"]
+    except (ValueError, KeyError, TypeError):
+        raise CursorInvalido("Cursor inválido")
+    if datos.get("f") != _huella(filtros):
+        raise CursorInvalido("El cursor corresponde a otros filtros")
+    if not isinstance(valores, list) or len(valores) != (len(columnas) if cantidad is None else cantidad):
+        raise CursorInvalido("Cursor inválido")
+    convertidos = list(valores)
+    for i, columna in enumerate(columnas):
+        valor = valores[i]
+        if valor is not None and _es_fecha(columna):
+            try:
+                valor = datetime.fromisoformat(valor)
+            except (TypeError, ValueError):
+                raise CursorInvalido("Cursor inválido")
+            convertidos[i] = valor
+    return convertidos
+
+
+def fecha_para(db, fecha: Optional[datetime]):
+    """Valor con el que se compara una fecha en esta BD.
+
+    SQLite guarda las fechas como texto en UTC sin zona, y el valor por defecto
+    del servidor (CURRENT_TIMESTAMP) no lleva microsegundos: se compara con el
+    mismo texto para que el orden de las cadenas coincida con el cronológico.
+    """
+    if fecha is None or db.get_bind().dialect.name != "sqlite":
+        return fecha
+    if fecha.tzinfo is not None:
+        fecha = fecha.astimezone(timezone.utc).replace(tzinfo=None)
+    texto = fecha.strftime("%Y-%m-%d %H:%M:%S") + (f".{fecha.microsecond:06d}" if fecha.microsecond else "")
+    return literal(texto, String())
+
+
+def paginar(db, consulta, orden: Sequence, filtros: dict, cursor: Optional[str] = None,
+            limite: int = 50, descendente: bool = True) -> dict:
+    """Ejecuta ``consulta`` (un ``select``) una página a la vez.
+
+    ``orden`` son las columnas de orden, la última única (p. ej. created_at, id);
+    también sirve una expresión con etiqueta que esté en la consulta (p. ej. la
+    relevancia de una búsqueda).
+    Retorna ``{"items": [filas como dict], "siguiente": cursor o None}``.
+    """
+    sqlite = db.get_bind().dialect.name == "sqlite"
+    # En SQLite una misma columna puede tener fechas con y sin microsegundos: el
+    # cursor guarda el texto tal como está en la BD, que es el orden del índice
+    claves = [(type_coerce(c, String) if _es_fecha(c) else c).label(f"_clave_{i}")
+              for i, c in enumerate(orden)] if sqlite else []
+    if cursor:
+        valores = decodificar_cursor(cursor, [] if sqlite else orden, filtros, len(orden))
+        if sqlite:
+            valores = [literal(v, String()) if isinstance(v, str) and _es_fecha(c) else v
+                       for c, v in zip(orden, valores)]
+        clave = tuple_(*orden)
+        consulta = consulta.where(clave < tuple_(*valores) if descendente else clave > tuple_(*valores))
+    consulta = consulta.add_columns(*claves)
+    consulta = consulta.order_by(*[c.desc() if descendente else c.asc() for c in orden]).limit(limite + 1)
+    filas: List[dict] = [dict(fila._mapping) for fila in db.execute(consulta)]
+    siguiente = None
+    if len(filas) > limite:
+        filas = filas[:limite]
+        ultima = filas[-1]
+        siguiente = codificar_cursor([ultima[c.key] for c in claves or orden], filtros)
+    for fila in filas:
+        for c in claves:
+            del fila[c.key]
+    return {"items": filas, "siguiente": siguiente}
@@ -0,0 +1,88 @@
+import math
+import os
+import re
+from typing import Dict, List, Set
+
+from controller.normalizacion import normalizar_prompt, palabras, raiz
+
+# Tope de tokens de contexto aunque el modelo admita más (costo y latencia)
+PROMPT_MAX_TOKENS = int(os.getenv("PROMPT_MAX_TOKENS", "6000"))
+# Reserva para el formato de mensajes y desviaciones de la estimación
+PROMPT_MARGEN_TOKENS = int(os.getenv("PROMPT_MARGEN_TOKENS", "256"))
+
+_PIEZAS = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+# Palabras (prefijos normalizados) que indican el tema de la pregunta
+TEMAS = {
+    "materias": ("materia", "asignatura", "credito", "prioriz", "matricul", "semestre", "nota",
+                 "calificacion", "curso", "clase", "horario", "inscrib", "prerrequisito"),
+    "sugerencia": ("queja", "reclamo", "sugerencia", "felicit", "buzon", "quej"),
+    "usuarios": ("profesor", "docente", "usuario", "analista", "quien"),
+}
+
+
+def estimar_tokens(texto: str) -> int:
+    """Estimación local de tokens: palabras largas cuentan ~1 token por cada 4 caracteres."""
+    if not texto:
+        return 0
+    total = 0
+    for pieza in _PIEZAS.findall(texto):
+        total += max(1, math.ceil(len(pieza) / 4))
+    return total
+
+
+def presupuesto_tokens(context_window: int, max_tokens: int) -> int:
+    """Tokens disponibles para el prompt según la ventana del modelo."""
+    return max(0, min(context_window - max_tokens - PROMPT_MARGEN_TOKENS, PROMPT_MAX_TOKENS))
+
+
+def _terminos(texto: str) -> Set[str]:
+    """Raíces aproximadas de las palabras con contenido."""
+    return {raiz(palabra) for palabra in palabras(texto) if len(palabra) > 2}
+
+
+def detectar_temas(pregunta: str) -> Set[str]:
+    texto = normalizar_prompt(pregunta)
+    palabras = texto.split()
+    return {
+        tema for tema, prefijos in TEMAS.items()
+        if any(palabra.startswith(prefijo) for palabra in palabras for prefijo in prefijos)
+    }
+
+
+# Términos por rama de cada árbol de opciones: {id(árbol): (árbol, {clave: (título, contenido)})}
+_terminos_por_arbol: Dict[int, tuple] = {}
+
+
+def _terminos_ramas(contexto_json: dict) -> Dict[str, tuple]:
+    entrada = _terminos_por_arbol.get(id(contexto_json))
+    if entrada is not None and entrada[0] is contexto_json:
+        return entrada[1]
+    ramas = {}
+    for clave, opcion in contexto_json.get("opciones", {}).items():
+        textos = [opcion.get("texto", "")]
+        for sub_opcion in opcion.get("opciones", {}).values():
+            textos.append(sub_opcion.get("texto", ""))
+            textos.append(str(sub_opcion.get("resultado", "")))
+        if "resultado" in opcion:
+            textos.append(str(opcion["resultado"]))
+        ramas[clave] = (_terminos(opcion.get("texto", "")), _terminos(" ".join(textos)))
+    if len(_terminos_por_arbol) > 8:
+        _terminos_por_arbol.clear()
+    # Se guarda la referencia al árbol para que su id no se reutilice
+    _terminos_por_arbol[id(contexto_json)] = (contexto_json, ramas)
+    return ramas
+
+
+def ramas_relevantes(contexto_json: dict, pregunta: str, max_ramas: int = 3) -> List[str]:
+    """Claves de las opciones de primer nivel que comparten términos con la pregunta."""
+    terminos = _terminos(pregunta)
+    if not terminos or not contexto_json:
+        return []
+    puntajes: Dict[str, int] = {}
+    for clave, (titulo, contenido) in _terminos_ramas(contexto_json).items():
+        # El título de la rama pesa el doble que su contenido
+        puntaje = 2 * len(terminos & titulo) + len(terminos & contenido)
+        if puntaje:
+            puntajes[clave] = puntaje
+    return sorted(puntajes, key=puntajes.get, reverse=True)[:max_ramas]
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr
-from typing import Optional
+from typing import Any, List, Optional
 from datetime import datetime
 
 # Schema para Materia
@@ -57,6 +57,7 @@ class EncuestaBase(BaseModel):
     id_estudiante: str
     facultad: str
     satisfaccion: str 
+    respuestas: Optional[str] = None  # JSON {dato_clave: respuesta}
 
 class EncuestaCreate(EncuestaBase):
     pass
@@ -110,4 +111,72 @@ class EstudianteResponse(EstudianteBase):
     updated_at: Optional[datetime] = None
     
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+# Schemas de los listados paginados por cursor (datos_router)
+class MateriaItem(BaseModel):
+    id_materia: int
+    nombre_materia: Optional[str] = None
+    creditos: Optional[int] = None
+
+class SugerenciaItem(BuzonSugerenciasBase):
+    id: int
+    descripcion: Optional[str] = None
+    created_at: Optional[datetime] = None
+
+class HistorialItem(BaseModel):
+    id: int
+    tipo_documento: Optional[str] = None
+    numero_documento: Optional[str] = None
+    mensaje: Optional[str] = None
+    respuesta: Any = None  # lista de mensajes decodificada
+    estado: Optional[str] = None
+    created_at: Optional[datetime] = None
+
+class PaginaMaterias(BaseModel):
+    items: List[MateriaItem]
+    siguiente: Optional[str] = None
+
+class PaginaSugerencias(BaseModel):
+    items: List[SugerenciaItem]
+    siguiente: Optional[str] = None
+
+class PaginaHistorial(BaseModel):
+    items: List[HistorialItem]
+    siguiente: Optional[str] = None
+
+# Resultados de la búsqueda de texto completo
+class SugerenciaEncontrada(SugerenciaItem):
+    relevancia: float
+    fragmento: Optional[str] = None
+
+class HistorialEncontrado(HistorialItem):
+    relevancia: float
+    fragmento: Optional[str] = None
+
+class BusquedaSugerencias(BaseModel):
+    items: List[SugerenciaEncontrada]
+    siguiente: Optional[str] = None
+
+class BusquedaHistorial(BaseModel):
+    items: List[HistorialEncontrado]
+    siguiente: Optional[str] = None
+
+# Resumen de encuestas (contadores precalculados)
+class ResumenRespuesta(BaseModel):
+    respuesta: str
+    total: int
+    porcentaje: float
+
+class ResumenPregunta(BaseModel):
+    clave: str
+    pregunta: Optional[str] = None
+    total: int
+    promedio: Optional[float] = None
+    respuestas: List[ResumenRespuesta]
+
+class ResumenEncuestas(BaseModel):
+    facultad: Optional[str] = None
+    encuestas: int
+    por_facultad: Optional[dict] = None
+    preguntas: List[ResumenPregunta]
@@ -0,0 +1,23 @@
+import os
+import secrets
+from typing import Optional
+
+from fastapi import Header, HTTPException
+
+# Token de los endpoints de administración (/datos). Sin configurar quedan deshabilitados
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+
+def requiere_admin(
+    authorization: Optional[str] = Header(None),
+    x_api_key: Optional[str] = Header(None),
+):
+    """Dependencia: exige ``Authorization: Bearer <ADMIN_TOKEN>`` o ``X-API-Key: <ADMIN_TOKEN>``."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Endpoints de administración deshabilitados (ADMIN_TOKEN)")
+    token = x_api_key
+    if authorization and authorization[:7].lower() == "bearer ":
+        token = authorization[7:].strip()
+    if not token or not secrets.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Token de administración inválido",
+                            headers={"WWW-Authenticate": "Bearer"})
@@ -0,0 +1,157 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+SESIONES_ALMACEN = os.getenv("SESIONES_ALMACEN", "memoria")  # memoria | sqlite
+SESIONES_TTL = float(os.getenv("SESIONES_TTL", "1800"))  # segundos sin actividad
+SESIONES_MAX = int(os.getenv("SESIONES_MAX", "10000"))
+SESIONES_RUTA = os.getenv(
+    "SESIONES_RUTA",
+    str(Path(__file__).resolve().parent.parent.parent / "database" / "sesiones.db")
+)
+
+
+class SesionConversacion:
+    """Estado de una conversación: nodo actual, identificación y datos en curso."""
+    __slots__ = ("id", "estado", "nodo_id", "huella_arbol", "identificacion", "datos_encuesta", "datos_buzon")
+
+    def __init__(self, id: str = None, estado: str = "pidiendo_tipo", nodo_id: str = None,
+                 huella_arbol: str = None, identificacion: dict = None, datos_encuesta: dict = None,
+                 datos_buzon: dict = None):
+        self.id = id or uuid.uuid4().hex
+        self.estado = estado
+        self.nodo_id = nodo_id
+        # Huella del árbol en que se resolvió nodo_id (tras una recarga el id puede ser otro nodo)
+        self.huella_arbol = huella_arbol
+        self.identificacion = identificacion or {}
+        self.datos_encuesta = datos_encuesta or {}
+        self.datos_buzon = datos_buzon or {}
+
+    def to_dict(self) -> dict:
+        return {campo: getattr(self, campo) for campo in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, datos: dict) -> "SesionConversacion":
+        return cls(**{campo: datos.get(campo) for campo in cls.__slots__})
+
+    def __repr__(self):
+        return f"<SesionConversacion(id={self.id}, estado={self.estado}, nodo={self.nodo_id})>"
+
+
+class AlmacenSesiones:
+    """Interfaz de los almacenes de sesiones."""
+
+    def obtener(self, id_sesion: str) -> Optional[SesionConversacion]:
+        raise NotImplementedError
+
+    def guardar(self, sesion: SesionConversacion):
+        raise NotImplementedError
+
+    def eliminar(self, id_sesion: str):
+        raise NotImplementedError
+
+
+class AlmacenMemoria(AlmacenSesiones):
+    """LRU en memoria con expiración por inactividad (solo un worker)."""
+
+    def __init__(self, ttl: float = SESIONES_TTL, max_sesiones: int = SESIONES_MAX):
+        self.ttl = ttl
+        self.max_sesiones = max_sesiones
+        self._sesiones: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtener(self, id_sesion: str) -> Optional[SesionConversacion]:
+        with self._lock:
+            entrada = self._sesiones.get(id_sesion)
+            if entrada is None:
+                return None
+            expira, sesion = entrada
+            if expira < time.monotonic():
+                del self._sesiones[id_sesion]
+                return None
+            self._sesiones.move_to_end(id_sesion)
+            return sesion
+
+    def guardar(self, sesion: SesionConversacion):
+        with self._lock:
+            self._sesiones[sesion.id] = (time.monotonic() + self.ttl, sesion)
+            self._sesiones.move_to_end(sesion.id)
+            while len(self._sesiones) > self.max_sesiones:
+                self._sesiones.popitem(last=False)
+
+    def eliminar(self, id_sesion: str):
+        with self._lock:
+            self._sesiones.pop(id_sesion, None)
+
+    def __len__(self):
+        return len(self._sesiones)
+
+
+class AlmacenSQLite(AlmacenSesiones):
+    """Almacén persistente en SQLite, compartido entre workers de la misma máquina."""
+
+    def __init__(self, ruta: str = SESIONES_RUTA, ttl: float = SESIONES_TTL, limpiar_cada: int = 500):
+        self.ruta = ruta
+        self.ttl = ttl
+        self.limpiar_cada = limpiar_cada
+        self._escrituras = 0
+        self._local = threading.local()
+        with self._conexion() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sesiones ("
+                "id TEXT PRIMARY KEY, datos TEXT NOT NULL, expira REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_sesiones_expira ON sesiones (expira)")
+
+    def _conexion(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.ruta, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def obtener(self, id_sesion: str) -> Optional[SesionConversacion]:
+        fila = self._conexion().execute(
+            "SELECT datos FROM sesiones WHERE id = ? AND expira >= ?", (id_sesion, time.time())
+        ).fetchone()
+        if fila is None:
+            return None
+        return SesionConversacion.from_dict(json.loads(fila[0]))
+
+    def guardar(self, sesion: SesionConversacion):
+        conn = self._conexion()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sesiones (id, datos, expira) VALUES (?, ?, ?)",
+                (sesion.id, json.dumps(sesion.to_dict(), ensure_ascii=False), time.time() + self.ttl)
+            )
+        self._escrituras += 1
+        if self._escrituras % self.limpiar_cada == 0:
+            self.limpiar_expiradas()
+
+    def eliminar(self, id_sesion: str):
+        conn = self._conexion()
+        with conn:
+            conn.execute("DELETE FROM sesiones WHERE id = ?", (id_sesion,))
+
+    def limpiar_expiradas(self):
+        conn = self._conexion()
+        with conn:
+            conn.execute("DELETE FROM sesiones WHERE expira < ?", (time.time(),))
+
+
+def crear_almacen(tipo: str = SESIONES_ALMACEN) -> AlmacenSesiones:
+    if tipo == "sqlite":
+        return AlmacenSQLite()
+    return AlmacenMemoria()
+
+
+almacen_sesiones = crear_almacen()
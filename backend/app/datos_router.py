@@ -0,0 +1,173 @@
+"""Listados paginados por cursor (keyset) del buzón, el historial y las materias,
+la búsqueda de texto completo, el resumen de encuestas y la carga masiva de
+materias y matrículas.
+
+Todo el router exige el token de administración (``controller.seguridad``):
+las sugerencias y el historial traen documentos y mensajes de los usuarios.
+
+Cada respuesta trae ``siguiente``: se envía como ``cursor`` para pedir la
+página siguiente (``null`` en la última). El costo de cada página no depende
+de qué tan profunda sea.
+"""
+import os
+import tempfile
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+
+from controller import crud, encuestas, ingesta, schemas
+from controller.databaseconfig import get_db, get_db_lectura
+from controller.historial import decodificar_respuesta
+from controller.busqueda import ConsultaVacia
+from controller.paginacion import CursorInvalido
+from controller.seguridad import requiere_admin
+from model.arbol_opciones import registro_opciones
+
+router = APIRouter(prefix="/datos", tags=["datos"], dependencies=[Depends(requiere_admin)])
+
+LIMITE_MAX = 200
+
+
+def _pagina(funcion, *args, **kwargs) -> dict:
+    try:
+        return funcion(*args, **kwargs)
+    except (CursorInvalido, ConsultaVacia) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/sugerencias", response_model=schemas.PaginaSugerencias)
+def listar_sugerencias(
+    estado: Optional[str] = None,
+    tipo_sugerencia: Optional[str] = None,
+    documento: Optional[str] = Query(None, description="Documento del estudiante"),
+    desde: Optional[datetime] = Query(None, description="created_at >= desde"),
+    hasta: Optional[datetime] = Query(None, description="created_at < hasta"),
+    cursor: Optional[str] = None,
+    limite: int = Query(50, ge=1, le=LIMITE_MAX),
+    db: Session = Depends(get_db_lectura),
+):
+    """Sugerencias de la más reciente a la más antigua."""
+    return _pagina(crud.listar_sugerencias, db, estado, tipo_sugerencia, documento, desde, hasta, cursor, limite)
+
+
+@router.get("/historial", response_model=schemas.PaginaHistorial)
+def listar_historial(
+    documento: Optional[str] = Query(None, description="numero_documento del usuario"),
+    tipo_documento: Optional[str] = None,
+    estado: Optional[str] = None,
+    desde: Optional[datetime] = Query(None, description="created_at >= desde"),
+    hasta: Optional[datetime] = Query(None, description="created_at < hasta"),
+    cursor: Optional[str] = None,
+    limite: int = Query(50, ge=1, le=LIMITE_MAX),
+    db: Session = Depends(get_db_lectura),
+):
+    """Historial de chat (solo los meses en la tabla; los archivados se leen con controller/historial.py)."""
+    pagina = _pagina(crud.listar_historial, db, documento, tipo_documento, estado, desde, hasta, cursor, limite)
+    for fila in pagina["items"]:
+        fila["respuesta"] = decodificar_respuesta(fila["respuesta"])
+    return pagina
+
+
+@router.get("/buscar/sugerencias", response_model=schemas.BusquedaSugerencias)
+def buscar_sugerencias(
+    q: str = Query(..., min_length=1, max_length=200, description="Palabras a buscar en asunto y descripción"),
+    estado: Optional[str] = None,
+    tipo_sugerencia: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limite: int = Query(50, ge=1, le=LIMITE_MAX),
+    db: Session = Depends(get_db_lectura),
+):
+    """Sugerencias que contienen todas las palabras de ``q``, de la más relevante a la menos."""
+    return _pagina(crud.buscar_sugerencias, db, q, estado, tipo_sugerencia, cursor, limite)
+
+
+@router.get("/buscar/historial", response_model=schemas.BusquedaHistorial)
+def buscar_historial(
+    q: str = Query(..., min_length=1, max_length=200, description="Palabras a buscar en mensaje y respuesta"),
+    documento: Optional[str] = Query(None, description="numero_documento del usuario"),
+    estado: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limite: int = Query(50, ge=1, le=LIMITE_MAX),
+    db: Session = Depends(get_db_lectura),
+):
+    """Conversaciones que contienen todas las palabras de ``q`` (solo los meses en la tabla).
+
+    Como todo ``/datos`` exige el token de administración: devuelve mensajes y documentos.
+    """
+    pagina = _pagina(crud.buscar_historial, db, q, documento, estado, cursor, limite)
+    for fila in pagina["items"]:
+        fila["respuesta"] = decodificar_respuesta(fila["respuesta"])
+    return pagina
+
+
+@router.get("/materias", response_model=schemas.PaginaMaterias)
+def listar_materias(
+    documento: Optional[str] = Query(None, description="Solo las materias matriculadas por este estudiante"),
+    creditos: Optional[int] = None,
+    cursor: Optional[str] = None,
+    limite: int = Query(50, ge=1, le=LIMITE_MAX),
+    db: Session = Depends(get_db_lectura),
+):
+    """Materias ordenadas por id."""
+    return _pagina(crud.listar_materias, db, documento, creditos, cursor, limite)
+
+
+@router.get("/encuestas/resumen", response_model=schemas.ResumenEncuestas)
+def resumen_encuestas(
+    facultad: Optional[str] = Query(None, description="Solo las encuestas de esta facultad"),
+    db: Session = Depends(get_db_lectura),
+):
+    """Totales por pregunta y respuesta desde los contadores (no recorre la tabla encuesta)."""
+    return encuestas.resumen(db, registro_opciones.arbol("general"), facultad)
+
+
+# El cuerpo se guarda en memoria hasta este tamaño y luego en un archivo temporal
+INGESTA_MEMORIA = 8 * 1024 * 1024
+# Tamaño máximo del cuerpo de una carga (más grande: por la CLI de controller/ingesta.py)
+INGESTA_MAX_BYTES = int(os.getenv("INGESTA_MAX_BYTES", str(200 * 1024 * 1024)))
+
+
+def _demasiado_grande() -> HTTPException:
+    return HTTPException(status_code=413, detail=f"El cuerpo supera INGESTA_MAX_BYTES ({INGESTA_MAX_BYTES} bytes)")
+
+
+@router.post("/ingesta/{tabla}")
+async def ingerir(
+    tabla: str,
+    request: Request,
+    formato: Optional[str] = Query(None, pattern="^(csv|jsonl)$",
+                                   description="Por defecto según el Content-Type (csv si no se indica)"),
+    verificar_referencias: bool = True,
+    db: Session = Depends(get_db),
+):
+    """Carga masiva del cuerpo (CSV con encabezado o JSONL) en ``materias`` o ``estudiante_materias``.
+
+    Responde con el reporte: filas leídas, escritas, duplicadas y rechazadas (con línea y motivo).
+    El cuerpo no puede pasar de ``INGESTA_MAX_BYTES``.
+    """
+    if tabla not in ingesta.DESTINOS:
+        raise HTTPException(status_code=404, detail=f"Tabla no soportada: {tabla}")
+    if formato is None:
+        formato = "jsonl" if "json" in request.headers.get("content-type", "") else "csv"
+    largo = request.headers.get("content-length")
+    if largo and largo.isdigit() and int(largo) > INGESTA_MAX_BYTES:
+        raise _demasiado_grande()
+    archivo = tempfile.SpooledTemporaryFile(max_size=INGESTA_MEMORIA)
+    try:
+        # Content-Length puede faltar (chunked) o mentir: se cuenta lo recibido
+        recibidos = 0
+        async for parte in request.stream():
+            recibidos += len(parte)
+            if recibidos > INGESTA_MAX_BYTES:
+                raise _demasiado_grande()
+            archivo.write(parte)
+        archivo.seek(0)
+        # La carga es bloqueante (lectura, validación y BD): fuera del event loop
+        reporte = await run_in_threadpool(ingesta.ingerir, db, tabla, archivo, formato,
+                                          verificar_referencias=verificar_referencias)
+    finally:
+        archivo.close()
+    return reporte.como_dict()
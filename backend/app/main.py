@@ -1,4 +1,5 @@
-from fastapi import FastAPI,FastAPI, Depends, HTTPException
+from fastapi import FastAPI,FastAPI, Depends, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import json
@@ -6,14 +7,35 @@ from model.chat_bot import *
 from sqlalchemy.orm import Session
 from typing import List
 from controller import models, schemas, crud
-from controller.databaseconfig import engine, get_db
+from controller.databaseconfig import get_db, estadisticas_pool
 from pathlib import Path
 from ai_router import router as ai_router
+from datos_router import router as datos_router
+from model.arbol_opciones import registro_opciones
+from controller.sesiones import almacen_sesiones, SesionConversacion
+from controller.cliente_groq import cliente_groq
+from controller.outbox import outbox
+from controller.arranque import calentamiento
+from controller.historial import codificar_respuesta
+from controller.metricas import registro_metricas, http_peticion_segundos, opciones_resolucion_segundos, errores_total
+from types import SimpleNamespace
+from contextlib import asynccontextmanager
+import logging
+import os
+import time
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Esquema, pool de la BD, árboles de opciones, PLN, outbox y cliente de Groq
+    # (importar este módulo no abre conexiones ni ejecuta DDL)
+    await calentamiento.iniciar()
+    yield
+    await calentamiento.detener()
+    outbox.detener()
+    await cliente_groq.cerrar()
 
-models.Base.metadata.create_all(bind=engine)
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -23,28 +45,45 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def medir_peticion(request: Request, call_next):
+    inicio = time.perf_counter()
+    response = await call_next(request)
+    # Se etiqueta con la plantilla de la ruta (no la URL) para acotar las series
+    ruta = getattr(request.scope.get("route"), "path", "sin_ruta")
+    http_peticion_segundos.observar(time.perf_counter() - inicio, request.method, ruta, response.status_code)
+    return response
+
 # Registrar el router de IA
 app.include_router(ai_router)
+# Listados y búsqueda paginados por cursor, resumen de encuestas y carga masiva
+app.include_router(datos_router)
 
-with open('opciones.json', encoding='utf-8') as f:
-    OPCIONES = json.load(f)
+# Si es "1" se aceptan clientes que envían nodo_actual e identificacion en cada mensaje
+SESIONES_COMPAT = os.getenv("SESIONES_COMPAT", "1") == "1"
 
 class MensajeRequest(BaseModel):
     mensaje: str
-    estado: str
-    identificacion: dict
-    nodo_actual: dict | None
+    estado: str | None = None
+    identificacion: dict = {}
+    nodo_actual: dict | None = None
+    # Modo compatible: id estable del nodo y huella del árbol de la respuesta anterior
+    nodo_id: str | None = None
+    huella_arbol: str | None = None
+    # Modo sesión: el estado de la conversación se guarda en el servidor
+    session_id: str | None = None
+    usar_sesion: bool = False
 
 @app.get("/opciones")
 async def get_opciones():
-    return OPCIONES
+    return registro_opciones.arbol("general").datos
 
-@app.post("/procesar_mensaje")
-async def procesar_mensaje(request: MensajeRequest, db: Session = Depends(get_db)):
-    respuesta = ChatBot(request, OPCIONES).respuesta()
-    # Determinar conjunto de opciones según identificacion + rol en DB
-    identificacion = request.identificacion if isinstance(request.identificacion, dict) else {}
-    opciones_a_usar = OPCIONES
+def _arbol_para_usuario(db: Session, identificacion: dict):
+    """Selecciona el árbol de opciones según el rol del usuario en la BD."""
+    with opciones_resolucion_segundos.medir():
+        return _buscar_arbol(db, identificacion)
+
+def _buscar_arbol(db: Session, identificacion: dict):
     try:
         tipo = identificacion.get("tipo")
         numero = identificacion.get("numero")
@@ -53,34 +92,156 @@ async def procesar_mensaje(request: MensajeRequest, db: Session = Depends(get_db
             if usuario:
                 # Ajusta el nombre del atributo 'rol' según tu modelo (p. ej. usuario.rol)
                 rol = getattr(usuario, "rol", None) or getattr(usuario, "role", None)
-                if rol:
-                    if str(rol).lower() in ("profesor"):
-                        with open('opciones_profes.json', encoding='utf-8') as f:
-                            opciones_a_usar = json.load(f)
-                    elif str(rol).lower() in ("estudiante"):
-                        with open('opciones_estudiantes.json', encoding='utf-8') as f:
-                            opciones_a_usar = json.load(f)
+                return registro_opciones.arbol_para_rol(rol)
     except Exception as e:
+        # La sesión sigue en uso en la petición: sin rollback queda abortada en PostgreSQL
+        db.rollback()
+        errores_total.inc("opciones")
         print("Error buscando rol/seleccionando opciones:", e)
+    return registro_opciones.arbol("general")
 
-    respuesta = ChatBot(request, opciones_a_usar).respuesta()
+def _nodo_del_cliente(arbol, request: MensajeRequest):
+    """Nodo compilado que indica el cliente en modo compatible (o None).
 
-    # Guardar en el historial
-    try:
-        # Asegurar que identificacion sea un diccionario
+    ``nodo_actual`` llega como JSON y no es el diccionario del árbol, así que se
+    resuelve por ``nodo_id``; la huella descarta ids de una versión anterior
+    del árbol o del árbol de otro rol.
+    """
+    if not request.nodo_id or request.huella_arbol != arbol.huella:
+        return None
+    return arbol.nodo(request.nodo_id)
+
+def _opciones_compactas(opciones):
+    """Reduce las opciones a {clave: texto} para no reenviar el subárbol completo."""
+    if not isinstance(opciones, dict):
+        return opciones
+    return {clave: opcion.get("texto", "") for clave, opcion in opciones.items()}
+
+def _respuesta_sesion(sesion: SesionConversacion, mensajes: list, opciones=None, sugerir_ia: bool = False) -> dict:
+    return {
+        "session_id": sesion.id,
+        "nodo_id": sesion.nodo_id,
+        "nuevo_estado": sesion.estado,
+        "mensajes": mensajes,
+        "opciones": _opciones_compactas(opciones),
+        "sugerir_ia": sugerir_ia,
+    }
+
+def _volver_al_menu(sesion: SesionConversacion, arbol, aviso: str) -> dict:
+    """Lleva la sesión al menú principal de ``arbol`` (sin interpretar el mensaje) y la guarda."""
+    sesion.estado = "en_opciones"
+    sesion.nodo_id = arbol.raiz.id
+    sesion.huella_arbol = arbol.huella
+    almacen_sesiones.guardar(sesion)
+    return _respuesta_sesion(sesion, [aviso, arbol.raiz.datos["pregunta"]], arbol.raiz.datos["opciones"])
+
+def _procesar_con_sesion(request: MensajeRequest, db: Session):
+    """Atiende el mensaje con el estado guardado en el servidor.
+
+    Retorna (respuesta, estado_previo, identificacion) para el historial.
+    """
+    sesion = almacen_sesiones.obtener(request.session_id) if request.session_id else None
+    if sesion is None:
+        sesion = SesionConversacion(estado=request.estado or "pidiendo_tipo")
+    elif sesion.estado == "finalizado":
+        # La conversación anterior terminó: el siguiente mensaje empieza otra con el mismo id
+        sesion = SesionConversacion(id=sesion.id)
+    estado_previo = sesion.estado
+
+    identificacion = dict(sesion.identificacion)
+    identificacion["datos_encuesta"] = sesion.datos_encuesta
+    identificacion["datos_buzon"] = sesion.datos_buzon
+    arbol = _arbol_para_usuario(db, identificacion)
+    if sesion.nodo_id and sesion.huella_arbol != arbol.huella:
+        # El árbol cambió (recarga o árbol de otro rol): el id podría ser otro nodo
+        return _volver_al_menu(sesion, arbol, "El menú se actualizó."), estado_previo, identificacion
+    nodo = arbol.nodo(sesion.nodo_id) if sesion.nodo_id else None
+
+    peticion = SimpleNamespace(
+        mensaje=request.mensaje,
+        estado=sesion.estado,
+        identificacion=identificacion,
+        nodo_actual=nodo.datos if nodo else None,
+    )
+    respuesta = ChatBot(peticion, arbol.datos, arbol, db=db).respuesta()
+    if not isinstance(respuesta, dict):
+        # Error del flujo: la sesión no queda en un estado del que no puede salir
+        if sesion.identificacion.get("numero"):
+            return _volver_al_menu(sesion, arbol, respuesta), estado_previo, identificacion
+        sesion = SesionConversacion(id=sesion.id)
+        almacen_sesiones.guardar(sesion)
+        return _respuesta_sesion(sesion, [respuesta]), estado_previo, identificacion
+
+    identificacion = respuesta.get("identificacion") or identificacion
+    sesion.datos_encuesta = identificacion.pop("datos_encuesta", {}) or {}
+    sesion.datos_buzon = identificacion.pop("datos_buzon", {}) or {}
+    sesion.identificacion = identificacion
+    sesion.estado = respuesta["nuevo_estado"]
+    sesion.nodo_id = arbol.id_de(respuesta.get("nodo_actual"))
+    sesion.huella_arbol = arbol.huella
+    almacen_sesiones.guardar(sesion)
+
+    return _respuesta_sesion(sesion, respuesta["mensajes"], respuesta["opciones"],
+                             respuesta.get("sugerir_ia", False)), estado_previo, identificacion
+
+@app.post("/procesar_mensaje")
+def procesar_mensaje(request: MensajeRequest, db: Session = Depends(get_db)):
+    if request.session_id or request.usar_sesion or not SESIONES_COMPAT:
+        respuesta, estado, identificacion = _procesar_con_sesion(request, db)
+    else:
+        # Modo compatible: el cliente envía y recibe nodo_actual e identificacion
+        # Determinar conjunto de opciones según identificacion + rol en DB
         identificacion = request.identificacion if isinstance(request.identificacion, dict) else {}
-        
+        arbol = _arbol_para_usuario(db, identificacion)
+        estado = request.estado
+        nodo = _nodo_del_cliente(arbol, request)
+        if nodo is not None:
+            # El nodo compilado reemplaza la copia del cliente: usa el índice y sus resultados precalculados
+            request.nodo_actual = nodo.datos
+        respuesta = ChatBot(request, arbol.datos, arbol, db=db).respuesta()
+        if isinstance(respuesta, dict):
+            respuesta["nodo_id"] = arbol.id_de(respuesta.get("nodo_actual"))
+            respuesta["huella_arbol"] = arbol.huella
+
+    # Guardar en el historial (se inserta en lote fuera de la petición)
+    try:
         chat_history = schemas.ChatHistorialCreate(
             tipo_documento=identificacion.get("tipo") if identificacion else None,
             numero_documento=identificacion.get("numero") if identificacion else None,
             mensaje=request.mensaje,
-            respuesta=str(respuesta.get("mensajes", [])) if isinstance(respuesta, dict) else str(respuesta),
-            estado=request.estado
+            respuesta=codificar_respuesta(respuesta),
+            estado=estado
         )
-        crud.crear_historial_chat(db, chat_history)
+        outbox.encolar("chat_history", chat_history.dict())
     except Exception as e:
+        errores_total.inc("historial")
         print(f"Error guardando historial: {e}")
         import traceback
         traceback.print_exc()  # Esto imprimirá más detalles del error
     
-    return respuesta
\ No newline at end of file
+    return respuesta
+
+
+@app.get("/ready")
+def listo():
+    """503 hasta que termina el calentamiento (para el balanceador o el orquestador)."""
+    reporte = calentamiento.reporte()
+    return JSONResponse(reporte, status_code=200 if reporte["listo"] else 503)
+
+
+@app.get("/outbox")
+def estadisticas_outbox():
+    """Filas pendientes y escritas por la escritura diferida."""
+    return outbox.estadisticas()
+
+
+@app.get("/db/pool")
+def estadisticas_db_pool():
+    """Conexiones en uso, libres y en overflow del pool de la BD."""
+    return estadisticas_pool()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metricas():
+    """Latencias por etapa y contadores en formato de texto de Prometheus."""
+    return PlainTextResponse(registro_metricas.exportar(), media_type="text/plain; version=0.0.4")
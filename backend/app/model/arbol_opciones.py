@@ -0,0 +1,213 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+RUTA_APP = Path(__file__).resolve().parent.parent
+
+# Archivos de opciones por rol (el nombre es la clave del registro)
+ARCHIVOS_OPCIONES = {
+    "general": "opciones.json",
+    "estudiante": "opciones_estudiantes.json",
+    "profesor": "opciones_profes.json",
+}
+
+ID_RAIZ = "raiz"
+
+
+class ErrorArbolOpciones(ValueError):
+    """Error de estructura en un archivo de opciones."""
+
+
+class Nodo:
+    """Nodo compilado del árbol de opciones."""
+    __slots__ = ("id", "datos", "tipo", "hijos", "siguiente", "resultado", "usa_link_hoja")
+
+    def __init__(self, id_nodo: str, datos: dict, tipo: str):
+        self.id = id_nodo
+        self.datos = datos
+        self.tipo = tipo
+        self.hijos: Dict[str, str] = {}
+        self.siguiente: Optional[str] = None
+        self.resultado: Optional[str] = None
+        self.usa_link_hoja = False
+
+    def __repr__(self):
+        return f"<Nodo(id={self.id}, tipo={self.tipo})>"
+
+
+def _id_hijo(padre: str, clave: str) -> str:
+    return clave if padre == ID_RAIZ else f"{padre}.{clave}"
+
+
+def _tipo_nodo(datos: dict, ruta: str) -> str:
+    if "resultado" in datos:
+        return "resultado"
+    if "estado" in datos:
+        return "estado"
+    if "pregunta_encuesta" in datos:
+        return "encuesta"
+    if "pregunta_sugerencia" in datos:
+        return "sugerencia"
+    if "pregunta" in datos and "opciones" in datos:
+        return "menu"
+    raise ErrorArbolOpciones(f"Nodo '{ruta}' sin resultado, estado, pregunta ni opciones")
+
+
+class ArbolCompilado:
+    """Árbol de opciones indexado: ids planos, mapa de hijos y resultados precalculados.
+
+    Los diccionarios originales se conservan en ``Nodo.datos`` para que el
+    ChatBot pueda seguir trabajando con ``nodo_actual`` como antes.
+    """
+
+    def __init__(self, nombre: str, datos: dict, mtime: float = 0.0):
+        self.nombre = nombre
+        self.datos = datos
+        self.mtime = mtime
+        self.nodos: Dict[str, Nodo] = {}
+        self._ids_por_objeto: Dict[int, str] = {}
+        if not isinstance(datos, dict) or "pregunta" not in datos or "opciones" not in datos:
+            raise ErrorArbolOpciones(f"'{nombre}': la raíz debe tener 'pregunta' y 'opciones'")
+        self._compilar(ID_RAIZ, datos, "menu")
+        # Identifica el contenido del árbol (p. ej. para claves de caché)
+        self.huella = hashlib.sha1(json.dumps(datos, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+    def _registrar(self, id_nodo: str, datos: dict, tipo: str) -> Nodo:
+        nodo = Nodo(id_nodo, datos, tipo)
+        self.nodos[id_nodo] = nodo
+        self._ids_por_objeto[id(datos)] = id_nodo
+        return nodo
+
+    def _compilar(self, id_nodo: str, datos: dict, tipo: str = None) -> Nodo:
+        if not isinstance(datos, dict):
+            raise ErrorArbolOpciones(f"'{self.nombre}': el nodo '{id_nodo}' no es un objeto")
+        nodo = self._registrar(id_nodo, datos, tipo or _tipo_nodo(datos, id_nodo))
+
+        if nodo.tipo == "resultado":
+            nodo.resultado = str(datos["resultado"])
+            nodo.usa_link_hoja = "{link_hoja}" in nodo.resultado
+
+        for clave, hijo in datos.get("opciones", {}).items():
+            if not isinstance(hijo, dict) or "texto" not in hijo:
+                raise ErrorArbolOpciones(f"'{self.nombre}': la opción '{_id_hijo(id_nodo, clave)}' no tiene 'texto'")
+            nodo.hijos[clave] = self._compilar(_id_hijo(id_nodo, clave), hijo).id
+
+        for campo in ("respuestas_encuesta", "respuestas_sugerencia"):
+            for clave, respuesta in datos.get(campo, {}).items():
+                if "dato_clave" not in respuesta:
+                    raise ErrorArbolOpciones(f"'{self.nombre}': la respuesta '{id_nodo}/{clave}' no tiene 'dato_clave'")
+
+        if "siguiente" in datos:
+            nodo.siguiente = self._compilar(f"{id_nodo}.sig", datos["siguiente"]).id
+        return nodo
+
+    @property
+    def raiz(self) -> Nodo:
+        return self.nodos[ID_RAIZ]
+
+    def nodo(self, id_nodo: str) -> Optional[Nodo]:
+        return self.nodos.get(id_nodo)
+
+    def hijo(self, id_nodo: str, clave: str) -> Optional[Nodo]:
+        """Busca la opción ``clave`` del nodo ``id_nodo`` sin recorrer el árbol."""
+        nodo = self.nodos.get(id_nodo)
+        if nodo is None:
+            return None
+        id_hijo = nodo.hijos.get(clave)
+        return self.nodos[id_hijo] if id_hijo else None
+
+    def id_de(self, datos: dict) -> Optional[str]:
+        """Retorna el id del nodo cuyo diccionario original es ``datos``.
+
+        Compara por identidad: solo sirve con diccionarios del propio árbol
+        (p. ej. ``Nodo.datos``), no con una copia que llegó del cliente.
+        """
+        if datos is None:
+            return None
+        return self._ids_por_objeto.get(id(datos))
+
+
+class RegistroOpciones:
+    """Carga, valida y compila los árboles de opciones una sola vez.
+
+    Revisa la fecha de modificación de los archivos como máximo cada
+    ``intervalo_revision`` segundos y reemplaza el árbol completo cuando
+    cambian. Si el archivo nuevo es inválido se conserva la versión anterior.
+    """
+
+    def __init__(self, directorio: Path = RUTA_APP, archivos: Dict[str, str] = None,
+                 intervalo_revision: float = None):
+        self.directorio = Path(directorio)
+        self.archivos = archivos or ARCHIVOS_OPCIONES
+        if intervalo_revision is None:
+            intervalo_revision = float(os.getenv("OPCIONES_INTERVALO_REVISION", "2"))
+        self.intervalo_revision = intervalo_revision
+        self._arboles: Dict[str, ArbolCompilado] = {}
+        self._ultima_revision = 0.0
+        self._lock = threading.Lock()
+
+    def _ruta(self, nombre: str) -> Path:
+        return self.directorio / self.archivos[nombre]
+
+    def _compilar_archivo(self, nombre: str) -> ArbolCompilado:
+        ruta = self._ruta(nombre)
+        mtime = ruta.stat().st_mtime
+        with open(ruta, encoding="utf-8") as f:
+            datos = json.load(f)
+        return ArbolCompilado(nombre, datos, mtime)
+
+    def cargar(self):
+        """Compila todos los archivos. Falla si alguno es inválido."""
+        with self._lock:
+            arboles = {nombre: self._compilar_archivo(nombre) for nombre in self.archivos}
+            self._arboles = arboles
+            self._ultima_revision = time.monotonic()
+
+    def revisar_cambios(self, forzar: bool = False):
+        """Recompila los archivos que cambiaron en disco desde la última carga."""
+        ahora = time.monotonic()
+        if not forzar and ahora - self._ultima_revision < self.intervalo_revision:
+            return
+        with self._lock:
+            self._ultima_revision = ahora
+            nuevos = dict(self._arboles)
+            for nombre in self.archivos:
+                actual = nuevos.get(nombre)
+                try:
+                    mtime = self._ruta(nombre).stat().st_mtime
+                    if actual is not None and mtime == actual.mtime:
+                        continue
+                    nuevos[nombre] = self._compilar_archivo(nombre)
+                    logger.info(f"Opciones '{nombre}' recargadas")
+                except (OSError, ValueError) as e:
+                    logger.warning(f"No se pudo recargar '{nombre}', se conserva la versión anterior: {e}")
+            # Reemplazo atómico: los lectores ven el diccionario viejo o el nuevo
+            self._arboles = nuevos
+
+    def arbol(self, nombre: str = "general") -> ArbolCompilado:
+        if not self._arboles:
+            self.cargar()
+        elif self.intervalo_revision >= 0:
+            self.revisar_cambios()
+        return self._arboles[nombre]
+
+    def arboles(self) -> Dict[str, ArbolCompilado]:
+        self.arbol()
+        return dict(self._arboles)
+
+    def arbol_para_rol(self, rol: Optional[str]) -> ArbolCompilado:
+        """Árbol que corresponde al rol del usuario (general si no hay uno propio)."""
+        rol = str(rol).lower() if rol else ""
+        if rol in self.archivos:
+            return self.arbol(rol)
+        return self.arbol("general")
+
+
+registro_opciones = RegistroOpciones()
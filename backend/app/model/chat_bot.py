@@ -8,11 +8,21 @@ from materia import Materia
 from encuesta import *
 from controller.base_datos import *
 from model.buzon_sugerencias import BuzonSugerencia
+from model.pln import registro_pln
+from controller.metricas import chatbot_respuesta_segundos
+
+# Estados válidos del flujo (etiqueta de las métricas)
+ESTADOS = ("pidiendo_tipo", "pidiendo_numero", "en_opciones", "en_encuesta", "en_sugerencia",
+           "ordenar_materias", "reiniciar")
 
 class ChatBot:
-    def __init__(self, request, opciones: Dict):
+    def __init__(self, request, opciones: Dict, arbol=None, db=None):
         self.opciones = opciones
         self.request = request
+        # Sesión de la petición; las consultas del flujo la comparten
+        self.db = db
+        # Árbol compilado (ArbolCompilado) con el índice de nodos de ``opciones``
+        self.arbol = arbol
 
     def _mensaje_error(self, mensaje):
         return mensaje
@@ -20,22 +30,23 @@ class ChatBot:
     def respuesta(self):
         """Controla el flujo principal del chatbot según el estado del usuario."""
         estado = self.request.estado
-        if estado == "pidiendo_tipo":
-            return self._procesar_tipo()
-        elif estado == "pidiendo_numero":
-            return self._procesar_numero()
-        elif estado == "en_opciones":
-            return self._procesar_opciones()
-        elif estado == "en_encuesta":
-            return self._procesar_encuesta()
-        elif estado == "en_sugerencia":
-            return self._procesar_sugerencia()
-        elif estado == "ordenar_materias":
-            return self._priorizar_materias()
-        elif estado == "reiniciar":
-            return self._reiniciar_conversacion()
-        else:
-            return self._mensaje_error("Estado no reconocido o fuera de flujo.")
+        with chatbot_respuesta_segundos.medir(estado if estado in ESTADOS else "desconocido"):
+            if estado == "pidiendo_tipo":
+                return self._procesar_tipo()
+            elif estado == "pidiendo_numero":
+                return self._procesar_numero()
+            elif estado == "en_opciones":
+                return self._procesar_opciones()
+            elif estado == "en_encuesta":
+                return self._procesar_encuesta()
+            elif estado == "en_sugerencia":
+                return self._procesar_sugerencia()
+            elif estado == "ordenar_materias":
+                return self._priorizar_materias()
+            elif estado == "reiniciar":
+                return self._reiniciar_conversacion()
+            else:
+                return self._mensaje_error("Estado no reconocido o fuera de flujo.")
 
     def _priorizar_materias(self):
         """Obtiene y muestra las materias priorizadas del estudiante"""
@@ -52,7 +63,7 @@ class ChatBot:
                 return respuesta
             
             # Obtener materias priorizadas
-            materias_priorizadas = Materia.ordenar_matrias(id_estudiante)
+            materias_priorizadas = Materia.ordenar_matrias(id_estudiante, self.db)
             
             if not materias_priorizadas:
                 respuesta["mensajes"].append("No tienes materias registradas en el sistema.")
@@ -111,7 +122,8 @@ class ChatBot:
                     
                     mensaje_registro = BuzonSugerencia.procesar_sugerencia(
                         id_estudiante=identificacion.get("numero"),
-                        datos_sugerencia=datos_completos
+                        datos_sugerencia=datos_completos,
+                        db=self.db
                     )
                     
                     # Limpiar los datos temporales
@@ -191,9 +203,10 @@ class ChatBot:
 
         # Buscar nombre en la BD (si existe)
         try:
-            nombre = BaseDatos.buscar_id(identificacion["numero"])[0]
+            nombre = BaseDatos.buscar_id(identificacion["numero"], self.db)[0]
             respuesta["mensajes"].append(f"¡Gracias! {nombre}")
         except Exception:
+            # Un error de la BD ya deshizo la transacción de self.db (BaseDatos.sesion)
             respuesta["mensajes"].append("Número no encontrado en la base de datos.")
 
         respuesta["mensajes"].append(self.opciones["pregunta"])
@@ -212,7 +225,16 @@ class ChatBot:
         if not nodo_actual or "opciones" not in nodo_actual:
             return self._mensaje_error("Estructura de nodo inválida.")
 
-        seleccion = nodo_actual["opciones"].get(mensaje)
+        nodo = self._buscar_nodo_compilado(nodo_actual, mensaje)
+        seleccion = nodo.datos if nodo else nodo_actual["opciones"].get(mensaje)
+        if not seleccion and not mensaje.isdigit():
+            # Texto libre: buscar la opción más parecida en todo el árbol
+            nodo = self._buscar_por_texto(mensaje)
+            if nodo is not None:
+                seleccion = nodo.datos
+            else:
+                # Sin coincidencia segura: el cliente puede enviar la pregunta a la IA
+                respuesta["sugerir_ia"] = True
         if not seleccion:
             respuesta["mensajes"].append("Opción no válida. Selecciona un número de la lista.")
             respuesta["mensajes"].append(nodo_actual.get("pregunta", "Por favor, selecciona una opción."))
@@ -222,12 +244,13 @@ class ChatBot:
         # Si la opción tiene un resultado directo
         if "resultado" in seleccion:
             respuesta["nuevo_estado"] = "reiniciar"
-            mensaje_resultado = seleccion["resultado"]
+            mensaje_resultado = nodo.resultado if nodo else seleccion["resultado"]
+            usa_link_hoja = nodo.usa_link_hoja if nodo else "{link_hoja}" in mensaje_resultado
 
             # Reemplazar {link_hoja} si existe en el mensaje
-            if "{link_hoja}" in mensaje_resultado:
+            if usa_link_hoja:
                 usuario_id = identificacion.get("numero")
-                link_hoja = BaseDatos.obtener_link_hoja(usuario_id)
+                link_hoja = BaseDatos.obtener_link_hoja(usuario_id, self.db)
                 if link_hoja:
                     mensaje_resultado = mensaje_resultado.replace("{link_hoja}", link_hoja)
                 else:
@@ -273,6 +296,24 @@ class ChatBot:
 
         return self._mensaje_error("Error en la estructura del flujo de opciones.")
 
+    def _buscar_por_texto(self, mensaje):
+        """Nodo del árbol que coincide con seguridad con el texto libre (o None)."""
+        if self.arbol is None:
+            return None
+        coincidencia = registro_pln.para(self.arbol).mejor(mensaje)
+        if coincidencia is None or not coincidencia.segura:
+            return None
+        return self.arbol.nodo(coincidencia.id_nodo)
+
+    def _buscar_nodo_compilado(self, nodo_actual, clave):
+        """Busca la opción en el árbol compilado si ``nodo_actual`` pertenece a él."""
+        if self.arbol is None:
+            return None
+        id_actual = self.arbol.id_de(nodo_actual)
+        if id_actual is None:
+            return None
+        return self.arbol.hijo(id_actual, clave)
+
     def _procesar_encuesta(self):
         mensaje = self.request.mensaje.strip()
         nodo_actual = self.request.nodo_actual
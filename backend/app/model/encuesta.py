@@ -5,35 +5,18 @@ from sqlalchemy import text
 backend_path = Path(__file__).resolve().parent
 sys.path.append(str(backend_path))
 
-from controller.base_datos import BaseDatos
+from controller.encuestas import fila_encuesta
+from controller.outbox import outbox
 
 class encuesta:
     @staticmethod
     def subir_opciones(id_estudiante, respuestas):
-        db = BaseDatos.get_session()
         try:
-            guardar_respuestas = []
-            for key, value in respuestas.items():
-                guardar_respuestas.append(value)
-            
-            subir_encuesta = text(
-                "INSERT INTO encuesta (id_estudiante, facultad, satisfaccion) "
-                "VALUES (:id_estudiante, :facultad, :satisfaccion)"
-            )
-            
-            db.execute(subir_encuesta, {
-                "id_estudiante": id_estudiante,
-                "facultad": guardar_respuestas[0] if len(guardar_respuestas) > 0 else None,
-                "satisfaccion": guardar_respuestas[1] if len(guardar_respuestas) > 1 else None
-            })
-            
-            db.commit()
+            # La respuesta no necesita el ID de la fila: se inserta en lote después
+            # (los contadores del resumen se actualizan en el mismo lote)
+            outbox.encolar("encuesta", fila_encuesta(id_estudiante, respuestas))
             return "¡Gracias! Tu respuesta ha sido registrada exitosamente."
-        
+
         except Exception as e:
-            db.rollback()
             print(f"Error al guardar encuesta: {e}")
             return f"Error al guardar la encuesta: {str(e)}"
-        
-        finally:
-            db.close()
\ No newline at end of file
@@ -6,27 +6,22 @@ from abc import ABC
 
 ruta = Path(__file__).resolve().parent.parent
 sys.path.append(str(ruta))
-from controller import schemas
+from controller import schemas, crud
 from controller.base_datos import BaseDatos
 
 class Materia(ABC):
-    id_materia = None
-    nombre_materia = None
-    creditos = None
+    __slots__ = ("id_materia", "nombre_materia", "creditos")
 
-    def crear_materias(id):
-        materias_de_estudiante = []
-        buscar_materias = BaseDatos.buscar_materias_de_estudiante(id)
-        for materia in buscar_materias:
-            materia_completa = BaseDatos.buscar_materias_por_id(materia[0])
+    def __init__(self, id_materia=None, nombre_materia=None, creditos=None):
+        self.id_materia = id_materia
+        self.nombre_materia = nombre_materia
+        self.creditos = creditos
 
-            objecto_materia = Materia()
-            objecto_materia.id_materia = materia_completa[0][0]
-            objecto_materia.nombre_materia = materia_completa[0][1]
-            objecto_materia.creditos = materia_completa[0][2]
-            
-            materias_de_estudiante.append(objecto_materia)
-        return materias_de_estudiante
+    def crear_materias(id, db=None):
+        """Materias del estudiante ordenadas por créditos, con una sola consulta."""
+        with BaseDatos.sesion(db, lectura=True) as sesion:
+            filas = crud.obtener_materias_priorizadas(sesion, id)
+        return [Materia(id_materia, nombre_materia, creditos) for id_materia, nombre_materia, creditos in filas]
 
 
     def prioridad (materia):
@@ -37,10 +32,9 @@ class Materia(ABC):
         else:
             return 'Baja'
 
-    def ordenar_matrias(id):
+    def ordenar_matrias(id, db=None):
         mensaje:dict[Materia,str] = {}
-        materias_priorizadas = sorted(Materia.crear_materias(id),key=lambda Materia: Materia.creditos, reverse=True)
-        for i in materias_priorizadas:
+        # La consulta ya viene ordenada por créditos (de mayor a menor)
+        for i in Materia.crear_materias(id, db):
             mensaje[i] = Materia.prioridad(i)
         return mensaje
-    
\ No newline at end of file
@@ -1,3 +1,219 @@
+import argparse
+import json
+import math
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional
+
+ruta = Path(__file__).resolve().parent.parent
+sys.path.append(str(ruta))
+from controller.normalizacion import PARADAS, palabras, raiz
+
+# Puntaje BM25 mínimo y confianza mínima para saltar directo a un nodo del menú
+PLN_PUNTAJE_MIN = float(os.getenv("PLN_PUNTAJE_MIN", "2.5"))
+PLN_CONFIANZA_MIN = float(os.getenv("PLN_CONFIANZA_MIN", "0.55"))
+# Fracción mínima de términos de la pregunta presentes en la opción
+PLN_COBERTURA_MIN = float(os.getenv("PLN_COBERTURA_MIN", "0.5"))
+PLN_K1 = 1.5
+PLN_B = 0.75
+
+# Palabras vacías más las fórmulas de cortesía y pedido típicas del chat
+STOPWORDS = PARADAS | frozenset("""
+hola favor gracias necesito ayuda ayudame saber quisiera podria deseo dime
+""".split())
+
+# Equivalencias frecuentes (ya normalizadas) antes de sacar la raíz
+SINONIMOS = {
+    "clave": "contraseña", "password": "contraseña", "contrasena": "contraseña", "olvide": "restablecer",
+    "recuperar": "restablecer", "cambiar": "restablecer", "mail": "correo", "email": "correo",
+    "notas": "calificaciones", "nota": "calificaciones", "asignatura": "materia", "asignaturas": "materias",
+    "clases": "materias", "cursos": "materias", "salon": "salones", "aula": "salones", "pagar": "pago",
+    "factura": "facturacion", "recibo": "facturacion", "queja": "sugerencias", "reclamo": "sugerencias",
+    "felicitacion": "sugerencias", "buzon": "sugerencias", "moodle": "uvirtual",
+    "wifi": "red", "internet": "red", "docente": "profesor", "docentes": "profesores",
+    "constancia": "certificado", "constancias": "certificados", "prioridad": "priorizar",
+}
+
+
+def terminos(texto: str) -> List[str]:
+    """Normaliza (minúsculas, sin tildes ni URLs), quita stopwords y saca raíces."""
+    resultado = []
+    for palabra in palabras(texto, STOPWORDS):
+        palabra = SINONIMOS.get(palabra, palabra)
+        if palabra.isdigit():
+            continue
+        resultado.append(raiz(palabra))
+    return resultado
+
+
+class Coincidencia:
+    __slots__ = ("id_nodo", "puntaje", "confianza", "cobertura")
+
+    def __init__(self, id_nodo: str, puntaje: float, confianza: float, cobertura: float = 1.0):
+        self.id_nodo = id_nodo
+        self.puntaje = puntaje
+        self.confianza = confianza
+        self.cobertura = cobertura
+
+    @property
+    def segura(self) -> bool:
+        return (self.puntaje >= PLN_PUNTAJE_MIN and self.confianza >= PLN_CONFIANZA_MIN
+                and self.cobertura >= PLN_COBERTURA_MIN)
+
+    def to_dict(self) -> dict:
+        return {"id_nodo": self.id_nodo, "puntaje": round(self.puntaje, 3), "confianza": round(self.confianza, 3),
+                "cobertura": round(self.cobertura, 3)}
+
+    def __repr__(self):
+        return f"<Coincidencia(id_nodo={self.id_nodo}, puntaje={self.puntaje:.2f}, confianza={self.confianza:.2f})>"
+
+
 class Pln:
+    """Índice invertido BM25 sobre las opciones de un árbol compilado.
+
+    Cada opción es un documento con su ``texto`` (peso doble), el texto de
+    las opciones padre y su ``resultado``.
+    """
+
+    def __init__(self, arbol):
+        self.arbol = arbol
+        self._indice: Dict[str, List[tuple]] = {}
+        self._longitudes: Dict[str, int] = {}
+        self._idf: Dict[str, float] = {}
+        self._construir()
+
+    def _documentos(self):
+        for id_nodo, nodo in self.arbol.nodos.items():
+            # Solo opciones del menú (las preguntas encadenadas ".sig" no son destinos)
+            if "texto" not in nodo.datos or ".sig" in id_nodo:
+                continue
+            partes = [nodo.datos["texto"]] * 2
+            padre = id_nodo.rpartition(".")[0]
+            while padre:
+                partes.append(self.arbol.nodo(padre).datos.get("texto", ""))
+                padre = padre.rpartition(".")[0]
+            if nodo.resultado:
+                partes.append(nodo.resultado)
+            yield id_nodo, terminos(" ".join(partes))
+
+    def _construir(self):
+        for id_nodo, lista in self._documentos():
+            self._longitudes[id_nodo] = len(lista)
+            for termino, frecuencia in Counter(lista).items():
+                self._indice.setdefault(termino, []).append((id_nodo, frecuencia))
+        total = len(self._longitudes)
+        self._promedio = (sum(self._longitudes.values()) / total) if total else 0.0
+        for termino, postings in self._indice.items():
+            n = len(postings)
+            self._idf[termino] = math.log(1 + (total - n + 0.5) / (n + 0.5))
+
+    def buscar(self, texto: str, k: int = 3) -> List[Coincidencia]:
+        """Mejores ``k`` nodos para el texto, con confianza = ventaja sobre el segundo."""
+        puntajes: Dict[str, float] = {}
+        encontrados: Dict[str, int] = {}
+        consulta = set(terminos(texto))
+        for termino in consulta:
+            idf = self._idf.get(termino)
+            if idf is None:
+                continue
+            for id_nodo, frecuencia in self._indice[termino]:
+                norma = PLN_K1 * (1 - PLN_B + PLN_B * self._longitudes[id_nodo] / self._promedio)
+                puntajes[id_nodo] = puntajes.get(id_nodo, 0.0) + idf * frecuencia * (PLN_K1 + 1) / (frecuencia + norma)
+                encontrados[id_nodo] = encontrados.get(id_nodo, 0) + 1
+        if not puntajes:
+            return []
+        mejores = sorted(puntajes.items(), key=lambda par: (-par[1], par[0].count("."), par[0]))[:max(k, 2)]
+        # Si un menú y su propia opción empatan casi, el resultado no es ambiguo
+        segundo = next((p for id_nodo, p in mejores[1:] if not self._relacionados(mejores[0][0], id_nodo)), 0.0)
+        return [
+            Coincidencia(
+                id_nodo, puntaje,
+                puntaje / (puntaje + segundo) if i == 0 else puntaje / (mejores[0][1] + puntaje),
+                encontrados[id_nodo] / len(consulta),
+            )
+            for i, (id_nodo, puntaje) in enumerate(mejores[:k])
+        ]
+
+    @staticmethod
+    def _relacionados(a: str, b: str) -> bool:
+        return a.startswith(b + ".") or b.startswith(a + ".")
+
+    def mejor(self, texto: str) -> Optional[Coincidencia]:
+        resultados = self.buscar(texto, k=1)
+        return resultados[0] if resultados else None
+
+
+class RegistroPln:
+    """Un índice por árbol de opciones; se reconstruye cuando el árbol se recarga."""
+
     def __init__(self):
-        pass
\ No newline at end of file
+        self._indices: Dict[str, Pln] = {}
+        self._lock = threading.Lock()
+
+    def para(self, arbol) -> Pln:
+        indice = self._indices.get(arbol.nombre)
+        if indice is None or indice.arbol is not arbol:
+            with self._lock:
+                indice = self._indices.get(arbol.nombre)
+                if indice is None or indice.arbol is not arbol:
+                    indice = Pln(arbol)
+                    self._indices[arbol.nombre] = indice
+        return indice
+
+    def calentar(self, arboles):
+        """Construye los índices al iniciar la app."""
+        for arbol in arboles:
+            self.para(arbol)
+
+
+registro_pln = RegistroPln()
+
+
+def evaluar(ruta_casos: str) -> dict:
+    """Exactitud y latencia sobre un conjunto etiquetado.
+
+    Cada caso es ``{"texto", "arbol", "esperado"}``; ``esperado`` null indica
+    que la pregunta debe pasar al LLM (sin coincidencia segura).
+    """
+    from model.arbol_opciones import registro_opciones
+
+    with open(ruta_casos, encoding="utf-8") as f:
+        casos = json.load(f)
+    aciertos, latencias, fallos = 0, [], []
+    for caso in casos:
+        indice = registro_pln.para(registro_opciones.arbol(caso.get("arbol", "general")))
+        inicio = time.perf_counter()
+        coincidencia = indice.mejor(caso["texto"])
+        latencias.append((time.perf_counter() - inicio) * 1000)
+        obtenido = coincidencia.id_nodo if coincidencia and coincidencia.segura else None
+        if obtenido == caso["esperado"]:
+            aciertos += 1
+        else:
+            fallos.append({"texto": caso["texto"], "esperado": caso["esperado"], "obtenido": obtenido,
+                           "detalle": coincidencia.to_dict() if coincidencia else None})
+    latencias.sort()
+    percentil = lambda p: round(latencias[min(len(latencias) - 1, int(p * len(latencias)))], 4) if latencias else 0.0
+    return {
+        "casos": len(casos),
+        "exactitud": round(aciertos / len(casos), 4) if casos else 0.0,
+        "latencia_ms": {"p50": percentil(0.5), "p95": percentil(0.95), "max": percentil(1.0)},
+        "fallos": fallos,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evalúa el enrutador de intención local")
+    parser.add_argument("casos", nargs="?", default=str(ruta / "configs" / "pln_evaluacion.json"))
+    parser.add_argument("--texto", help="Muestra las coincidencias para un texto")
+    parser.add_argument("--arbol", default="general")
+    args = parser.parse_args()
+    if args.texto:
+        from model.arbol_opciones import registro_opciones
+        for c in registro_pln.para(registro_opciones.arbol(args.arbol)).buscar(args.texto):
+            print(c, "segura" if c.segura else "")
+    else:
+        print(json.dumps(evaluar(args.casos), ensure_ascii=False, indent=2))
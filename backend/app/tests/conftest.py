@@ -0,0 +1,60 @@
+"""Configuración común: la app corre sobre un SQLite temporal, sin Groq ni archivos del repo."""
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+# La configuración se lee al importar los módulos de la app: se define antes
+_directorio = tempfile.mkdtemp(prefix="pruebas_")
+os.environ["DATABASE_URL"] = f"sqlite:///{_directorio}/pruebas.db"
+os.environ["OUTBOX_SPOOL"] = f"{_directorio}/outbox.jsonl"
+os.environ["HISTORIAL_DIR"] = f"{_directorio}/historial"
+os.environ["ADMIN_TOKEN"] = "token-de-pruebas"
+os.environ["GROQ_API_KEY"] = ""
+os.environ.pop("BENCH_DATABASE_URL", None)
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import pytest
+
+from controller import busqueda, migraciones, models
+from controller.databaseconfig import engine, session_local
+
+ADMIN = {"X-API-Key": "token-de-pruebas"}
+
+
+def pytest_sessionfinish(session, exitstatus):
+    engine.dispose()
+    shutil.rmtree(_directorio, ignore_errors=True)
+
+
+def vaciar_bd():
+    """Borra las tablas, las de búsqueda y el registro de migraciones (aplicar() las vuelve a correr)."""
+    models.Base.metadata.drop_all(bind=engine)
+    with engine.begin() as conexion:
+        conexion.exec_driver_sql("DROP TABLE IF EXISTS schema_version")
+        for indice in busqueda.INDICES.values():
+            conexion.exec_driver_sql(f"DROP TABLE IF EXISTS {indice.fts}")
+
+
+@pytest.fixture
+def db():
+    """Esquema vacío con las migraciones aplicadas y una sesión."""
+    vaciar_bd()
+    models.Base.metadata.create_all(bind=engine)
+    migraciones.aplicar(engine)
+    sesion = session_local()
+    try:
+        yield sesion
+    finally:
+        sesion.close()
+
+
+@pytest.fixture
+def cliente(db):
+    """TestClient de la app (con el calentamiento) sobre el esquema de ``db``."""
+    from fastapi.testclient import TestClient
+    import main
+    with TestClient(main.app) as cliente:
+        yield cliente
@@ -0,0 +1,126 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from controller.admision import ControlAdmision, CuboTokens, SolicitudDescartada
+
+
+def test_cubo_tokens_recarga():
+    cubo = CuboTokens(capacidad=10, por_segundo=10)
+    cubo.consumir(10)
+    assert cubo.tiempo_para(5) == pytest.approx(0.5, abs=0.05)
+
+
+def test_descarta_si_el_plazo_no_alcanza():
+    control = ControlAdmision(rpm=1, tpm=10_000)
+
+    async def dos_llamadas():
+        await control.admitir(100, plazo=1)
+        await control.admitir(100, plazo=1)
+
+    with pytest.raises(SolicitudDescartada) as error:
+        asyncio.run(dos_llamadas())
+    assert error.value.motivo == "plazo_insuficiente"
+    assert error.value.reintentar_en > 1
+
+
+def test_descarta_con_la_cola_llena():
+    control = ControlAdmision(rpm=60, tpm=10_000, cola_max=0)
+    with pytest.raises(SolicitudDescartada) as error:
+        asyncio.run(control.admitir(100))
+    assert error.value.motivo == "cola_llena"
+
+
+def test_devolver_restituye_la_reserva():
+    control = ControlAdmision(rpm=30, tpm=6000)
+    asyncio.run(control.admitir(1000))
+    assert control.tokens.nivel == pytest.approx(5000, abs=5)
+    control.devolver(1000)
+    assert control.tokens.nivel == pytest.approx(6000, abs=5)
+    assert control.peticiones.nivel == pytest.approx(30, abs=0.1)
+
+
+def test_espera_max_acotada(cliente):
+    r = cliente.post("/ai/generate", json={"prompt": "hola", "espera_max": 10_000})
+    assert r.status_code == 422
+
+
+class _ErrorGroq(Exception):
+    def __init__(self, mensaje, status_code=None):
+        super().__init__(mensaje)
+        self.status_code = status_code
+
+
+def _conexion_rechazada():
+    # Como lo envuelve el cliente de OpenAI: APIConnectionError desde httpx.ConnectError
+    ConnectError = type("ConnectError", (Exception,), {})
+    try:
+        raise ConnectError("[Errno 111] Connection refused")
+    except ConnectError as causa:
+        error = type("APIConnectionError", (Exception,), {})("Connection error.")
+        error.__cause__ = causa
+        return error
+
+
+class _ClienteFalso:
+    """Cliente de Groq que responde a cada intento con el siguiente resultado de ``resultados``."""
+
+    def __init__(self, resultados):
+        self.resultados = list(resultados)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._crear))
+
+    async def _crear(self, **kwargs):
+        resultado = self.resultados.pop(0)
+        if isinstance(resultado, Exception):
+            raise resultado
+        return resultado
+
+
+@pytest.fixture
+def router_ia(monkeypatch):
+    import ai_router
+    from controller.enrutador_modelos import EnrutadorModelos
+    modelos = ["modelo-a", "modelo-b", "modelo-c"]
+    monkeypatch.setattr(ai_router, "enrutador", EnrutadorModelos(modelos, {"ligera": modelos, "completa": modelos}))
+    monkeypatch.setattr(ai_router, "control_admision", ControlAdmision(rpm=30, tpm=6000))
+    return ai_router
+
+
+def _llamar(router_ia, resultados):
+    """Admite una llamada de 1000 tokens y la intenta con ``resultados``. Retorna la cuota que queda."""
+    control = router_ia.control_admision
+
+    async def llamar():
+        await control.admitir(1000)
+        peticion = router_ia.AIGenerateRequest(prompt="hola")
+        await router_ia._crear_completion(_ClienteFalso(resultados), peticion, "hola", tokens_reservados=1000)
+
+    try:
+        asyncio.run(llamar())
+    except HTTPException:
+        pass
+    return round(control.peticiones.nivel), round(control.tokens.nivel)
+
+
+def test_cada_intento_cobra_una_peticion(router_ia):
+    # 429 y timeout llegaron a Groq: cuentan; la conexión rechazada no
+    resultados = [_ErrorGroq("rate limit", 429), _conexion_rechazada(), SimpleNamespace(usage=None)]
+    assert _llamar(router_ia, resultados) == (28, 5000)
+
+
+def test_los_429_no_se_devuelven(router_ia):
+    resultados = [_ErrorGroq("rate limit", 429)] * 3
+    assert _llamar(router_ia, resultados) == (27, 5000)
+
+
+def test_sin_llegar_a_groq_se_devuelve_todo(router_ia):
+    resultados = [_ErrorGroq("model not found", 404), _conexion_rechazada(), _conexion_rechazada()]
+    assert _llamar(router_ia, resultados) == (30, 6000)
+
+
+def test_timeout_acotado(cliente):
+    for timeout in (0, -1, 10_000):
+        r = cliente.post("/ai/generate", json={"prompt": "hola", "timeout": timeout})
+        assert r.status_code == 422
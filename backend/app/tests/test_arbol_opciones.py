@@ -0,0 +1,11 @@
+def test_modo_compatible_resuelve_el_nodo_por_id(cliente):
+    r = cliente.post("/procesar_mensaje", json={"mensaje": "123", "estado": "pidiendo_numero",
+                                                "identificacion": {"tipo": "CC"}}).json()
+    assert r["nodo_id"] == "raiz" and r["huella_arbol"]
+    clave = next(iter(r["opciones"]))
+    base = {"mensaje": clave, "estado": "en_opciones", "identificacion": r["identificacion"]}
+    # Sin nodo_actual: el nodo sale del árbol compilado
+    por_id = cliente.post("/procesar_mensaje", json={**base, "nodo_id": r["nodo_id"],
+                                                     "huella_arbol": r["huella_arbol"]}).json()
+    por_copia = cliente.post("/procesar_mensaje", json={**base, "nodo_actual": r["nodo_actual"]}).json()
+    assert por_id["mensajes"] == por_copia["mensajes"]
@@ -0,0 +1,65 @@
+import pytest
+
+from controller import busqueda, crud, models
+from controller.paginacion import CursorInvalido
+
+
+def _ids(db, texto, **filtros):
+    return [fila["id"] for fila in crud.buscar_sugerencias(db, texto, **filtros)["items"]]
+
+
+def _sugerencia(db, asunto, descripcion):
+    sugerencia = models.BuzonSugerencias(asunto=asunto, descripcion=descripcion, tipo_sugerencia="Queja")
+    db.add(sugerencia)
+    db.commit()
+    return sugerencia
+
+
+def test_el_indice_sigue_los_cambios_de_la_tabla(db):
+    sugerencia = _sugerencia(db, "Biblioteca", "Las bibliotecas cierran muy temprano")
+    otra = _sugerencia(db, "Cafetería", "El café está frío")
+    assert _ids(db, "biblioteca") == [sugerencia.id]
+    assert _ids(db, "cafeteria") == [otra.id]
+
+    sugerencia.descripcion = "Faltan enchufes en la sala de estudio"
+    sugerencia.asunto = "Sala de estudio"
+    db.commit()
+    assert _ids(db, "bibliotecas") == []
+    assert _ids(db, "enchufe") == [sugerencia.id]
+
+    db.delete(sugerencia)
+    db.commit()
+    assert _ids(db, "enchufes") == []
+    assert _ids(db, "café frío") == [otra.id]
+
+
+def test_paginacion_por_relevancia(db):
+    # Más repeticiones de la palabra, más relevante
+    for i in range(23):
+        _sugerencia(db, f"Caso {i}", " ".join(["parqueadero"] * (1 + i % 5) + ["lleno"] * 10))
+    _sugerencia(db, "Otro tema", "Nada que ver")
+    vistos, relevancias, cursor = [], [], None
+    while True:
+        pagina = crud.buscar_sugerencias(db, "parqueaderos", cursor=cursor, limite=5)
+        assert len(pagina["items"]) <= 5
+        vistos.extend(fila["id"] for fila in pagina["items"])
+        relevancias.extend(fila["relevancia"] for fila in pagina["items"])
+        cursor = pagina["siguiente"]
+        if cursor is None:
+            break
+    assert sorted(vistos) == list(range(1, 24))
+    assert relevancias == sorted(relevancias, reverse=True)
+    assert "[parqueadero]" in pagina["items"][0]["fragmento"]
+
+    siguiente = crud.buscar_sugerencias(db, "parqueaderos", limite=5)["siguiente"]
+    with pytest.raises(CursorInvalido):
+        crud.buscar_sugerencias(db, "lleno", cursor=siguiente, limite=5)
+
+
+def test_consultas_con_las_mismas_palabras_en_ambos_motores():
+    palabras = busqueda.terminos("¿Las bibliotecas del campus están cerradas? https://u.edu.co")
+    assert palabras == ["bibliotecas", "campus", "cerradas"]
+    assert busqueda.consulta_fts5(palabras) == '"bibliotec"* "campu"* "cerr"*'
+    assert busqueda.consulta_pg(palabras) == "bibliotecas:* & campus:* & cerradas:*"
+    with pytest.raises(busqueda.ConsultaVacia):
+        busqueda.buscar(None, "sugerencias", "de la que")
@@ -0,0 +1,26 @@
+from controller.cache_contexto import CacheContexto
+
+
+def test_contexto_invalida_por_usuario():
+    cache = CacheContexto(ttl_usuario=60, ttl_global=60)
+    cargas = []
+    cargar = lambda: cargas.append(1) or len(cargas)
+    assert cache.usuario("1001", cargar) == 1
+    assert cache.usuario("1001", cargar) == 1
+    cache.invalidar_usuario("1001")
+    assert cache.usuario("1001", cargar) == 2
+    assert cache.global_(cargar) == 3
+    cache.invalidar_todo()
+    assert cache.global_(cargar) == 4
+
+
+def test_contexto_descarta_cargas_anteriores_a_una_invalidacion():
+    cache = CacheContexto(ttl_usuario=60, ttl_global=60)
+
+    def cargar_e_invalidar():
+        # Una escritura invalida mientras se cargaba: el valor viejo no se guarda
+        cache.invalidar_usuario("1001")
+        return "viejo"
+
+    assert cache.usuario("1001", cargar_e_invalidar) == "viejo"
+    assert cache.usuario("1001", lambda: "nuevo") == "nuevo"
@@ -0,0 +1,29 @@
+from controller.cache_respuestas import CacheRespuestas
+
+
+def test_respuestas_exacta_y_aproximada():
+    cache = CacheRespuestas(max_entradas=10, ttl=60, umbral_similitud=0.8)
+    particion = CacheRespuestas.particion(None, 0.7, "ctx", None)
+    cache.guardar("¿Cuál es el horario de la biblioteca?", particion, {"text": "8 a 20"})
+
+    assert cache.obtener("cual es el horario de la biblioteca", particion) == ({"text": "8 a 20"}, "exacto")
+    assert cache.obtener("¿Cuál es el horario de la biblioteca central?", particion)[1] == "aproximado"
+    # Otro contexto inyectado es otra partición
+    assert cache.obtener("¿Cuál es el horario de la biblioteca?",
+                         CacheRespuestas.particion(None, 0.7, "otro", None)) == (None, None)
+
+
+def test_respuestas_personalizadas_sin_aproximacion():
+    cache = CacheRespuestas(max_entradas=10, ttl=60, umbral_similitud=0.5)
+    particion = CacheRespuestas.particion(None, 0.7, "ctx", "1001")
+    cache.guardar("¿Qué materias tengo?", particion, {"text": "Cálculo"})
+    assert cache.obtener("¿Qué materias tengo hoy?", particion) == (None, None)
+
+
+def test_respuestas_lru():
+    cache = CacheRespuestas(max_entradas=2, ttl=60, aproximado=False)
+    particion = CacheRespuestas.particion(None, 0.0, "", None)
+    for prompt in ("uno", "dos", "tres"):
+        cache.guardar(prompt, particion, prompt)
+    assert cache.obtener("uno", particion) == (None, None)
+    assert cache.estadisticas()["entradas"] == 2
@@ -0,0 +1,38 @@
+import time
+
+from controller import crud, encuestas, schemas
+from controller.databaseconfig import session_local
+from controller.outbox import Outbox
+from model.arbol_opciones import registro_opciones
+
+
+def test_contadores_iguales_por_outbox_y_por_crud(db, tmp_path):
+    outbox = Outbox(session_local, tmp_path / "outbox.jsonl", lote=4, intervalo=0.05)
+    outbox.iniciar()
+    try:
+        for i in range(10):
+            respuestas = {"Facultad": ["Diseño", "Ingeniería"][i % 2], "Satisfaccion": f"{1 + i % 5} (Nivel)",
+                          "Recomendaria": "Sí" if i % 3 else "No"}
+            outbox.encolar("encuesta", encuestas.fila_encuesta(str(i), respuestas))
+        # Fila anterior a la columna respuestas: cuenta por facultad/satisfaccion
+        outbox.encolar("encuesta", {"id_estudiante": "10", "facultad": "Diseño", "satisfaccion": "5"})
+        limite = time.monotonic() + 5
+        while outbox.escritas < 11 and time.monotonic() < limite:
+            time.sleep(0.05)
+    finally:
+        outbox.detener()
+    assert outbox.escritas == 11
+
+    crud.crear_encuesta(db, schemas.EncuestaCreate(**encuestas.fila_encuesta(
+        "20", {"Facultad": "Ingeniería", "Satisfaccion": "2 (Nivel)", "Recomendaria": "No"})))
+    crud.crear_encuesta(db, schemas.EncuestaCreate(id_estudiante="21", facultad="Artes", satisfaccion="4"))
+
+    arbol = registro_opciones.arbol("general")
+    acumulado = encuestas.resumen(db, arbol)
+    diseno = encuestas.resumen(db, arbol, "Diseño")
+    assert acumulado["encuestas"] == 13
+    assert acumulado["por_facultad"] == {"Diseño": 6, "Ingeniería": 6, "Artes": 1}
+    assert encuestas.recalcular(db) == 13
+    db.commit()
+    assert encuestas.resumen(db, arbol) == acumulado
+    assert encuestas.resumen(db, arbol, "Diseño") == diseno
@@ -0,0 +1,161 @@
+import gzip
+import json
+import os
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy import func, select
+
+from controller import historial, models
+
+
+@pytest.fixture
+def meses(db, tmp_path, monkeypatch):
+    """Historial con 30 filas en 2024-01, 20 en 2024-02 y 5 del mes actual."""
+    monkeypatch.setattr(historial, "HISTORIAL_DIR", str(tmp_path / "historial"))
+    monkeypatch.setattr(historial, "HISTORIAL_LOTE_ARCHIVO", 8)
+    ahora = datetime.utcnow()
+    filas = [_fila(i, datetime(2024, 1, 1 + i % 28, 10, 0, 0, 123_457)) for i in range(30)]
+    filas += [_fila(i, datetime(2024, 2, 1 + i % 28, 9)) for i in range(20)]
+    filas += [_fila(i, ahora) for i in range(5)]
+    db.execute(models.ChatHistory.__table__.insert(), filas)
+    db.commit()
+    return db
+
+
+def _fila(i, momento, **extra):
+    return {"tipo_documento": "CC", "numero_documento": str(1000 + i % 4), "mensaje": f"mensaje {i}",
+            "respuesta": historial.codificar_respuesta(["Hola", f"opción {i}"]), "estado": "en_opciones",
+            "created_at": momento, **extra}
+
+
+def _en_tabla(db, periodo):
+    return db.scalar(select(func.count()).select_from(models.ChatHistory).where(historial._en_periodo(periodo)))
+
+
+def _particion(db, periodo):
+    db.expire_all()
+    return db.get(models.HistorialParticion, periodo)
+
+
+def test_compacta_verifica_y_borra(meses):
+    db = meses
+    resultados = historial.compactar(db)
+    assert [(r["periodo"], r["filas"], r["borradas"]) for r in resultados] == [("2024-01", 30, 30),
+                                                                              ("2024-02", 20, 20)]
+    assert _en_tabla(db, "2024-01") == 0 and db.scalar(select(func.count()).select_from(models.ChatHistory)) == 5
+
+    particion = _particion(db, "2024-01")
+    assert particion.estado == "archivada" and particion.filas == 30
+    assert historial.verificar_archivo(particion.archivo)["filas"] == 30
+    assert historial._sha256(particion.archivo) == particion.sha256
+    filas = historial.leer_archivo(particion.archivo)
+    assert filas[0]["respuesta"] == ["Hola", "opción 0"]
+    assert filas[0]["created_at"].microsecond == 123_457
+    assert not [n for n in os.listdir(historial.HISTORIAL_DIR) if n.endswith((".nuevo", ".tmp"))]
+
+
+def test_retoma_una_compactacion_interrumpida(meses, monkeypatch):
+    db = meses
+    borrar = historial._borrar_de_tabla
+
+    def interrumpir(db, periodo, hasta_id=None):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(historial, "_borrar_de_tabla", interrumpir)
+    with pytest.raises(KeyboardInterrupt):
+        historial.compactar_periodo(db, "2024-01")
+    db.rollback()
+    assert _particion(db, "2024-01").estado == "archivando" and _en_tabla(db, "2024-01") == 30
+
+    monkeypatch.setattr(historial, "_borrar_de_tabla", borrar)
+    historial.compactar(db)
+    particion = _particion(db, "2024-01")
+    assert particion.estado == "archivada" and _en_tabla(db, "2024-01") == 0
+    # Cada fila una sola vez aunque estaba en la tabla y en el archivo
+    ids = [f["id"] for f in historial.iterar_archivo(particion.archivo)]
+    assert len(ids) == len(set(ids)) == 30
+
+
+def test_fila_tardia_se_une_al_archivo(meses):
+    db = meses
+    historial.compactar(db)
+    febrero = _particion(db, "2024-02")
+    sha_febrero, modificado = febrero.sha256, os.path.getmtime(febrero.archivo)
+
+    db.execute(models.ChatHistory.__table__.insert(), [_fila(99, datetime(2024, 1, 31, 23, 59))])
+    db.commit()
+    resultados = historial.compactar(db)
+    # Solo se reescribe el mes con filas en la tabla
+    assert [(r["periodo"], r["filas"]) for r in resultados] == [("2024-01", 31)]
+    assert _particion(db, "2024-02").sha256 == sha_febrero
+    assert os.path.getmtime(febrero.archivo) == modificado
+    mensajes = [f["mensaje"] for f in historial.iterar_archivo(_particion(db, "2024-01").archivo)]
+    assert len(mensajes) == 31 and mensajes[-1] == "mensaje 99"
+
+
+def test_id_reutilizado_con_otro_contenido_no_borra(meses):
+    db = meses
+    historial.compactar(db)
+    archivo = _particion(db, "2024-01").archivo
+    antes = historial._sha256(archivo)
+    archivada = historial.leer_archivo(archivo)[3]
+    # Mismo id que una fila archivada (SQLite reutiliza ids) pero con otro mensaje
+    db.execute(models.ChatHistory.__table__.insert(),
+               [_fila(3, datetime(2024, 1, 20), id=archivada["id"], mensaje="otro")])
+    db.commit()
+
+    with pytest.raises(RuntimeError, match="no coincide"):
+        historial.compactar_periodo(db, "2024-01")
+    assert _en_tabla(db, "2024-01") == 1
+    assert historial._sha256(archivo) == antes
+    assert not os.path.exists(archivo + ".nuevo")
+
+
+def test_purga_por_retencion(meses):
+    db = meses
+    historial.compactar(db)
+    historial.fijar_retencion(db, "2024-02", None)
+    enero = _particion(db, "2024-01")
+    assert historial.purgar(db, hoy=enero.retener_hasta) == ["2024-01"]
+    assert _particion(db, "2024-01").estado == "eliminada"
+    assert not os.path.exists(enero.archivo)
+    # Sin retención (indefinida) no se purga nunca
+    assert historial.purgar(db, hoy=date(2999, 1, 1)) == []
+    assert _particion(db, "2024-02").estado == "archivada"
+
+
+def test_lee_archivos_del_formato_anterior(meses):
+    db = meses
+    filas = [dict(f._mapping) for f in db.execute(
+        select(*[models.ChatHistory.__table__.c[c] for c in historial.COLUMNAS])
+        .where(historial._en_periodo("2024-01")).order_by(models.ChatHistory.id))]
+    valores = [historial._valores_archivo(f) for f in filas]
+    columnas = {nombre: historial._codificar_columna(list(columna))
+                for nombre, columna in zip(historial.COLUMNAS, zip(*valores))}
+    ruta = os.path.join(historial.HISTORIAL_DIR, "chat_history_2024-01.json.gz")
+    os.makedirs(historial.HISTORIAL_DIR)
+    with gzip.open(ruta, "wt", encoding="utf-8") as f:
+        json.dump({"formato": historial.FORMATO_V1, "periodo": "2024-01", "filas": len(filas), "columnas": columnas}, f)
+
+    leidas = historial.leer_archivo(ruta)
+    assert [historial._valores_archivo(f) for f in leidas] == valores
+    assert historial.verificar_archivo(ruta)["filas"] == 30
+
+    # Una compactación posterior lo reescribe en el formato actual
+    db.add(models.HistorialParticion(periodo="2024-01", estado="archivada", archivo=ruta, filas=30))
+    db.commit()
+    assert historial.compactar_periodo(db, "2024-01")["filas"] == 30
+    with gzip.open(ruta, "rt", encoding="utf-8") as f:
+        assert json.loads(f.readline())["formato"] == historial.FORMATO
+
+
+def test_un_periodo_a_la_vez(meses):
+    db = meses
+    with historial._bloqueo("2024-01"):
+        with pytest.raises(historial.PeriodoOcupado):
+            historial.compactar_periodo(db, "2024-01")
+        resultados = historial.compactar(db)
+    assert resultados[0] == {"periodo": "2024-01", "omitido": "en curso en otro proceso"}
+    assert resultados[1]["filas"] == 20
+    assert _en_tabla(db, "2024-01") == 30
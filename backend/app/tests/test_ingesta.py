@@ -0,0 +1,50 @@
+import io
+import json
+
+from sqlalchemy import func, select
+
+import datos_router
+from controller import ingesta, models
+from tests.conftest import ADMIN
+
+MATERIAS_CSV = "id_materia,nombre_materia,creditos\n1,Cálculo,4\n2,Física,3\nx,Química,3\n3,Dibujo,-1\n"
+
+
+def _cargar(db, tabla, contenido, formato="csv", **opciones):
+    return ingesta.ingerir(db, tabla, io.BytesIO(contenido.encode("utf-8")), formato, **opciones).como_dict()
+
+
+def test_csv_con_rechazos(db):
+    reporte = _cargar(db, "materias", MATERIAS_CSV)
+    assert (reporte["leidas"], reporte["escritas"], reporte["rechazadas"]) == (4, 2, 2)
+    assert [r["linea"] for r in reporte["rechazos"]] == [4, 5]
+
+
+def test_jsonl_idempotente_y_referencias(db):
+    _cargar(db, "materias", MATERIAS_CSV)
+    db.add(models.Estudiante(id=1001, nombre="Ana", apellidos="Pérez", tipo_id="CC"))
+    db.commit()
+    matriculas = "".join(json.dumps(f) + "\n" for f in [
+        {"id_estudiante": "1001", "id_materia": 1},
+        {"id_estudiante": "1001", "id_materia": 2},
+        {"id_estudiante": "999", "id_materia": 1},
+        {"id_estudiante": "1001", "id_materia": 7},
+    ])
+    primera = _cargar(db, "estudiante_materias", matriculas, "jsonl", bloque=2)
+    assert (primera["escritas"], primera["rechazadas"]) == (2, 2)
+    segunda = _cargar(db, "estudiante_materias", matriculas, "jsonl")
+    assert segunda["rechazadas"] == 2
+    assert db.scalar(select(func.count()).select_from(models.EstudianteMateria)) == 2
+
+
+def test_endpoint_protegido_y_acotado(db, cliente, monkeypatch):
+    url = "/datos/ingesta/materias"
+    assert cliente.post(url, content=MATERIAS_CSV).status_code == 401
+    r = cliente.post(url, content=MATERIAS_CSV, headers=ADMIN)
+    assert r.status_code == 200 and r.json()["escritas"] == 2
+
+    monkeypatch.setattr(datos_router, "INGESTA_MAX_BYTES", 16)
+    assert cliente.post(url, content=MATERIAS_CSV, headers=ADMIN).status_code == 413
+    # Sin Content-Length (chunked) se cuenta lo recibido
+    partes = (MATERIAS_CSV[i:i + 8].encode() for i in range(0, len(MATERIAS_CSV), 8))
+    assert cliente.post(url, content=partes, headers=ADMIN).status_code == 413
@@ -0,0 +1,112 @@
+import io
+import json
+from unittest import mock
+
+import pytest
+
+from controller import migraciones, models
+from controller.databaseconfig import engine
+
+
+def test_aplicar_es_idempotente(db):
+    assert migraciones.aplicar(engine) == []
+    assert migraciones.versiones_aplicadas(engine) == {m.version for m in migraciones.MIGRACIONES}
+
+
+def test_matriculas_repetidas_detienen_la_migracion(db):
+    # Una BD anterior a la migración 5: sin clave única y con matrículas repetidas
+    with engine.begin() as conexion:
+        conexion.exec_driver_sql("DROP INDEX ux_estudiante_materias")
+        conexion.exec_driver_sql("DELETE FROM schema_version WHERE version = 5")
+    db.add(models.Estudiante(id=1001, nombre="Ana", apellidos="Pérez", tipo_id="CC"))
+    db.add_all([models.Materia(id_materia=i, nombre_materia=f"M{i}", creditos=3) for i in (1, 2)])
+    db.flush()
+    db.add_all([models.EstudianteMateria(id_estudiante="1001", id_materia=m) for m in (1, 1, 2, 1, 2)])
+    db.commit()
+
+    with pytest.raises(RuntimeError, match="3 matrículas repetidas"):
+        migraciones.aplicar(engine)
+    assert db.query(models.EstudianteMateria).count() == 5
+
+    respaldo = io.StringIO()
+    assert migraciones.quitar_matriculas_repetidas(engine, respaldo) == 3
+    borradas = [json.loads(linea) for linea in respaldo.getvalue().splitlines()]
+    assert [(f["id"], f["id_materia"]) for f in borradas] == [(2, 1), (4, 1), (5, 2)]
+    assert migraciones.aplicar(engine) == [5]
+    assert {(m.id, m.id_materia) for m in db.query(models.EstudianteMateria)} == {(1, 1), (3, 2)}
+
+
+def test_versiones_en_orden_y_sin_repetir():
+    versiones = [m.version for m in migraciones.MIGRACIONES]
+    assert versiones == sorted(set(versiones))
+
+
+def _conexion_pg(respuestas):
+    """Conexión falsa de PostgreSQL: ``respuestas`` da el resultado de cada SELECT."""
+    conexion = mock.MagicMock()
+    conexion.dialect.name = "postgresql"
+    conexion.exec_driver_sql.side_effect = lambda sql, *args: respuestas(sql)
+    return conexion
+
+
+def _sentencias(conexion):
+    return [llamada.args[0] for llamada in conexion.exec_driver_sql.call_args_list]
+
+
+def test_crear_indice_rehace_uno_invalido():
+    conexion = _conexion_pg(lambda sql: mock.Mock(first=lambda: (1,)))
+    migraciones.crear_indice(conexion, "ix_buzon_fts", "buzon_de_sugerencias", ["(vector)"], metodo="gin")
+    assert _sentencias(conexion)[1:] == [
+        "DROP INDEX CONCURRENTLY IF EXISTS ix_buzon_fts",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_buzon_fts ON buzon_de_sugerencias USING gin ((vector))",
+    ]
+
+
+def test_crear_indice_valido_no_se_borra():
+    conexion = _conexion_pg(lambda sql: mock.Mock(first=lambda: None))
+    migraciones.crear_indice(conexion, "ix_a", "t", ["a", "b"], unico=True)
+    assert _sentencias(conexion)[1:] == ["CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS ix_a ON t (a, b)"]
+
+
+def test_bloqueo_sondea_hasta_tomarlo(monkeypatch):
+    monkeypatch.setattr(migraciones, "MIGRACIONES_SONDEO", 0.01)
+    intentos = iter([False, False, True])
+    conexion = _conexion_pg(lambda sql: mock.Mock(scalar=lambda: next(intentos)))
+    migraciones._tomar_bloqueo(conexion, espera=5)
+    assert len(_sentencias(conexion)) == 3
+    assert all("pg_try_advisory_lock" in sql for sql in _sentencias(conexion))
+
+
+def test_bloqueo_con_plazo(monkeypatch):
+    monkeypatch.setattr(migraciones, "MIGRACIONES_SONDEO", 0.01)
+    conexion = _conexion_pg(lambda sql: mock.Mock(scalar=lambda: False))
+    with pytest.raises(TimeoutError):
+        migraciones._tomar_bloqueo(conexion, espera=0.05)
+
+
+def _motor(conexion):
+    motor = mock.MagicMock()
+    motor.connect.return_value.execution_options.return_value.__enter__.return_value = conexion
+    return motor
+
+
+def test_aplicar_sin_statement_timeout(monkeypatch):
+    conexion = _conexion_pg(lambda sql: mock.Mock(scalar=lambda: True))
+    monkeypatch.setattr(migraciones, "_versiones", lambda c: {m.version for m in migraciones.MIGRACIONES})
+    migraciones.aplicar(_motor(conexion))
+    sentencias = _sentencias(conexion)
+    assert sentencias[:2] == ["SET statement_timeout = 0",
+                              f"SET lock_timeout = {migraciones.MIGRACIONES_LOCK_TIMEOUT_MS}"]
+    # La conexión vuelve al pool con los límites de la app
+    assert sentencias[-2:] == ["RESET statement_timeout", "RESET lock_timeout"]
+
+
+def test_aplicar_restaura_los_limites_si_no_toma_el_bloqueo(monkeypatch):
+    monkeypatch.setattr(migraciones, "MIGRACIONES_SONDEO", 0.01)
+    monkeypatch.setattr(migraciones._tomar_bloqueo, "__defaults__", (0.02,))
+    conexion = _conexion_pg(lambda sql: mock.Mock(scalar=lambda: False))
+    with pytest.raises(TimeoutError):
+        migraciones.aplicar(_motor(conexion))
+    sentencias = _sentencias(conexion)
+    assert not any("pg_advisory_unlock" in sql for sql in sentencias)
+    assert sentencias[-2:] == ["RESET statement_timeout", "RESET lock_timeout"]
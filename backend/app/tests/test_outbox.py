@@ -0,0 +1,98 @@
+import time
+
+from sqlalchemy import func, select
+from sqlalchemy.exc import OperationalError
+
+from controller import models
+from controller.databaseconfig import session_local
+from controller.outbox import Outbox
+
+
+def _esperar(condicion, segundos=5.0):
+    limite = time.monotonic() + segundos
+    while not condicion() and time.monotonic() < limite:
+        time.sleep(0.05)
+    return condicion()
+
+
+def _encuestas(db):
+    return db.scalar(select(func.count()).select_from(models.Encuesta))
+
+
+def test_escribe_en_lotes_y_vacia_el_spool(db, tmp_path):
+    spool = tmp_path / "outbox.jsonl"
+    outbox = Outbox(session_local, spool, lote=10, intervalo=0.05)
+    outbox.iniciar()
+    try:
+        for i in range(25):
+            outbox.encolar("encuesta", {"id_estudiante": str(i), "facultad": "Diseño", "satisfaccion": "5"})
+        assert _esperar(lambda: outbox.pendientes() == 0 and outbox.escritas == 25)
+    finally:
+        outbox.detener()
+    assert _encuestas(db) == 25
+    assert spool.stat().st_size == 0
+
+
+def test_reprocesa_el_spool_al_iniciar(db, tmp_path):
+    spool = tmp_path / "outbox.jsonl"
+    anterior = Outbox(session_local, spool)
+    anterior._abrir_spool()
+    for i in range(3):
+        anterior._escribir_spool("encuesta", {"id_estudiante": str(i), "facultad": "Artes", "satisfaccion": "4"})
+    anterior._spool.close()
+
+    outbox = Outbox(session_local, spool, intervalo=0.05)
+    outbox.iniciar()
+    try:
+        assert _esperar(lambda: outbox.escritas == 3)
+    finally:
+        outbox.detener()
+    assert _encuestas(db) == 3
+
+
+def test_reintenta_tras_una_caida_de_la_bd(db, tmp_path):
+    caida = {"activa": True}
+
+    class SesionCaida:
+        def __init__(self):
+            self._sesion = session_local()
+
+        def execute(self, *args, **kwargs):
+            if caida["activa"]:
+                raise OperationalError("INSERT", {}, Exception("sin conexión"))
+            return self._sesion.execute(*args, **kwargs)
+
+        def __getattr__(self, nombre):
+            return getattr(self._sesion, nombre)
+
+    spool = tmp_path / "outbox.jsonl"
+    outbox = Outbox(SesionCaida, spool, lote=20, intervalo=0.05)
+    outbox.iniciar()
+    try:
+        for i in range(50):
+            outbox.encolar("encuesta", {"id_estudiante": str(i), "facultad": "Diseño", "satisfaccion": "5"})
+        time.sleep(1)
+        assert outbox.escritas == 0 and outbox.pendientes() == 50
+        caida["activa"] = False
+        assert _esperar(lambda: outbox.pendientes() == 0, segundos=10)
+    finally:
+        outbox.detener()
+    # Cada fila una sola vez, y los contadores del resumen también
+    assert _encuestas(db) == 50
+    total = db.scalar(select(models.EncuestaResumen.total).where(models.EncuestaResumen.pregunta == "*"))
+    assert total == 50
+    assert spool.stat().st_size == 0
+
+
+def test_cola_llena_espera_al_hilo_sin_bloquearlo(db, tmp_path):
+    outbox = Outbox(session_local, tmp_path / "outbox.jsonl", max_filas=2, lote=1, intervalo=0.01)
+    outbox.iniciar()
+    try:
+        for i in range(20):
+            outbox.encolar("encuesta", {"id_estudiante": str(i), "facultad": "Diseño", "satisfaccion": "5"})
+        assert _esperar(lambda: outbox.pendientes() == 0)
+    finally:
+        outbox.detener()
+    # El hilo sigue vaciando la cola mientras encolar espera: nada cae a escritura directa
+    assert outbox.encoladas == 20 and outbox.directas == 0
+    assert _encuestas(db) == 20
@@ -0,0 +1,55 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from controller import crud, models
+from controller.paginacion import CursorInvalido
+from tests.conftest import ADMIN
+
+
+@pytest.fixture
+def historial(db):
+    inicio = datetime(2024, 3, 1, 12, 0, 0)
+    # Fechas repetidas: el id desempata el orden
+    db.execute(models.ChatHistory.__table__.insert(), [
+        {"tipo_documento": "CC", "numero_documento": str(i % 3), "mensaje": f"mensaje {i}", "respuesta": "{}",
+         "estado": "en_opciones", "created_at": inicio + timedelta(minutes=i // 4)}
+        for i in range(57)
+    ])
+    db.commit()
+    return db
+
+
+def _recorrer(db, **filtros):
+    vistos, cursor = [], None
+    while True:
+        pagina = crud.listar_historial(db, cursor=cursor, limite=10, **filtros)
+        vistos.extend(fila["id"] for fila in pagina["items"])
+        cursor = pagina["siguiente"]
+        if cursor is None:
+            return vistos
+
+
+def test_cada_fila_una_vez_en_orden(historial):
+    ids = _recorrer(historial)
+    assert sorted(ids) == list(range(1, 58)) and len(set(ids)) == 57
+    filas = {f.id: f.created_at for f in historial.query(models.ChatHistory)}
+    claves = [(filas[i], i) for i in ids]
+    assert claves == sorted(claves, reverse=True)
+
+
+def test_filtros(historial):
+    assert len(_recorrer(historial, documento="1")) == 19
+
+
+def test_cursor_de_otra_consulta(historial):
+    cursor = crud.listar_historial(historial, documento="1", limite=5)["siguiente"]
+    with pytest.raises(CursorInvalido):
+        crud.listar_historial(historial, documento="2", cursor=cursor)
+
+
+def test_endpoint(historial, cliente):
+    r = cliente.get("/datos/historial", params={"limite": 20}, headers=ADMIN)
+    assert r.status_code == 200 and len(r.json()["items"]) == 20
+    assert cliente.get("/datos/historial", params={"cursor": "basura"}, headers=ADMIN).status_code == 400
+    assert cliente.get("/datos/historial").status_code == 401
@@ -0,0 +1,39 @@
+"""bench/planes_consulta.py como prueba: cada consulta de la app usa índices."""
+import importlib
+import os
+
+import pytest
+
+from tests.conftest import vaciar_bd
+
+# Un quinto del volumen: con menos materias (~100) SQLite prefiere recorrer la tabla completa
+ESCALA = 0.2
+
+
+@pytest.fixture
+def planes(monkeypatch):
+    # El módulo redefine la BD al importarse: se deja la de las pruebas
+    monkeypatch.setenv("BENCH_DATABASE_URL", os.environ["DATABASE_URL"])
+    monkeypatch.setenv("DATABASE_URL", os.environ["DATABASE_URL"])
+    monkeypatch.setenv("OUTBOX_HABILITADO", os.getenv("OUTBOX_HABILITADO", "1"))
+    return importlib.import_module("bench.planes_consulta")
+
+
+@pytest.mark.slow
+def test_consultas_usan_indices(planes):
+    vaciar_bd()
+    planes.poblar(escala=ESCALA, semilla=7)
+    planes.migraciones.aplicar(planes.engine)
+    planes.estadisticas()
+    problemas = {r.caso.nombre: r.problemas for r in planes.verificar() if r.problemas}
+    assert problemas == {}
+
+
+@pytest.mark.slow
+def test_detecta_los_recorridos_sin_indice(planes):
+    vaciar_bd()
+    planes.poblar(escala=ESCALA, semilla=7)
+    planes.migraciones.aplicar(planes.engine)
+    planes.quitar_indices()
+    planes.estadisticas()
+    assert any(r.problemas for r in planes.verificar())
@@ -0,0 +1,80 @@
+import time
+
+from controller.sesiones import AlmacenMemoria, AlmacenSQLite, SesionConversacion, almacen_sesiones
+from model.arbol_opciones import registro_opciones
+
+
+def test_memoria_guarda_y_expira():
+    almacen = AlmacenMemoria(ttl=0.05, max_sesiones=10)
+    sesion = SesionConversacion(estado="en_opciones", nodo_id="1.2", identificacion={"tipo": "CC"})
+    almacen.guardar(sesion)
+    assert almacen.obtener(sesion.id) is sesion
+    time.sleep(0.06)
+    assert almacen.obtener(sesion.id) is None
+
+
+def test_memoria_descarta_la_menos_usada():
+    almacen = AlmacenMemoria(ttl=60, max_sesiones=2)
+    a, b, c = (SesionConversacion() for _ in range(3))
+    almacen.guardar(a)
+    almacen.guardar(b)
+    almacen.obtener(a.id)
+    almacen.guardar(c)
+    assert almacen.obtener(b.id) is None
+    assert almacen.obtener(a.id) is a and len(almacen) == 2
+
+
+def test_sqlite_persiste_entre_instancias(tmp_path):
+    ruta = str(tmp_path / "sesiones.db")
+    sesion = SesionConversacion(estado="en_encuesta", nodo_id="3", datos_encuesta={"Facultad": "Diseño"})
+    AlmacenSQLite(ruta, ttl=60).guardar(sesion)
+
+    leida = AlmacenSQLite(ruta, ttl=60).obtener(sesion.id)
+    assert leida.to_dict() == sesion.to_dict()
+
+
+def test_sesion_en_el_servidor(cliente):
+    r = cliente.post("/procesar_mensaje", json={"mensaje": "CC", "usar_sesion": True}).json()
+    assert r["nuevo_estado"] == "pidiendo_numero"
+    r = cliente.post("/procesar_mensaje", json={"mensaje": "123", "session_id": r["session_id"]}).json()
+    assert r["nuevo_estado"] == "en_opciones" and r["nodo_id"] == "raiz"
+    # Las opciones van compactas: {clave: texto}
+    assert all(isinstance(texto, str) for texto in r["opciones"].values())
+
+
+def _enviar(cliente, sesion, mensaje):
+    almacen_sesiones.guardar(sesion)
+    respuesta = cliente.post("/procesar_mensaje", json={"mensaje": mensaje, "session_id": sesion.id}).json()
+    assert respuesta["session_id"] == sesion.id
+    return respuesta, almacen_sesiones.obtener(sesion.id)
+
+
+def test_sesion_finalizada_empieza_otra_conversacion(cliente):
+    sesion = SesionConversacion(estado="finalizado", identificacion={"tipo": "CC", "numero": "1001"})
+    respuesta, guardada = _enviar(cliente, sesion, "CC")
+    assert respuesta["nuevo_estado"] == guardada.estado == "pidiendo_numero"
+
+
+def test_error_del_flujo_no_deja_la_sesion_atascada(cliente):
+    respuesta, guardada = _enviar(cliente, SesionConversacion(estado="desconocido"), "hola")
+    assert respuesta["mensajes"] == ["Estado no reconocido o fuera de flujo."]
+    assert respuesta["nuevo_estado"] == guardada.estado == "pidiendo_tipo"
+
+    # Con la identificación ya dada vuelve al menú principal
+    identificada = SesionConversacion(estado="desconocido", identificacion={"tipo": "CC", "numero": "1001"})
+    respuesta, guardada = _enviar(cliente, identificada, "hola")
+    assert respuesta["nuevo_estado"] == "en_opciones" and guardada.nodo_id == "raiz"
+
+
+def test_nodo_de_otra_version_del_arbol(cliente):
+    arbol = registro_opciones.arbol("general")
+    nodo_id = next(iter(arbol.raiz.hijos.values()))
+    sesion = SesionConversacion(estado="en_opciones", nodo_id=nodo_id, huella_arbol="version-anterior",
+                                identificacion={"tipo": "CC", "numero": "1001"})
+    respuesta, guardada = _enviar(cliente, sesion, "1")
+    # No se interpreta "1" contra un nodo que pudo cambiar: vuelve al menú
+    assert respuesta["mensajes"][0] == "El menú se actualizó."
+    assert respuesta["nodo_id"] == "raiz" and guardada.huella_arbol == arbol.huella
+
+    respuesta, guardada = _enviar(cliente, guardada, "1")
+    assert respuesta["mensajes"][0] != "El menú se actualizó."